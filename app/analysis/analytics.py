@@ -0,0 +1,460 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from decouple import config
+from loguru import logger
+
+from app.storage.cache import cached
+from app.storage.database import DatabaseExecutor, Statement, statements
+from app.storage.queries import listing_cache
+
+METRIC_PRICE = 'price'
+METRIC_PRICE_PER_M2 = 'price_per_m2'
+
+# Логарифмические корзины гистограмм: 40 корзин на порядок, ошибка квантиля по корзине ~3%
+BIN_EDGES = {
+    METRIC_PRICE: np.geomspace(1e3, 1e10, 7 * 40 + 1),
+    METRIC_PRICE_PER_M2: np.geomspace(1e1, 1e7, 6 * 40 + 1),
+}
+
+GROUP_COLUMNS = ('deal_type', 'rooms', 'district')
+DEFAULT_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Значение rooms в агрегатах для объявлений без количества комнат (колонка входит в первичный ключ)
+UNKNOWN_ROOMS = -1
+
+ANALYTICS_CACHE_TAG = 'analytics'
+ROLLUP_WATERMARK = 'price_rollups'
+
+_DISTRICT_RE = re.compile(r'(?:р-н|район)\s+([^,]+)|([^,]+?)\s+(?:р-н|район)\b', re.IGNORECASE)
+
+# Неделя наблюдения в SQL — понедельник, как в week_start()
+_WEEK_SQL = "DATE(a.recorded_at) - INTERVAL WEEKDAY(a.recorded_at) DAY"
+
+NEXT_BATCH = statements.register('analytics.next_batch', """
+SELECT COUNT(*), MAX(id) FROM (
+    SELECT id FROM listing_analytics WHERE id > %s ORDER BY id LIMIT %s
+) batch
+""")
+# Недели новых наблюдений: остальные недели они не меняют
+AFFECTED_WEEKS = statements.register('analytics.affected_weeks', f"""
+SELECT DISTINCT {_WEEK_SQL} FROM listing_analytics a WHERE a.id > %s AND a.id <= %s
+""")
+LOCK_WATERMARK = statements.register(
+    'analytics.lock_watermark', "SELECT last_id FROM analytics_watermarks WHERE name = %s FOR UPDATE"
+)
+SET_WATERMARK = statements.register('analytics.set_watermark', """
+INSERT INTO analytics_watermarks (name, last_id) VALUES (%s, %s)
+ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+""")
+UPSERT_ROLLUP = statements.register('analytics.upsert_rollup', """
+INSERT INTO listing_price_rollups (metric, deal_type, rooms, district, week_start, bucket, observations, sum_value)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    observations = observations + VALUES(observations),
+    sum_value = sum_value + VALUES(sum_value)
+""")
+CLEAR_ROLLUPS = statements.register('analytics.clear_rollups', "DELETE FROM listing_price_rollups")
+
+
+def latest_observations_query(weeks: Sequence[date]) -> Statement:
+    """
+    Последнее за неделю наблюдение каждого объявления (не новее водяной отметки) для каждой из недель.
+    Параметры: отметка, начало и конец каждой недели, снова отметка.
+    """
+    ranges = ' OR '.join(['(a.recorded_at >= %s AND a.recorded_at < %s)'] * len(weeks))
+    return Statement('analytics.latest_observations', f"""
+        SELECT a.id, a.price, l.area, l.rooms, l.deal_type, l.location, a.recorded_at
+        FROM listing_analytics a
+        JOIN listings l ON l.id = a.listing_id
+        WHERE a.id <= %s AND ({ranges})
+          AND NOT EXISTS (
+              SELECT 1 FROM listing_analytics n
+              WHERE n.listing_id = a.listing_id AND n.id > a.id AND n.id <= %s
+                AND n.recorded_at < {_WEEK_SQL} + INTERVAL 7 DAY
+          )
+    """)
+
+
+def clear_weeks_query(weeks: Sequence[date]) -> Statement:
+    placeholders = ', '.join(['%s'] * len(weeks))
+    return Statement('analytics.clear_weeks', f"DELETE FROM listing_price_rollups WHERE week_start IN ({placeholders})")
+
+
+def district_of(location: Optional[str]) -> str:
+    """
+    Район из строки местоположения: "р-н X"/"X район", иначе первая часть адреса до запятой.
+    """
+    if not location:
+        return ''
+    match = _DISTRICT_RE.search(location)
+    if match:
+        return ' '.join((match.group(1) or match.group(2)).split())
+    return ' '.join(location.split(',', 1)[0].split())
+
+
+def week_start(timestamps: np.ndarray) -> np.ndarray:
+    """
+    Понедельник недели для каждой метки времени (1970-01-01 — четверг).
+    """
+    days = timestamps.astype('datetime64[D]')
+    return days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+
+
+def bucketize(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Номер корзины гистограммы; значения за границами попадают в крайние корзины.
+    """
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 2)
+
+
+def encode_groups(*columns: np.ndarray) -> Tuple[np.ndarray, List[tuple]]:
+    """
+    Код группы для каждой строки по сочетанию значений колонок.
+
+    Returns:
+        Tuple[np.ndarray, List[tuple]]: Коды групп и значения колонок для каждого кода.
+    """
+    if not columns:
+        raise ValueError("Нужна хотя бы одна колонка группировки.")
+    codes, uniques = [], []
+    for column in columns:
+        values, inverse = np.unique(column, return_inverse=True)
+        codes.append(inverse.reshape(-1))
+        uniques.append(values)
+
+    combined = np.ravel_multi_index(codes, [len(values) for values in uniques])
+    group_keys, group_codes = np.unique(combined, return_inverse=True)
+    positions = np.unravel_index(group_keys, [len(values) for values in uniques])
+    labels = list(zip(*[values[position].tolist() for values, position in zip(uniques, positions)]))
+    return group_codes.reshape(-1), labels
+
+
+def quantiles_from_histogram(counts: np.ndarray, edges: np.ndarray,
+                             quantiles: Sequence[float] = DEFAULT_QUANTILES) -> np.ndarray:
+    """
+    Квантили по гистограммам для всех групп сразу с геометрической интерполяцией внутри корзины.
+
+    Args:
+        counts (np.ndarray): Матрица (группы × корзины).
+        edges (np.ndarray): Границы корзин.
+        quantiles (Sequence[float]): Уровни квантилей.
+
+    Returns:
+        np.ndarray: Матрица (группы × квантили); NaN для пустых групп.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    cdf = np.cumsum(counts, axis=1)
+    totals = cdf[:, -1:]
+    targets = totals * np.asarray(quantiles, dtype=np.float64)[None, :]
+
+    # Первая корзина, где накопленная частота достигает цели
+    index = (cdf[:, None, :] < targets[:, :, None]).sum(axis=2)
+    index = np.minimum(index, counts.shape[1] - 1)
+
+    rows = np.arange(counts.shape[0])[:, None]
+    before = np.where(index > 0, cdf[rows, index - 1], 0.0)
+    in_bin = counts[rows, index]
+    fraction = np.divide(targets - before, in_bin, out=np.full_like(targets, 0.5), where=in_bin > 0)
+
+    lower, upper = edges[index], edges[index + 1]
+    result = lower * (upper / lower) ** np.clip(fraction, 0.0, 1.0)
+    result[totals[:, 0] == 0] = np.nan
+    return result
+
+
+@dataclass
+class PriceObservations:
+    """
+    Колоночное представление наблюдений цены (строк listing_analytics с атрибутами объявления).
+    Для агрегатов загружается только последнее наблюдение каждого объявления за неделю.
+    """
+    ids: np.ndarray
+    price: np.ndarray
+    area: np.ndarray
+    rooms: np.ndarray
+    deal_type: np.ndarray
+    district: np.ndarray
+    week: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[Any]]) -> "PriceObservations":
+        """
+        Args:
+            rows: Кортежи (id, price, area, rooms, deal_type, location, recorded_at).
+        """
+        ids, price, area, rooms, deal_type, location, recorded_at = zip(*rows)
+        locations, inverse = np.unique(np.array([value or '' for value in location], dtype=object),
+                                       return_inverse=True)
+        districts = np.array([district_of(value) for value in locations], dtype=object)
+        return cls(
+            ids=np.array(ids, dtype=np.int64),
+            price=np.array(price, dtype=np.float64),
+            area=np.array([np.nan if value is None else value for value in area], dtype=np.float64),
+            rooms=np.array([UNKNOWN_ROOMS if value is None else value for value in rooms], dtype=np.int64),
+            deal_type=np.array(deal_type, dtype=object),
+            district=districts[inverse.reshape(-1)],
+            week=week_start(np.array(recorded_at, dtype='datetime64[s]')),
+        )
+
+    def metric_values(self, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Значения метрики и маска строк, для которых она определена.
+        """
+        if metric == METRIC_PRICE:
+            return self.price, self.price > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = self.price / self.area
+        return values, (self.area > 0) & (self.price > 0)
+
+    def rollup_increments(self) -> List[tuple]:
+        """
+        Приращения агрегатов: количество и сумма значений на (метрика, группа, неделя, корзина).
+        """
+        increments = []
+        for metric, edges in BIN_EDGES.items():
+            values, mask = self.metric_values(metric)
+            if not mask.any():
+                continue
+            values = values[mask]
+            codes, labels = encode_groups(
+                self.deal_type[mask], self.rooms[mask], self.district[mask],
+                self.week[mask].astype(np.int64), bucketize(values, edges),
+            )
+            counts = np.bincount(codes, minlength=len(labels))
+            sums = np.bincount(codes, weights=values, minlength=len(labels))
+            for (deal_type, rooms, district, week, bucket), count, total in zip(labels, counts, sums):
+                increments.append((
+                    metric, deal_type, int(rooms), district,
+                    date(1970, 1, 1) + timedelta(days=int(week)), int(bucket), int(count), round(float(total), 2),
+                ))
+        return increments
+
+
+class PriceAnalytics(DatabaseExecutor):
+    """
+    Аналитика цен по предрасчитанным агрегатам.
+
+    Гистограммы listing_price_rollups — недельные срезы предложения: объявление учитывается
+    в каждой неделе, когда оно наблюдалось, по последней за эту неделю цене из listing_analytics,
+    в группе (тип сделки, комнаты, район). Наблюдение пишется при появлении объявления, при
+    изменении цены и раз в неделю, если парсер снова видит объявление (см. ListingService.upsert_listings),
+    поэтому в срез попадают и объявления с неизменной ценой. Обновление пересчитывает только
+    недели новых наблюдений. Запросы к API читают только агрегаты.
+    """
+    REFRESH_BATCH = config('ANALYTICS_REFRESH_BATCH', default=50000, cast=int)
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._pending = False
+
+    async def refresh(self) -> int:
+        """
+        Инкрементальное обновление агрегатов по наблюдениям после водяной отметки.
+        Если обновление уже идет, вызов помечает его для повтора и сразу возвращается.
+
+        Returns:
+            int: Количество обработанных наблюдений.
+        """
+        if self._lock.locked():
+            self._pending = True
+            return 0
+
+        processed = 0
+        async with self._lock:
+            self._pending = True
+            while self._pending:
+                self._pending = False
+                processed += await self._refresh_batches()
+
+        if processed:
+            await listing_cache.invalidate(ANALYTICS_CACHE_TAG)
+            logger.info(f"Агрегаты цен обновлены: {processed} наблюдений.")
+        return processed
+
+    async def _refresh_batches(self) -> int:
+        processed = 0
+        while True:
+            # Строка водяной отметки блокируется до конца транзакции, поэтому
+            # параллельные обновления из других процессов не учтут наблюдения дважды
+            async with self.transaction() as cursor:
+                await cursor.execute(LOCK_WATERMARK.sql, (ROLLUP_WATERMARK,))
+                row = await cursor.fetchone()
+                last_id = row[0] if row else 0
+
+                await cursor.execute(NEXT_BATCH.sql, (last_id, self.REFRESH_BATCH))
+                count, upto = await cursor.fetchone()
+                if not count:
+                    return processed
+
+                await cursor.execute(AFFECTED_WEEKS.sql, (last_id, upto))
+                weeks = sorted(row[0] for row in await cursor.fetchall())
+                await cursor.execute(clear_weeks_query(weeks).sql, weeks)
+
+                bounds = [value for week in weeks for value in (week, week + timedelta(days=7))]
+                await cursor.execute(latest_observations_query(weeks).sql, (upto, *bounds, upto))
+                rows = await cursor.fetchall()
+                if rows:
+                    observations = PriceObservations.from_rows(rows)
+                    await cursor.executemany(UPSERT_ROLLUP.sql, observations.rollup_increments())
+                await cursor.execute(SET_WATERMARK.sql, (ROLLUP_WATERMARK, upto))
+
+            processed += count
+            if count < self.REFRESH_BATCH:
+                return processed
+
+    async def rebuild(self) -> int:
+        """
+        Полный пересчет агрегатов по всей истории цен.
+        """
+        async with self._lock:
+            async with self.transaction() as cursor:
+                await cursor.execute(CLEAR_ROLLUPS.sql)
+                await cursor.execute(SET_WATERMARK.sql, (ROLLUP_WATERMARK, 0))
+        await listing_cache.invalidate(ANALYTICS_CACHE_TAG)
+        return await self.refresh()
+
+    async def _load_rollups(self, metric: str, since: date, filters: Dict[str, Any]) -> List[tuple]:
+        conditions, params = ['metric = %s', 'week_start >= %s'], [metric, since]
+        for column in ('deal_type', 'rooms', 'district'):
+            if filters.get(column) is not None:
+                conditions.append(f'{column} = %s')
+                params.append(filters[column])
+
+        query = Statement('analytics.rollups', f"""
+            SELECT deal_type, rooms, district, week_start, bucket, observations, sum_value
+            FROM listing_price_rollups WHERE {' AND '.join(conditions)}
+        """)
+        return list(await self.execute_query(query, params, fetch=True))
+
+    @cached(listing_cache, tags=(ANALYTICS_CACHE_TAG,))
+    async def price_stats(self, metric: str = METRIC_PRICE_PER_M2, weeks: int = 4,
+                          group_by: Sequence[str] = GROUP_COLUMNS, filters: Optional[Dict[str, Any]] = None,
+                          histogram: bool = False) -> List[Dict[str, Any]]:
+        """
+        Распределение цены по группам за последние weeks недель.
+
+        Наблюдения — недельные срезы: объявление, которое было на рынке все weeks недель,
+        входит в статистику weeks раз, по цене каждой недели.
+
+        Args:
+            metric (str): price или price_per_m2.
+            weeks (int): Глубина окна в неделях, включая текущую.
+            group_by (Sequence[str]): Колонки группировки из GROUP_COLUMNS.
+            filters (Optional[Dict[str, Any]]): Фильтры deal_type, rooms, district.
+            histogram (bool): Добавить непустые корзины гистограммы.
+
+        Returns:
+            List[Dict[str, Any]]: Статистика по группам: количество, среднее, медиана и процентили.
+        """
+        since = date.today() - timedelta(days=date.today().weekday() + 7 * (weeks - 1))
+        rows = await self._load_rollups(metric, since, filters or {})
+        if not rows:
+            return []
+
+        deal_type, rooms, district, _, bucket, observations, sum_value = (np.array(column, dtype=object)
+                                                                          for column in zip(*rows))
+        by_column = {'deal_type': deal_type, 'rooms': rooms.astype(np.int64), 'district': district}
+        edges = BIN_EDGES[metric]
+        group_by = [column for column in GROUP_COLUMNS if column in group_by]
+        if group_by:
+            codes, labels = encode_groups(*(by_column[column] for column in group_by))
+        else:
+            codes, labels = np.zeros(len(rows), dtype=np.int64), [()]
+
+        bins = len(edges) - 1
+        observations = observations.astype(np.int64)
+        counts = np.bincount(codes * bins + bucket.astype(np.int64), weights=observations,
+                             minlength=len(labels) * bins).reshape(len(labels), bins)
+        totals = counts.sum(axis=1)
+        sums = np.bincount(codes, weights=sum_value.astype(np.float64), minlength=len(labels))
+        quantiles = quantiles_from_histogram(counts, edges, DEFAULT_QUANTILES)
+
+        result = []
+        for index, label in enumerate(labels):
+            group = dict(zip(group_by, label))
+            if group.get('rooms') == UNKNOWN_ROOMS:
+                group['rooms'] = None
+            p10, p25, median, p75, p90 = (round(float(value), 2) for value in quantiles[index])
+            stats = {
+                **group,
+                'observations': int(totals[index]),
+                'mean': round(float(sums[index] / totals[index]), 2),
+                'median': median, 'p10': p10, 'p25': p25, 'p75': p75, 'p90': p90,
+            }
+            if histogram:
+                nonzero = np.flatnonzero(counts[index])
+                stats['histogram'] = [
+                    {'lower': round(float(edges[i]), 2), 'upper': round(float(edges[i + 1]), 2),
+                     'count': int(counts[index, i])}
+                    for i in nonzero
+                ]
+            result.append(stats)
+        return result
+
+    @cached(listing_cache, tags=(ANALYTICS_CACHE_TAG,))
+    async def week_over_week(self, metric: str = METRIC_PRICE_PER_M2, group_by: Sequence[str] = GROUP_COLUMNS,
+                             filters: Optional[Dict[str, Any]] = None,
+                             week: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Изменение медианы за неделю по сравнению с предыдущей неделей.
+
+        Args:
+            metric (str): price или price_per_m2.
+            group_by (Sequence[str]): Колонки группировки из GROUP_COLUMNS.
+            filters (Optional[Dict[str, Any]]): Фильтры deal_type, rooms, district.
+            week (Optional[date]): Любой день сравниваемой недели, по умолчанию последняя полная неделя.
+
+        Returns:
+            List[Dict[str, Any]]: Медианы двух недель и разница по группам.
+        """
+        week = week or date.today() - timedelta(days=7)
+        current = week - timedelta(days=week.weekday())
+        previous = current - timedelta(days=7)
+
+        rows = [row for row in await self._load_rollups(metric, previous, filters or {})
+                if row[3] in (previous, current)]
+        if not rows:
+            return []
+
+        deal_type, rooms, district, week_start_, bucket, observations, _ = (np.array(column, dtype=object)
+                                                                           for column in zip(*rows))
+        by_column = {'deal_type': deal_type, 'rooms': rooms.astype(np.int64), 'district': district}
+        group_by = [column for column in GROUP_COLUMNS if column in group_by]
+        is_current = (week_start_ == current).astype(np.int64)
+        if group_by:
+            codes, labels = encode_groups(*(by_column[column] for column in group_by))
+        else:
+            codes, labels = np.zeros(len(rows), dtype=np.int64), [()]
+
+        edges = BIN_EDGES[metric]
+        bins = len(edges) - 1
+        # Строки матрицы: (группа, предыдущая/текущая неделя)
+        slots = codes * 2 + is_current
+        counts = np.bincount(slots * bins + bucket.astype(np.int64), weights=observations.astype(np.int64),
+                             minlength=len(labels) * 2 * bins).reshape(len(labels) * 2, bins)
+        medians = quantiles_from_histogram(counts, edges, (0.5,))[:, 0].reshape(len(labels), 2)
+        totals = counts.sum(axis=1).reshape(len(labels), 2)
+
+        result = []
+        for index, label in enumerate(labels):
+            group = dict(zip(group_by, label))
+            if group.get('rooms') == UNKNOWN_ROOMS:
+                group['rooms'] = None
+            previous_median, current_median = medians[index]
+            delta = current_median - previous_median
+            result.append({
+                **group,
+                'week_start': current,
+                'current_median': None if np.isnan(current_median) else round(float(current_median), 2),
+                'previous_median': None if np.isnan(previous_median) else round(float(previous_median), 2),
+                'delta': None if np.isnan(delta) else round(float(delta), 2),
+                'delta_pct': None if np.isnan(delta) else round(float(delta / previous_median * 100), 2),
+                'current_observations': int(totals[index, 1]),
+                'previous_observations': int(totals[index, 0]),
+            })
+        return result
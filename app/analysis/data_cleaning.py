@@ -0,0 +1,388 @@
+import asyncio
+import hashlib
+import re
+import zlib
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from decouple import config
+from loguru import logger
+
+from app.storage.database import DatabaseExecutor, Statement, statements
+from app.storage.queries import LISTINGS_CACHE_TAG, listing_cache
+
+SELECT_PENDING_DEDUP = statements.register('dedup.pending', """
+SELECT id, source_id, url, title, description, price, deal_type, rooms, area, content_hash
+FROM listings
+WHERE deduped_at IS NULL AND id > %s
+ORDER BY id
+LIMIT %s
+""")
+STORE_SIGNATURE = statements.register('dedup.store_signature', """
+INSERT INTO listing_signatures (listing_id, signature) VALUES (%s, %s)
+ON DUPLICATE KEY UPDATE signature = VALUES(signature)
+""")
+STORE_BUCKET = statements.register(
+    'dedup.store_bucket', "INSERT IGNORE INTO listing_lsh_buckets (bucket, listing_id) VALUES (%s, %s)"
+)
+STORE_DUPLICATE_PRICE = statements.register('dedup.store_price', """
+INSERT INTO listing_prices (listing_id, source_id, price, source_url) VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    price = VALUES(price),
+    source_url = VALUES(source_url),
+    last_checked = CURRENT_TIMESTAMP
+""")
+RESET_DEDUP = (
+    statements.register('dedup.reset_buckets', "DELETE FROM listing_lsh_buckets"),
+    statements.register('dedup.reset_signatures', "DELETE FROM listing_signatures"),
+    # Цены дубликатов у канонических объявлений: строки не своего источника
+    statements.register('dedup.reset_prices', """
+        DELETE p FROM listing_prices p JOIN listings l ON l.id = p.listing_id
+        WHERE NOT (p.source_id <=> l.source_id)
+    """),
+    statements.register(
+        'dedup.reset_listings', "UPDATE listings SET canonical_id = NULL, deduped_at = NULL, updated_at = updated_at"
+    ),
+)
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+class DedupConfig:
+    """
+    Класс конфигурации поиска дубликатов.
+    """
+    # Длина MinHash-подписи и число LSH-полос; порог сходства для кандидатов ≈ (1 / BANDS) ^ (1 / строк в полосе)
+    DEDUP_NUM_PERM = config('DEDUP_NUM_PERM', default=128, cast=int)
+    DEDUP_BANDS = config('DEDUP_BANDS', default=32, cast=int)
+    DEDUP_SHINGLE_SIZE = config('DEDUP_SHINGLE_SIZE', default=5, cast=int)
+    DEDUP_SEED = config('DEDUP_SEED', default=20240901, cast=int)
+    # Подтверждение кандидата: оценка сходства Жаккара и допуски по цене и площади
+    DEDUP_SIMILARITY = config('DEDUP_SIMILARITY', default=0.6, cast=float)
+    DEDUP_PRICE_TOLERANCE = config('DEDUP_PRICE_TOLERANCE', default=0.05, cast=float)
+    DEDUP_AREA_TOLERANCE = config('DEDUP_AREA_TOLERANCE', default=0.03, cast=float)
+    DEDUP_BATCH = config('DEDUP_BATCH', default=500, cast=int)
+    # Корзины, в которых больше объявлений, пропускаются при поиске кандидатов: их полосу подписи дает
+    # типовой текст (шаблон агентства), совпадение в ней мало что значит, а выборка растет без предела
+    DEDUP_MAX_BUCKET_SIZE = config('DEDUP_MAX_BUCKET_SIZE', default=200, cast=int)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def shingle_hashes(title: Optional[str], description: Optional[str], size: int = DedupConfig.DEDUP_SHINGLE_SIZE) -> np.ndarray:
+    """
+    Уникальные 32-битные хеши символьных шинглов заголовка и описания.
+
+    Текст сводится к словам через пробел, поэтому пунктуация, регистр и ё не влияют на сходство;
+    символьные шинглы, в отличие от словесных, устойчивы к перестановке фраз.
+    CRC32 вместо hash(), чтобы подписи не зависели от процесса.
+    """
+    text = ' '.join(tokenize(title) + tokenize(description))
+    if not text:
+        return np.empty(0, dtype=np.uint64)
+    shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+    return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                       dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    """
+    MinHash-подписи и LSH-корзины.
+
+    Перестановки заменены семейством multiply-shift: ((a * x + b) mod 2^64) >> 32
+    с фиксированным seed, поэтому подписи, сохраненные в базе, сравнимы между запусками.
+    """
+
+    def __init__(self, num_perm: int = DedupConfig.DEDUP_NUM_PERM, bands: int = DedupConfig.DEDUP_BANDS,
+                 seed: int = DedupConfig.DEDUP_SEED):
+        if num_perm % bands:
+            raise ValueError("Длина подписи должна делиться на число полос")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Подпись набора шинглов или None для пустого набора.
+        """
+        if not len(hashes):
+            return None
+        with np.errstate(over='ignore'):
+            values = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+    def buckets(self, signature: np.ndarray) -> List[int]:
+        """
+        Ключи LSH-корзин: по одному на полосу подписи, номер полосы входит в ключ.
+        """
+        keys = []
+        for band, start in enumerate(range(0, self.num_perm, self.rows)):
+            digest = hashlib.blake2b(signature[start:start + self.rows].tobytes(), digest_size=8,
+                                     person=band.to_bytes(2, 'little')).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """
+        Оценка сходства Жаккара по доле совпавших компонент подписей.
+        """
+        return float(np.mean(first == second))
+
+
+@dataclass
+class DedupListing:
+    """
+    Объявление с атрибутами, нужными для подтверждения дубликата.
+    """
+    id: int
+    source_id: Optional[int]
+    url: Optional[str]
+    price: Decimal
+    deal_type: str
+    rooms: Optional[int]
+    area: Optional[Decimal]
+    canonical_id: Optional[int]
+    signature: np.ndarray
+
+    @property
+    def root(self) -> int:
+        return self.canonical_id or self.id
+
+
+def _within(first: Optional[Decimal], second: Optional[Decimal], tolerance: float) -> bool:
+    if first is None or second is None:
+        return True
+    first, second = float(first), float(second)
+    return abs(first - second) <= tolerance * max(abs(first), abs(second))
+
+
+class ListingDeduplicator(DatabaseExecutor, DedupConfig):
+    """
+    Поиск почти одинаковых объявлений (одна квартира на разных площадках или перевыложенная).
+
+    Заголовок и описание разбиваются на шинглы, по ним строится MinHash-подпись,
+    подпись раскладывается по LSH-корзинам (listing_lsh_buckets). Кандидаты в дубликаты —
+    объявления, совпавшие хотя бы в одной корзине; они подтверждаются по сходству подписей,
+    типу сделки, комнатам и допускам по цене и площади. Дубликат ссылается на самое раннее
+    объявление группы (canonical_id), а его цена записывается в listing_prices канонического
+    объявления как цена своего источника. Корзины больше DEDUP_MAX_BUCKET_SIZE кандидатов не дают.
+    """
+
+    def __init__(self, hasher: Optional[MinHasher] = None):
+        self.hasher = hasher or MinHasher(self.DEDUP_NUM_PERM, self.DEDUP_BANDS, self.DEDUP_SEED)
+        self._lock = asyncio.Lock()
+        self._pending = False
+
+    def is_duplicate(self, listing: DedupListing, candidate: DedupListing) -> bool:
+        return (
+            listing.deal_type == candidate.deal_type
+            and (listing.rooms is None or candidate.rooms is None or listing.rooms == candidate.rooms)
+            and _within(listing.price, candidate.price, self.DEDUP_PRICE_TOLERANCE)
+            and _within(listing.area, candidate.area, self.DEDUP_AREA_TOLERANCE)
+            and self.hasher.similarity(listing.signature, candidate.signature) >= self.DEDUP_SIMILARITY
+        )
+
+    async def process_pending(self) -> int:
+        """
+        Инкрементальная обработка новых и измененных объявлений (deduped_at IS NULL).
+        Если обработка уже идет, вызов помечает ее для повтора и сразу возвращается.
+
+        Returns:
+            int: Количество найденных дубликатов.
+        """
+        if self._lock.locked():
+            self._pending = True
+            return 0
+
+        duplicates = 0
+        async with self._lock:
+            self._pending = True
+            while self._pending:
+                self._pending = False
+                duplicates += await self._process_batches()
+
+        if duplicates:
+            await listing_cache.invalidate(LISTINGS_CACHE_TAG)
+            logger.info(f"Найдено дубликатов объявлений: {duplicates}.")
+        return duplicates
+
+    async def rebuild(self) -> int:
+        """
+        Полный пересчет: подписи, корзины и связи с каноническими объявлениями строятся заново
+        по всей таблице в порядке id, поэтому каноническим становится самое раннее объявление группы.
+        """
+        async with self._lock:
+            async with self.transaction() as cursor:
+                for statement in RESET_DEDUP:
+                    await cursor.execute(statement.sql)
+        return await self.process_pending()
+
+    async def _process_batches(self) -> int:
+        duplicates, last_id = 0, 0
+        while True:
+            rows = await self.execute_query(SELECT_PENDING_DEDUP, (last_id, self.DEDUP_BATCH), fetch=True)
+            if not rows:
+                return duplicates
+            last_id = rows[-1][0]
+            duplicates += await self._process_rows(rows)
+            if len(rows) < self.DEDUP_BATCH:
+                return duplicates
+
+    async def _process_rows(self, rows: Sequence[tuple]) -> int:
+        """
+        Обработка пачки: подписи, поиск кандидатов в базе и внутри пачки, подтверждение и запись.
+        """
+        batch: List[Tuple[DedupListing, List[int], str]] = []
+        unsigned: List[Tuple[int, str]] = []
+        for id_, source_id, url, title, description, price, deal_type, rooms, area, content_hash in rows:
+            signature = self.hasher.signature(shingle_hashes(title, description))
+            if signature is None:
+                unsigned.append((id_, content_hash))
+                continue
+            listing = DedupListing(id_, source_id, url, Decimal(str(price)), deal_type, rooms,
+                                   Decimal(str(area)) if area is not None else None, None, signature)
+            batch.append((listing, self.hasher.buckets(signature), content_hash))
+
+        stored = await self._fetch_candidates({bucket for _, buckets, _ in batch for bucket in buckets},
+                                              exclude=[listing.id for listing, _, _ in batch])
+
+        # Корзины пачки: объявления пачки сравниваются и с более ранними объявлениями той же пачки
+        batch_buckets: Dict[int, List[DedupListing]] = {}
+        duplicates = 0
+        for listing, buckets, _ in batch:
+            candidates: Dict[int, DedupListing] = {}
+            for bucket in buckets:
+                for candidate in stored.get(bucket, []) + batch_buckets.get(bucket, []):
+                    if candidate.id < listing.id:
+                        candidates[candidate.id] = candidate
+            confirmed = [candidate for candidate in candidates.values() if self.is_duplicate(listing, candidate)]
+            if confirmed:
+                listing.canonical_id = min(candidate.root for candidate in confirmed)
+                duplicates += 1
+            for bucket in buckets:
+                batch_buckets.setdefault(bucket, []).append(listing)
+
+        await self._store(batch, unsigned)
+        return duplicates
+
+    async def _fetch_candidates(self, buckets: Iterable[int], exclude: List[int]) -> Dict[int, List[DedupListing]]:
+        """
+        Сохраненные объявления из тех же LSH-корзин, сгруппированные по корзине.
+        Корзины больше DEDUP_MAX_BUCKET_SIZE пропускаются; размер считается по индексу корзин.
+        """
+        buckets = list(buckets)
+        if not buckets:
+            return {}
+        rows = await self.execute_query(Statement('dedup.candidates', f"""
+            SELECT b.bucket, l.id, l.source_id, l.url, l.price, l.deal_type, l.rooms, l.area, l.canonical_id, s.signature
+            FROM (
+                SELECT bucket FROM listing_lsh_buckets
+                WHERE bucket IN ({', '.join(['%s'] * len(buckets))})
+                GROUP BY bucket
+                HAVING COUNT(*) <= %s
+            ) kept
+            JOIN listing_lsh_buckets b ON b.bucket = kept.bucket
+            JOIN listings l ON l.id = b.listing_id
+            JOIN listing_signatures s ON s.listing_id = b.listing_id
+        """), [*buckets, self.DEDUP_MAX_BUCKET_SIZE], fetch=True)
+
+        excluded = set(exclude)
+        listings: Dict[int, DedupListing] = {}
+        by_bucket: Dict[int, List[DedupListing]] = {}
+        for bucket, id_, source_id, url, price, deal_type, rooms, area, canonical_id, signature in rows:
+            if id_ in excluded:
+                continue
+            if id_ not in listings:
+                listings[id_] = DedupListing(
+                    id_, source_id, url, Decimal(str(price)), deal_type, rooms,
+                    Decimal(str(area)) if area is not None else None, canonical_id,
+                    np.frombuffer(signature, dtype=np.uint32),
+                )
+            by_bucket.setdefault(bucket, []).append(listings[id_])
+        return by_bucket
+
+    async def _store(self, batch: List[Tuple[DedupListing, List[int], str]], unsigned: List[Tuple[int, str]]):
+        """
+        Запись подписей, корзин и связей с каноническими объявлениями одной транзакцией.
+        """
+        if not batch and not unsigned:
+            return
+
+        prices = []
+        async with self.transaction() as cursor:
+            await self._resolve_roots(cursor, [listing for listing, _, _ in batch])
+            ids = [listing.id for listing, _, _ in batch]
+            if ids:
+                # Подпись измененного объявления могла поменяться: старые корзины удаляются
+                await cursor.execute(
+                    f"DELETE FROM listing_lsh_buckets WHERE listing_id IN ({', '.join(['%s'] * len(ids))})", ids
+                )
+                await cursor.executemany(STORE_SIGNATURE.sql, [
+                    (listing.id, listing.signature.tobytes()) for listing, _, _ in batch
+                ])
+                await cursor.executemany(STORE_BUCKET.sql, [
+                    (bucket, listing.id) for listing, buckets, _ in batch for bucket in buckets
+                ])
+
+            updates = [(listing.id, content_hash, listing.canonical_id) for listing, _, content_hash in batch]
+            updates += [(id_, content_hash, None) for id_, content_hash in unsigned]
+            # Одно UPDATE на пачку; строка обновляется, только если содержимое не изменилось с момента выборки.
+            # updated_at остается прежним, как и при записи координат
+            values = ' UNION ALL '.join(['SELECT %s AS id, %s AS content_hash, %s AS canonical_id'] * len(updates))
+            await cursor.execute(f"""
+                UPDATE listings l JOIN ({values}) v ON l.id = v.id AND l.content_hash <=> v.content_hash
+                SET l.canonical_id = v.canonical_id, l.deduped_at = CURRENT_TIMESTAMP, l.updated_at = l.updated_at
+            """, [value for update in updates for value in update])
+
+            for listing, _, _ in batch:
+                if listing.canonical_id is None or listing.source_id is None:
+                    continue
+                prices.append((listing.canonical_id, listing.source_id, listing.price, listing.url or ''))
+            if prices:
+                # Цена дубликата с того же источника, что и у канонического, не пишется:
+                # ее строка в listing_prices принадлежит самому каноническому объявлению
+                await cursor.execute(
+                    f"SELECT id, source_id FROM listings WHERE id IN ({', '.join(['%s'] * len(prices))})",
+                    [price[0] for price in prices]
+                )
+                canonical_sources = dict(await cursor.fetchall())
+                prices = [price for price in prices if canonical_sources.get(price[0]) != price[1]]
+            if prices:
+                await cursor.executemany(STORE_DUPLICATE_PRICE.sql, prices)
+
+    async def _resolve_roots(self, cursor, listings: List[DedupListing]):
+        """
+        Замена canonical_id на корень цепочки. Каноническое объявление после изменения
+        содержимого могло само стать дубликатом, и его canonical_id указывает дальше.
+        Если корень удален после поиска кандидатов, объявление остается без canonical_id.
+        """
+        parents: Dict[int, Optional[int]] = {listing.id: listing.canonical_id for listing in listings}
+        deleted = set()
+        pending = {listing.canonical_id for listing in listings if listing.canonical_id is not None} - set(parents)
+        while pending:
+            await cursor.execute(
+                f"SELECT id, canonical_id FROM listings WHERE id IN ({', '.join(['%s'] * len(pending))})",
+                list(pending)
+            )
+            found = dict(await cursor.fetchall())
+            deleted |= pending - set(found)
+            for id_ in pending:
+                parents[id_] = found.get(id_)
+            pending = {parent for parent in found.values() if parent is not None} - set(parents)
+
+        for listing in listings:
+            root, visited = listing.canonical_id, {listing.id}
+            while root is not None and root not in visited and parents.get(root) is not None:
+                visited.add(root)
+                root = parents[root]
+            listing.canonical_id = None if root == listing.id or root in deleted else root
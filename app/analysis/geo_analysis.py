@@ -0,0 +1,625 @@
+import asyncio
+import hashlib
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+from decouple import config
+from loguru import logger
+
+from app.parsers.utils import TokenBucket
+from app.storage.cache import MISSING, LRUCache
+from app.storage.database import DatabaseExecutor, Statement, statements
+
+# Средний радиус Земли, км
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+Coordinates = Tuple[float, float]
+# Обработчик изменения точек индекса: координаты затронутых точек (прежние и новые) или None, None при перестроении
+IndexListener = Callable[[Optional[np.ndarray], Optional[np.ndarray]], None]
+
+SELECT_PENDING_GEOCODING = statements.register('geo.pending', """
+SELECT id, location FROM listings
+WHERE geocoded_at IS NULL AND location IS NOT NULL AND location <> '' AND id > %s
+ORDER BY id
+LIMIT %s
+""")
+STORE_GEOCODE_CACHE = statements.register('geo.cache_store', """
+INSERT INTO geocode_cache (address_hash, address, latitude, longitude)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    latitude = VALUES(latitude),
+    longitude = VALUES(longitude),
+    resolved_at = CURRENT_TIMESTAMP
+""")
+SELECT_COORDINATES = statements.register('geo.coordinates', """
+SELECT id, latitude, longitude, geocoded_at FROM listings
+WHERE geocoded_at >= %s AND latitude IS NOT NULL
+""")
+# Объявления, у которых координаты сброшены (смена адреса в listings.upsert) после updated_at
+SELECT_RESET_COORDINATES = statements.register('geo.reset', """
+SELECT id FROM listings
+WHERE updated_at >= %s AND latitude IS NULL
+""")
+SELECT_UPDATED_WATERMARK = statements.register('geo.updated_watermark', """
+SELECT MAX(updated_at), (SELECT MAX(seq) FROM listing_changes) FROM listings
+""")
+# Удаленные объявления по ленте изменений (см. app/storage/changes.py)
+SELECT_DELETED = statements.register('geo.deleted', """
+SELECT listing_id FROM listing_changes
+WHERE seq > %s AND seq <= %s AND op = 'delete'
+""")
+
+
+class GeoConfig:
+    """
+    Класс конфигурации геокодирования и пространственного индекса.
+    """
+    # Адрес сервиса в формате Nominatim, например https://nominatim.openstreetmap.org/search
+    # (соблюдайте его правила использования); пустой — геокодирование выключено
+    GEOCODER_URL = config('GEOCODER_URL', default='')
+    GEOCODER_USER_AGENT = config('GEOCODER_USER_AGENT', default='property_pulse/1.0')
+    GEOCODER_RATE = config('GEOCODER_RATE', default=1, cast=float)
+    GEOCODER_TIMEOUT = config('GEOCODER_TIMEOUT', default=10, cast=float)
+    GEOCODER_BATCH = config('GEOCODER_BATCH', default=500, cast=int)
+    GEOCODE_LOCAL_CACHE = config('GEOCODE_LOCAL_CACHE', default=100000, cast=int)
+    # Размер ячейки сетки индекса в градусах (0.01° ≈ 1.1 км по широте)
+    GEO_CELL_DEGREES = config('GEO_CELL_DEGREES', default=0.01, cast=float)
+    # Как часто подтягивать из базы новые координаты и как часто перестраивать индекс целиком, сек
+    GEO_INDEX_SYNC = config('GEO_INDEX_SYNC', default=10, cast=float)
+    GEO_INDEX_RELOAD = config('GEO_INDEX_RELOAD', default=3600, cast=float)
+    # Сколько id можно передать в SQL как IN (...); при большем числе кандидатов фильтр идет по колонкам
+    GEO_MAX_IDS = config('GEO_MAX_IDS', default=5000, cast=int)
+    GEO_MAX_RADIUS_KM = config('GEO_MAX_RADIUS_KM', default=100, cast=float)
+
+
+_ADDRESS_JUNK_RE = re.compile(r'[^\w\s,.\-/]+')
+
+
+def normalize_address(address: str) -> str:
+    """
+    Нормализация адреса для ключа кэша геокодирования: регистр, ё, лишние пробелы и знаки.
+    """
+    address = _ADDRESS_JUNK_RE.sub(' ', address.lower().replace('ё', 'е'))
+    return ', '.join(' '.join(part.split()) for part in address.split(',') if part.strip())
+
+
+def address_key(address: str) -> str:
+    return hashlib.sha1(normalize_address(address).encode('utf-8')).hexdigest()
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Расстояние по большому кругу от точки до массива точек, км.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    """
+    Прямоугольник в градусах. min_lon > max_lon означает переход через 180-й меридиан.
+    """
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+
+    @classmethod
+    def around(cls, lat: float, lon: float, radius_km: float) -> "BoundingBox":
+        """
+        Описанный прямоугольник круга радиуса radius_km.
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        cos_lat = min(np.cos(np.radians(min_lat)), np.cos(np.radians(max_lat)))
+        if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+            return cls(min_lat, -180.0, max_lat, 180.0)
+        dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+        return cls(min_lat, _wrap_lon(lon - dlon), max_lat, _wrap_lon(lon + dlon))
+
+    def lon_ranges(self) -> List[Tuple[float, float]]:
+        if self.min_lon <= self.max_lon:
+            return [(self.min_lon, self.max_lon)]
+        return [(self.min_lon, 180.0), (-180.0, self.max_lon)]
+
+
+@dataclass(frozen=True)
+class GeoQuery:
+    """
+    Пространственный фильтр выборки: круг (center + radius_km) или прямоугольник.
+    """
+    center: Optional[Coordinates] = None
+    radius_km: Optional[float] = None
+    bbox: Optional[BoundingBox] = None
+
+    @property
+    def bounds(self) -> BoundingBox:
+        if self.bbox is not None:
+            return self.bbox
+        return BoundingBox.around(*self.center, self.radius_km)
+
+
+def _wrap_lon(lon: float) -> float:
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def _concat_ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Склейка диапазонов [start, stop) в один массив индексов без цикла на Python.
+    """
+    lengths = stops - starts
+    mask = lengths > 0
+    starts, lengths = starts[mask], lengths[mask]
+    if not len(starts):
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+
+class SpatialIndex:
+    """
+    Сеточный пространственный индекс в памяти процесса.
+
+    Точки хранятся в массивах NumPy, отсортированных по коду ячейки
+    (ряд по широте * число колонок + колонка по долготе). Ячейки одного ряда
+    идут подряд, поэтому прямоугольник превращается в один бинарный поиск
+    на ряд сетки и точную проверку только попавших в эти ряды точек.
+    """
+
+    def __init__(self, cell_degrees: float = GeoConfig.GEO_CELL_DEGREES):
+        self.cell = cell_degrees
+        self.columns = int(np.ceil(360.0 / cell_degrees))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+        self.codes = np.empty(0, dtype=np.int64)
+        # Изменения копятся и вливаются в массивы перед следующим запросом
+        self._pending: Dict[int, Optional[Coordinates]] = {}
+        self.listeners: List[IndexListener] = []
+
+    def __len__(self) -> int:
+        self._apply_pending()
+        return len(self.ids)
+
+    def _rows(self, lat) -> np.ndarray:
+        return np.floor((np.asarray(lat) + 90.0) / self.cell).astype(np.int64)
+
+    def _cols(self, lon) -> np.ndarray:
+        return np.minimum(np.floor((np.asarray(lon) + 180.0) / self.cell).astype(np.int64), self.columns - 1)
+
+    def _encode(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        return self._rows(lat) * self.columns + self._cols(lon)
+
+    def build(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+        """
+        Построение индекса с нуля.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        codes = self._encode(lat, lon)
+        order = np.argsort(codes, kind='stable')
+        self.ids, self.lat, self.lon, self.codes = ids[order], lat[order], lon[order], codes[order]
+        self._pending.clear()
+        self._notify(None, None)
+
+    def upsert(self, ids: Iterable[int], lat: Iterable[float], lon: Iterable[float]):
+        for id_, lat_, lon_ in zip(ids, lat, lon):
+            self._pending[int(id_)] = (float(lat_), float(lon_))
+
+    def remove(self, ids: Iterable[int]):
+        for id_ in ids:
+            self._pending[int(id_)] = None
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Текущие id и координаты всех точек. Массивы не изменяются на месте, а заменяются
+        новыми, поэтому снимок можно читать, пока в индекс вливаются изменения.
+        """
+        self._apply_pending()
+        return self.ids, self.lat, self.lon
+
+    def _notify(self, lat: Optional[np.ndarray], lon: Optional[np.ndarray]):
+        for listener in self.listeners:
+            try:
+                listener(lat, lon)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменений пространственного индекса: {e}")
+
+    def _apply_pending(self):
+        if not self._pending:
+            return
+        changed = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+        keep = ~np.isin(self.ids, changed)
+        touched_lat, touched_lon = [self.lat[~keep]], [self.lon[~keep]]
+        ids, lat, lon, codes = self.ids[keep], self.lat[keep], self.lon[keep], self.codes[keep]
+
+        added = [(id_, point) for id_, point in self._pending.items() if point is not None]
+        self._pending.clear()
+        if added:
+            new_ids = np.array([id_ for id_, _ in added], dtype=np.int64)
+            new_lat = np.array([point[0] for _, point in added], dtype=np.float64)
+            new_lon = np.array([point[1] for _, point in added], dtype=np.float64)
+            new_codes = self._encode(new_lat, new_lon)
+            order = np.argsort(new_codes, kind='stable')
+            # Вставка отсортированной порции за один проход вместо полной пересортировки
+            positions = np.searchsorted(codes, new_codes[order], side='right')
+            ids = np.insert(ids, positions, new_ids[order])
+            lat = np.insert(lat, positions, new_lat[order])
+            lon = np.insert(lon, positions, new_lon[order])
+            codes = np.insert(codes, positions, new_codes[order])
+            touched_lat.append(new_lat)
+            touched_lon.append(new_lon)
+        self.ids, self.lat, self.lon, self.codes = ids, lat, lon, codes
+        if self.listeners:
+            self._notify(np.concatenate(touched_lat), np.concatenate(touched_lon))
+
+    def _candidates(self, bbox: BoundingBox) -> np.ndarray:
+        """
+        Позиции точек в ячейках, пересекающих прямоугольник.
+        """
+        rows = np.arange(self._rows(bbox.min_lat), self._rows(bbox.max_lat) + 1, dtype=np.int64)
+        parts = []
+        for min_lon, max_lon in bbox.lon_ranges():
+            starts = np.searchsorted(self.codes, rows * self.columns + self._cols(min_lon), side='left')
+            stops = np.searchsorted(self.codes, rows * self.columns + self._cols(max_lon), side='right')
+            parts.append(_concat_ranges(starts, stops))
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def bbox(self, bbox: BoundingBox) -> np.ndarray:
+        """
+        id точек внутри прямоугольника.
+        """
+        self._apply_pending()
+        positions = self._candidates(bbox)
+        lat, lon = self.lat[positions], self.lon[positions]
+        inside = (lat >= bbox.min_lat) & (lat <= bbox.max_lat)
+        if bbox.min_lon <= bbox.max_lon:
+            inside &= (lon >= bbox.min_lon) & (lon <= bbox.max_lon)
+        else:
+            inside &= (lon >= bbox.min_lon) | (lon <= bbox.max_lon)
+        return self.ids[positions[inside]]
+
+    def radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        id и расстояния (км) точек в круге, по возрастанию расстояния.
+        """
+        self._apply_pending()
+        positions = self._candidates(BoundingBox.around(lat, lon, radius_km))
+        distances = haversine_km(lat, lon, self.lat[positions], self.lon[positions])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return self.ids[positions[order]], distances[order]
+
+    def nearest(self, lat: float, lon: float, k: int,
+                max_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k ближайших точек: поиск в круге, радиус которого удваивается, пока в нем меньше k точек.
+        Любая точка ближе k-й найденной в круге лежит в том же круге, поэтому результат точный.
+        """
+        self._apply_pending()
+        limit = max_km if max_km is not None else np.pi * EARTH_RADIUS_KM
+        radius_km = min(self.cell * KM_PER_DEGREE, limit)
+        while True:
+            ids, distances = self.radius(lat, lon, radius_km)
+            if len(ids) >= k or radius_km >= limit or len(ids) == len(self.ids):
+                return ids[:k], distances[:k]
+            radius_km = min(radius_km * 2, limit)
+
+    def query(self, geo: GeoQuery) -> np.ndarray:
+        if geo.center is not None and geo.radius_km is not None:
+            return self.radius(*geo.center, geo.radius_km)[0]
+        return self.bbox(geo.bbox)
+
+
+class GeocoderBackend(ABC):
+    """
+    Внешний сервис геокодирования.
+    """
+
+    @abstractmethod
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        """
+        Координаты адреса или None, если адрес не найден.
+        Ошибки сети и сервиса пробрасываются: такие адреса не кэшируются и будут запрошены снова.
+        """
+
+    async def close(self):
+        pass
+
+
+class NominatimGeocoder(GeocoderBackend, GeoConfig):
+    """
+    Геокодирование через Nominatim (OpenStreetMap) с ограничением частоты запросов.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or self.GEOCODER_URL
+        self.rate_limiter = TokenBucket(self.GEOCODER_RATE, 1)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={'User-Agent': self.GEOCODER_USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=self.GEOCODER_TIMEOUT),
+            )
+        await self.rate_limiter.acquire()
+        params = {'q': address, 'format': 'jsonv2', 'limit': 1, 'countrycodes': 'ru'}
+        async with self.session.get(self.url, params=params) as response:
+            response.raise_for_status()
+            results = await response.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class Geocoder(DatabaseExecutor, GeoConfig):
+    """
+    Геокодирование с двухуровневым кэшем: LRU в памяти процесса и таблица geocode_cache.
+    Во внешний сервис уходит только адрес, которого нет ни в одном из них;
+    результат «не найден» тоже кэшируется.
+    """
+
+    def __init__(self, backend: Optional[GeocoderBackend] = None):
+        self.backend = backend if backend is not None else (NominatimGeocoder() if self.GEOCODER_URL else None)
+        self.local = LRUCache(self.GEOCODE_LOCAL_CACHE, float('inf'))
+
+    async def geocode_many(self, addresses: Iterable[str]) -> Dict[str, Optional[Coordinates]]:
+        """
+        Геокодирование набора адресов.
+
+        Returns:
+            Dict[str, Optional[Coordinates]]: Координаты или None для ненайденных адресов.
+                Адресов, которые не удалось разрешить из-за ошибки, в результате нет.
+        """
+        keys = {address: address_key(address) for address in addresses}
+        resolved: Dict[str, Optional[Coordinates]] = {}
+
+        missing: Dict[str, List[str]] = {}
+        for address, key in keys.items():
+            value = self.local.get(key)
+            if value is MISSING:
+                missing.setdefault(key, []).append(address)
+            else:
+                resolved[address] = value
+
+        if missing:
+            placeholders = ', '.join(['%s'] * len(missing))
+            rows = await self.execute_query(Statement('geo.cache_lookup', f"""
+                SELECT address_hash, latitude, longitude FROM geocode_cache WHERE address_hash IN ({placeholders})
+            """), list(missing), fetch=True)
+            for key, lat, lon in rows:
+                value = (lat, lon) if lat is not None else None
+                self.local.set(key, value)
+                for address in missing.pop(key):
+                    resolved[address] = value
+
+        if missing and self.backend is not None:
+            fetched = []
+            for key, same_addresses in missing.items():
+                address = same_addresses[0]
+                try:
+                    value = await self.backend.geocode(address)
+                except Exception as e:
+                    logger.warning(f"Не удалось геокодировать адрес {address!r}: {e}")
+                    continue
+                self.local.set(key, value)
+                fetched.append((key, normalize_address(address)[:512], *(value or (None, None))))
+                for same in same_addresses:
+                    resolved[same] = value
+            if fetched:
+                await self.execute_many(STORE_GEOCODE_CACHE, fetched)
+
+        return resolved
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+
+class GeoService(DatabaseExecutor, GeoConfig):
+    """
+    Координаты объявлений и пространственный поиск по ним.
+
+    Объявления без координат геокодируются фоновыми пачками, если задан GEOCODER_URL;
+    индекс в памяти процесса подтягивает из базы новые координаты и удаления
+    не чаще GEO_INDEX_SYNC и полностью перестраивается раз в GEO_INDEX_RELOAD.
+    """
+
+    def __init__(self, geocoder: Optional[Geocoder] = None):
+        self.geocoder = geocoder or Geocoder()
+        self.index = SpatialIndex()
+        self._index_lock = asyncio.Lock()
+        self._geocode_lock = asyncio.Lock()
+        self._loaded_at: Optional[float] = None
+        self._synced_at = 0.0
+        self._watermark = None
+        # Наибольший updated_at на момент прошлой синхронизации, для поиска сброшенных координат
+        self._updated_watermark = None
+        # Наибольший номер в ленте изменений на момент прошлой синхронизации, для поиска удалений
+        self._change_seq = None
+
+    async def ensure_index(self) -> SpatialIndex:
+        """
+        Актуальный индекс: полная загрузка при первом обращении и по истечении GEO_INDEX_RELOAD,
+        между ними — только координаты, геокодированные после последней синхронизации,
+        и удаление точек объявлений, которые с тех пор удалены или чьи координаты сброшены.
+        """
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._synced_at < self.GEO_INDEX_SYNC:
+            return self.index
+
+        async with self._index_lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.GEO_INDEX_RELOAD:
+                await self._load(full=True)
+                self._loaded_at = now
+            elif now - self._synced_at >= self.GEO_INDEX_SYNC:
+                await self._load(full=False)
+            self._synced_at = now
+        return self.index
+
+    async def _load(self, full: bool):
+        # Берется до чтения координат: сброс во время загрузки попадет в следующую синхронизацию
+        rows = await self.execute_query(SELECT_UPDATED_WATERMARK, fetch=True)
+        updated_watermark, change_seq = rows[0]
+        if not full and self._updated_watermark is not None:
+            reset = [row[0] for row in await self.execute_query(
+                SELECT_RESET_COORDINATES, (self._updated_watermark,), fetch=True
+            )]
+            if reset:
+                self.index.remove(reset)
+        if not full and change_seq is not None and change_seq != self._change_seq:
+            deleted = [row[0] for row in await self.execute_query(
+                SELECT_DELETED, (self._change_seq or 0, change_seq), fetch=True
+            )]
+            if deleted:
+                self.index.remove(deleted)
+        self._updated_watermark = updated_watermark
+        self._change_seq = change_seq
+
+        ids, lat, lon = [], [], []
+        watermark = self._watermark
+        since = '1970-01-02' if full or watermark is None else watermark
+        async for row in self.stream_query(SELECT_COORDINATES, (since,), batch_size=10000):
+            ids.append(row['id'])
+            lat.append(row['latitude'])
+            lon.append(row['longitude'])
+            if watermark is None or row['geocoded_at'] > watermark:
+                watermark = row['geocoded_at']
+
+        if full:
+            self.index.build(np.array(ids, dtype=np.int64), np.array(lat, dtype=np.float64),
+                             np.array(lon, dtype=np.float64))
+            logger.info(f"Пространственный индекс построен: {len(ids)} точек.")
+        elif ids:
+            self.index.upsert(ids, lat, lon)
+        self._watermark = watermark
+
+    async def search(self, geo: GeoQuery) -> np.ndarray:
+        """
+        id объявлений в круге или прямоугольнике.
+        """
+        index = await self.ensure_index()
+        return index.query(geo)
+
+    async def nearest(self, lat: float, lon: float, k: int,
+                      max_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        index = await self.ensure_index()
+        return index.nearest(lat, lon, k, max_km)
+
+    async def nearest_listings(self, listing_service, lat: float, lon: float, k: int,
+                               max_km: Optional[float] = None, filters: Optional[Dict[str, Any]] = None,
+                               columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        k ближайших объявлений, подходящих под фильтры.
+
+        Кандидаты из индекса проверяются фильтрами в SQL; если подошло меньше k,
+        число кандидатов увеличивается, пока не кончатся точки или не будет достигнут GEO_MAX_IDS.
+
+        Args:
+            listing_service (ListingService): Сервис выборки объявлений по id.
+
+        Returns:
+            List[Dict[str, Any]]: Объявления с расстоянием distance_km, от ближних к дальним.
+        """
+        candidates = k
+        while True:
+            ids, distances = await self.nearest(lat, lon, candidates, max_km)
+            rows = await listing_service.get_listings_by_ids(ids.tolist(), filters, columns)
+            if len(rows) >= k or len(ids) < candidates or candidates >= self.GEO_MAX_IDS:
+                break
+            candidates = min(candidates * 4, self.GEO_MAX_IDS)
+
+        result = []
+        for id_, distance in zip(ids.tolist(), distances.tolist()):
+            if id_ in rows:
+                result.append({**rows[id_], 'distance_km': round(distance, 3)})
+                if len(result) == k:
+                    break
+        return result
+
+    async def listing_filters(self, filters: Dict[str, Any], geo: Optional[GeoQuery]) -> Dict[str, Any]:
+        """
+        Фильтры выборки объявлений с пространственным условием.
+
+        Кандидаты берутся из индекса и передаются в SQL списком id; если их больше
+        GEO_MAX_IDS, условие переходит на колонки координат, чтобы не собирать огромный IN (...).
+        """
+        if geo is None:
+            return filters
+        ids = await self.search(geo)
+        if len(ids) <= self.GEO_MAX_IDS:
+            return {**filters, 'ids': sorted(ids.tolist(), reverse=True)}
+        geo_filter = {'bbox': geo.bounds}
+        if geo.center is not None:
+            geo_filter['radius'] = (*geo.center, geo.radius_km)
+        return {**filters, **geo_filter}
+
+    async def geocode_pending(self) -> int:
+        """
+        Геокодирование объявлений без координат. Параллельный вызов сразу возвращает 0:
+        уже идущий проход дойдет и до новых объявлений. Без GEOCODER_URL ничего не делает.
+
+        Returns:
+            int: Количество объявлений, для которых определены координаты.
+        """
+        if self._geocode_lock.locked() or self.geocoder.backend is None:
+            return 0
+
+        located = 0
+        last_id = 0
+        async with self._geocode_lock:
+            while True:
+                rows = await self.execute_query(SELECT_PENDING_GEOCODING, (last_id, self.GEOCODER_BATCH), fetch=True)
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                located += await self._geocode_rows(rows)
+                if len(rows) < self.GEOCODER_BATCH:
+                    break
+
+        if located:
+            logger.info(f"Геокодировано объявлений: {located}.")
+        return located
+
+    async def _geocode_rows(self, rows: List[Tuple[int, str]]) -> int:
+        coordinates = await self.geocoder.geocode_many({location for _, location in rows})
+        updates = [(id_, location, *(coordinates[location] or (None, None)))
+                   for id_, location in rows if location in coordinates]
+        if not updates:
+            return 0
+
+        # Одно UPDATE на пачку через производную таблицу; строка обновляется,
+        # только если адрес не изменился с момента выборки. updated_at остается прежним:
+        # служебная запись не попадает в ленту изменений и не меняет ETag
+        values = ' UNION ALL '.join(['SELECT %s AS id, %s AS location, %s AS latitude, %s AS longitude'] * len(updates))
+        await self.execute_query(Statement('geo.store_coordinates', f"""
+            UPDATE listings l JOIN ({values}) v ON l.id = v.id AND l.location = v.location
+            SET l.latitude = v.latitude, l.longitude = v.longitude, l.geocoded_at = CURRENT_TIMESTAMP,
+                l.updated_at = l.updated_at
+        """), [value for update in updates for value in update])
+
+        located = [(id_, lat, lon) for id_, _, lat, lon in updates if lat is not None]
+        if located:
+            ids, lat, lon = zip(*located)
+            self.index.upsert(ids, lat, lon)
+        return len(located)
+
+    async def close(self):
+        await self.geocoder.close()
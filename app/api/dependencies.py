@@ -0,0 +1,99 @@
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import Query
+
+from .exceptions import InvalidQueryHTTPException
+from app.analysis.analytics import GROUP_COLUMNS
+from app.analysis.geo_analysis import BoundingBox, GeoConfig, GeoQuery
+from app.storage.queries import LISTING_COLUMNS
+
+
+def listing_filters(
+    price_min: Optional[float] = Query(None, ge=0, description="Минимальная цена"),
+    price_max: Optional[float] = Query(None, ge=0, description="Максимальная цена"),
+    rooms: Optional[int] = Query(None, ge=0, description="Количество комнат"),
+    area_min: Optional[float] = Query(None, ge=0, description="Минимальная площадь, м²"),
+    area_max: Optional[float] = Query(None, ge=0, description="Максимальная площадь, м²"),
+    deal_type: Optional[Literal["sale", "rent"]] = Query(None, description="Тип сделки"),
+    location: Optional[str] = Query(None, min_length=1, description="Начало строки местоположения"),
+    unique: bool = Query(False, description="Скрыть найденные дубликаты объявлений"),
+) -> Dict[str, Any]:
+    """
+    Фильтры выборки объявлений из query-параметров.
+    """
+    return {
+        'price_min': price_min,
+        'price_max': price_max,
+        'rooms': rooms,
+        'area_min': area_min,
+        'area_max': area_max,
+        'deal_type': deal_type,
+        'location': location,
+        'unique': unique,
+    }
+
+
+def geo_query(
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Широта центра поиска"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Долгота центра поиска"),
+    radius_km: Optional[float] = Query(None, gt=0, le=GeoConfig.GEO_MAX_RADIUS_KM, description="Радиус поиска, км"),
+    bbox: Optional[str] = Query(None, description="Прямоугольник min_lat,min_lon,max_lat,max_lon"),
+) -> Optional[GeoQuery]:
+    """
+    Пространственный фильтр: круг (lat, lon, radius_km) или прямоугольник bbox.
+    """
+    if bbox is not None:
+        try:
+            min_lat, min_lon, max_lat, max_lon = (float(value) for value in bbox.split(','))
+        except ValueError:
+            raise InvalidQueryHTTPException("bbox должен состоять из четырех чисел: min_lat,min_lon,max_lat,max_lon")
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+            raise InvalidQueryHTTPException("Некорректные границы bbox")
+        return GeoQuery(bbox=BoundingBox(min_lat, min_lon, max_lat, max_lon))
+
+    if radius_km is None:
+        return None
+    if lat is None or lon is None:
+        raise InvalidQueryHTTPException("Для поиска в радиусе нужны lat и lon")
+    return GeoQuery(center=(lat, lon), radius_km=radius_km)
+
+
+def listing_columns(
+    fields: Optional[str] = Query(None, description="Колонки через запятую, например title,price"),
+) -> Optional[List[str]]:
+    """
+    Проекция колонок из query-параметра fields.
+    """
+    if not fields:
+        return None
+    columns = [column.strip() for column in fields.split(',') if column.strip()]
+    unknown = set(columns) - set(LISTING_COLUMNS)
+    if unknown:
+        raise InvalidQueryHTTPException(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return columns
+
+
+def analytics_filters(
+    deal_type: Optional[Literal["sale", "rent"]] = Query(None, description="Тип сделки"),
+    rooms: Optional[int] = Query(None, ge=0, description="Количество комнат"),
+    district: Optional[str] = Query(None, min_length=1, description="Район"),
+) -> Dict[str, Any]:
+    """
+    Фильтры по группам аналитики цен.
+    """
+    return {'deal_type': deal_type, 'rooms': rooms, 'district': district}
+
+
+def analytics_group_by(
+    group_by: Optional[str] = Query(
+        ",".join(GROUP_COLUMNS), description="Колонки группировки через запятую: deal_type, rooms, district"
+    ),
+) -> List[str]:
+    """
+    Колонки группировки аналитики; пустое значение — одна общая группа.
+    """
+    columns = [column.strip() for column in (group_by or "").split(',') if column.strip()]
+    unknown = set(columns) - set(GROUP_COLUMNS)
+    if unknown:
+        raise InvalidQueryHTTPException(f"Неизвестные колонки группировки: {', '.join(sorted(unknown))}")
+    return columns
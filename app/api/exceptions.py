@@ -1,7 +1,5 @@
 from fastapi import HTTPException
-from starlette.status import HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
-
-from .schemas import ListingCreate
+from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_410_GONE, HTTP_500_INTERNAL_SERVER_ERROR
 
 """Исключения для HTTP-ответов"""
 
@@ -15,81 +13,55 @@ class ListingAlreadyExistsException(HTTPException):
         detail = f"Объявление с ID {listing_id} уже существует."
         super().__init__(status_code=HTTP_400_BAD_REQUEST, detail=detail)
 
-class InvalidListingHTTPException(HTTPException):
-    def __init__(self):
-        detail = "Неверные данные для создания или обновления объявления."
-        super().__init__(status_code=HTTP_400_BAD_REQUEST, detail=detail)
-
-class InternalServerErrorException(HTTPException):
-    def __init__(self, message: str = "Произошла внутренняя ошибка сервера"):
-        super().__init__(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=message)
-
-
-"""Исключения для проверки валидации"""
-
-class InvalidListingDataException(Exception):
-    """
-    Базовое исключение для неверных данных объявления.
-    """
-    def __init__(self, message="Данные объявления некорректны"):
-        self.message = message
-        super().__init__(self.message)
-
-class MissingRequiredFieldException(InvalidListingDataException):
-    """
-    Исключение для случая, когда отсутствуют обязательные поля.
-    """
-    def __init__(self, field_name: str):
-        super().__init__(f"Обязательное поле '{field_name}' отсутствует.")
+class SavedSearchNotFoundException(HTTPException):
+    def __init__(self, search_id: int):
+        detail = f"Сохраненный поиск с ID {search_id} не найден."
+        super().__init__(status_code=HTTP_404_NOT_FOUND, detail=detail)
 
-class InvalidPriceException(InvalidListingDataException):
-    """
-    Исключение для случая, когда цена некорректна.
-    """
-    def __init__(self):
-        super().__init__("Цена должна быть положительным числом.")
+class ParserNotFoundException(HTTPException):
+    def __init__(self, name: str):
+        detail = f"Парсер {name} не найден."
+        super().__init__(status_code=HTTP_404_NOT_FOUND, detail=detail)
 
-class InvalidDealTypeException(InvalidListingDataException):
-    """
-    Исключение для некорректного типа сделки.
-    """
+class ParserAlreadyRunningException(HTTPException):
+    def __init__(self, name: str):
+        detail = f"Парсер {name} уже запущен."
+        super().__init__(status_code=HTTP_409_CONFLICT, detail=detail)
+
+class ChangeFeedExpiredException(HTTPException):
+    def __init__(self, since: int, oldest: int, head: int):
+        detail = {
+            "message": (f"Изменения после {since} удалены по сроку хранения (самое раннее: {oldest}). "
+                        f"Выполните полную выгрузку и продолжайте с номера head."),
+            "since": since,
+            "oldest": oldest,
+            "head": head,
+        }
+        super().__init__(status_code=HTTP_410_GONE, detail=detail)
+
+class MetricsDisabledException(HTTPException):
     def __init__(self):
-        super().__init__("Тип сделки должен быть 'sale' или 'rent'.")
+        detail = "Метрики выключены."
+        super().__init__(status_code=HTTP_404_NOT_FOUND, detail=detail)
 
-class InvalidRoomsException(InvalidListingDataException):
-    """
-    Исключение для некорректного количества комнат.
-    """
+class MetricsUnauthorizedException(HTTPException):
     def __init__(self):
-        super().__init__("Количество комнат должно быть положительным целым числом.")
+        detail = "Для доступа к метрикам нужен токен METRICS_TOKEN."
+        super().__init__(status_code=HTTP_401_UNAUTHORIZED, detail=detail, headers={"WWW-Authenticate": "Bearer"})
 
-class InvalidAreaException(InvalidListingDataException):
-    """
-    Исключение для некорректной площади.
-    """
+class InvalidListingHTTPException(HTTPException):
     def __init__(self):
-        super().__init__("Площадь должна быть положительным числом.")
-
-
-
-def is_valid_listing(listing: ListingCreate) -> None:
-    """
-    Проверяет валидность данных объявления и выбрасывает исключения, если данные некорректны.
-    """
-    if not listing.title:
-        raise MissingRequiredFieldException('title')
-    
-    if not listing.description:
-        raise MissingRequiredFieldException('description')
-
-    if listing.price <= 0:
-        raise InvalidPriceException()
+        detail = "Неверные данные для создания или обновления объявления."
+        super().__init__(status_code=HTTP_400_BAD_REQUEST, detail=detail)
 
-    if listing.deal_type not in ["sale", "rent"]:
-        raise InvalidDealTypeException()
+class InvalidBulkPayloadHTTPException(HTTPException):
+    def __init__(self, message: str = "Некорректный формат пакета объявлений."):
+        super().__init__(status_code=HTTP_400_BAD_REQUEST, detail=message)
 
-    if listing.rooms <= 0:
-        raise InvalidRoomsException()
+class InvalidQueryHTTPException(HTTPException):
+    def __init__(self, message: str = "Некорректные параметры запроса."):
+        super().__init__(status_code=HTTP_400_BAD_REQUEST, detail=message)
 
-    if listing.area <= 0:
-        raise InvalidAreaException()
+class InternalServerErrorException(HTTPException):
+    def __init__(self, message: str = "Произошла внутренняя ошибка сервера"):
+        super().__init__(status_code=HTTP_500_INTERNAL_SERVER_ERROR, detail=message)
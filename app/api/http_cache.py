@@ -0,0 +1,97 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from decouple import config
+from fastapi import Request, Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+# Заголовки, которые повторяются в ответе 304 (RFC 9110, 15.4.5)
+NOT_MODIFIED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+class HttpCacheConfig:
+    """
+    Класс конфигурации HTTP-кэширования и сжатия ответов.
+    """
+    # Сколько секунд клиент или обратный прокси может отдавать ответ без перепроверки
+    HTTP_CACHE_MAX_AGE = config('HTTP_CACHE_MAX_AGE', default=5, cast=int)
+    # Сколько секунд после истечения max-age прокси может отдавать ответ, перепроверяя его в фоне
+    HTTP_CACHE_STALE_WHILE_REVALIDATE = config('HTTP_CACHE_STALE_WHILE_REVALIDATE', default=30, cast=int)
+    # Ответы меньше этого размера не сжимаются, байт
+    GZIP_MIN_SIZE = config('GZIP_MIN_SIZE', default=1024, cast=int)
+    GZIP_LEVEL = config('GZIP_LEVEL', default=6, cast=int)
+
+
+def request_etag(request: Request, *parts: Any) -> str:
+    """
+    Слабый ETag представления: версия данных плюс путь и параметры запроса,
+    так что разные выборки одной версии данных получают разные ETag.
+    """
+    query = '&'.join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    payload = '\x1f'.join([*map(str, parts), request.url.path, query])
+    return f'W/"{hashlib.sha1(payload.encode("utf-8")).hexdigest()}"'
+
+
+def from_unix_time(value: Any) -> Optional[datetime]:
+    return datetime.fromtimestamp(float(value), tz=timezone.utc) if value is not None else None
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Валидаторы и Cache-Control для кэшируемого ответа.
+    """
+    headers = {
+        'ETag': etag,
+        'Cache-Control': (
+            f"public, max-age={HttpCacheConfig.HTTP_CACHE_MAX_AGE}, "
+            f"stale-while-revalidate={HttpCacheConfig.HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+        ),
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _strip_weak(etag: str) -> str:
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """
+    Совпадают ли условные заголовки запроса с валидаторами ответа.
+
+    If-None-Match сравнивается слабым сравнением и, если передан, имеет приоритет
+    над If-Modified-Since, который сравнивается с точностью до секунды.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        etag = _strip_weak(headers['ETag'])
+        return any(_strip_weak(candidate.strip()) == etag for candidate in if_none_match.split(','))
+
+    if_modified_since = request.headers.get('if-modified-since')
+    last_modified = headers.get('Last-Modified')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return parsedate_to_datetime(last_modified) <= since
+
+
+def not_modified(request: Request, headers: Dict[str, str]) -> Optional[Response]:
+    """
+    Ответ 304 без тела, если у клиента актуальная копия, иначе None.
+    """
+    if request.method not in ('GET', 'HEAD') or not is_not_modified(request, headers):
+        return None
+    return Response(
+        status_code=HTTP_304_NOT_MODIFIED,
+        headers={name: value for name, value in headers.items() if name in NOT_MODIFIED_HEADERS},
+    )
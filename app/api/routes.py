@@ -1,38 +1,547 @@
-from fastapi import HTTPException, APIRouter
+from datetime import date
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
 from loguru import logger
 
-from app.storage.queries import ListingService
+from app.analysis.analytics import METRIC_PRICE_PER_M2, PriceAnalytics
+from app.analysis.data_cleaning import ListingDeduplicator
+from app.analysis.geo_analysis import GeoConfig, GeoQuery, GeoService
+from app.instrumentation import PROMETHEUS_CONTENT_TYPE, InstrumentationConfig, metrics_authorized, registry
+from app.notifications.dispatcher import NotificationDispatcher
+from app.notifications.email_notifications import EmailBackend
+from app.notifications.matcher import SavedSearchService
+from app.notifications.scheduler import ParserScheduler
+from app.notifications.telegram_notifications import TelegramBackend
+from app.storage.changes import ChangeFeed, ChangeFeedConfig, ChangeFeedExpired
+from app.storage.queries import ListingService, ListingsVersion
+from app.storage.search import SearchConfig
+from app.visualization.maps import MapConfig, MapTileService
 
 from .exceptions import (
-    InvalidListingDataException, 
+    ChangeFeedExpiredException,
     InternalServerErrorException,
-    is_valid_listing
+    InvalidQueryHTTPException,
+    ListingNotFoundException,
+    MetricsDisabledException,
+    MetricsUnauthorizedException,
+    ParserAlreadyRunningException,
+    ParserNotFoundException,
+    SavedSearchNotFoundException
 )
 
 from .schemas import (
-    ListingCreate
+    ChangesResponse,
+    ListingCreate,
+    BulkListingResult,
+    BulkListingResponse,
+    ListingsPage,
+    PriceStatsResponse,
+    PriceDeltaResponse,
+    SavedSearch,
+    SavedSearchCreate
 ) 
 
+from .dependencies import listing_filters, listing_columns, geo_query, analytics_filters, analytics_group_by
+from .http_cache import cache_headers, from_unix_time, not_modified, request_etag
+from .utils import iter_bulk_payload, iter_ndjson, sse_event
+from .validation import errors_by_row, format_field_errors, listing_validator
+
 router = APIRouter()
 
 listing_service = ListingService()
+price_analytics = PriceAnalytics()
+geo_service = GeoService()
+map_tiles = MapTileService(geo_service)
+deduplicator = ListingDeduplicator()
+
+notification_backends = []
+if EmailBackend.SMTP_HOST:
+    notification_backends.append(EmailBackend())
+if TelegramBackend.TELEGRAM_BOT_TOKEN:
+    notification_backends.append(TelegramBackend())
+dispatcher = NotificationDispatcher(notification_backends)
+saved_searches = SavedSearchService(on_match=dispatcher.notify_matches)
+
+ListingService.add_listener(saved_searches.match_listings)
+
+change_feed = ChangeFeed(listing_service)
+scheduler = ParserScheduler(after_run=[
+    price_analytics.refresh, geo_service.geocode_pending, deduplicator.process_pending, change_feed.prune
+])
 
 @router.post("/api/listing/")
-async def create_listing(listing: ListingCreate):
+async def create_listing(listing: ListingCreate, background_tasks: BackgroundTasks):
+    # Ограничения полей проверены схемой ListingCreate до вызова обработчика
     try:
-        if not is_valid_listing(listing):
-            logger.warning(f"Invalid listing data: {listing}")
-            raise InvalidListingDataException()
-
-        await listing_service.save_listing_to_db(listing)
+        await listing_service.save_listing_to_db(listing.model_dump())
+        background_tasks.add_task(price_analytics.refresh)
+        background_tasks.add_task(geo_service.geocode_pending)
+        background_tasks.add_task(deduplicator.process_pending)
         
-        logger.info("Listing successfully created.")
+        logger.debug("Listing successfully created.")
         return {"message": "Listing created successfully"}
 
-    except InvalidListingDataException as e:
-        logger.error(f"Listing validation failed: {e}")
-        raise HTTPException(status_code=400, detail="Invalid listing data.")
-    
     except Exception as e:
         logger.error(f"Internal server error while creating listing: {e}")
         raise InternalServerErrorException(f"Ошибка при создании объявления: {str(e)}")
+
+
+@router.post("/api/listings/bulk", response_model=BulkListingResponse)
+async def create_listings_bulk(request: Request, background_tasks: BackgroundTasks):
+    """
+    Пакетное создание объявлений. Принимает JSON-массив или NDJSON-поток.
+    Некорректные строки отклоняются по отдельности и не мешают сохранению остальных;
+    весь пакет проверяется за один проход пакетным валидатором.
+    """
+    rows = []
+    parse_errors = {}
+    async for raw, parse_error in iter_bulk_payload(request):
+        if parse_error:
+            parse_errors[len(rows)] = parse_error
+        rows.append(raw)
+
+    valid_listings, valid_indexes, errors = listing_validator.validate(rows)
+    row_errors = errors_by_row(errors)
+    results = []
+    for index in range(len(rows)):
+        if index in parse_errors:
+            results.append(BulkListingResult(index=index, accepted=False, error=parse_errors[index]))
+        elif index in row_errors:
+            results.append(BulkListingResult(
+                index=index, accepted=False, error=format_field_errors(row_errors[index]), errors=row_errors[index]
+            ))
+        else:
+            results.append(BulkListingResult(index=index, accepted=True))
+
+    try:
+        stats = await listing_service.save_listings_bulk(valid_listings)
+    except Exception as e:
+        logger.error(f"Internal server error while saving listings batch: {e}")
+        raise InternalServerErrorException(f"Ошибка при пакетном создании объявлений: {str(e)}")
+
+    if stats['inserted'] or stats['updated']:
+        background_tasks.add_task(price_analytics.refresh)
+        background_tasks.add_task(geo_service.geocode_pending)
+        background_tasks.add_task(deduplicator.process_pending)
+
+    accepted = len(valid_listings)
+    logger.info(f"Listings batch processed: {accepted} accepted, {len(results) - accepted} rejected.")
+    return BulkListingResponse(accepted=accepted, rejected=len(results) - accepted, results=results, **stats)
+
+
+
+async def listings_cache_headers(request: Request) -> Tuple[ListingsVersion, Dict[str, str]]:
+    """
+    Версия данных объявлений и заголовки кэширования для ответа на запрос.
+    """
+    try:
+        version = await listing_service.get_listings_version()
+    except Exception as e:
+        logger.error(f"Internal server error while reading listings version: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении версии объявлений: {str(e)}")
+    return version, cache_headers(request_etag(request, version.tag), from_unix_time(version.updated_at))
+
+
+@router.get("/api/listings/", response_model=ListingsPage)
+async def get_listings(
+    request: Request,
+    response: Response,
+    filters: Dict[str, Any] = Depends(listing_filters),
+    columns: Optional[List[str]] = Depends(listing_columns),
+    geo: Optional[GeoQuery] = Depends(geo_query),
+    cursor: Optional[int] = Query(None, ge=1, description="Курсор из next_cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=500, description="Размер страницы"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson — потоковая выгрузка всех подходящих объявлений"),
+):
+    """
+    Список объявлений с фильтрами и keyset-пагинацией.
+    В режиме ndjson все подходящие объявления отдаются потоком, без пагинации.
+    Если данные не менялись с версии, которая есть у клиента (If-None-Match,
+    If-Modified-Since), возвращается 304 без выборки.
+    """
+    version, headers = await listings_cache_headers(request)
+    cached_response = not_modified(request, headers)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        filters = await geo_service.listing_filters(filters, geo)
+    except Exception as e:
+        logger.error(f"Internal server error while searching spatial index: {e}")
+        raise InternalServerErrorException(f"Ошибка пространственного поиска: {str(e)}")
+
+    if format == "ndjson":
+        rows = listing_service.stream_listings(filters, columns)
+        return StreamingResponse(iter_ndjson(rows), media_type="application/x-ndjson", headers=headers)
+
+    try:
+        listings, next_cursor = await listing_service.get_listings_page(
+            filters, columns, cursor=cursor, limit=limit, version=version.tag
+        )
+    except Exception as e:
+        logger.error(f"Internal server error while reading listings: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении объявлений: {str(e)}")
+
+    response.headers.update(headers)
+    return ListingsPage(listings=listings, next_cursor=next_cursor)
+
+
+@router.post("/api/listings/deduplicate")
+async def deduplicate_listings(rebuild: bool = Query(False, description="Пересчитать дубликаты по всей таблице")):
+    """
+    Поиск дубликатов среди новых и измененных объявлений или полный пересчет.
+    """
+    try:
+        duplicates = await (deduplicator.rebuild() if rebuild else deduplicator.process_pending())
+    except Exception as e:
+        logger.error(f"Internal server error while deduplicating listings: {e}")
+        raise InternalServerErrorException(f"Ошибка при поиске дубликатов: {str(e)}")
+    return {"duplicates": duplicates}
+
+
+@router.get("/api/listings/nearby", response_model=ListingsPage)
+async def get_nearby_listings(
+    request: Request,
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90, description="Широта"),
+    lon: float = Query(..., ge=-180, le=180, description="Долгота"),
+    k: int = Query(10, ge=1, le=100, description="Количество ближайших объявлений"),
+    max_km: Optional[float] = Query(None, gt=0, le=GeoConfig.GEO_MAX_RADIUS_KM, description="Максимальное расстояние, км"),
+    filters: Dict[str, Any] = Depends(listing_filters),
+    columns: Optional[List[str]] = Depends(listing_columns),
+):
+    """
+    k ближайших к точке объявлений, подходящих под фильтры, по возрастанию расстояния (distance_km).
+    """
+    _, headers = await listings_cache_headers(request)
+    cached_response = not_modified(request, headers)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        listings = await geo_service.nearest_listings(listing_service, lat, lon, k, max_km, filters, columns)
+    except Exception as e:
+        logger.error(f"Internal server error while searching nearby listings: {e}")
+        raise InternalServerErrorException(f"Ошибка пространственного поиска: {str(e)}")
+    response.headers.update(headers)
+    return ListingsPage(listings=listings, next_cursor=None)
+
+
+@router.get("/api/listings/search", response_model=ListingsPage)
+async def search_listings(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Поисковый запрос по заголовку и описанию"),
+    limit: int = Query(20, ge=1, le=100, description="Количество лучших результатов"),
+    filters: Dict[str, Any] = Depends(listing_filters),
+    columns: Optional[List[str]] = Depends(listing_columns),
+    geo: Optional[GeoQuery] = Depends(geo_query),
+):
+    """
+    Полнотекстовый поиск с теми же фильтрами, что и у списка объявлений:
+    limit лучших объявлений по убыванию релевантности (score).
+    """
+    version, headers = await listings_cache_headers(request)
+    cached_response = not_modified(request, headers)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        filters = await geo_service.listing_filters(filters, geo)
+    except Exception as e:
+        logger.error(f"Internal server error while searching spatial index: {e}")
+        raise InternalServerErrorException(f"Ошибка пространственного поиска: {str(e)}")
+
+    try:
+        listings = await listing_service.search_listings(q, filters, columns, limit=limit, version=version.tag)
+    except ValueError:
+        raise InvalidQueryHTTPException(
+            f"В запросе нет слов длиной от {SearchConfig.SEARCH_MIN_TOKEN} символов для поиска."
+        )
+    except Exception as e:
+        logger.error(f"Internal server error while searching listings: {e}")
+        raise InternalServerErrorException(f"Ошибка полнотекстового поиска: {str(e)}")
+
+    response.headers.update(headers)
+    return ListingsPage(listings=listings, next_cursor=None)
+
+
+@router.get("/api/listing/{listing_id}")
+async def get_listing(
+    listing_id: int,
+    request: Request,
+    response: Response,
+    columns: Optional[List[str]] = Depends(listing_columns),
+):
+    """
+    Объявление по id. ETag и Last-Modified строятся по updated_at объявления;
+    для актуальной копии клиента возвращается 304 без чтения строки.
+    """
+    try:
+        updated_at = await listing_service.get_listing_version(listing_id)
+    except Exception as e:
+        logger.error(f"Internal server error while reading listing version: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении объявления: {str(e)}")
+    if updated_at is None:
+        raise ListingNotFoundException(listing_id)
+
+    headers = cache_headers(request_etag(request, updated_at), from_unix_time(updated_at))
+    cached_response = not_modified(request, headers)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        listing = await listing_service.get_listing(listing_id, columns)
+    except Exception as e:
+        logger.error(f"Internal server error while reading listing: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении объявления: {str(e)}")
+    if listing is None:
+        raise ListingNotFoundException(listing_id)
+
+    response.headers.update(headers)
+    return listing
+
+
+@router.get("/api/map/tiles/{z}/{x}/{y}.json")
+async def get_map_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+):
+    """
+    Тайл карты z/x/y (схема XYZ, как у OpenStreetMap): кластеры объявлений
+    [lat, lon, count] и отдельные объявления [lat, lon, id].
+    """
+    if not 0 <= z <= MapConfig.MAP_MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise InvalidQueryHTTPException(f"Тайл {z}/{x}/{y} вне сетки масштабов 0-{MapConfig.MAP_MAX_ZOOM}.")
+
+    try:
+        body, etag = await map_tiles.get_tile(z, x, y)
+    except Exception as e:
+        logger.error(f"Internal server error while building map tile: {e}")
+        raise InternalServerErrorException(f"Ошибка построения тайла карты: {str(e)}")
+    headers = cache_headers(etag)
+    cached_response = not_modified(request, headers)
+    if cached_response is not None:
+        return cached_response
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/api/changes", response_model=ChangesResponse)
+async def get_changes(
+    since: int = Query(0, ge=0, description="Последний обработанный номер изменения, 0 — с самого раннего хранимого"),
+    limit: int = Query(500, ge=1, le=5000, description="Размер страницы"),
+    wait: float = Query(0, ge=0, le=ChangeFeedConfig.CHANGE_FEED_MAX_WAIT,
+                        description="Long-poll: сколько секунд ждать новых изменений, если их нет"),
+    include_listing: bool = Query(True, description="Добавить текущее состояние объявления"),
+    columns: Optional[List[str]] = Depends(listing_columns),
+):
+    """
+    Лента изменений объявлений (вставки, изменения, изменения цены, удаления) после номера since.
+    Клиент хранит next_since и передает его в следующем запросе.
+    """
+    try:
+        page = await change_feed.poll_changes(since, limit, wait, columns, include_listing)
+    except ChangeFeedExpired as e:
+        raise ChangeFeedExpiredException(e.since, e.oldest, e.head)
+    except Exception as e:
+        logger.error(f"Internal server error while reading change feed: {e}")
+        raise InternalServerErrorException(f"Ошибка при чтении ленты изменений: {str(e)}")
+    return ChangesResponse(changes=page.changes, next_since=page.next_since, head=page.head, has_more=page.has_more)
+
+
+@router.get("/api/changes/stream")
+async def stream_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description="Последний обработанный номер изменения"),
+    include_listing: bool = Query(True, description="Добавить текущее состояние объявления"),
+    columns: Optional[List[str]] = Depends(listing_columns),
+):
+    """
+    Лента изменений потоком Server-Sent Events: событие на изменение с id = seq.
+    При переподключении браузер передает Last-Event-ID, и поток продолжается с него.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    try:
+        # Первая страница читается до начала потока, чтобы вернуть 410 обычным ответом
+        first = await change_feed.get_changes(since, columns=columns, include_listing=include_listing)
+    except ChangeFeedExpired as e:
+        raise ChangeFeedExpiredException(e.since, e.oldest, e.head)
+
+    async def events():
+        page = first
+        while True:
+            for change in page.changes:
+                yield sse_event(change, event=change['op'], event_id=change['seq'])
+            if not page.changes:
+                yield b": keep-alive\n\n"
+            try:
+                page = await anext(pages)
+            except Exception as e:
+                logger.error(f"Ошибка потока ленты изменений: {e}")
+                yield sse_event({"detail": str(e)}, event="error")
+                return
+
+    pages = change_feed.follow(first.next_since, columns=columns, include_listing=include_listing)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        # GZipMiddleware буферизует поток; identity отключает сжатие для SSE
+        "Content-Encoding": "identity",
+    })
+
+
+@router.get("/api/health/db")
+async def database_health():
+    """
+    Проверка доступности базы данных и состояние пула соединений.
+    """
+    healthy = await listing_service.health_check()
+    content = {"status": "ok" if healthy else "unavailable", "pool": listing_service.pool_stats()}
+    if not healthy:
+        return JSONResponse(status_code=HTTP_503_SERVICE_UNAVAILABLE, content=content)
+    return content
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Метрики HTTP, базы данных и парсеров в текстовом формате Prometheus.
+    При заданном METRICS_TOKEN требуется заголовок Authorization: Bearer <токен>.
+    """
+    if not InstrumentationConfig.METRICS_ENABLED:
+        raise MetricsDisabledException()
+    if not metrics_authorized(request.headers.get("authorization")):
+        raise MetricsUnauthorizedException()
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/api/analytics/prices", response_model=PriceStatsResponse)
+async def get_price_stats(
+    metric: Literal["price", "price_per_m2"] = Query(METRIC_PRICE_PER_M2, description="Метрика"),
+    weeks: int = Query(4, ge=1, le=104, description="Глубина окна в неделях"),
+    histogram: bool = Query(False, description="Добавить гистограмму распределения"),
+    group_by: List[str] = Depends(analytics_group_by),
+    filters: Dict[str, Any] = Depends(analytics_filters),
+):
+    """
+    Медиана, процентили и распределение цены по группам из предрасчитанных агрегатов.
+    """
+    try:
+        groups = await price_analytics.price_stats(metric, weeks, group_by, filters, histogram)
+    except Exception as e:
+        logger.error(f"Internal server error while reading price stats: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении аналитики цен: {str(e)}")
+    return PriceStatsResponse(metric=metric, weeks=weeks, groups=groups)
+
+
+@router.get("/api/analytics/prices/wow", response_model=PriceDeltaResponse)
+async def get_price_week_over_week(
+    metric: Literal["price", "price_per_m2"] = Query(METRIC_PRICE_PER_M2, description="Метрика"),
+    week: Optional[date] = Query(None, description="Любой день недели для сравнения, по умолчанию прошлая неделя"),
+    group_by: List[str] = Depends(analytics_group_by),
+    filters: Dict[str, Any] = Depends(analytics_filters),
+):
+    """
+    Изменение медианной цены за неделю относительно предыдущей недели.
+    """
+    try:
+        groups = await price_analytics.week_over_week(metric, group_by, filters, week)
+    except Exception as e:
+        logger.error(f"Internal server error while reading price deltas: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении аналитики цен: {str(e)}")
+    return PriceDeltaResponse(metric=metric, groups=groups)
+
+
+@router.post("/api/analytics/refresh")
+async def refresh_price_analytics(rebuild: bool = Query(False, description="Пересчитать агрегаты с нуля")):
+    """
+    Обновление агрегатов цен новыми наблюдениями или полный пересчет.
+    """
+    try:
+        processed = await (price_analytics.rebuild() if rebuild else price_analytics.refresh())
+    except Exception as e:
+        logger.error(f"Internal server error while refreshing price analytics: {e}")
+        raise InternalServerErrorException(f"Ошибка при обновлении аналитики цен: {str(e)}")
+    return {"processed": processed}
+
+
+@router.post("/api/subscriptions", response_model=SavedSearch)
+async def create_saved_search(search: SavedSearchCreate):
+    """
+    Сохранение поиска: уведомления о новых объявлениях, подходящих под фильтры.
+    """
+    filters = search.model_dump(exclude={'recipient', 'channel'})
+    try:
+        created = await saved_searches.create(search.recipient, search.channel, filters)
+    except Exception as e:
+        logger.error(f"Internal server error while saving search: {e}")
+        raise InternalServerErrorException(f"Ошибка при сохранении поиска: {str(e)}")
+    return SavedSearch(id=created.id, **search.model_dump())
+
+
+@router.get("/api/subscriptions", response_model=List[SavedSearch])
+async def get_saved_searches(recipient: str = Query(..., min_length=1, description="Email или chat id в Telegram")):
+    """
+    Сохраненные поиски получателя.
+    """
+    try:
+        searches = await saved_searches.for_recipient(recipient)
+    except Exception as e:
+        logger.error(f"Internal server error while reading saved searches: {e}")
+        raise InternalServerErrorException(f"Ошибка при получении сохраненных поисков: {str(e)}")
+    return [SavedSearch.model_validate(search, from_attributes=True) for search in searches]
+
+
+@router.delete("/api/subscriptions/{search_id}")
+async def delete_saved_search(search_id: int):
+    """
+    Отключение сохраненного поиска.
+    """
+    try:
+        deleted = await saved_searches.delete(search_id)
+    except Exception as e:
+        logger.error(f"Internal server error while deleting saved search: {e}")
+        raise InternalServerErrorException(f"Ошибка при удалении сохраненного поиска: {str(e)}")
+    if not deleted:
+        raise SavedSearchNotFoundException(search_id)
+    return {"message": "Saved search deleted successfully"}
+
+
+@router.post("/api/notifications/replay")
+async def replay_failed_notifications():
+    """
+    Повторная отправка сохраненных неотправленных уведомлений.
+    """
+    try:
+        replayed = await dispatcher.replay_failed()
+    except Exception as e:
+        logger.error(f"Internal server error while replaying notifications: {e}")
+        raise InternalServerErrorException(f"Ошибка при повторной отправке уведомлений: {str(e)}")
+    return {"replayed": replayed, "stats": dispatcher.stats}
+
+
+@router.get("/api/parsers/")
+async def get_parsers():
+    """
+    Расписание и состояние последних запусков парсеров.
+    """
+    return {"enabled": scheduler.SCHEDULER_ENABLED, "parsers": scheduler.status()}
+
+
+@router.post("/api/parsers/{name}/", status_code=202)
+async def run_parser(name: str, full: bool = Query(False, description="Полный обход без остановки на виденных объявлениях")):
+    """
+    Внеочередной запуск парсера в фоне.
+    """
+    if name not in scheduler.jobs:
+        raise ParserNotFoundException(name)
+    if not scheduler.trigger(name, full=full):
+        raise ParserAlreadyRunningException(name)
+    return {"message": f"Parser {name} started", "full": full}
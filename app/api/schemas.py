@@ -1,20 +1,33 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from datetime import date, datetime
+from decimal import Decimal
+
+from pydantic import BaseModel, Field, field_serializer
+from typing import Any, Dict, List, Literal, Optional
+
+DealType = Literal["sale", "rent"]
 
 class ListingBase(BaseModel):
-    title: str = Field(..., description="Заголовок объявления")
-    description: str = Field(..., description="Описание объявления")
-    price: float = Field(..., description="Цена объявления")
+    title: str = Field(..., min_length=1, description="Заголовок объявления")
+    description: str = Field(..., min_length=1, description="Описание объявления")
+    price: float = Field(..., gt=0, description="Цена объявления")
+    deal_type: DealType = Field(..., description="Тип сделки (sale или rent)")
+    rooms: Optional[int] = Field(None, gt=0, description="Количество комнат")
+    area: Optional[float] = Field(None, gt=0, description="Площадь объекта, м²")
     location: str = Field(..., description="Местоположение объекта")
     url: Optional[str] = Field(None, description="Ссылка на объявление")
+    source: Optional[str] = Field(None, description="Источник объявления (avito, cian)")
+    external_id: Optional[str] = Field(None, description="Идентификатор объявления в источнике, по умолчанию URL")
 
 class ListingCreate(ListingBase):
     pass
 
 class ListingUpdate(BaseModel):
-    title: Optional[str] = Field(None, description="Заголовок объявления")
-    description: Optional[str] = Field(None, description="Описание объявления")
-    price: Optional[float] = Field(None, description="Цена объявления")
+    title: Optional[str] = Field(None, min_length=1, description="Заголовок объявления")
+    description: Optional[str] = Field(None, min_length=1, description="Описание объявления")
+    price: Optional[float] = Field(None, gt=0, description="Цена объявления")
+    deal_type: Optional[DealType] = Field(None, description="Тип сделки (sale или rent)")
+    rooms: Optional[int] = Field(None, gt=0, description="Количество комнат")
+    area: Optional[float] = Field(None, gt=0, description="Площадь объекта, м²")
     location: Optional[str] = Field(None, description="Местоположение объекта")
     url: Optional[str] = Field(None, description="Ссылка на объявление")
 
@@ -23,3 +36,108 @@ class Listing(ListingBase):
 
 class ListingsResponse(BaseModel):
     listings: List[Listing] = Field(..., description="Список объявлений")
+
+class ListingsPage(BaseModel):
+    listings: List[Dict[str, Any]] = Field(..., description="Объявления страницы (только запрошенные колонки)")
+    next_cursor: Optional[int] = Field(None, description="Курсор следующей страницы, None на последней странице")
+
+    @field_serializer("listings")
+    def serialize_listings(self, listings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # DECIMAL-колонки приходят из драйвера как Decimal; в JSON отдаем числа
+        return [
+            {key: float(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+            for row in listings
+        ]
+
+class FieldError(BaseModel):
+    field: str = Field(..., description="Поле объявления; пустая строка — ошибка всей строки")
+    type: str = Field(..., description="Тип ошибки в терминах pydantic (missing, greater_than, literal_error, ...)")
+    message: str = Field(..., description="Описание ошибки")
+
+class BulkListingResult(BaseModel):
+    index: int = Field(..., description="Порядковый номер строки в пакете")
+    accepted: bool = Field(..., description="Принята ли строка")
+    error: Optional[str] = Field(None, description="Причина отклонения строки")
+    errors: Optional[List[FieldError]] = Field(None, description="Ошибки по полям")
+
+class BulkListingResponse(BaseModel):
+    accepted: int = Field(..., description="Количество принятых объявлений")
+    rejected: int = Field(..., description="Количество отклоненных объявлений")
+    inserted: int = Field(0, description="Количество новых объявлений")
+    updated: int = Field(0, description="Количество обновленных объявлений")
+    unchanged: int = Field(0, description="Количество объявлений без изменений, пропущенных без записи")
+    results: List[BulkListingResult] = Field(..., description="Результат по каждой строке пакета")
+
+class HistogramBin(BaseModel):
+    lower: float = Field(..., description="Нижняя граница корзины")
+    upper: float = Field(..., description="Верхняя граница корзины")
+    count: int = Field(..., description="Количество наблюдений")
+
+class PriceStats(BaseModel):
+    deal_type: Optional[str] = Field(None, description="Тип сделки")
+    rooms: Optional[int] = Field(None, description="Количество комнат")
+    district: Optional[str] = Field(None, description="Район")
+    observations: int = Field(..., description="Количество наблюдений цены")
+    mean: float = Field(..., description="Среднее значение")
+    median: float = Field(..., description="Медиана")
+    p10: float = Field(..., description="10-й процентиль")
+    p25: float = Field(..., description="25-й процентиль")
+    p75: float = Field(..., description="75-й процентиль")
+    p90: float = Field(..., description="90-й процентиль")
+    histogram: Optional[List[HistogramBin]] = Field(None, description="Непустые корзины гистограммы")
+
+class PriceStatsResponse(BaseModel):
+    metric: str = Field(..., description="Метрика: price или price_per_m2")
+    weeks: int = Field(..., description="Глубина окна в неделях")
+    groups: List[PriceStats] = Field(..., description="Статистика по группам")
+
+class PriceDelta(BaseModel):
+    deal_type: Optional[str] = Field(None, description="Тип сделки")
+    rooms: Optional[int] = Field(None, description="Количество комнат")
+    district: Optional[str] = Field(None, description="Район")
+    week_start: date = Field(..., description="Понедельник сравниваемой недели")
+    current_median: Optional[float] = Field(None, description="Медиана за неделю")
+    previous_median: Optional[float] = Field(None, description="Медиана за предыдущую неделю")
+    delta: Optional[float] = Field(None, description="Изменение медианы")
+    delta_pct: Optional[float] = Field(None, description="Изменение медианы, %")
+    current_observations: int = Field(..., description="Наблюдений за неделю")
+    previous_observations: int = Field(..., description="Наблюдений за предыдущую неделю")
+
+class PriceDeltaResponse(BaseModel):
+    metric: str = Field(..., description="Метрика: price или price_per_m2")
+    groups: List[PriceDelta] = Field(..., description="Изменения по группам")
+
+class SavedSearchCreate(BaseModel):
+    recipient: str = Field(..., min_length=1, description="Email или chat id в Telegram")
+    channel: Literal["email", "telegram"] = Field(..., description="Канал уведомлений")
+    deal_type: Optional[DealType] = Field(None, description="Тип сделки")
+    rooms: Optional[int] = Field(None, ge=0, description="Количество комнат")
+    location: Optional[str] = Field(None, min_length=1, description="Начало строки местоположения")
+    price_min: Optional[float] = Field(None, ge=0, description="Минимальная цена")
+    price_max: Optional[float] = Field(None, ge=0, description="Максимальная цена")
+    area_min: Optional[float] = Field(None, ge=0, description="Минимальная площадь, м²")
+    area_max: Optional[float] = Field(None, ge=0, description="Максимальная площадь, м²")
+
+class SavedSearch(SavedSearchCreate):
+    id: int = Field(..., description="Идентификатор сохраненного поиска")
+
+class ListingChange(BaseModel):
+    seq: int = Field(..., description="Номер изменения")
+    listing_id: int = Field(..., description="Идентификатор объявления")
+    op: Literal["insert", "update", "price", "delete"] = Field(..., description="Тип изменения")
+    price: Optional[float] = Field(None, description="Цена после изменения")
+    old_price: Optional[float] = Field(None, description="Цена до изменения (для price и delete)")
+    changed_at: datetime = Field(..., description="Время изменения")
+    listing: Optional[Dict[str, Any]] = Field(None, description="Текущее состояние объявления, None для удаленных")
+
+    @field_serializer("listing")
+    def serialize_listing(self, listing: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if listing is None:
+            return None
+        return {key: float(value) if isinstance(value, Decimal) else value for key, value in listing.items()}
+
+class ChangesResponse(BaseModel):
+    changes: List[ListingChange] = Field(..., description="Изменения по возрастанию seq")
+    next_since: int = Field(..., description="Значение since для следующего запроса")
+    head: int = Field(..., description="Последний номер изменения на момент запроса")
+    has_more: bool = Field(..., description="Есть ли изменения после этой страницы")
@@ -0,0 +1,92 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+from fastapi import Request
+
+from .exceptions import InvalidBulkPayloadHTTPException
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def is_ndjson_request(request: Request) -> bool:
+    """
+    Проверяет, передано ли тело запроса в формате NDJSON.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type in NDJSON_CONTENT_TYPES
+
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """
+    Построчное чтение NDJSON из потока, без загрузки всего тела в память.
+    """
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def iter_bulk_payload(request: Request) -> AsyncIterator[Tuple[Any, Optional[str]]]:
+    """
+    Разбор пакета объявлений из JSON-массива или NDJSON-потока.
+
+    :param request: Входящий HTTP-запрос
+    :return: Пары (сырой объект, ошибка разбора); ошибка не None только для битых строк NDJSON
+    """
+    if is_ndjson_request(request):
+        async for line in _iter_ndjson_lines(request):
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, f"Некорректная строка JSON: {e}"
+        return
+
+    try:
+        payload = json.loads(await request.body())
+    except ValueError as e:
+        raise InvalidBulkPayloadHTTPException(f"Некорректный JSON: {e}")
+
+    if not isinstance(payload, list):
+        raise InvalidBulkPayloadHTTPException("Ожидается JSON-массив объявлений.")
+
+    for item in payload:
+        yield item, None
+
+
+def json_default(value: Any) -> Any:
+    """
+    Сериализация типов, которые возвращает драйвер MySQL, для json.dumps.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def iter_ndjson(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """
+    Построчная сериализация потока строк в NDJSON.
+    """
+    async for row in rows:
+        yield json.dumps(row, ensure_ascii=False, default=json_default).encode("utf-8") + b"\n"
+
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[Union[int, str]] = None) -> bytes:
+    """
+    Событие Server-Sent Events; data сериализуется в JSON одной строкой.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=json_default)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
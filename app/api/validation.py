@@ -0,0 +1,367 @@
+import math
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import (
+    Annotated, Any, Dict, List, Literal, NamedTuple, Optional, Sequence, Tuple, Type, Union, get_args, get_origin,
+)
+
+import annotated_types
+import numpy as np
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from .schemas import FieldError, ListingCreate
+
+class _Missing:
+    """
+    Отсутствующее в строке поле.
+    """
+
+
+_MISSING = _Missing()
+
+KIND_STR = 'str'
+KIND_INT = 'int'
+KIND_FLOAT = 'float'
+KIND_LITERAL = 'literal'
+# Поле любого другого типа или с ограничениями, которые не проверяются по столбцу
+KIND_OTHER = 'other'
+
+_BOUNDS = (
+    (annotated_types.Gt, 'gt', 'greater_than', "greater than", np.greater),
+    (annotated_types.Ge, 'ge', 'greater_than_equal', "greater than or equal to", np.greater_equal),
+    (annotated_types.Lt, 'lt', 'less_than', "less than", np.less),
+    (annotated_types.Le, 'le', 'less_than_equal', "less than or equal to", np.less_equal),
+)
+
+
+def _objects(values: Sequence[Any]) -> np.ndarray:
+    """
+    Одномерный массив объектов без попытки NumPy разобрать вложенные списки.
+    """
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _types(values: Sequence[Any]) -> np.ndarray:
+    """
+    Массив типов значений: сравнение с типом (types == str) дает маску столбца за один проход.
+    """
+    return np.fromiter(map(type, values), dtype=object, count=len(values))
+
+
+class ValidationIssue(NamedTuple):
+    """
+    Ошибка в строке пакета. Типы и тексты ошибок совпадают с pydantic.
+    """
+    index: int
+    field: str
+    type: str
+    message: str
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """
+    Ограничения поля, прочитанные из pydantic-схемы.
+
+    adapter приводит одно значение самим pydantic: для str, int, float и Literal —
+    только тип (ограничения проверяются по столбцу), для KIND_OTHER — тип вместе
+    с ограничениями.
+    """
+    name: str
+    kind: str
+    required: bool
+    nullable: bool
+    default: Any = None
+    bounds: Tuple[Tuple[str, Any, str, str, Any], ...] = ()
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    choices: Tuple[Any, ...] = ()
+    adapter: Optional[TypeAdapter] = field(default=None, compare=False, repr=False)
+
+
+def _plural(count: int, word: str) -> str:
+    return f"{count} {word}{'' if count == 1 else 's'}"
+
+
+def field_rules(model: Type[BaseModel]) -> List[FieldRule]:
+    """
+    Ограничения полей модели: тип, обязательность, допустимость None и ограничения
+    Field. Поля str, int, float и Literal с ограничениями gt/ge/lt/le и
+    min_length/max_length проверяются по столбцу, остальные — pydantic по одному значению.
+    """
+    rules = []
+    for name, info in model.model_fields.items():
+        annotation = info.annotation
+        nullable = False
+        if get_origin(annotation) is Union:
+            args = [arg for arg in get_args(annotation) if arg is not type(None)]
+            nullable = len(args) < len(get_args(annotation))
+            annotation = args[0] if len(args) == 1 else Union[tuple(args)]
+        required = info.is_required()
+        default = None if required else info.get_default(call_default_factory=True)
+
+        bounds, min_length, max_length, columnar = [], None, None, True
+        for constraint in info.metadata:
+            if isinstance(constraint, annotated_types.MinLen):
+                min_length = constraint.min_length
+                continue
+            if isinstance(constraint, annotated_types.MaxLen):
+                max_length = constraint.max_length
+                continue
+            for cls, attribute, error_type, text, compare in _BOUNDS:
+                if isinstance(constraint, cls):
+                    limit = getattr(constraint, attribute)
+                    bounds.append((error_type, limit, f"Input should be {text} {limit}", attribute, compare))
+                    break
+            else:
+                columnar = False
+
+        choices: Tuple[Any, ...] = ()
+        if columnar and get_origin(annotation) is Literal:
+            kind, choices = KIND_LITERAL, get_args(annotation)
+        elif columnar and annotation in (str, int, float):
+            kind = annotation.__name__
+        else:
+            adapter = TypeAdapter(Annotated[(annotation, *info.metadata)] if info.metadata else annotation)
+            rules.append(FieldRule(name=name, kind=KIND_OTHER, required=required, nullable=nullable,
+                                   default=default, adapter=adapter))
+            continue
+
+        rules.append(FieldRule(
+            name=name, kind=kind, required=required, nullable=nullable, default=default,
+            bounds=tuple(bounds), min_length=min_length, max_length=max_length, choices=choices,
+            adapter=TypeAdapter(annotation),
+        ))
+    return rules
+
+
+def _coerce(adapter: TypeAdapter, value: Any) -> Tuple[Any, List[Tuple[str, str]]]:
+    """
+    Медленный путь: значение приводится самим pydantic (lax mode), ошибки — как у model_validate.
+    """
+    try:
+        return adapter.validate_python(value), []
+    except ValidationError as e:
+        return None, [(error['type'], error['msg']) for error in e.errors()]
+
+
+def _as_float(value: Any) -> float:
+    """
+    Значение для сравнения с ограничениями; целые вне диапазона float64 — бесконечность со знаком.
+    """
+    try:
+        return float(value)
+    except OverflowError:
+        return math.inf if value > 0 else -math.inf
+
+
+def _plain_number(text: str) -> bool:
+    """
+    Строка, которую float() разбирает так же, как pydantic: ASCII без '_'.
+    Unicode-цифры и разделители '_' pydantic разбирает иначе, такие строки идут медленным путем.
+    """
+    return text.isascii() and '_' not in text
+
+
+class BatchValidator:
+    """
+    Пакетная проверка объявлений по столбцам без создания модели на каждую строку.
+
+    Ограничения берутся из pydantic-схемы (Field gt/ge/lt/le, min_length, Literal),
+    поэтому объявляются один раз. Каждое поле проверяется за один проход по столбцу:
+    значения обычных типов собираются в массивы NumPy и сравниваются с ограничениями
+    векторно. Быстрым путем идут int и float для чисел, ASCII-строки чисел без '_'
+    для float-полей, str для строк и значения Literal. Остальное (bytes, bool, Decimal,
+    Unicode-цифры, целые вне диапазона float64) приводит сам pydantic по одному
+    значению, поэтому принятые строки, значения и ошибки совпадают с model_validate.
+    Ошибки возвращаются списком, без исключений, с типами и текстами pydantic.
+    """
+
+    def __init__(self, model: Type[BaseModel] = ListingCreate):
+        self.model = model
+        self.rules = field_rules(model)
+        self._model_error = f"Input should be a valid dictionary or instance of {model.__name__}"
+
+    def validate(self, rows: Sequence[Any]) -> Tuple[List[Dict[str, Any]], List[int], List[ValidationIssue]]:
+        """
+        Проверка пакета.
+
+        Returns:
+            Tuple: Нормализованные корректные строки (как model_dump), их индексы
+            в пакете и ошибки, упорядоченные по строке и порядку полей в схеме.
+        """
+        count = len(rows)
+        issues: List[Tuple[int, int, str, str, str]] = []
+        is_dict = _types(rows) == dict
+        all_dicts = bool(is_dict.all())
+        if not all_dicts:
+            is_dict |= np.fromiter((isinstance(row, dict) for row in rows), bool, count)
+            for index in np.flatnonzero(~is_dict):
+                issues.append((int(index), -1, '', 'model_type', self._model_error))
+
+        # Строки, которые нельзя отдать копией исходного словаря: лишние или отсутствующие
+        # ключи, приведенные значения
+        changed = np.ones(count, bool)
+        if all_dicts:
+            changed = np.fromiter(map(len, rows), np.int64, count) != len(self.rules)
+        columns = []
+        for order, rule in enumerate(self.rules):
+            if all_dicts:
+                column = list(map(dict.get, rows, repeat(rule.name, count), repeat(_MISSING, count)))
+            else:
+                column = [row.get(rule.name, _MISSING) if ok else None for row, ok in zip(rows, is_dict)]
+            columns.append(self._check_column(rule, order, column, is_dict, changed, issues))
+
+        invalid = ~is_dict
+        if issues:
+            invalid[[issue[0] for issue in issues]] = True
+        valid_indexes = np.flatnonzero(~invalid)
+
+        names = [rule.name for rule in self.rules]
+        rebuild = changed[valid_indexes]
+        positions = valid_indexes[rebuild]
+        selected = [_objects(column)[positions] for column in columns]
+        rebuilt = (dict(zip(names, values)) for values in zip(*selected))
+        valid = [next(rebuilt) if flag else rows[index].copy()
+                 for index, flag in zip(valid_indexes.tolist(), rebuild.tolist())]
+
+        issues.sort(key=lambda issue: (issue[0], issue[1]))
+        errors = [ValidationIssue(index, field, error_type, message) for index, _, field, error_type, message in issues]
+        return valid, valid_indexes.tolist(), errors
+
+    def _check_column(self, rule: FieldRule, order: int, column: List[Any], is_dict: np.ndarray,
+                      changed: np.ndarray, issues: List[Tuple[int, int, str, str, str]]) -> List[Any]:
+        """
+        Проверка одного столбца. Приведенные значения записываются в column,
+        строки с ними отмечаются в changed.
+        """
+        count = len(column)
+        types = _types(column)
+        missing = (types == _Missing) & is_dict
+        if missing.any():
+            if rule.required:
+                for index in np.flatnonzero(missing):
+                    issues.append((int(index), order, rule.name, 'missing', "Field required"))
+            for index in np.flatnonzero(missing):
+                column[index] = rule.default
+            types[missing] = type(rule.default)
+            changed |= missing
+        check = is_dict & ~missing
+        if rule.nullable:
+            check &= types != type(None)
+
+        def fail(index: int, error_type: str, message: str):
+            issues.append((index, order, rule.name, error_type, message))
+            check[index] = False
+
+        def coerce(index: int) -> bool:
+            value, errors = _coerce(rule.adapter, column[index])
+            for error_type, message in errors:
+                fail(index, error_type, message)
+            if errors:
+                return False
+            column[index] = value
+            changed[index] = True
+            return True
+
+        if rule.kind == KIND_OTHER:
+            for index in np.flatnonzero(check).tolist():
+                coerce(index)
+            return column
+
+        if rule.kind == KIND_LITERAL:
+            values = _objects(column)
+            allowed = np.zeros(count, bool)
+            for choice in rule.choices:
+                allowed |= values == choice
+            allowed &= types == type(rule.choices[0])
+            for index in np.flatnonzero(check & ~allowed).tolist():
+                coerce(index)
+            return column
+
+        if rule.kind == KIND_STR:
+            for index in np.flatnonzero(check & (types != str)).tolist():
+                coerce(index)
+            if rule.min_length == 1 and rule.max_length is None:
+                # Самое частое ограничение — непустая строка — проверяется сравнением без подсчета длин
+                for index in np.flatnonzero(check & (_objects(column) == '')):
+                    fail(int(index), 'string_too_short', "String should have at least 1 character")
+            elif rule.min_length is not None or rule.max_length is not None:
+                lengths = np.zeros(count, np.int64)
+                positions = np.flatnonzero(check)
+                lengths[positions] = np.fromiter(map(len, _objects(column)[positions]), np.int64, len(positions))
+                if rule.min_length is not None:
+                    message = f"String should have at least {_plural(rule.min_length, 'character')}"
+                    for index in np.flatnonzero(check & (lengths < rule.min_length)):
+                        fail(int(index), 'string_too_short', message)
+                if rule.max_length is not None:
+                    message = f"String should have at most {_plural(rule.max_length, 'character')}"
+                    for index in np.flatnonzero(check & (lengths > rule.max_length)):
+                        fail(int(index), 'string_too_long', message)
+            return column
+
+        # Числа: быстрый путь для int/float через astype, остальное приводит pydantic
+        fast = types == int
+        if rule.kind == KIND_FLOAT:
+            fast |= types == float
+        numbers = np.full(count, np.nan)
+        positions = np.flatnonzero(fast)
+        try:
+            numbers[positions] = _objects(column)[positions].astype(np.float64)
+        except OverflowError:
+            # Целые вне диапазона float64 (цена 10**400) уходят на медленный путь:
+            # для float-поля это ошибка float_type, int-поле pydantic принимает
+            for index in positions.tolist():
+                try:
+                    numbers[index] = float(column[index])
+                except OverflowError:
+                    fast[index] = False
+        slow = check & ~fast
+        if rule.kind == KIND_FLOAT:
+            # Числа строками (частый случай у парсеров) переводятся одним проходом float(),
+            # который, как и pydantic, допускает пробелы по краям
+            positions = np.array([index for index in np.flatnonzero(slow & (types == str)).tolist()
+                                  if _plain_number(column[index])], np.int64)
+            try:
+                converted = np.fromiter(map(float, _objects(column)[positions]), np.float64, len(positions))
+                numbers[positions] = converted
+                for index, value in zip(positions.tolist(), converted.tolist()):
+                    column[index] = value
+                slow[positions] = False
+                changed[positions] = True
+            except ValueError:
+                pass
+            # Как и pydantic, целые значения float-полей отдаем как float
+            ints = np.flatnonzero(check & fast & (types == int))
+            for index, value in zip(ints.tolist(), numbers[ints].tolist()):
+                column[index] = value
+            changed[ints] = True
+        for index in np.flatnonzero(slow).tolist():
+            if coerce(index):
+                numbers[index] = _as_float(column[index])
+        for error_type, limit, message, _, compare in rule.bounds:
+            with np.errstate(invalid='ignore'):
+                passed = compare(numbers, limit)
+            for index in np.flatnonzero(check & ~passed):
+                fail(int(index), error_type, message)
+        return column
+
+
+def errors_by_row(errors: Sequence[ValidationIssue]) -> Dict[int, List[FieldError]]:
+    """
+    Ошибки пакета, сгруппированные по индексу строки.
+    """
+    grouped: Dict[int, List[FieldError]] = {}
+    for issue in errors:
+        grouped.setdefault(issue.index, []).append(FieldError(field=issue.field, type=issue.type, message=issue.message))
+    return grouped
+
+
+def format_field_errors(errors: Sequence[FieldError]) -> str:
+    """
+    Короткое описание ошибок строки: "поле: сообщение; ...".
+    """
+    return "; ".join(f"{error.field}: {error.message}" if error.field else error.message for error in errors)
+
+
+listing_validator = BatchValidator(ListingCreate)
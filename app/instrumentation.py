@@ -0,0 +1,437 @@
+import bisect
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from decouple import config
+from loguru import logger
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Маршрут для запросов, не совпавших ни с одним обработчиком: отдельная метка на каждый
+# неизвестный путь раздула бы число рядов метрик
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class InstrumentationConfig:
+    """
+    Класс конфигурации метрик и профилировщика.
+    """
+    # Сбор метрик и маршрут /metrics; при False маршрут отвечает 404
+    METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+    # Токен для /metrics (Authorization: Bearer <токен>); пустое значение — доступ без авторизации
+    METRICS_TOKEN = config('METRICS_TOKEN', default='')
+    # Добавлять заголовок Server-Timing со временем обработки и временем в базе
+    SERVER_TIMING = config('SERVER_TIMING', default=False, cast=bool)
+    # Токен заголовка X-Profile; пустое значение — профилирование по запросу выключено
+    PROFILE_TOKEN = config('PROFILE_TOKEN', default='')
+    PROFILE_DIR = config('PROFILE_DIR', default='profiles')
+    # Период опроса стека потока событийного цикла, сек
+    PROFILE_INTERVAL = config('PROFILE_INTERVAL', default=0.002, cast=float)
+
+
+class LatencyHistogram:
+    """
+    Гистограмма задержек с фиксированными корзинами.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield '+Inf' if bound == float('inf') else str(bound), total
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Накопительные счетчики по корзинам (le), как в Prometheus.
+        """
+        return {'buckets': dict(self.cumulative()), 'count': self.count, 'sum': round(self.sum, 6)}
+
+
+class MetricValue:
+    """
+    Значение счетчика или показателя с одним набором меток.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class MetricFamily:
+    """
+    Метрика с именем и набором меток; значения по каждому сочетанию меток создаются при первом обращении.
+    Метрика без меток сама принимает observe/inc/set.
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> Any:
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        return list(self._children.items())
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+class Counter(MetricFamily):
+    type = 'counter'
+
+    def _new_child(self) -> MetricValue:
+        return MetricValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    @property
+    def total(self) -> float:
+        return sum(child.value for child in self._children.values())
+
+    def samples(self) -> Iterator[str]:
+        for key, child in self.children():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(child.value)}"
+
+
+class Gauge(Counter):
+    """
+    Показатель. Если задан callback, значения считываются им в момент выгрузки:
+    число для метрики без меток или словарь {кортеж меток: значение}.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def children(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        if self.callback is None:
+            return super().children()
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        result = []
+        for key, value in values.items():
+            child = MetricValue()
+            child.set(value)
+            result.append((tuple(str(label) for label in key), child))
+        return result
+
+
+class Histogram(MetricFamily):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self) -> LatencyHistogram:
+        return LatencyHistogram(self.buckets)
+
+    def observe(self, seconds: float):
+        self.labels().observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Сводка по всем сочетаниям меток в формате LatencyHistogram.snapshot.
+        """
+        merged = LatencyHistogram(self.buckets)
+        for child in self._children.values():
+            merged.counts = [total + count for total, count in zip(merged.counts, child.counts)]
+            merged.count += child.count
+            merged.sum += child.sum
+        return merged.snapshot()
+
+    def samples(self) -> Iterator[str]:
+        for key, child in self.children():
+            for bound, total in child.cumulative():
+                bucket = _format_labels(self.labelnames, key, 'le="' + bound + '"')
+                yield f"{self.name}_bucket{bucket} {total}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_number(round(child.sum, 6))}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса и выгрузка в текстовом формате Prometheus.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+
+    def register(self, family: MetricFamily) -> MetricFamily:
+        existing = self._families.get(family.name)
+        if existing is not None:
+            if type(existing) is not type(family) or existing.labelnames != family.labelnames:
+                raise ValueError(f"Метрика {family.name} уже зарегистрирована с другим типом или метками.")
+            return existing
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families.values():
+            try:
+                lines.extend(family.render())
+            except Exception as e:
+                logger.error(f"Ошибка выгрузки метрики {family.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'Обработанные HTTP-запросы', ('route', 'method', 'status'))
+http_errors = registry.counter(
+    'http_request_errors_total', 'Запросы, завершившиеся ответом 5xx или исключением', ('route', 'method'))
+http_in_flight = registry.gauge(
+    'http_requests_in_flight', 'Запросы в обработке', ('method',))
+http_latency = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ('route', 'method'))
+http_db_time = registry.histogram(
+    'http_request_db_seconds', 'Суммарное время запросов к базе за HTTP-запрос', ('route',))
+
+# Время по категориям (db, ...) в рамках текущего HTTP-запроса, для Server-Timing и http_request_db_seconds
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+
+def add_timing(name: str, seconds: float):
+    """
+    Учет времени в рамках текущего HTTP-запроса; вне запроса ничего не делает.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    """
+    Проверка заголовка Authorization запроса к /metrics.
+    """
+    token = InstrumentationConfig.METRICS_TOKEN
+    if not token:
+        return True
+    scheme, _, credentials = (authorization or '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+    return f"{module}:{code.co_qualname}"
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик потока событийного цикла.
+
+    Фоновый поток раз в PROFILE_INTERVAL снимает стек целевого потока через
+    sys._current_frames() и копит число попаданий каждого стека. Результат
+    сохраняется в свернутом формате (frame;frame;frame count), который принимают
+    flamegraph.pl, speedscope и inferno. Запросы обслуживаются одним потоком,
+    поэтому в профиль попадают и конкурентные запросы, выполнявшиеся в то же время.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.collapsed())
+
+
+def _route_template(scope) -> str:
+    route = scope.get('route')
+    return getattr(route, 'path', None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware(InstrumentationConfig):
+    """
+    ASGI-middleware: задержки, число запросов в обработке и ошибки по шаблонам маршрутов.
+
+    Метки маршрута берутся из шаблона (/api/listings/{listing_id}/), а не из фактического
+    пути, поэтому число рядов ограничено числом обработчиков. Запрос с заголовком
+    X-Profile, равным PROFILE_TOKEN, выполняется под сэмплирующим профилировщиком;
+    путь к свернутому профилю возвращается в заголовке X-Profile-File.
+    """
+    _profiling = False
+
+    def __init__(self, app):
+        self.app = app
+
+    def _profile_requested(self, scope) -> bool:
+        if not self.PROFILE_TOKEN or MetricsMiddleware._profiling:
+            return False
+        for name, value in scope.get('headers', ()):
+            if name == b'x-profile':
+                return hmac.compare_digest(value, self.PROFILE_TOKEN.encode())
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        status = 500
+        profiler = None
+        profile_path = None
+        if self._profile_requested(scope):
+            MetricsMiddleware._profiling = True
+            slug = re.sub(r'[^\w-]+', '_', scope['path']).strip('_') or 'root'
+            profile_path = os.path.join(self.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}.collapsed")
+            profiler = SamplingProfiler(threading.get_ident(), self.PROFILE_INTERVAL)
+            profiler.start()
+
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = list(message.get('headers', []))
+                if self.SERVER_TIMING:
+                    headers.append((b'server-timing', ', '.join(
+                        [f"app;dur={(time.perf_counter() - started) * 1000:.1f}"]
+                        + [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+                    ).encode()))
+                if profile_path is not None:
+                    headers.append((b'x-profile-file', profile_path.encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        http_in_flight.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.labels(method).dec()
+            _request_timings.reset(token)
+            route = _route_template(scope)
+            http_latency.labels(route, method).observe(elapsed)
+            http_requests.labels(route, method, status).inc()
+            http_db_time.labels(route).observe(timings.get('db', 0.0))
+            if status >= 500:
+                http_errors.labels(route, method).inc()
+            if profiler is not None:
+                profiler.stop()
+                MetricsMiddleware._profiling = False
+                try:
+                    profiler.dump(profile_path)
+                    logger.info(f"Профиль {method} {scope['path']}: {profiler.samples} сэмплов, {profile_path}")
+                except OSError as e:
+                    logger.error(f"Не удалось сохранить профиль {profile_path}: {e}")
@@ -0,0 +1,286 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from decouple import config
+from loguru import logger
+
+from app.parsers.utils import TokenBucket, backoff_delay
+from app.storage.database import DatabaseExecutor, statements
+
+from .matcher import Match
+
+STORE_FAILED_NOTIFICATION = statements.register('notifications.store_failed', """
+INSERT INTO notification_failures (channel, recipient, subject, body, error, attempts)
+VALUES (%s, %s, %s, %s, %s, %s)
+""")
+SELECT_FAILED_NOTIFICATIONS = statements.register('notifications.failed', """
+SELECT id, channel, recipient, subject, body FROM notification_failures
+WHERE replayed_at IS NULL
+ORDER BY id
+LIMIT %s
+""")
+
+DigestKey = Tuple[str, str]
+
+
+class NotificationConfig:
+    """
+    Класс конфигурации отправки уведомлений.
+    """
+    # Сообщения одному получателю, пришедшие за это окно, уходят одним дайджестом, сек
+    NOTIFY_COALESCE_WINDOW = config('NOTIFY_COALESCE_WINDOW', default=30, cast=float)
+    NOTIFY_DIGEST_MAX = config('NOTIFY_DIGEST_MAX', default=20, cast=int)
+    NOTIFY_QUEUE_SIZE = config('NOTIFY_QUEUE_SIZE', default=10000, cast=int)
+    NOTIFY_CONCURRENCY = config('NOTIFY_CONCURRENCY', default=4, cast=int)
+    NOTIFY_RETRIES = config('NOTIFY_RETRIES', default=3, cast=int)
+    NOTIFY_BACKOFF_BASE = config('NOTIFY_BACKOFF_BASE', default=1, cast=float)
+    NOTIFY_BACKOFF_MAX = config('NOTIFY_BACKOFF_MAX', default=60, cast=float)
+    NOTIFY_REPLAY_BATCH = config('NOTIFY_REPLAY_BATCH', default=1000, cast=int)
+
+
+class NotificationError(Exception):
+    """
+    Ошибка отправки. retryable=False — повтор не поможет (неверный адрес, бот заблокирован);
+    retry_after — задержка, которую попросил сам сервис.
+    """
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class NotificationBackend(ABC):
+    """
+    Канал доставки уведомлений. rate и burst задают token bucket канала.
+    """
+    channel: str
+    rate: float = 1.0
+    burst: float = 1.0
+
+    @abstractmethod
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        """
+        Отправка одного сообщения; при ошибке — NotificationError.
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class Notification:
+    """
+    Сообщение для получателя. key склеивает одинаковые сообщения внутри дайджеста
+    (например, одно объявление, совпавшее с несколькими поисками).
+    """
+    channel: str
+    recipient: str
+    subject: str
+    body: str
+    key: Optional[str] = None
+
+
+@dataclass
+class _Digest:
+    deadline: float
+    items: Dict[str, Notification] = field(default_factory=dict)
+
+
+def format_listing(listing: Dict[str, Any]) -> str:
+    parts = [listing.get('title') or 'Объявление']
+    details = []
+    if listing.get('price') is not None:
+        details.append(f"{float(listing['price']):,.0f} ₽".replace(',', ' '))
+    if listing.get('rooms') is not None:
+        details.append(f"{listing['rooms']}-комн.")
+    if listing.get('area') is not None:
+        details.append(f"{float(listing['area']):g} м²")
+    if details:
+        parts.append(', '.join(details))
+    if listing.get('location'):
+        parts.append(listing['location'])
+    if listing.get('url'):
+        parts.append(listing['url'])
+    return '\n'.join(parts)
+
+
+def build_digest(items: List[Notification]) -> Tuple[str, str]:
+    """
+    Тема и текст дайджеста; одиночное сообщение отправляется как есть.
+    """
+    if len(items) == 1:
+        return items[0].subject, items[0].body
+    return f"Новых объявлений по вашим поискам: {len(items)}", '\n\n'.join(item.body for item in items)
+
+
+class NotificationDispatcher(DatabaseExecutor, NotificationConfig):
+    """
+    Асинхронная отправка уведомлений.
+
+    Сообщения попадают в очередь и группируются по (канал, получатель): все, что пришло
+    получателю за NOTIFY_COALESCE_WINDOW, уходит одним дайджестом. Отправка по каждому
+    каналу ограничена token bucket'ом и NOTIFY_CONCURRENCY одновременных запросов,
+    временные ошибки повторяются с экспоненциальной задержкой, а неотправленные
+    сообщения сохраняются в notification_failures для повторной отправки через replay_failed.
+    """
+
+    def __init__(self, backends: Optional[List[NotificationBackend]] = None):
+        self.backends: Dict[str, NotificationBackend] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        for backend in backends or ():
+            self.register(backend)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.NOTIFY_QUEUE_SIZE)
+        self.stats = {'queued': 0, 'sent': 0, 'digests': 0, 'retries': 0, 'failed': 0}
+        self._pending: Dict[DigestKey, _Digest] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self._worker: Optional[asyncio.Task] = None
+
+    def register(self, backend: NotificationBackend):
+        self.backends[backend.channel] = backend
+        self.buckets[backend.channel] = TokenBucket(backend.rate, backend.burst)
+        self.semaphores[backend.channel] = asyncio.Semaphore(self.NOTIFY_CONCURRENCY)
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Остановка: накопленные дайджесты отправляются сразу, затем дожидаемся всех отправок.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        while not self.queue.empty():
+            self._add(self.queue.get_nowait())
+        self._flush(force=True)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        for backend in self.backends.values():
+            await backend.close()
+
+    async def submit(self, notification: Notification):
+        try:
+            self.queue.put_nowait(notification)
+            self.stats['queued'] += 1
+        except asyncio.QueueFull:
+            logger.warning(f"Очередь уведомлений переполнена, сообщение для {notification.recipient} сохранено")
+            await self._store_failed([notification], "Очередь уведомлений переполнена", 0)
+
+    async def notify_matches(self, matches: List[Match]):
+        """
+        Уведомления о совпадениях с сохраненными поисками; подходит как SavedSearchService.on_match.
+        """
+        for search, listing in matches:
+            await self.submit(Notification(
+                channel=search.channel,
+                recipient=search.recipient,
+                subject=f"Новое объявление: {listing.get('title') or ''}".strip(),
+                body=format_listing(listing),
+                key=listing.get('url') or listing.get('external_id') or format_listing(listing),
+            ))
+
+    async def replay_failed(self) -> int:
+        """
+        Повторная постановка в очередь сохраненных неотправленных сообщений.
+
+        Returns:
+            int: Количество сообщений, поставленных в очередь.
+        """
+        async with self.transaction() as cursor:
+            await cursor.execute(SELECT_FAILED_NOTIFICATIONS.sql, (self.NOTIFY_REPLAY_BATCH,))
+            rows = await cursor.fetchall()
+            if not rows:
+                return 0
+            await cursor.execute(
+                f"UPDATE notification_failures SET replayed_at = CURRENT_TIMESTAMP "
+                f"WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                [row[0] for row in rows]
+            )
+        for _, channel, recipient, subject, body in rows:
+            # Уже собранный дайджест отправляется целиком, без повторной склейки
+            await self.submit(Notification(channel, recipient, subject, body))
+        logger.info(f"Поставлено в очередь неотправленных уведомлений: {len(rows)}.")
+        return len(rows)
+
+    def _add(self, notification: Notification):
+        key = (notification.channel, notification.recipient)
+        digest = self._pending.get(key)
+        if digest is None:
+            digest = self._pending[key] = _Digest(time.monotonic() + self.NOTIFY_COALESCE_WINDOW)
+        digest.items.setdefault(notification.key or f"#{id(notification)}", notification)
+        if len(digest.items) >= self.NOTIFY_DIGEST_MAX:
+            digest.deadline = 0
+
+    def _flush(self, force: bool = False):
+        now = time.monotonic()
+        for key in [key for key, digest in self._pending.items() if force or digest.deadline <= now]:
+            digest = self._pending.pop(key)
+            task = asyncio.create_task(self._send_digest(*key, list(digest.items.values())))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _run(self):
+        while True:
+            timeout = None
+            if self._pending:
+                timeout = max(0.0, min(digest.deadline for digest in self._pending.values()) - time.monotonic())
+            try:
+                notification = await asyncio.wait_for(self.queue.get(), timeout)
+                self._add(notification)
+                # Забираем все, что уже лежит в очереди, до проверки сроков
+                while not self.queue.empty():
+                    self._add(self.queue.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+            self._flush()
+
+    async def _send_digest(self, channel: str, recipient: str, items: List[Notification]):
+        subject, body = build_digest(items)
+        backend = self.backends.get(channel)
+        if backend is None:
+            await self._store_failed(items, f"Канал {channel} не настроен", 0, subject, body)
+            return
+
+        error = None
+        attempt = 0
+        async with self.semaphores[channel]:
+            for attempt in range(self.NOTIFY_RETRIES + 1):
+                await self.buckets[channel].acquire()
+                try:
+                    await backend.send(recipient, subject, body)
+                    self.stats['sent'] += len(items)
+                    self.stats['digests'] += 1
+                    return
+                except NotificationError as e:
+                    error = e
+                    if not e.retryable:
+                        break
+                    if e.retry_after:
+                        self.buckets[channel].pause(e.retry_after)
+                except Exception as e:
+                    error = e
+                if attempt < self.NOTIFY_RETRIES:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(backoff_delay(attempt, self.NOTIFY_BACKOFF_BASE, self.NOTIFY_BACKOFF_MAX))
+
+        logger.warning(f"Не удалось отправить уведомление {channel}:{recipient}: {error}")
+        await self._store_failed(items, str(error), attempt + 1, subject, body)
+
+    async def _store_failed(self, items: List[Notification], error: str, attempts: int,
+                            subject: Optional[str] = None, body: Optional[str] = None):
+        self.stats['failed'] += len(items)
+        if subject is None:
+            subject, body = build_digest(items)
+        try:
+            await self.execute_query(STORE_FAILED_NOTIFICATION, (
+                items[0].channel, items[0].recipient, subject[:255], body, error[:512], attempts,
+            ))
+        except Exception as e:
+            logger.error(f"Не удалось сохранить неотправленное уведомление для {items[0].recipient}: {e}")
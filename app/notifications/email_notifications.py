@@ -0,0 +1,88 @@
+import asyncio
+import smtplib
+import ssl
+from email.message import EmailMessage
+from typing import List, Optional
+
+from decouple import config
+
+from .dispatcher import NotificationBackend, NotificationError
+
+
+class EmailConfig:
+    """
+    Класс конфигурации email-уведомлений.
+    """
+    SMTP_HOST = config('SMTP_HOST', default='')
+    SMTP_PORT = config('SMTP_PORT', default=587, cast=int)
+    SMTP_USER = config('SMTP_USER', default='')
+    SMTP_PASSWORD = config('SMTP_PASSWORD', default='')
+    SMTP_FROM = config('SMTP_FROM', default='')
+    SMTP_STARTTLS = config('SMTP_STARTTLS', default=True, cast=bool)
+    SMTP_TIMEOUT = config('SMTP_TIMEOUT', default=30, cast=float)
+    SMTP_POOL_SIZE = config('SMTP_POOL_SIZE', default=2, cast=int)
+    EMAIL_RATE = config('EMAIL_RATE', default=5, cast=float)
+    EMAIL_BURST = config('EMAIL_BURST', default=10, cast=float)
+
+
+class EmailBackend(NotificationBackend, EmailConfig):
+    """
+    Отправка писем через пул постоянных SMTP-соединений.
+
+    smtplib блокирующий, поэтому отправка идет в потоке; соединение после письма
+    возвращается в пул, а разорванное сервером переоткрывается при следующей отправке.
+    """
+    channel = 'email'
+
+    def __init__(self):
+        self.rate = self.EMAIL_RATE
+        self.burst = self.EMAIL_BURST
+        self._idle: List[smtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(self.SMTP_POOL_SIZE)
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.SMTP_HOST, self.SMTP_PORT, timeout=self.SMTP_TIMEOUT)
+        if self.SMTP_STARTTLS:
+            connection.starttls(context=ssl.create_default_context())
+        if self.SMTP_USER:
+            connection.login(self.SMTP_USER, self.SMTP_PASSWORD)
+        return connection
+
+    def _send_sync(self, connection: Optional[smtplib.SMTP], message: EmailMessage) -> smtplib.SMTP:
+        if connection is not None:
+            try:
+                connection.send_message(message)
+                return connection
+            except smtplib.SMTPServerDisconnected:
+                pass
+        connection = self._connect()
+        connection.send_message(message)
+        return connection
+
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        message = EmailMessage()
+        message['From'] = self.SMTP_FROM or self.SMTP_USER
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.set_content(body)
+
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                connection = await asyncio.to_thread(self._send_sync, connection, message)
+            except smtplib.SMTPRecipientsRefused as e:
+                raise NotificationError(f"Адрес отклонен сервером: {recipient}", retryable=False) from e
+            except smtplib.SMTPResponseException as e:
+                # 5xx — постоянная ошибка, 4xx — временная
+                raise NotificationError(f"SMTP {e.smtp_code}: {e.smtp_error!r}", retryable=e.smtp_code < 500) from e
+            except (smtplib.SMTPException, OSError) as e:
+                raise NotificationError(f"Ошибка SMTP: {e}") from e
+            self._idle.append(connection)
+
+    async def close(self) -> None:
+        while self._idle:
+            connection = self._idle.pop()
+            try:
+                await asyncio.to_thread(connection.quit)
+            except (smtplib.SMTPException, OSError):
+                pass
@@ -0,0 +1,337 @@
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from decouple import config
+from loguru import logger
+
+from app.storage.database import DatabaseExecutor, statements
+
+# Ключ раздела индекса: (тип сделки, комнаты); None — подписка не ограничивает поле
+PartitionKey = Tuple[Optional[str], Optional[int]]
+GroupKey = Tuple[Optional[str], Optional[int], str]
+
+Match = Tuple["SavedSearch", Dict[str, Any]]
+MatchSink = Callable[[List[Match]], Awaitable[None]]
+
+SELECT_SAVED_SEARCHES = statements.register('saved_searches.active', """
+SELECT id, recipient, channel, deal_type, rooms, location, price_min, price_max, area_min, area_max
+FROM saved_searches
+WHERE active = TRUE
+""")
+INSERT_SAVED_SEARCH = statements.register('saved_searches.insert', """
+INSERT INTO saved_searches (recipient, channel, deal_type, rooms, location, price_min, price_max, area_min, area_max)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+DEACTIVATE_SAVED_SEARCH = statements.register(
+    'saved_searches.deactivate', "UPDATE saved_searches SET active = FALSE WHERE id = %s AND active = TRUE"
+)
+
+
+class MatcherConfig:
+    """
+    Класс конфигурации сопоставления объявлений с сохраненными поисками.
+    """
+    # Как часто перечитывать подписки из базы (их могли создать другие процессы), сек
+    SAVED_SEARCHES_RELOAD = config('SAVED_SEARCHES_RELOAD', default=60, cast=float)
+
+
+def normalize_location(location: Optional[str]) -> str:
+    """
+    Местоположение для сравнения по префиксу: без регистра и лишних пробелов, как LIKE 'префикс%' в MySQL.
+    """
+    return ' '.join((location or '').lower().replace('ё', 'е').split())
+
+
+def _bound(value: Optional[float], default: float) -> float:
+    return default if value is None else float(value)
+
+
+@dataclass
+class SavedSearch:
+    """
+    Сохраненный поиск: получатель и те же фильтры, что у GET /api/listings/.
+    """
+    id: int
+    recipient: str
+    channel: str
+    deal_type: Optional[str] = None
+    rooms: Optional[int] = None
+    location: Optional[str] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    area_min: Optional[float] = None
+    area_max: Optional[float] = None
+    location_prefix: str = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.location_prefix = normalize_location(self.location)
+
+    def matches(self, listing: Dict[str, Any]) -> bool:
+        """
+        Прямая проверка одного объявления; эталон для индекса.
+        """
+        price, area = listing.get('price'), listing.get('area')
+        return (
+            (self.deal_type is None or listing.get('deal_type') == self.deal_type)
+            and (self.rooms is None or listing.get('rooms') == self.rooms)
+            and normalize_location(listing.get('location')).startswith(self.location_prefix)
+            and _bound(self.price_min, -np.inf) <= float(price) <= _bound(self.price_max, np.inf)
+            and (self.area_min is None and self.area_max is None
+                 or area is not None and _bound(self.area_min, -np.inf) <= float(area) <= _bound(self.area_max, np.inf))
+        )
+
+
+class IntervalTree:
+    """
+    Статическое центрированное дерево интервалов над массивами границ.
+
+    Поиск интервалов, содержащих точку, стоит O(log n + k): в каждом узле по пути
+    интервалы, пересекающие центр, берутся срезом после бинарного поиска.
+    Открытые границы задаются как -inf/inf.
+    """
+    LEAF_SIZE = 32
+
+    def __init__(self, lo: np.ndarray, hi: np.ndarray):
+        self.lo = lo
+        self.hi = hi
+        self.root = self._build(np.arange(len(lo), dtype=np.int64))
+
+    def _build(self, positions: np.ndarray):
+        lo, hi = self.lo[positions], self.hi[positions]
+        endpoints = np.concatenate((lo, hi))
+        endpoints = endpoints[np.isfinite(endpoints)]
+        if len(positions) <= self.LEAF_SIZE or not len(endpoints):
+            return positions
+
+        center = float(np.median(endpoints))
+        here = (lo <= center) & (hi >= center)
+        by_lo = positions[here][np.argsort(lo[here], kind='stable')]
+        by_hi = positions[here][np.argsort(-hi[here], kind='stable')]
+        return (
+            center,
+            by_lo, self.lo[by_lo],
+            by_hi, -self.hi[by_hi],
+            self._build(positions[hi < center]) if (hi < center).any() else None,
+            self._build(positions[lo > center]) if (lo > center).any() else None,
+        )
+
+    def stab(self, x: float) -> np.ndarray:
+        """
+        Позиции интервалов, содержащих x.
+        """
+        parts = []
+        node = self.root
+        while node is not None:
+            if isinstance(node, np.ndarray):
+                parts.append(node[(self.lo[node] <= x) & (self.hi[node] >= x)])
+                break
+            center, by_lo, lo_sorted, by_hi, neg_hi_sorted, left, right = node
+            if x < center:
+                parts.append(by_lo[:np.searchsorted(lo_sorted, x, side='right')])
+                node = left
+            elif x > center:
+                parts.append(by_hi[:np.searchsorted(neg_hi_sorted, -x, side='right')])
+                node = right
+            else:
+                parts.append(by_lo)
+                break
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+class _Group:
+    """
+    Подписки с одинаковыми типом сделки, комнатами и префиксом местоположения.
+    Дерево по цене и массивы площади перестраиваются лениво после изменений.
+    """
+
+    def __init__(self):
+        self.members: Dict[int, SavedSearch] = {}
+        self.dirty = True
+        self._ids = np.empty(0, dtype=np.int64)
+        self._area_lo = self._area_hi = np.empty(0)
+        self._tree: Optional[IntervalTree] = None
+
+    def _rebuild(self):
+        searches = list(self.members.values())
+        self._ids = np.array([search.id for search in searches], dtype=np.int64)
+        price_lo = np.array([_bound(search.price_min, -np.inf) for search in searches], dtype=np.float64)
+        price_hi = np.array([_bound(search.price_max, np.inf) for search in searches], dtype=np.float64)
+        self._area_lo = np.array([_bound(search.area_min, -np.inf) for search in searches], dtype=np.float64)
+        self._area_hi = np.array([_bound(search.area_max, np.inf) for search in searches], dtype=np.float64)
+        self._tree = IntervalTree(price_lo, price_hi)
+        self.dirty = False
+
+    def match(self, price: float, area: Optional[float]) -> np.ndarray:
+        if self.dirty:
+            self._rebuild()
+        positions = self._tree.stab(price)
+        if not len(positions):
+            return self._ids[positions]
+        area_lo, area_hi = self._area_lo[positions], self._area_hi[positions]
+        if area is None:
+            # Как в SQL: объявление без площади не проходит ни одно условие по площади
+            mask = np.isneginf(area_lo) & np.isposinf(area_hi)
+        else:
+            mask = (area_lo <= area) & (area_hi >= area)
+        return self._ids[positions[mask]]
+
+
+class SavedSearchIndex:
+    """
+    Индекс сохраненных поисков для проверки новых объявлений.
+
+    Подписки разложены по разделам (тип сделки, комнаты) с учетом «любого» значения
+    и внутри раздела — по префиксу местоположения. Объявление проверяется не более чем
+    в четырех разделах и только по тем длинам префикса, которые в разделе встречаются;
+    в найденных группах интервальное дерево по цене отбирает кандидатов, площадь
+    проверяется по массивам только для них.
+    """
+
+    def __init__(self, searches: Iterable[SavedSearch] = ()):
+        self.searches: Dict[int, SavedSearch] = {}
+        self._groups: Dict[GroupKey, _Group] = {}
+        self._prefix_lengths: Dict[PartitionKey, Counter] = {}
+        for search in searches:
+            self.add(search)
+
+    def __len__(self) -> int:
+        return len(self.searches)
+
+    @staticmethod
+    def _group_key(search: SavedSearch) -> GroupKey:
+        return search.deal_type, search.rooms, search.location_prefix
+
+    def add(self, search: SavedSearch):
+        if search.id in self.searches:
+            self.remove(search.id)
+        key = self._group_key(search)
+        self.searches[search.id] = search
+        group = self._groups.setdefault(key, _Group())
+        group.members[search.id] = search
+        group.dirty = True
+        self._prefix_lengths.setdefault(key[:2], Counter())[len(key[2])] += 1
+
+    def remove(self, search_id: int) -> Optional[SavedSearch]:
+        search = self.searches.pop(search_id, None)
+        if search is None:
+            return None
+        key = self._group_key(search)
+        group = self._groups[key]
+        del group.members[search_id]
+        group.dirty = True
+        if not group.members:
+            del self._groups[key]
+        lengths = self._prefix_lengths[key[:2]]
+        lengths[len(key[2])] -= 1
+        if not lengths[len(key[2])]:
+            del lengths[len(key[2])]
+        return search
+
+    def match(self, listing: Dict[str, Any]) -> List[SavedSearch]:
+        """
+        Подписки, фильтрам которых удовлетворяет объявление.
+        """
+        if listing.get('price') is None:
+            return []
+        price = float(listing['price'])
+        area = float(listing['area']) if listing.get('area') is not None else None
+        location = normalize_location(listing.get('location'))
+        deal_types = (listing.get('deal_type'), None) if listing.get('deal_type') is not None else (None,)
+        rooms = (listing.get('rooms'), None) if listing.get('rooms') is not None else (None,)
+
+        matched = []
+        for deal_type in deal_types:
+            for rooms_ in rooms:
+                lengths = self._prefix_lengths.get((deal_type, rooms_))
+                if not lengths:
+                    continue
+                for length in lengths:
+                    if length > len(location):
+                        continue
+                    group = self._groups.get((deal_type, rooms_, location[:length]))
+                    if group is not None:
+                        matched.extend(self.searches[id_] for id_ in group.match(price, area).tolist())
+        return matched
+
+
+class SavedSearchService(DatabaseExecutor, MatcherConfig):
+    """
+    Сохраненные поиски и сопоставление с ними новых объявлений.
+
+    Подписки держатся в индексе в памяти процесса; изменения через этот сервис
+    попадают в индекс сразу, подписки других процессов — при перечитывании раз в
+    SAVED_SEARCHES_RELOAD. Совпадения передаются в on_match (например, диспетчеру уведомлений).
+    """
+
+    def __init__(self, on_match: Optional[MatchSink] = None):
+        self.index = SavedSearchIndex()
+        self.on_match = on_match
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def ensure_loaded(self) -> SavedSearchIndex:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.SAVED_SEARCHES_RELOAD:
+            return self.index
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.SAVED_SEARCHES_RELOAD:
+                rows = await self.execute_query(SELECT_SAVED_SEARCHES, fetch=True)
+                self.index = SavedSearchIndex(SavedSearch(*row) for row in rows)
+                self._loaded_at = time.monotonic()
+                logger.debug(f"Загружено сохраненных поисков: {len(self.index)}.")
+        return self.index
+
+    async def create(self, recipient: str, channel: str, filters: Dict[str, Any]) -> SavedSearch:
+        """
+        Создание сохраненного поиска.
+
+        Args:
+            recipient (str): Адрес email или chat id в Telegram.
+            channel (str): email или telegram.
+            filters (Dict[str, Any]): deal_type, rooms, location, price_min, price_max, area_min, area_max.
+        """
+        search = SavedSearch(0, recipient, channel, *(filters.get(name) for name in (
+            'deal_type', 'rooms', 'location', 'price_min', 'price_max', 'area_min', 'area_max',
+        )))
+        async with self.transaction() as cursor:
+            await cursor.execute(INSERT_SAVED_SEARCH.sql, (
+                recipient, channel, search.deal_type, search.rooms, search.location,
+                search.price_min, search.price_max, search.area_min, search.area_max,
+            ))
+            search.id = cursor.lastrowid
+        (await self.ensure_loaded()).add(search)
+        return search
+
+    async def delete(self, search_id: int) -> bool:
+        """
+        Отключение сохраненного поиска.
+
+        Returns:
+            bool: False, если активного поиска с таким id нет.
+        """
+        async with self.transaction() as cursor:
+            deleted = await cursor.execute(DEACTIVATE_SAVED_SEARCH.sql, (search_id,))
+        (await self.ensure_loaded()).remove(search_id)
+        return bool(deleted)
+
+    async def for_recipient(self, recipient: str) -> List[SavedSearch]:
+        index = await self.ensure_loaded()
+        return [search for search in index.searches.values() if search.recipient == recipient]
+
+    async def match_listings(self, listings: List[Dict[str, Any]]) -> List[Match]:
+        """
+        Сопоставление новых объявлений с подписками и передача совпадений в on_match.
+        Подходит как слушатель ListingService.add_listener.
+        """
+        index = await self.ensure_loaded()
+        matches = [(search, listing) for listing in listings for search in index.match(listing)]
+        if matches:
+            logger.debug(f"Совпадений с сохраненными поисками: {len(matches)}.")
+            if self.on_match is not None:
+                await self.on_match(matches)
+        return matches
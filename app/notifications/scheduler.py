@@ -0,0 +1,351 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from decouple import config
+from loguru import logger
+
+from app.api.validation import listing_validator
+from app.parsers.base_parser import Controller, find_parser_class
+from app.parsers.checkpoint import Checkpoint
+from app.storage.database import DatabaseExecutor, statements
+from app.storage.queries import ListingService
+
+SELECT_CHECKPOINT = statements.register('parser_checkpoints.get', """
+SELECT newest_id, newest_date, http_validators FROM parser_checkpoints WHERE parser = %s
+""")
+UPSERT_CHECKPOINT = statements.register('parser_checkpoints.upsert', """
+INSERT INTO parser_checkpoints (parser, newest_id, newest_date, http_validators)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    newest_id = VALUES(newest_id),
+    newest_date = VALUES(newest_date),
+    http_validators = VALUES(http_validators)
+""")
+
+# Поля cron-выражения: минуты, часы, дни месяца, месяцы, дни недели (0 — воскресенье)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+# Горизонт поиска следующего запуска: 29 февраля бывает раз в четыре года
+CRON_SEARCH_DAYS = 4 * 366
+
+AfterRun = Callable[[], Awaitable[Any]]
+
+
+class SchedulerConfig:
+    """
+    Класс конфигурации планировщика парсеров.
+    """
+    SCHEDULER_ENABLED = config('SCHEDULER_ENABLED', default=False, cast=bool)
+    # Сколько парсеров может работать одновременно во всем процессе
+    SCHEDULER_MAX_JOBS = config('SCHEDULER_MAX_JOBS', default=2, cast=int)
+    # URL API, которому Controller отправляет clear_data при полной перезагрузке
+    SCHEDULER_API_URL = config('SCHEDULER_API_URL', default='http://localhost:8000')
+    # Каждый N-й запуск — полный обход без остановки на виденных объявлениях; 0 — только по запросу
+    SCHEDULER_FULL_EVERY = config('SCHEDULER_FULL_EVERY', default=0, cast=int)
+    AVITO_SCHEDULE = config('AVITO_SCHEDULE', default='*/30 * * * *')
+    AVITO_WORKERS = config('AVITO_WORKERS', default=4, cast=int)
+    AVITO_MAX_PAGES = config('AVITO_MAX_PAGES', default=0, cast=int)
+    CIAN_SCHEDULE = config('CIAN_SCHEDULE', default='15,45 * * * *')
+    CIAN_WORKERS = config('CIAN_WORKERS', default=4, cast=int)
+    CIAN_MAX_PAGES = config('CIAN_MAX_PAGES', default=0, cast=int)
+
+
+def _parse_cron_field(spec: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in spec.split(','):
+        part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Значение вне диапазона {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """
+    Расписание в формате cron из пяти полей: "минуты часы дни месяцы дни_недели".
+    Поддерживаются *, списки через запятую, диапазоны a-b и шаг */n. Как и в cron,
+    если заданы и дни месяца, и дни недели, подходит совпадение любого из них.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Ожидается {len(CRON_FIELDS)} полей cron-выражения: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(spec, low, high) for spec, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # В cron 0 — воскресенье, в datetime.weekday() — понедельник
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        if moment.month not in self.months:
+            return False
+        by_day = moment.day in self.days
+        by_weekday = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return by_day and by_weekday
+        return by_day or by_weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Ближайший момент расписания строго после moment (с точностью до минуты).
+        """
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = moment.replace(hour=0, minute=0)
+        for _ in range(CRON_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= moment:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"Расписание {self.expression!r} никогда не срабатывает")
+
+
+@dataclass
+class ParserJob:
+    """
+    Регулярный запуск одного парсера. workers — бюджет одновременных запросов парсера.
+    """
+    name: str
+    module: str
+    schedule: CronSchedule
+    workers: int
+    max_pages: int = 0
+    incremental: bool = True
+    next_run: Optional[datetime] = None
+    running: bool = False
+    runs: int = 0
+    skipped: int = 0
+    last_started: Optional[datetime] = None
+    last_finished: Optional[datetime] = None
+    last_status: Optional[str] = None
+    last_stats: Dict[str, int] = field(default_factory=dict)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'schedule': self.schedule.expression,
+            'workers': self.workers,
+            'running': self.running,
+            'next_run': self.next_run,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'last_started': self.last_started,
+            'last_finished': self.last_finished,
+            'last_status': self.last_status,
+            'last_stats': self.last_stats,
+        }
+
+
+def default_jobs() -> List[ParserJob]:
+    """
+    Задания Avito и ЦИАН с настройками из окружения. Задание регистрируется, только если
+    его модуль объявляет подкласс Parser: иначе каждый запуск по расписанию завершался бы ошибкой.
+    """
+    candidates = [
+        ParserJob('avito', 'app.parsers.avito_parser', CronSchedule(SchedulerConfig.AVITO_SCHEDULE),
+                  SchedulerConfig.AVITO_WORKERS, SchedulerConfig.AVITO_MAX_PAGES),
+        ParserJob('cian', 'app.parsers.cian_parser', CronSchedule(SchedulerConfig.CIAN_SCHEDULE),
+                  SchedulerConfig.CIAN_WORKERS, SchedulerConfig.CIAN_MAX_PAGES),
+    ]
+    jobs = []
+    for job in candidates:
+        try:
+            parser_class = find_parser_class(job.module)
+        except Exception as e:
+            logger.error(f"Не удалось загрузить модуль парсера {job.module}: {e}")
+            continue
+        if parser_class is None:
+            logger.warning(f"Модуль {job.module} не объявляет парсер, задание {job.name} не зарегистрировано.")
+            continue
+        jobs.append(job)
+    return jobs
+
+
+class ParserScheduler(DatabaseExecutor, SchedulerConfig):
+    """
+    Планировщик парсеров: запускает Avito и ЦИАН по cron-расписанию параллельно.
+
+    Запуск пропускается, если предыдущий запуск того же парсера еще идет — в этом
+    процессе (флаг running) или в другом (блокировка GET_LOCK в MySQL). Одновременно
+    работают не больше SCHEDULER_MAX_JOBS парсеров, у каждого свой бюджет воркеров.
+    По умолчанию обход инкрементальный: состояние прошлого запуска берется из
+    parser_checkpoints и сохраняется только после обхода без ошибок, иначе пропущенные
+    страницы были бы потеряны для следующего запуска.
+    """
+
+    def __init__(self, jobs: Optional[Sequence[ParserJob]] = None, after_run: Sequence[AfterRun] = ()):
+        """
+        :param jobs: Задания; по умолчанию Avito и ЦИАН с настройками из окружения
+        :param after_run: Задачи после запуска, сохранившего новые или измененные объявления
+        """
+        self.jobs: Dict[str, ParserJob] = {job.name: job for job in (jobs if jobs is not None else default_jobs())}
+        self.after_run = list(after_run)
+        self.listing_service = ListingService()
+        self._slots = asyncio.Semaphore(self.SCHEDULER_MAX_JOBS)
+        self._tasks = set()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self.jobs:
+            logger.warning("Планировщик включен, но нет ни одного задания с парсером; расписание не запущено.")
+            return
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """
+        Остановка расписания и текущих запусков; checkpoint прерванного запуска не сохраняется.
+        """
+        tasks = [task for task in (self._loop_task, *self._tasks) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [job.snapshot() for job in self.jobs.values()]
+
+    def trigger(self, name: str, full: bool = False) -> bool:
+        """
+        Внеочередной запуск парсера.
+
+        Returns:
+            bool: False, если парсер уже работает.
+        """
+        job = self.jobs[name]
+        if job.running:
+            return False
+        self._spawn(job, full)
+        return True
+
+    async def load_checkpoint(self, parser: str) -> Checkpoint:
+        rows = await self.execute_query(SELECT_CHECKPOINT, (parser,), fetch=True)
+        if not rows:
+            return Checkpoint(parser)
+        newest_id, newest_date, validators = rows[0]
+        return Checkpoint(parser, newest_id, newest_date, json.loads(validators) if validators else {})
+
+    async def save_checkpoint(self, checkpoint: Checkpoint):
+        await self.execute_query(UPSERT_CHECKPOINT, (
+            checkpoint.parser, checkpoint.newest_id, checkpoint.newest_date,
+            json.dumps(checkpoint.validators, ensure_ascii=False),
+        ))
+
+    def _spawn(self, job: ParserJob, full: bool = False):
+        # Флаг ставится сразу, чтобы повторный trigger до старта задачи не запустил второй обход
+        job.running = True
+        task = asyncio.create_task(self._run_job(job, full))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _loop(self):
+        now = datetime.now()
+        for job in self.jobs.values():
+            job.next_run = job.schedule.next_after(now)
+        while True:
+            due = min(job.next_run for job in self.jobs.values())
+            await asyncio.sleep(max(0.0, (due - datetime.now()).total_seconds()))
+            now = datetime.now()
+            for job in self.jobs.values():
+                if job.next_run > now:
+                    continue
+                job.next_run = job.schedule.next_after(now)
+                if job.running:
+                    job.skipped += 1
+                    logger.warning(f"Парсер {job.name} еще работает, запуск по расписанию пропущен.")
+                    continue
+                full = bool(self.SCHEDULER_FULL_EVERY) and (job.runs + 1) % self.SCHEDULER_FULL_EVERY == 0
+                self._spawn(job, full)
+
+    @asynccontextmanager
+    async def _exclusive(self, name: str) -> AsyncIterator[bool]:
+        """
+        Блокировка запуска между процессами. Соединение с блокировкой держится до конца запуска,
+        поэтому берется вне пула.
+        """
+        async with self.dedicated_connection() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute("SELECT GET_LOCK(%s, 0)", (f"parser:{name}",))
+                (acquired,) = await cursor.fetchone()
+                try:
+                    yield bool(acquired)
+                finally:
+                    if acquired:
+                        await cursor.execute("SELECT RELEASE_LOCK(%s)", (f"parser:{name}",))
+                        await cursor.fetchone()
+
+    async def _run_job(self, job: ParserJob, full: bool = False):
+        try:
+            async with self._slots, self._exclusive(job.name) as acquired:
+                if not acquired:
+                    job.skipped += 1
+                    logger.warning(f"Парсер {job.name} уже запущен другим процессом, запуск пропущен.")
+                    return
+                await self._crawl(job, full or not job.incremental)
+        except asyncio.CancelledError:
+            job.last_status = 'cancelled'
+            raise
+        except Exception as e:
+            job.last_status = 'failed'
+            logger.error(f"Ошибка запуска парсера {job.name}: {e}")
+        finally:
+            job.running = False
+            job.last_finished = datetime.now()
+
+    async def _crawl(self, job: ParserJob, full: bool):
+        job.runs += 1
+        job.last_started = datetime.now()
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+
+        async def save(items: List[Dict[str, Any]]):
+            listings, _, _ = listing_validator.validate([{'source': job.name, **item} for item in items])
+            stats['rejected'] += len(items) - len(listings)
+            for key, value in (await self.listing_service.save_listings_bulk(listings)).items():
+                stats[key] += value
+
+        # Полный обход начинается с пустого состояния: без условных запросов и остановки на
+        # виденных объявлениях, но без clear_data — upsert идемпотентен
+        checkpoint = Checkpoint(job.name) if full else await self.load_checkpoint(job.name)
+        controller = Controller(job.module, None, self.SCHEDULER_API_URL)
+        logger.info(f"Запуск парсера {job.name} ({'полный' if full else 'инкрементальный'} обход).")
+        script = await controller.run(checkpoint, workers=job.workers, max_pages=job.max_pages or None,
+                                      on_items=save)
+        job.last_stats = stats
+        crawl = script.last_crawl if script is not None else None
+        if crawl is None:
+            job.last_status = 'failed'
+            return
+        stats.update(pages=crawl.pages_fetched, unchanged_pages=crawl.pages_unchanged,
+                     stopped_pages=crawl.pages_stopped, failed_pages=crawl.pages_failed)
+
+        if crawl.pages_failed:
+            job.last_status = 'partial'
+            logger.warning(f"Парсер {job.name}: ошибок страниц {crawl.pages_failed}, checkpoint не обновлен.")
+        else:
+            job.last_status = 'ok'
+            await self.save_checkpoint(checkpoint.advance())
+
+        if stats['inserted'] or stats['updated']:
+            for task in self.after_run:
+                try:
+                    await task()
+                except Exception as e:
+                    logger.error(f"Ошибка задачи после запуска парсера {job.name}: {e}")
+        logger.info(f"Парсер {job.name} завершен: {stats}.")
@@ -0,0 +1,100 @@
+import hashlib
+from typing import Optional
+
+import aiohttp
+from decouple import config
+
+from app.storage.cache import LRUCache, MISSING
+from .dispatcher import NotificationBackend, NotificationError
+
+# Ограничение Bot API на длину одного сообщения
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class TelegramConfig:
+    """
+    Класс конфигурации уведомлений через Telegram.
+    """
+    TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN', default='')
+    TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='https://api.telegram.org')
+    # Bot API допускает около 30 сообщений в секунду на бота
+    TELEGRAM_RATE = config('TELEGRAM_RATE', default=25, cast=float)
+    TELEGRAM_BURST = config('TELEGRAM_BURST', default=30, cast=float)
+    TELEGRAM_POOL_LIMIT = config('TELEGRAM_POOL_LIMIT', default=20, cast=int)
+    TELEGRAM_TIMEOUT = config('TELEGRAM_TIMEOUT', default=15, cast=float)
+    # Сколько помнить доставленные части длинного сообщения, чтобы повтор не отправлял их снова, сек
+    TELEGRAM_PROGRESS_TTL = config('TELEGRAM_PROGRESS_TTL', default=86400, cast=float)
+    TELEGRAM_PROGRESS_SIZE = config('TELEGRAM_PROGRESS_SIZE', default=10000, cast=int)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT):
+    """
+    Разбиение длинного текста на части не длиннее limit, по возможности по границе абзаца.
+    """
+    while len(text) > limit:
+        cut = text.rfind('\n\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        yield text[:cut]
+        text = text[cut:].lstrip('\n')
+    if text:
+        yield text
+
+
+class TelegramBackend(NotificationBackend, TelegramConfig):
+    """
+    Отправка сообщений через Bot API на общей aiohttp-сессии с пулом keep-alive соединений.
+
+    Сообщение длиннее лимита уходит несколькими частями; число доставленных частей
+    запоминается, и повторная отправка того же сообщения продолжает с первой недоставленной.
+    """
+    channel = 'telegram'
+
+    def __init__(self, token: Optional[str] = None):
+        self.token = token or self.TELEGRAM_BOT_TOKEN
+        self.rate = self.TELEGRAM_RATE
+        self.burst = self.TELEGRAM_BURST
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.progress = LRUCache(self.TELEGRAM_PROGRESS_SIZE, self.TELEGRAM_PROGRESS_TTL)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.TELEGRAM_POOL_LIMIT),
+                timeout=aiohttp.ClientTimeout(total=self.TELEGRAM_TIMEOUT),
+            )
+        return self.session
+
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        session = await self.get_session()
+        url = f"{self.TELEGRAM_API_URL}/bot{self.token}/sendMessage"
+        text = f"{subject}\n\n{body}"
+        key = hashlib.sha1(f"{recipient}\x1f{text}".encode('utf-8')).hexdigest()
+        delivered = self.progress.get(key)
+        delivered = 0 if delivered is MISSING else delivered
+        for number, part in enumerate(split_message(text)):
+            if number < delivered:
+                continue
+            payload = {'chat_id': recipient, 'text': part, 'disable_web_page_preview': True}
+            try:
+                async with session.post(url, json=payload) as response:
+                    if response.status == 200:
+                        self.progress.set(key, number + 1)
+                        continue
+                    data = await response.json(content_type=None)
+            except aiohttp.ClientError as e:
+                raise NotificationError(f"Ошибка соединения с Telegram: {e}") from e
+
+            if not isinstance(data, dict):
+                data = {}
+            description = data.get('description', f"HTTP {response.status}")
+            if response.status == 429:
+                retry_after = (data.get('parameters') or {}).get('retry_after')
+                raise NotificationError(f"Telegram: {description}", retry_after=retry_after)
+            # 400/403: неверный chat id или бот заблокирован — повтор не поможет
+            raise NotificationError(f"Telegram: {description}", retryable=response.status >= 500)
+        self.progress.delete(key)
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
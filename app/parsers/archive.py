@@ -0,0 +1,279 @@
+import asyncio
+import gzip
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from decouple import config
+from loguru import logger
+
+try:
+    import zstandard
+except ImportError:  # zstd — необязательная зависимость, без нее архив пишется в gzip
+    zstandard = None
+
+CODEC_GZIP = 'gzip'
+CODEC_ZSTD = 'zstd'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    codec TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    parser TEXT,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    status INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pages_parser_time ON pages (parser, fetched_at);
+CREATE INDEX IF NOT EXISTS idx_pages_url ON pages (url, fetched_at);
+"""
+
+
+class ArchiveConfig:
+    """
+    Класс конфигурации архива сырых страниц.
+    """
+    # Каталог архива; пустое значение — страницы не архивируются
+    PAGE_ARCHIVE_DIR = config('PAGE_ARCHIVE_DIR', default='')
+    # zstd, если установлен пакет zstandard, иначе gzip
+    PAGE_ARCHIVE_CODEC = config('PAGE_ARCHIVE_CODEC', default=CODEC_ZSTD if zstandard else CODEC_GZIP)
+    PAGE_ARCHIVE_LEVEL = config('PAGE_ARCHIVE_LEVEL', default=6, cast=int)
+    # Размер сегмента, после которого запись идет в новый файл, байт
+    PAGE_ARCHIVE_SEGMENT_SIZE = config('PAGE_ARCHIVE_SEGMENT_SIZE', default=256 * 1024 * 1024, cast=int)
+
+
+@dataclass(frozen=True)
+class PageRecord:
+    """
+    Запись индекса: одна загрузка страницы. hash — ключ содержимого, None для ответов с ошибкой.
+    """
+    id: int
+    parser: Optional[str]
+    url: str
+    fetched_at: float
+    status: int
+    hash: Optional[str]
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class PageArchive(ArchiveConfig):
+    """
+    Локальный архив загруженных страниц с адресацией по содержимому.
+
+    Тела страниц сжимаются (zstd или gzip) и дописываются в сегментные файлы
+    segments/NNNNNN.seg; одинаковые страницы хранятся один раз под SHA-256 содержимого.
+    Индекс в SQLite (index.sqlite) хранит расположение блобов и каждую загрузку:
+    парсер, URL, время и статус ответа. Сегменты читаются через mmap, так что
+    воспроизведение большого архива не копирует файлы в память процесса.
+    """
+
+    def __init__(self, path: str, codec: Optional[str] = None, level: Optional[int] = None,
+                 segment_size: Optional[int] = None):
+        self.path = path
+        self.codec = codec or self.PAGE_ARCHIVE_CODEC
+        if self.codec == CODEC_ZSTD and zstandard is None:
+            raise RuntimeError("Для сжатия zstd нужен пакет zstandard")
+        if self.codec not in (CODEC_GZIP, CODEC_ZSTD):
+            raise ValueError(f"Неизвестный формат сжатия: {self.codec}")
+        self.level = level if level is not None else self.PAGE_ARCHIVE_LEVEL
+        self.segment_size = segment_size or self.PAGE_ARCHIVE_SEGMENT_SIZE
+        self.stats = {'pages': 0, 'blobs': 0, 'deduplicated': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+
+        os.makedirs(os.path.join(path, 'segments'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'index.sqlite'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._writer = None
+        self._segment, self._segment_end = self._last_segment()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, 'segments', f"{segment:06d}.seg")
+
+    def _last_segment(self) -> Tuple[int, int]:
+        row = self._db.execute("SELECT MAX(segment) FROM blobs").fetchone()
+        segment = row[0] or 1
+        path = self._segment_path(segment)
+        return segment, os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _compress(self, body: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=self.level).compress(body)
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+    @staticmethod
+    def _decompress(data, codec: str) -> bytes:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Для чтения блобов zstd нужен пакет zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _append(self, data: bytes) -> Tuple[int, int]:
+        if self._segment_end and self._segment_end + len(data) > self.segment_size:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._segment += 1
+            self._segment_end = 0
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._segment), 'ab')
+        offset = self._segment_end
+        self._writer.write(data)
+        self._writer.flush()
+        self._segment_end += len(data)
+        return self._segment, offset
+
+    def store_sync(self, url: str, status: int, body: Optional[bytes] = None, parser: Optional[str] = None,
+                   fetched_at: Optional[float] = None) -> Optional[str]:
+        """
+        Запись загрузки страницы; тело, уже лежащее в архиве, повторно не сохраняется.
+
+        :return: Ключ содержимого или None, если тела нет
+        """
+        key = content_hash(body) if body is not None else None
+        with self._lock:
+            if key is not None:
+                if self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (key,)).fetchone():
+                    self.stats['deduplicated'] += 1
+                else:
+                    data = self._compress(body)
+                    segment, offset = self._append(data)
+                    self._db.execute(
+                        "INSERT INTO blobs (hash, segment, offset, length, size, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, segment, offset, len(data), len(body), self.codec)
+                    )
+                    self.stats['blobs'] += 1
+                    self.stats['raw_bytes'] += len(body)
+                    self.stats['stored_bytes'] += len(data)
+            self._db.execute(
+                "INSERT INTO pages (parser, url, fetched_at, status, hash) VALUES (?, ?, ?, ?, ?)",
+                (parser, url, fetched_at or time.time(), status, key)
+            )
+            self._db.commit()
+            self.stats['pages'] += 1
+        return key
+
+    async def store(self, url: str, status: int, body: Optional[bytes] = None, parser: Optional[str] = None) -> Optional[str]:
+        """
+        Асинхронная запись: сжатие и запись на диск выполняются в отдельном потоке.
+        """
+        return await asyncio.to_thread(self.store_sync, url, status, body, parser, time.time())
+
+    def _segment_map(self, segment: int, end: int) -> mmap.mmap:
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            # Текущий сегмент растет: отображение пересоздается, если блоб лежит за его концом
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), 'rb') as file:
+                mapped = self._maps[segment] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def load(self, key: str) -> Optional[bytes]:
+        """
+        Тело страницы по ключу содержимого или None, если его нет в архиве.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT segment, offset, length, codec FROM blobs WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            segment, offset, length, codec = row
+            # Отображения сегментов общие для потоков; распаковка идет уже без блокировки
+            data = self._segment_map(segment, offset + length)[offset:offset + length]
+        return self._decompress(data, codec)
+
+    def pages(self, parser: Optional[str] = None, url_prefix: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, unique: bool = False) -> List[PageRecord]:
+        """
+        Загрузки из индекса в порядке расположения тел в сегментах (для последовательного
+        чтения при воспроизведении). Ответы без тела не включаются.
+
+        :param unique: Только первая загрузка каждого уникального содержимого
+        """
+        conditions = ["pages.hash IS NOT NULL"]
+        params: list = []
+        if parser is not None:
+            conditions.append("pages.parser = ?")
+            params.append(parser)
+        if url_prefix:
+            conditions.append("pages.url >= ? AND pages.url < ?")
+            params.extend([url_prefix, url_prefix + '\uffff'])
+        if since is not None:
+            conditions.append("pages.fetched_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("pages.fetched_at < ?")
+            params.append(until)
+        # В SQLite остальные столбцы при MIN() берутся из той же строки, что и минимум
+        query = (
+            f"SELECT {'MIN(pages.id)' if unique else 'pages.id'}, pages.parser, pages.url, pages.fetched_at, "
+            f"pages.status, pages.hash "
+            f"FROM pages JOIN blobs ON blobs.hash = pages.hash "
+            f"WHERE {' AND '.join(conditions)} "
+            f"{'GROUP BY pages.hash ' if unique else ''}"
+            f"ORDER BY blobs.segment, blobs.offset, pages.id"
+        )
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [PageRecord(*row) for row in rows]
+
+    def iter_bodies(self, records: List[PageRecord]) -> Iterator[Tuple[PageRecord, bytes]]:
+        for record in records:
+            body = self.load(record.hash)
+            if body is not None:
+                yield record, body
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._db.close()
+        logger.info(f"Архив страниц {self.path} закрыт: {self.stats}")
+
+
+_archives: Dict[str, PageArchive] = {}
+
+
+def get_page_archive(path: Optional[str] = None) -> Optional[PageArchive]:
+    """
+    Общий для всех парсеров архив по каталогу, открывается при первом обращении.
+    Без каталога (PAGE_ARCHIVE_DIR не задан) возвращает None.
+    """
+    path = path or ArchiveConfig.PAGE_ARCHIVE_DIR
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = PageArchive(path)
+        logger.info(f"Архив страниц открыт: {path} ({archive.codec})")
+    return archive
+
+
+def close_page_archives():
+    for archive in _archives.values():
+        archive.close()
+    _archives.clear()
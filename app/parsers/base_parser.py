@@ -1,15 +1,51 @@
 import importlib
 import inspect
+import os
+import time
 
 from asyncio import sleep
 import asyncio
+from typing import Iterable, Optional, Type
+
 import aiohttp
+from decouple import config
 
 from loguru import logger
-from random import randint
+
+from app.instrumentation import registry
+from .archive import PageArchive, get_page_archive
+from .checkpoint import Checkpoint
+from .crawler import Crawler, FollowUrl
+from .executor import get_parse_executor
 from .user_agent import random
+from .utils import NOT_MODIFIED, RETRY_STATUSES, DomainRateLimiter, backoff_delay, retry_after_delay
+
+fetch_latency = registry.histogram(
+    'parser_fetch_duration_seconds', 'Время загрузки страницы парсером (одна попытка)', ('parser', 'status'))
+
+
+class ParserConfig:
+    """
+    Класс конфигурации HTTP-клиента парсеров.
+    """
+    HTTP_POOL_LIMIT = config('HTTP_POOL_LIMIT', default=100, cast=int)
+    HTTP_LIMIT_PER_HOST = config('HTTP_LIMIT_PER_HOST', default=8, cast=int)
+    HTTP_DNS_CACHE_TTL = config('HTTP_DNS_CACHE_TTL', default=300, cast=int)
+    HTTP_KEEPALIVE_TIMEOUT = config('HTTP_KEEPALIVE_TIMEOUT', default=30, cast=float)
+    HTTP_TIMEOUT = config('HTTP_TIMEOUT', default=30, cast=float)
+    HTTP_RETRIES = config('HTTP_RETRIES', default=5, cast=int)
+    HTTP_BACKOFF_BASE = config('HTTP_BACKOFF_BASE', default=1, cast=float)
+    HTTP_BACKOFF_MAX = config('HTTP_BACKOFF_MAX', default=60, cast=float)
+    CRAWL_WORKERS = config('CRAWL_WORKERS', default=8, cast=int)
+    CRAWL_MAX_PAGES = config('CRAWL_MAX_PAGES', default=0, cast=int)
+    CRAWL_RATE_PER_DOMAIN = config('CRAWL_RATE_PER_DOMAIN', default=2, cast=float)
+    CRAWL_BURST_PER_DOMAIN = config('CRAWL_BURST_PER_DOMAIN', default=4, cast=float)
+    # Доля уже виденных объявлений на странице, после которой инкрементальный обход не идет дальше
+    CRAWL_SEEN_STOP_RATIO = config('CRAWL_SEEN_STOP_RATIO', default=0.5, cast=float)
+    PARSE_WORKERS = config('PARSE_WORKERS', default=os.cpu_count() or 1, cast=int)
+
 
-class Controller:
+class Controller(ParserConfig):
     def __init__(self, script_name: str, user_agent: str, base_url: str):
         """
         Инициализация контроллера для парсинга.
@@ -21,8 +57,35 @@ class Controller:
         self.script_name = script_name  # Название скрипта, который будет загружаться
         self.user_agent = random  # Пользовательский агент для запросов
         self.base_url = base_url  # Базовый URL для API
+        self.session: Optional[aiohttp.ClientSession] = None  # Общая сессия с пулом соединений
         logger.info(f"Controller initialized with script: {self.script_name}, base_url: {self.base_url}")
 
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Долгоживущая HTTP-сессия с пулом keep-alive соединений и кэшем DNS.
+        Создается при первом запросе и переиспользуется всеми последующими.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.HTTP_POOL_LIMIT,
+                limit_per_host=self.HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=self.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=self.HTTP_KEEPALIVE_TIMEOUT,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.HTTP_TIMEOUT),
+            )
+        return self.session
+
+    async def close(self):
+        """
+        Закрытие HTTP-сессии и всех соединений пула.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
     async def clear_data(self, parser_name: str):
         """
         Асинхронная очистка старых данных на сервере перед парсингом.
@@ -33,12 +96,12 @@ class Controller:
         payload = {'parser': parser_name}
         try:
             # Асинхронный запрос на очистку данных
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/clear_data/", json=payload) as response:
-                    if response.status != 200:
-                        logger.error(f"Failed to clear data: {response.status}")
-                    else:
-                        logger.info(f"Data cleared for parser: {parser_name}")
+            session = await self.get_session()
+            async with session.post(f"{self.base_url}/clear_data/", json=payload) as response:
+                if response.status != 200:
+                    logger.error(f"Failed to clear data: {response.status}")
+                else:
+                    logger.info(f"Data cleared for parser: {parser_name}")
         except Exception as e:
             logger.error(f"Error while clearing data: {e}")
 
@@ -48,94 +111,267 @@ class Controller:
         """
         logger.debug(f"Loading script: {self.script_name}")
         try:
-            parser_module = importlib.import_module(self.script_name)
-            for name in dir(parser_module):
-                obj = getattr(parser_module, name)
-                if (
-                    inspect.isclass(obj)
-                    and issubclass(obj, Parser)
-                    and obj != Parser
-                ):
-                    logger.info(f"Parser {name} loaded successfully.")
-                    return obj()
+            parser_class = find_parser_class(self.script_name)
+            if parser_class is None:
+                logger.error(f"Module {self.script_name} does not define a parser.")
+                return None
+            logger.info(f"Parser {parser_class.__name__} loaded successfully.")
+            return parser_class()
         except Exception as e:
             logger.error(f"Failed to load parser: {e}")
             return None
 
-    async def run(self):
+    async def run(self, checkpoint: Optional[Checkpoint] = None, workers: Optional[int] = None,
+                  max_pages: Optional[int] = None, on_items=None):
         """
-        Запуск парсера. Очищает старые данные, а затем запускает основной процесс парсинга.
+        Запуск парсера.
+
+        Без checkpoint — полная перезагрузка: старые данные очищаются, затем сайт обходится целиком.
+        С checkpoint — инкрементальный режим без очистки: условные запросы по сохраненным
+        ETag/Last-Modified, а пагинация прекращается на уже виденных объявлениях.
+
+        :param checkpoint: Состояние прошлого запуска для инкрементального режима
+        :param workers: Количество одновременных воркеров обхода
+        :param max_pages: Ограничение на количество страниц
+        :param on_items: Асинхронный обработчик объявлений со страницы
+        :return: Парсер после обхода (статистика в last_crawl) или None, если его не удалось загрузить
         """
         logger.info(f"Starting the controller for script: {self.script_name}")
         script = await self.load_script()
-        if script:
-            # Очищаем данные перед запуском
-            await self.clear_data(script.name)
-            try:
-                # Запускаем основной процесс парсинга
-                await script.main()
-            except AttributeError as e:
-                logger.error(f"Parser error: {e}")
-                return
-            logger.info(f"The script {script.name} completed successfully.")
-            if script.session is not None:
-                await script.session.close()
+        if not script:
+            return None
+        try:
+            if checkpoint is None:
+                # Очищаем данные перед полной перезагрузкой
+                await self.clear_data(script.name)
+            else:
+                script.checkpoint = checkpoint
+            await script.run(workers=workers, max_pages=max_pages, on_items=on_items)
+        finally:
+            await script.close()
+            await self.close()
+        logger.info(f"The script {script.name} completed successfully.")
+        return script
+
+def find_parser_class(module_name: str) -> Optional[Type["Parser"]]:
+    """
+    Первый подкласс Parser, объявленный в модуле, или None.
+    """
+    parser_module = importlib.import_module(module_name)
+    for name in dir(parser_module):
+        obj = getattr(parser_module, name)
+        if inspect.isclass(obj) and issubclass(obj, Parser) and obj is not Parser:
+            return obj
+    return None
+
 
 class Parser(Controller):
+    # Синхронная функция разбора сырой страницы (bytes -> список объявлений и FollowUrl),
+    # которая выполняется в пуле процессов: функция уровня модуля через staticmethod
+    # или экземпляр XPathExtractor. Если не задана, parse_page переопределяется целиком.
+    page_parser = None
+    # Состояние инкрементального обхода; None — полный обход без условных запросов
+    checkpoint: Optional[Checkpoint] = None
+    # Краулер последнего запуска (статистика страниц)
+    last_crawl: Optional[Crawler] = None
+
     def __init__(self, script_name: str, base_url: str, headers=None, proxies=None):
         """
         Инициализация парсера с базовыми параметрами (URL, заголовки, прокси).
 
         :param script_name: Название скрипта для загрузки
         :param base_url: URL для парсинга
-        :param headers: Заголовки для HTTP-запросов
+        :param headers: Заголовки для HTTP-запросов. Если User-Agent не задан, он выбирается случайно на каждый запрос
         :param proxies: Прокси для обхода блокировок
         """
-        super().__init__(script_name=script_name, user_agent=headers['User-Agent'] if headers else None, base_url=base_url)
-        self.headers = headers if headers else {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        super().__init__(script_name=script_name, user_agent=headers.get('User-Agent') if headers else None, base_url=base_url)
+        self.headers = headers if headers else {}
         self.proxies = proxies  # Для прокси можно добавить поддержку aiohttp прокси
+        self.rate_limiter = DomainRateLimiter(self.CRAWL_RATE_PER_DOMAIN, self.CRAWL_BURST_PER_DOMAIN)
+        # Архив загруженных страниц (PAGE_ARCHIVE_DIR); None — страницы не сохраняются
+        self.archive: Optional[PageArchive] = get_page_archive()
+
+    def request_headers(self) -> dict:
+        """
+        Заголовки для очередного запроса с ротацией User-Agent.
+        """
+        if 'User-Agent' in self.headers:
+            return self.headers
+        return {**self.headers, 'User-Agent': self.user_agent()}
+
+    @property
+    def archive_name(self) -> str:
+        """
+        Имя парсера в индексе архива страниц.
+        """
+        return getattr(self, 'name', None) or self.script_name
+
+    @property
+    def raw_html(self) -> bool:
+        """
+        Нужно ли передавать в parse_page сырые байты страницы вместо текста.
+        """
+        return self.page_parser is not None
 
-    async def fetch_page(self, url, params=None, retries=3):
+    async def fetch_page(self, url, params=None, retries=None, raw=False):
         """
         Асинхронное получение HTML-страницы с URL.
 
+        Перед каждой попыткой ожидает токен лимита частоты для домена. Повторяет запрос
+        при сетевых ошибках и ответах 429/5xx с экспоненциальной задержкой и джиттером;
+        если сервер прислал Retry-After, ждет указанное время и приостанавливает весь домен.
+        При заданном checkpoint отправляет условный запрос по сохраненным ETag/Last-Modified.
+        Если подключен архив, тело ответа и статус записываются в него.
+
         :param url: URL для запроса
         :param params: Дополнительные параметры для GET-запроса
-        :param retries: Количество попыток
-        :return: HTML-содержимое страницы или None в случае неудачи
+        :param retries: Количество попыток, по умолчанию HTTP_RETRIES
+        :param raw: Вернуть сырые байты без декодирования
+        :return: HTML-содержимое страницы, NOT_MODIFIED при ответе 304 или None в случае неудачи
         """
+        retries = retries or self.HTTP_RETRIES
+        conditional = self.checkpoint.conditional_headers(url, params) if self.checkpoint is not None else {}
         for attempt in range(retries):
+            delay = backoff_delay(attempt, self.HTTP_BACKOFF_BASE, self.HTTP_BACKOFF_MAX)
+            started = None
             try:
+                await self.rate_limiter.acquire(url)
                 logger.info(f"Запрос к странице: {url}, Попытка: {attempt+1}")
-                async with aiohttp.ClientSession(headers=self.headers) as session:
-                    async with session.get(url, params=params, proxy=self.proxies) as response:
-                        response.raise_for_status()  # Проверка на ошибки HTTP
-                        html = await response.text()
-                        return html
-            except aiohttp.ClientError as e:
+                session = await self.get_session()
+                headers = {**self.request_headers(), **conditional}
+                started = time.perf_counter()
+                async with session.get(url, params=params, headers=headers, proxy=self.proxies) as response:
+                    if response.status == 304:
+                        self._record_fetch(started, response.status)
+                        return NOT_MODIFIED
+                    response.raise_for_status()  # Проверка на ошибки HTTP
+                    if self.checkpoint is not None:
+                        self.checkpoint.remember_validators(url, params, response.headers)
+                    body = await response.read()
+                    self._record_fetch(started, response.status)
+                    if self.archive is not None:
+                        await self.archive.store(str(response.url), response.status, body, self.archive_name)
+                    if raw:
+                        return body
+                    html = await response.text()
+                    return html
+            except aiohttp.ClientResponseError as e:
+                self._record_fetch(started, e.status)
+                logger.error(f"Ошибка запроса: {e.status} {e.message}, попытка {attempt + 1}")
+                if self.archive is not None:
+                    await self.archive.store(str(e.request_info.real_url), e.status, parser=self.archive_name)
+                if e.status not in RETRY_STATUSES:
+                    return None
+                retry_after = retry_after_delay(e.headers)
+                if retry_after is not None:
+                    delay = min(retry_after, self.HTTP_BACKOFF_MAX)
+                    self.rate_limiter.pause(url, delay)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._record_fetch(started, 'error')
                 logger.error(f"Ошибка запроса: {e}, попытка {attempt + 1}")
-                await sleep(randint(1, 3))  # Пауза перед повторной попыткой
+            if attempt + 1 < retries:
+                await sleep(delay)  # Пауза перед повторной попыткой
         return None
 
+    def _record_fetch(self, started: Optional[float], status):
+        """
+        Учет времени попытки загрузки без ожидания лимита частоты; status — код ответа или error.
+        """
+        if started is not None:
+            fetch_latency.labels(self.archive_name, status).observe(time.perf_counter() - started)
+
     async def parse_page(self, html):
         """
-        Метод парсинга страницы (должен быть переопределен в конкретных парсерах).
-        
+        Метод парсинга страницы (должен быть переопределен в конкретных парсерах,
+        если не задан page_parser).
+
+        Может вернуть список объявлений или быть асинхронным генератором, который выдает
+        объявления (dict) и ссылки FollowUrl на следующие страницы для обхода.
+        Если задан page_parser, страница разбирается им в пуле процессов.
+
         :param html: HTML-содержимое страницы
         :return: Извлеченные данные
         """
-        raise NotImplementedError("Метод parse_page() должен быть переопределен в подклассах")
+        if self.page_parser is None:
+            raise NotImplementedError("Метод parse_page() должен быть переопределен в подклассах")
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        return await get_parse_executor(self.PARSE_WORKERS).run(self.page_parser, html)
 
-    async def run(self):
+    def start_urls(self) -> Iterable[str]:
         """
-        Запуск процесса парсинга.
+        Начальные URL обхода. По умолчанию только base_url.
+        """
+        return [self.base_url]
+
+    async def run(self, workers: Optional[int] = None, max_pages: Optional[int] = None, on_items=None):
+        """
+        Запуск процесса парсинга: конкурентный обход от start_urls() по ссылкам из parse_page.
+
+        :param workers: Количество одновременных воркеров
+        :param max_pages: Ограничение на количество страниц
+        :param on_items: Асинхронный обработчик объявлений со страницы
+        :return: Собранные объявления
         """
         logger.info(f"Запуск парсинга URL: {self.base_url}")
-        html = await self.fetch_page(self.base_url)
-        if html:
-            return await self.parse_page(html)
-        else:
+        crawler = self.last_crawl = Crawler(self, workers=workers, max_pages=max_pages, on_items=on_items)
+        items = await crawler.run(self.start_urls())
+        if not crawler.pages_fetched and not crawler.pages_unchanged:
             logger.error(f"Не удалось получить данные с {self.base_url}")
-            return None
\ No newline at end of file
+        return items
+
+    async def replay(self, archive: Optional[PageArchive] = None, on_items=None, concurrency: Optional[int] = None,
+                     **filters):
+        """
+        Разбор страниц из архива без сети: тела читаются из сегментов и передаются в parse_page.
+        Ссылки FollowUrl игнорируются — воспроизводятся ровно те страницы, что были загружены.
+        Чтение индекса и распаковка тел выполняются в отдельном потоке, не блокируя event loop.
+
+        :param archive: Архив страниц, по умолчанию общий архив PAGE_ARCHIVE_DIR
+        :param on_items: Асинхронный обработчик объявлений со страницы
+        :param concurrency: Сколько страниц разбирается одновременно, по умолчанию 2 * PARSE_WORKERS
+        :param filters: Отбор страниц, см. PageArchive.pages (по умолчанию страницы этого парсера)
+        :return: Собранные объявления (пустой список, если задан on_items) и статистика
+        """
+        archive = archive or self.archive
+        if archive is None:
+            raise RuntimeError("Архив страниц не подключен (PAGE_ARCHIVE_DIR)")
+        filters.setdefault('parser', self.archive_name)
+        records = await asyncio.to_thread(archive.pages, **filters)
+        semaphore = asyncio.Semaphore(concurrency or 2 * self.PARSE_WORKERS)
+        items = []
+        stats = {'pages': 0, 'items': 0, 'failed': 0, 'bytes': 0}
+        crawler = Crawler(self)
+        started = time.perf_counter()
+
+        async def parse(record, body):
+            page = body if self.raw_html else body.decode('utf-8', 'replace')
+            try:
+                page_items = [item async for item in crawler._iter_parsed(page)
+                              if item is not None and not isinstance(item, FollowUrl)]
+                stats['items'] += len(page_items)
+                if on_items is not None and page_items:
+                    await on_items(page_items)
+                elif on_items is None:
+                    items.extend(page_items)
+            except Exception as e:
+                stats['failed'] += 1
+                logger.error(f"Ошибка разбора страницы {record.url} из архива: {e}")
+            finally:
+                semaphore.release()
+
+        tasks = []
+        for record in records:
+            await semaphore.acquire()
+            body = await asyncio.to_thread(archive.load, record.hash)
+            if body is None:
+                semaphore.release()
+                continue
+            stats['pages'] += 1
+            stats['bytes'] += len(body)
+            tasks.append(asyncio.create_task(parse(record, body)))
+        await asyncio.gather(*tasks)
+
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Воспроизведение архива завершено: {stats}")
+        return items, stats
@@ -0,0 +1,101 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+
+# Заголовки ответа, которые сохраняются для условных запросов, и соответствующие заголовки запроса
+VALIDATOR_HEADERS = {'ETag': 'If-None-Match', 'Last-Modified': 'If-Modified-Since'}
+
+
+def _published_at(item: Dict[str, Any]) -> Optional[datetime]:
+    value = item.get('published_at')
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    return None
+
+
+def _newer_id(first: Optional[str], second: Optional[str]) -> bool:
+    """
+    Новее ли объявление с id first, чем с id second. Числовые id площадок растут со временем.
+    """
+    if first is None or second is None:
+        return second is None and first is not None
+    if first.isdigit() and second.isdigit():
+        return int(first) > int(second)
+    return False
+
+
+@dataclass
+class Checkpoint:
+    """
+    Состояние инкрементального обхода парсера между запусками.
+
+    Хранит самое новое из уже виденных объявлений (id и дату публикации) и валидаторы
+    HTTP-кэша (ETag, Last-Modified) страниц выдачи. В ходе обхода копит новые значения,
+    которые становятся состоянием следующего запуска через advance().
+    """
+    parser: str
+    newest_id: Optional[str] = None
+    newest_date: Optional[datetime] = None
+    validators: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    _run_newest_id: Optional[str] = field(default=None, init=False, repr=False)
+    _run_newest_date: Optional[datetime] = field(default=None, init=False, repr=False)
+    _run_validators: Dict[str, Dict[str, str]] = field(default_factory=dict, init=False, repr=False)
+
+    @staticmethod
+    def page_key(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        if not params:
+            return url
+        return url + '?' + '&'.join(f"{key}={params[key]}" for key in sorted(params))
+
+    def conditional_headers(self, url: str, params: Optional[Mapping[str, Any]] = None) -> Dict[str, str]:
+        """
+        Заголовки условного запроса для страницы, по которой есть сохраненные валидаторы.
+        """
+        saved = self.validators.get(self.page_key(url, params), {})
+        return {VALIDATOR_HEADERS[name]: value for name, value in saved.items() if name in VALIDATOR_HEADERS}
+
+    def remember_validators(self, url: str, params: Optional[Mapping[str, Any]], headers: Mapping[str, str]):
+        saved = {name: headers[name] for name in VALIDATOR_HEADERS if headers.get(name)}
+        if saved:
+            self._run_validators[self.page_key(url, params)] = saved
+
+    def is_new(self, item: Dict[str, Any]) -> bool:
+        """
+        Появилось ли объявление после прошлого запуска. Сначала сравнивается дата
+        публикации, затем числовой id; объявление без того и другого считается новым.
+        """
+        published_at = _published_at(item)
+        if published_at is not None and self.newest_date is not None:
+            return published_at > self.newest_date
+        external_id = item.get('external_id')
+        if external_id is not None and self.newest_id is not None:
+            external_id = str(external_id)
+            return external_id != self.newest_id and (_newer_id(external_id, self.newest_id)
+                                                      or not external_id.isdigit())
+        return True
+
+    def observe(self, item: Dict[str, Any]):
+        """
+        Учет объявления, встреченного в текущем обходе.
+        """
+        published_at = _published_at(item)
+        if published_at is not None and (self._run_newest_date is None or published_at > self._run_newest_date):
+            self._run_newest_date = published_at
+        external_id = item.get('external_id')
+        if external_id is not None and _newer_id(str(external_id), self._run_newest_id):
+            self._run_newest_id = str(external_id)
+
+    def advance(self) -> "Checkpoint":
+        """
+        Состояние для следующего запуска: новейшие значения из прошлого и текущего обходов.
+        """
+        newest_id = self.newest_id
+        if _newer_id(self._run_newest_id, newest_id):
+            newest_id = self._run_newest_id
+        newest_date = max(filter(None, (self.newest_date, self._run_newest_date)), default=None)
+        return Checkpoint(self.parser, newest_id, newest_date, {**self.validators, **self._run_validators})
@@ -0,0 +1,180 @@
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+from loguru import logger
+
+from app.instrumentation import registry
+from .checkpoint import Checkpoint
+from .utils import NOT_MODIFIED, normalize_url
+
+if TYPE_CHECKING:
+    from .base_parser import Parser
+
+
+@dataclass(frozen=True)
+class FollowUrl:
+    """
+    Ссылка, которую parse_page возвращает наряду с объявлениями, чтобы краулер поставил ее в очередь.
+    Относительные URL разрешаются относительно текущей страницы.
+    """
+    url: str
+    params: Optional[Dict[str, Any]] = field(default=None, compare=False)
+
+
+parse_latency = registry.histogram(
+    'parser_parse_duration_seconds', 'Время разбора страницы парсером', ('parser',))
+
+ItemsSink = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class Crawler:
+    """
+    Конкурентный обход сайта вокруг Parser: очередь URL с дедупликацией и пул воркеров.
+    Ограничение частоты по доменам и повторы с backoff выполняет Parser.fetch_page.
+
+    Если у парсера задан checkpoint, обход инкрементальный: страница, на которой доля уже
+    виденных объявлений не меньше CRAWL_SEEN_STOP_RATIO, не порождает переходов дальше,
+    а неизмененная страница (304) не разбирается вовсе.
+    """
+
+    def __init__(self, parser: "Parser", workers: Optional[int] = None, max_pages: Optional[int] = None,
+                 on_items: Optional[ItemsSink] = None):
+        """
+        :param parser: Парсер, который загружает и разбирает страницы
+        :param workers: Количество одновременных воркеров
+        :param max_pages: Ограничение на количество загруженных страниц за запуск
+        :param on_items: Асинхронный обработчик объявлений со страницы; если не задан, объявления копятся в результате
+        """
+        self.parser = parser
+        self.workers = workers or parser.CRAWL_WORKERS
+        self.max_pages = max_pages if max_pages is not None else parser.CRAWL_MAX_PAGES
+        self.on_items = on_items
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.seen = set()
+        self.items: List[Dict[str, Any]] = []
+        self.pages_fetched = 0
+        self.pages_failed = 0
+        self.pages_unchanged = 0
+        self.pages_stopped = 0
+
+    def enqueue(self, url: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Постановка URL в очередь, если он еще не встречался и лимит страниц не исчерпан.
+        Один URL с разными params (например, номер страницы выдачи) — разные страницы.
+        """
+        url = normalize_url(url)
+        key = Checkpoint.page_key(url, params)
+        if key in self.seen:
+            return False
+        if self.max_pages and len(self.seen) >= self.max_pages:
+            return False
+        self.seen.add(key)
+        self.queue.put_nowait((url, params))
+        return True
+
+    async def run(self, start_urls: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        Обход начиная со start_urls до исчерпания очереди.
+
+        :return: Собранные объявления (пустой список, если задан on_items)
+        """
+        for url in start_urls:
+            self.enqueue(url)
+
+        tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            await self.queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        logger.info(
+            f"Обход завершен: страниц {self.pages_fetched}, без изменений {self.pages_unchanged}, "
+            f"ошибок {self.pages_failed}, объявлений {len(self.items)}"
+        )
+        return self.items
+
+    async def _worker(self):
+        while True:
+            url, params = await self.queue.get()
+            try:
+                await self._process(url, params)
+            except Exception as e:
+                self.pages_failed += 1
+                logger.error(f"Ошибка обработки страницы {url}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, url: str, params: Optional[Dict[str, Any]]):
+        html = await self.parser.fetch_page(url, params=params, raw=self.parser.raw_html)
+        if html is None:
+            self.pages_failed += 1
+            return
+        if html is NOT_MODIFIED:
+            self.pages_unchanged += 1
+            return
+        self.pages_fetched += 1
+
+        items = []
+        follow = []
+        async for result in self._iter_parsed(html):
+            if isinstance(result, FollowUrl):
+                follow.append(result)
+            elif result is not None:
+                items.append(result)
+
+        if not self._reached_seen(items):
+            for result in follow:
+                self.enqueue(urljoin(url, result.url), result.params)
+
+        if not items:
+            return
+        if self.on_items is not None:
+            await self.on_items(items)
+        else:
+            self.items.extend(items)
+
+    def _reached_seen(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        Дошел ли инкрементальный обход до объявлений, виденных в прошлом запуске.
+        Порог по доле, а не по первому совпадению, чтобы закрепленные старые объявления
+        в начале выдачи не обрывали обход.
+        """
+        checkpoint = self.parser.checkpoint
+        if checkpoint is None or not items:
+            return False
+        seen = 0
+        for item in items:
+            if not checkpoint.is_new(item):
+                seen += 1
+            checkpoint.observe(item)
+        if seen / len(items) < self.parser.CRAWL_SEEN_STOP_RATIO:
+            return False
+        self.pages_stopped += 1
+        return True
+
+    async def _iter_parsed(self, html):
+        """
+        Унифицирует результат parse_page: асинхронный генератор, список или одиночный объект.
+        Время от начала разбора до последнего результата попадает в parser_parse_duration_seconds.
+        """
+        started = time.perf_counter()
+        result = self.parser.parse_page(html)
+        if not inspect.isasyncgen(result):
+            result = await result
+            parse_latency.labels(self.parser.archive_name).observe(time.perf_counter() - started)
+            if isinstance(result, (list, tuple)):
+                for item in result:
+                    yield item
+            elif result is not None:
+                yield result
+            return
+
+        async for item in result:
+            yield item
+        parse_latency.labels(self.parser.archive_name).observe(time.perf_counter() - started)
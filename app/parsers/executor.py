@@ -0,0 +1,152 @@
+import asyncio
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+from lxml import etree, html as lxml_html
+
+from .crawler import FollowUrl
+
+# Кэш скомпилированных XPath-выражений; в каждом процессе-воркере заполняется один раз
+_XPATH_CACHE: Dict[str, etree.XPath] = {}
+# HTML-парсеры по кодировке страниц; парсер lxml не передается через pickle и создается в воркере
+_PARSER_CACHE: Dict[Optional[str], lxml_html.HTMLParser] = {}
+
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def compile_xpath(expression: str) -> etree.XPath:
+    compiled = _XPATH_CACHE.get(expression)
+    if compiled is None:
+        compiled = _XPATH_CACHE[expression] = etree.XPath(expression)
+    return compiled
+
+
+def html_parser(encoding: Optional[str]) -> lxml_html.HTMLParser:
+    parser = _PARSER_CACHE.get(encoding)
+    if parser is None:
+        parser = _PARSER_CACHE[encoding] = lxml_html.HTMLParser(encoding=encoding)
+    return parser
+
+
+def to_number(text: Optional[str]) -> Optional[float]:
+    """
+    Число из строки вида "12 500 000 ₽" или "45,5 м²".
+    """
+    if not text:
+        return None
+    match = _NUMBER_RE.search(text.replace('\xa0', '').replace(' ', ''))
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def to_int(text: Optional[str]) -> Optional[int]:
+    number = to_number(text)
+    return int(number) if number is not None else None
+
+
+class XPathExtractor:
+    """
+    Быстрый разбор страницы на lxml по заранее заданным XPath-выражениям, без дерева BeautifulSoup.
+
+    Экземпляр передается в процесс-воркер целиком, поэтому конвертеры должны быть
+    функциями уровня модуля. Выражения компилируются в воркере один раз и кэшируются.
+    """
+
+    def __init__(self, item_xpath: str, fields: Dict[str, str], follow_xpath: Optional[str] = None,
+                 converters: Optional[Dict[str, Callable[[Optional[str]], Any]]] = None,
+                 constants: Optional[Dict[str, Any]] = None, encoding: Optional[str] = 'utf-8'):
+        """
+        :param item_xpath: XPath карточек объявлений на странице
+        :param fields: XPath полей относительно карточки, например {'title': 'string(.//h3)'}
+        :param follow_xpath: XPath ссылок на следующие страницы (атрибут href)
+        :param converters: Преобразования значений полей, например {'price': to_number}
+        :param constants: Поля с постоянным значением, например {'source': 'avito'}
+        :param encoding: Кодировка страницы; None — по meta charset, а без него lxml читает байты как latin-1
+        """
+        self.item_xpath = item_xpath
+        self.fields = fields
+        self.follow_xpath = follow_xpath
+        self.converters = converters or {}
+        self.constants = constants or {}
+        self.encoding = encoding
+
+    def __call__(self, page: bytes) -> List[Any]:
+        if not page:
+            return []
+        document = lxml_html.fromstring(page, parser=html_parser(self.encoding))
+        results: List[Any] = []
+
+        for node in compile_xpath(self.item_xpath)(document):
+            item = dict(self.constants)
+            for name, expression in self.fields.items():
+                value = self._text(compile_xpath(expression)(node))
+                converter = self.converters.get(name)
+                item[name] = converter(value) if converter else value
+            results.append(item)
+
+        if self.follow_xpath:
+            for href in compile_xpath(self.follow_xpath)(document):
+                results.append(FollowUrl(str(href)))
+
+        return results
+
+    @staticmethod
+    def _text(value: Any) -> Optional[str]:
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value is None:
+            return None
+        if isinstance(value, etree._Element):
+            value = value.text_content()
+        text = ' '.join(str(value).split())
+        return text or None
+
+
+class ParseExecutor:
+    """
+    Пул процессов для CPU-bound разбора HTML, чтобы не блокировать event loop загрузчиков.
+    При max_workers=0 разбор выполняется в текущем процессе.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self.pool = ProcessPoolExecutor(max_workers=max_workers or None) if max_workers != 0 else None
+        logger.info(f"Parse executor initialized with workers: {max_workers or 'cpu_count'}")
+
+    async def run(self, func: Callable[..., Any], page: bytes, *args) -> Any:
+        """
+        Выполнение функции разбора над сырой страницей.
+
+        :param func: Функция уровня модуля или XPathExtractor (передается в воркер через pickle)
+        :param page: Сырое HTML-содержимое страницы
+        """
+        if self.pool is None:
+            return func(page, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, func, page, *args)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("Parse executor shut down.")
+
+
+_executor: Optional[ParseExecutor] = None
+
+
+def get_parse_executor(max_workers: Optional[int] = None) -> ParseExecutor:
+    """
+    Общий для всех парсеров пул разбора, создается при первом обращении.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ParseExecutor(max_workers)
+    return _executor
+
+
+def shutdown_parse_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
@@ -0,0 +1,118 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+from urllib.parse import urldefrag, urlparse
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Результат fetch_page для условного запроса, на который сервер ответил 304 Not Modified
+NOT_MODIFIED = object()
+
+
+def normalize_url(url: str) -> str:
+    """
+    Нормализация URL для дедупликации во фронтире: без фрагмента и пробелов по краям.
+    """
+    return urldefrag(url.strip())[0]
+
+
+def url_host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Экспоненциальная задержка с полным джиттером.
+
+    :param attempt: Номер попытки, начиная с 0
+    :param base: Базовая задержка, сек
+    :param cap: Максимальная задержка, сек
+    :return: Случайная задержка в диапазоне [0, min(cap, base * 2^attempt)]
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_delay(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    Разбор заголовка Retry-After (секунды или HTTP-дата).
+
+    :return: Задержка в секундах или None, если заголовка нет или он некорректен
+    """
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: не более rate запросов в секунду с всплеском до capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """
+        Ожидание свободного токена. Ожидающие обслуживаются по очереди.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Приостановка выдачи токенов, например после 429 с Retry-After.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class DomainRateLimiter:
+    """
+    Набор token bucket'ов, по одному на домен.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = url_host(url)
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        return self.buckets[host]
+
+    async def acquire(self, url: str):
+        await self.bucket(url).acquire()
+
+    def pause(self, url: str, seconds: float):
+        self.bucket(url).pause(seconds)
@@ -0,0 +1,281 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from decouple import config
+from loguru import logger
+
+# Маркер отсутствия значения: None — допустимое значение в кэше
+MISSING = object()
+
+TagsSpec = Union[Iterable[str], Callable[..., Iterable[str]]]
+
+
+class CacheConfig:
+    """
+    Класс конфигурации кэша.
+    """
+    CACHE_MAX_ENTRIES = config('CACHE_MAX_ENTRIES', default=10000, cast=int)
+    CACHE_TTL = config('CACHE_TTL', default=30, cast=float)
+    CACHE_LOCAL_TTL = config('CACHE_LOCAL_TTL', default=5, cast=float)
+    # Срок жизни версии данных (для ETag); изменения из других процессов видны с этой задержкой
+    CACHE_VERSION_TTL = config('CACHE_VERSION_TTL', default=1, cast=float)
+
+
+class LRUCache:
+    """
+    Локальный кэш процесса с вытеснением давно неиспользуемых записей и сроком жизни.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, on_evict: Optional[Callable[[str], None]] = None):
+        """
+        :param on_evict: Вызывается с ключом записи, вытесненной, истекшей или удаленной
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._evicted(key)
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            evicted, _ = self._data.popitem(last=False)
+            self._evicted(evicted)
+
+    def delete(self, key: str):
+        if self._data.pop(key, None) is not None:
+            self._evicted(key)
+
+    def clear(self):
+        self._data.clear()
+
+    def _evicted(self, key: str):
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+
+class CacheBackend(ABC):
+    """
+    Интерфейс общего для нескольких процессов уровня кэша (например, Redis).
+    Значения хранятся как есть; сериализацию, если она нужна, выполняет реализация.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        """Значение по ключу или MISSING."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        """Сохранение значения на ttl секунд."""
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        """Удаление ключей."""
+
+    @abstractmethod
+    async def add_to_tag(self, tag: str, key: str):
+        """Привязка ключа к тегу для последующей инвалидации."""
+
+    @abstractmethod
+    async def pop_tag(self, tag: str) -> Set[str]:
+        """Ключи, привязанные к тегу; сам тег удаляется."""
+
+
+class InMemoryBackend(CacheBackend):
+    """
+    Реализация общего уровня в памяти процесса: для тестов и запуска в одном процессе.
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[float, Any]] = {}
+        self.tags: Dict[str, Set[str]] = {}
+
+    async def get(self, key: str) -> Any:
+        entry = self.data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.data.pop(key, None)
+            return MISSING
+        return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self.data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def add_to_tag(self, tag: str, key: str):
+        self.tags.setdefault(tag, set()).add(key)
+
+    async def pop_tag(self, tag: str) -> Set[str]:
+        return self.tags.pop(tag, set())
+
+
+class Cache(CacheConfig):
+    """
+    Read-through кэш: локальный LRU+TTL уровень, необязательный общий уровень и
+    объединение одновременных промахов по одному ключу в один запрос к источнику.
+
+    Записи помечаются тегами; invalidate(tag) удаляет все связанные ключи на обоих уровнях.
+    Локальный уровень других процессов общий уровень не чистит, поэтому его TTL
+    (CACHE_LOCAL_TTL) при наличии общего уровня держится коротким.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 backend: Optional[CacheBackend] = None, local_ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else self.CACHE_TTL
+        self.backend = backend
+        if local_ttl is None:
+            local_ttl = self.CACHE_LOCAL_TTL if backend is not None else self.ttl
+        self.local = LRUCache(max_entries or self.CACHE_MAX_ENTRIES, local_ttl, on_evict=self._untag)
+        # Ключи локального уровня по тегам и обратное соответствие, чтобы вытесненные
+        # и истекшие записи не копились в тегах до следующей инвалидации
+        self._tags: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Tuple[str, ...]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Счетчик инвалидаций: результат загрузки, начатой до инвалидации, в кэш не кладется
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    async def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is MISSING and self.backend is not None:
+            value = await self.backend.get(key)
+            if value is not MISSING:
+                self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        ttl = ttl if ttl is not None else self.ttl
+        tags = tuple(tags)
+        self._untag(key)
+        self.local.set(key, value, min(ttl, self.local.ttl))
+        if tags:
+            self._key_tags[key] = tags
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+        if self.backend is not None:
+            await self.backend.set(key, value, ttl)
+            for tag in tags:
+                await self.backend.add_to_tag(tag, key)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None,
+                          tags: Iterable[str] = ()) -> Any:
+        """
+        Значение из кэша или результат loader(); одновременные промахи ждут один и тот же вызов.
+
+        Загрузка идет в отдельной задаче: отмена запроса, который ее начал (например,
+        клиент закрыл соединение), не отменяет ее для остальных ожидающих.
+        """
+        value = await self.get(key)
+        if value is not MISSING:
+            self.stats['hits'] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['misses'] += 1
+            task = asyncio.ensure_future(self._load(key, loader, ttl, tags))
+            task.add_done_callback(_retrieve_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[float],
+                    tags: Iterable[str]) -> Any:
+        generation = self._generation
+        try:
+            value = await loader()
+            if generation == self._generation:
+                await self.set(key, value, ttl, tags)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, *tags: str):
+        """
+        Удаление всех записей, помеченных любым из тегов.
+        """
+        self._generation += 1
+        keys: Set[str] = set()
+        for tag in tags:
+            keys |= self._tags.pop(tag, set())
+            if self.backend is not None:
+                keys |= await self.backend.pop_tag(tag)
+        for key in keys:
+            self.local.delete(key)
+        if self.backend is not None and keys:
+            await self.backend.delete(*keys)
+        if keys:
+            logger.debug(f"Кэш инвалидирован по тегам {tags}: {len(keys)} ключей")
+
+    async def clear(self):
+        self.local.clear()
+        self._tags.clear()
+        self._key_tags.clear()
+
+    def _untag(self, key: str):
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Ошибку загрузки получают ожидающие; если все они отменены, она не должна попасть в лог asyncio
+    if not task.cancelled():
+        task.exception()
+
+
+def make_cache_key(namespace: str, args: tuple, kwargs: dict) -> str:
+    payload = json.dumps([args, kwargs], sort_keys=True, default=str, ensure_ascii=False)
+    return f"{namespace}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def cached(cache: Cache, namespace: Optional[str] = None, ttl: Optional[float] = None, tags: TagsSpec = ()):
+    """
+    Декоратор read-through кэширования асинхронной функции или метода.
+
+    Ключ строится из имени функции и аргументов (self методов не учитывается).
+    tags — список тегов или функция от аргументов вызова, возвращающая теги.
+    """
+    def decorator(func):
+        namespace_ = namespace or func.__qualname__
+        is_method = next(iter(inspect.signature(func).parameters), None) == 'self'
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key_args = args[1:] if is_method else args
+            key = make_cache_key(namespace_, key_args, kwargs)
+            call_tags = tags(*args, **kwargs) if callable(tags) else tags
+            return await cache.get_or_load(key, lambda: func(*args, **kwargs), ttl=ttl, tags=call_tags)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,237 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from decouple import config
+from loguru import logger
+
+from .database import DatabaseExecutor, statements
+from .queries import ListingService
+
+# Типы изменений в listing_changes; записываются триггерами на listings (см. models.sql)
+CHANGE_OPS = ('insert', 'update', 'price', 'delete')
+
+SELECT_CHANGES = statements.register('listing_changes.page', """
+SELECT seq, listing_id, op, price, old_price, changed_at,
+       UNIX_TIMESTAMP(NOW(6)) - UNIX_TIMESTAMP(changed_at) AS age
+FROM listing_changes
+WHERE seq > %s
+ORDER BY seq
+LIMIT %s
+""")
+SELECT_CHANGES_BOUNDS = statements.register(
+    'listing_changes.bounds', "SELECT MIN(seq), MAX(seq) FROM listing_changes"
+)
+PRUNE_CHANGES = statements.register('listing_changes.prune', """
+DELETE FROM listing_changes
+WHERE changed_at < NOW() - INTERVAL %s DAY
+ORDER BY seq
+LIMIT %s
+""")
+
+
+class ChangeFeedConfig:
+    """
+    Класс конфигурации ленты изменений объявлений.
+    """
+    # Как часто проверять новые изменения, пока есть ожидающие клиенты, сек
+    CHANGE_FEED_POLL_INTERVAL = config('CHANGE_FEED_POLL_INTERVAL', default=0.5, cast=float)
+    # Сколько ждать незафиксированную транзакцию, занявшую номер перед уже видимым изменением, сек
+    CHANGE_FEED_GAP_TIMEOUT = config('CHANGE_FEED_GAP_TIMEOUT', default=30, cast=float)
+    # Наибольшее время ожидания long-poll запроса, сек
+    CHANGE_FEED_MAX_WAIT = config('CHANGE_FEED_MAX_WAIT', default=30, cast=float)
+    # Интервал пустых событий потока SSE, чтобы прокси не закрывали простаивающее соединение, сек
+    CHANGE_FEED_HEARTBEAT = config('CHANGE_FEED_HEARTBEAT', default=15, cast=float)
+    CHANGE_FEED_RETENTION_DAYS = config('CHANGE_FEED_RETENTION_DAYS', default=14, cast=int)
+    CHANGE_FEED_PRUNE_BATCH = config('CHANGE_FEED_PRUNE_BATCH', default=10000, cast=int)
+
+
+class ChangeFeedExpired(Exception):
+    """
+    Изменения после запрошенного номера уже удалены по сроку хранения; нужна полная синхронизация.
+    """
+
+    def __init__(self, since: int, oldest: int, head: int):
+        self.since = since
+        self.oldest = oldest
+        self.head = head
+        super().__init__(f"Изменения после {since} удалены, самое раннее доступное: {oldest}")
+
+
+@dataclass
+class ChangesPage:
+    """
+    Страница ленты: изменения по возрастанию seq и курсор для следующего запроса.
+
+    has_more — за страницей уже есть изменения (в том числе задержанные незакрытым пропуском),
+    head — наибольший выданный базой номер изменения на момент запроса.
+    """
+    changes: List[Dict[str, Any]] = field(default_factory=list)
+    next_since: int = 0
+    head: int = 0
+    has_more: bool = False
+
+
+class ChangeFeed(DatabaseExecutor, ChangeFeedConfig):
+    """
+    Лента изменений объявлений для инкрементальной синхронизации.
+
+    Номера изменений (seq) выдает AUTO_INCREMENT таблицы listing_changes, которую
+    заполняют триггеры на вставку, изменение и удаление объявлений. Номер занимается
+    при записи, а виден после фиксации транзакции, поэтому при пропуске в номерах
+    страница обрывается перед ним, пока пропуск моложе CHANGE_FEED_GAP_TIMEOUT:
+    иначе клиент сдвинул бы курсор дальше изменения, которое появится позже.
+    Пропуск старше таймаута считается откатом транзакции.
+
+    Ожидание новых изменений (long-poll, SSE) обслуживает один опрос MAX(seq)
+    на процесс, сколько бы клиентов ни ждали.
+    """
+    _head = 0
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _condition: Optional[asyncio.Condition] = None
+    _poller: Optional[asyncio.Task] = None
+    _waiters = 0
+
+    def __init__(self, listing_service: Optional[ListingService] = None):
+        self.listing_service = listing_service or ListingService()
+
+    async def bounds(self) -> Sequence[Optional[int]]:
+        """
+        Самый ранний хранимый и последний номер изменения.
+        """
+        rows = await self.execute_query(SELECT_CHANGES_BOUNDS, fetch=True)
+        return rows[0]
+
+    async def get_changes(self, since: int = 0, limit: int = 500, columns: Optional[Sequence[str]] = None,
+                          include_listing: bool = True) -> ChangesPage:
+        """
+        Изменения с номером больше since.
+
+        Args:
+            since (int): Последний обработанный клиентом номер изменения, 0 — с самого раннего
+                хранимого изменения.
+            limit (int): Наибольшее число изменений на странице.
+            columns (Optional[Sequence[str]]): Колонки текущего состояния объявления.
+            include_listing (bool): Добавить текущее состояние объявления (None для удаленных).
+
+        Raises:
+            ChangeFeedExpired: Изменения после since уже удалены по сроку хранения.
+        """
+        oldest, head = await self.bounds()
+        head = head or 0
+        ChangeFeed._head = max(ChangeFeed._head, head)
+        if since == 0 and oldest is not None:
+            # Новый клиент начинает с хранимой части ленты; ранние изменения уже удалены prune
+            since = oldest - 1
+        elif oldest is not None and since + 1 < oldest and since < head:
+            raise ChangeFeedExpired(since, oldest, head)
+
+        rows = await self.execute_query(SELECT_CHANGES, (since, limit + 1), fetch=True, dict_rows=True)
+        changes = []
+        expected = since + 1
+        stalled = False
+        for row in rows[:limit]:
+            age = float(row.pop('age'))
+            if row['seq'] != expected and age < self.CHANGE_FEED_GAP_TIMEOUT:
+                stalled = True
+                break
+            changes.append(row)
+            expected = row['seq'] + 1
+
+        if include_listing and changes:
+            listings = await self.listing_service.get_listings_by_ids(
+                list({change['listing_id'] for change in changes}), columns=columns
+            )
+            for change in changes:
+                change['listing'] = listings.get(change['listing_id'])
+
+        return ChangesPage(
+            changes=changes,
+            next_since=changes[-1]['seq'] if changes else since,
+            head=head,
+            has_more=stalled or len(rows) > limit,
+        )
+
+    async def poll_changes(self, since: int = 0, limit: int = 500, timeout: float = 0,
+                           columns: Optional[Sequence[str]] = None, include_listing: bool = True) -> ChangesPage:
+        """
+        Long-poll: страница изменений, а если их нет — ожидание первых новых до timeout секунд.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            page = await self.get_changes(since, limit, columns, include_listing)
+            remaining = deadline - loop.time()
+            if page.changes or remaining <= 0:
+                return page
+            if page.has_more:
+                # Впереди незакрытый пропуск: ждем фиксации транзакции, а не нового номера
+                await asyncio.sleep(min(self.CHANGE_FEED_POLL_INTERVAL, remaining))
+            else:
+                await self.wait_for_head(page.head, remaining)
+
+    async def follow(self, since: int = 0, limit: int = 500, columns: Optional[Sequence[str]] = None,
+                     include_listing: bool = True) -> AsyncIterator[ChangesPage]:
+        """
+        Бесконечный поток страниц изменений для SSE. Если за CHANGE_FEED_HEARTBEAT
+        изменений не появилось, выдается пустая страница.
+        """
+        while True:
+            page = await self.poll_changes(since, limit, self.CHANGE_FEED_HEARTBEAT, columns, include_listing)
+            yield page
+            since = page.next_since
+
+    async def wait_for_head(self, after: int, timeout: float) -> bool:
+        """
+        Ожидание изменения с номером больше after.
+
+        :return: True, если оно появилось до истечения timeout
+        """
+        loop = asyncio.get_running_loop()
+        if ChangeFeed._loop is not loop:
+            # Условие и задача опроса привязаны к циклу событий, в котором созданы
+            ChangeFeed._loop, ChangeFeed._condition, ChangeFeed._poller = loop, asyncio.Condition(), None
+        condition = ChangeFeed._condition
+        ChangeFeed._waiters += 1
+        if ChangeFeed._poller is None or ChangeFeed._poller.done():
+            ChangeFeed._poller = asyncio.create_task(self._poll_head())
+        try:
+            async with condition:
+                return await asyncio.wait_for(condition.wait_for(lambda: ChangeFeed._head > after), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            ChangeFeed._waiters -= 1
+
+    async def _poll_head(self):
+        """
+        Опрос последнего номера изменения, пока есть ожидающие клиенты.
+        """
+        while ChangeFeed._waiters > 0:
+            try:
+                _, head = await self.bounds()
+                if head is not None and head > ChangeFeed._head:
+                    ChangeFeed._head = head
+                    async with ChangeFeed._condition:
+                        ChangeFeed._condition.notify_all()
+            except Exception as e:
+                logger.error(f"Ошибка опроса ленты изменений: {e}")
+            await asyncio.sleep(self.CHANGE_FEED_POLL_INTERVAL)
+
+    async def prune(self) -> int:
+        """
+        Удаление изменений старше CHANGE_FEED_RETENTION_DAYS пачками по CHANGE_FEED_PRUNE_BATCH.
+
+        :return: Количество удаленных записей
+        """
+        removed = 0
+        while True:
+            async with self.transaction() as cursor:
+                await cursor.execute(PRUNE_CHANGES.sql, (self.CHANGE_FEED_RETENTION_DAYS, self.CHANGE_FEED_PRUNE_BATCH))
+                deleted = cursor.rowcount
+            removed += deleted
+            if deleted < self.CHANGE_FEED_PRUNE_BATCH:
+                break
+        if removed:
+            logger.info(f"Из ленты изменений удалено {removed} записей старше {self.CHANGE_FEED_RETENTION_DAYS} дн.")
+        return removed
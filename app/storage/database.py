@@ -1,9 +1,15 @@
-from typing import Any, List, Optional
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence, Union
 from decouple import config
 import aiomysql
 from aiomysql import Pool
 from loguru import logger
 
+from app.instrumentation import add_timing, registry
+
 class DBConfig:
     """
     Класс конфигурации для базы данных.
@@ -12,6 +18,16 @@ class DBConfig:
     DATABASE = config('DATABASE', default='mydb')
     USER = config('USER', default='root')
     PASSWORD = config('PASSWORD', default='password')
+    BULK_CHUNK_SIZE = config('BULK_CHUNK_SIZE', default=1000, cast=int)
+    POOL_MINSIZE = config('DB_POOL_MINSIZE', default=1, cast=int)
+    POOL_MAXSIZE = config('DB_POOL_MAXSIZE', default=10, cast=int)
+    POOL_RECYCLE = config('DB_POOL_RECYCLE', default=3600, cast=int)
+    POOL_ACQUIRE_TIMEOUT = config('DB_POOL_ACQUIRE_TIMEOUT', default=10, cast=float)
+    PING_IDLE_SECONDS = config('DB_PING_IDLE_SECONDS', default=30, cast=float)
+    CONNECT_TIMEOUT = config('DB_CONNECT_TIMEOUT', default=10, cast=int)
+    QUERY_TIMEOUT_MS = config('DB_QUERY_TIMEOUT_MS', default=30000, cast=int)
+    SLOW_QUERY_MS = config('DB_SLOW_QUERY_MS', default=500, cast=float)
+    LOG_SAMPLE_RATE = config('DB_LOG_SAMPLE_RATE', default=0.01, cast=float)
 
     @classmethod
     def validate(cls):
@@ -22,70 +38,356 @@ class DBConfig:
             raise ValueError("Все параметры базы данных (HOST, DATABASE, USER, PASSWORD) должны быть заданы.")
 
 
+class Statement(NamedTuple):
+    """
+    SQL-запрос с именем, под которым он попадает в логи и метрики вместо полного текста.
+    """
+    name: str
+    sql: str
+
+
+class StatementRegistry:
+    """
+    Реестр именованных запросов: текст собирается и нормализуется один раз при регистрации.
+    """
+
+    def __init__(self):
+        self._statements: Dict[str, Statement] = {}
+
+    def register(self, name: str, sql: str) -> Statement:
+        statement = Statement(name, ' '.join(sql.split()))
+        existing = self._statements.get(name)
+        if existing is not None and existing.sql != statement.sql:
+            raise ValueError(f"Запрос с именем {name} уже зарегистрирован с другим текстом.")
+        self._statements[name] = statement
+        return statement
+
+    def __getitem__(self, name: str) -> Statement:
+        return self._statements[name]
+
+    def __iter__(self) -> Iterator[Statement]:
+        return iter(self._statements.values())
+
+
+statements = StatementRegistry()
+
+Query = Union[str, Statement]
+
+
+def as_statement(query: Query) -> Statement:
+    """
+    Приведение запроса к Statement; для произвольного текста используется имя adhoc.
+    """
+    return query if isinstance(query, Statement) else Statement('adhoc', query)
+
+
+class PoolMetrics:
+    """
+    Метрики работы с пулом соединений. Хранятся в общем реестре метрик
+    и выгружаются вместе с метриками HTTP на /metrics.
+    """
+
+    def __init__(self):
+        self.acquire_wait = registry.histogram(
+            'db_pool_acquire_wait_seconds', 'Ожидание соединения из пула')
+        self.query_latency = registry.histogram(
+            'db_query_duration_seconds', 'Время выполнения запросов к базе', ('statement',))
+        self.acquire_timeouts = registry.counter(
+            'db_pool_acquire_timeouts_total', 'Превышения времени ожидания соединения')
+        self.query_errors = registry.counter(
+            'db_query_errors_total', 'Ошибки выполнения запросов к базе', ('statement',))
+        self.pings = registry.counter(
+            'db_pool_pings_total', 'Проверки простаивавших соединений')
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'acquire_wait_seconds': self.acquire_wait.snapshot(),
+            'query_latency_seconds': self.query_latency.snapshot(),
+            'acquire_timeouts': int(self.acquire_timeouts.total),
+            'query_errors': int(self.query_errors.total),
+            'pings': int(self.pings.total),
+        }
+
+
 class DatabaseExecutor(DBConfig):
     """
     Базовый класс для работы с базой данных.
+
+    Пул соединений и метрики общие для всех наследников и хранятся на уровне
+    DatabaseExecutor. Пул создается при старте приложения (см. main.lifespan)
+    или лениво при первом запросе.
     """
     db_pool: Pool = None
+    metrics = PoolMetrics()
+    _pool_lock: Optional[asyncio.Lock] = None
 
     async def init_db_pool(self) -> Pool:
         """
-        Инициализация пула соединений.
+        Инициализация пула соединений. Одновременные первые вызовы создают один пул.
         """
-        if not self.db_pool:
-            try:
-                self.db_pool = await aiomysql.create_pool(
-                    host=self.HOST,
-                    db=self.DATABASE,
-                    user=self.USER,
-                    password=self.PASSWORD,
-                    minsize=1,
-                    maxsize=10,
-                )
-                logger.info("Пул соединений успешно создан.")
-            except Exception as e:
-                logger.error(f"Ошибка при создании пула соединений: {e}")
-                raise
-        return self.db_pool
+        if DatabaseExecutor.db_pool is not None:
+            return DatabaseExecutor.db_pool
+
+        if DatabaseExecutor._pool_lock is None:
+            DatabaseExecutor._pool_lock = asyncio.Lock()
+
+        async with DatabaseExecutor._pool_lock:
+            if DatabaseExecutor.db_pool is None:
+                try:
+                    DatabaseExecutor.db_pool = await aiomysql.create_pool(
+                        host=self.HOST,
+                        db=self.DATABASE,
+                        user=self.USER,
+                        password=self.PASSWORD,
+                        minsize=self.POOL_MINSIZE,
+                        maxsize=self.POOL_MAXSIZE,
+                        pool_recycle=self.POOL_RECYCLE,
+                        connect_timeout=self.CONNECT_TIMEOUT,
+                        # Ограничение времени SELECT на стороне сервера
+                        init_command=f"SET SESSION MAX_EXECUTION_TIME={self.QUERY_TIMEOUT_MS}",
+                    )
+                    logger.info(
+                        f"Пул соединений успешно создан: minsize={self.POOL_MINSIZE}, maxsize={self.POOL_MAXSIZE}."
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка при создании пула соединений: {e}")
+                    raise
+        return DatabaseExecutor.db_pool
 
     async def close_db_pool(self):
         """
         Закрытие пула соединений.
         """
-        if self.db_pool:
-            self.db_pool.close()
-            await self.db_pool.wait_closed()
+        pool = DatabaseExecutor.db_pool
+        if pool:
+            DatabaseExecutor.db_pool = None
+            pool.close()
+            await pool.wait_closed()
             logger.info("Пул соединений закрыт.")
 
-    async def execute_query(self, query: str, params: Optional[List[Any]] = None, fetch: bool = False) -> Optional[List[Any]]:
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiomysql.Connection]:
+        """
+        Получение соединения из пула с учетом времени ожидания.
+
+        Соединение, простаивавшее дольше PING_IDLE_SECONDS, перед выдачей
+        проверяется ping'ом с переподключением.
+        """
+        pool = await self.init_db_pool()
+
+        started = time.perf_counter()
+        try:
+            connection = await asyncio.wait_for(pool.acquire(), timeout=self.POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.metrics.acquire_timeouts.inc()
+            logger.error(f"Превышено время ожидания соединения из пула: {self.POOL_ACQUIRE_TIMEOUT} с.")
+            raise
+        self.metrics.acquire_wait.observe(time.perf_counter() - started)
+
+        try:
+            if asyncio.get_running_loop().time() - connection.last_usage > self.PING_IDLE_SECONDS:
+                self.metrics.pings.inc()
+                await connection.ping(reconnect=True)
+            yield connection
+        finally:
+            await pool.release(connection)
+
+    @asynccontextmanager
+    async def dedicated_connection(self) -> AsyncIterator[aiomysql.Connection]:
+        """
+        Отдельное соединение вне пула для долгих сессионных блокировок (GET_LOCK),
+        чтобы они не забирали соединения у запросов API.
+        """
+        connection = await aiomysql.connect(
+            host=self.HOST,
+            db=self.DATABASE,
+            user=self.USER,
+            password=self.PASSWORD,
+            connect_timeout=self.CONNECT_TIMEOUT,
+        )
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Состояние пула и метрики для мониторинга.
+        """
+        pool = DatabaseExecutor.db_pool
+        stats = {
+            'initialized': pool is not None,
+            'minsize': self.POOL_MINSIZE,
+            'maxsize': self.POOL_MAXSIZE,
+            'size': pool.size if pool else 0,
+            'free': pool.freesize if pool else 0,
+            'in_use': pool.size - pool.freesize if pool else 0,
+        }
+        stats.update(self.metrics.snapshot())
+        return stats
+
+    async def health_check(self) -> bool:
+        """
+        Проверка доступности базы данных запросом SELECT 1.
+        """
+        try:
+            async with self.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute("SELECT 1")
+                    await cursor.fetchone()
+            return True
+        except Exception as e:
+            logger.error(f"Проверка базы данных не пройдена: {e}")
+            return False
+
+    def record_query(self, statement: Statement, elapsed: float):
+        """
+        Учет выполненного запроса: гистограмма задержек по имени запроса и время
+        в базе текущего HTTP-запроса всегда, лог — только для медленных запросов
+        и для выборки доли DB_LOG_SAMPLE_RATE остальных.
+        В лог попадают имя запроса и время, без текста и параметров.
+        """
+        self.metrics.query_latency.labels(statement.name).observe(elapsed)
+        add_timing('db', elapsed)
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= self.SLOW_QUERY_MS:
+            logger.warning("Медленный запрос {}: {:.1f} мс", statement.name, elapsed_ms)
+        elif self.LOG_SAMPLE_RATE and random.random() < self.LOG_SAMPLE_RATE:
+            logger.debug("Выполнен запрос {}: {:.2f} мс", statement.name, elapsed_ms)
+
+    async def execute_query(self, query: Query, params: Optional[Sequence[Any]] = None, fetch: bool = False,
+                            dict_rows: bool = False) -> Optional[List[Any]]:
         """
         Выполнение SQL-запроса.
         
         Args:
-            query (str): SQL-запрос для выполнения.
-            params (Optional[List[Any]]): Параметры для запроса.
+            query (Query): Именованный запрос из реестра statements или текст SQL.
+            params (Optional[Sequence[Any]]): Параметры для запроса.
             fetch (bool): Если True, выполняется SELECT и возвращаются данные.
+            dict_rows (bool): Если True, строки возвращаются словарями.
         
         Returns:
             Optional[List[Any]]: Результаты запроса для SELECT, иначе None.
         """
-        pool = await self.init_db_pool()
+        statement = as_statement(query)
+        result = None
 
         try:
-            async with pool.acquire() as connection:
-                async with connection.cursor() as cursor:
-                    await cursor.execute(query, params)
-                    
+            async with self.acquire() as connection:
+                async with connection.cursor(*((aiomysql.DictCursor,) if dict_rows else ())) as cursor:
+                    started = time.perf_counter()
+                    await cursor.execute(statement.sql, params)
+
                     if fetch:
                         result = await cursor.fetchall()
-                        logger.info(f"Выполнен запрос: {query}")
-                        return result
+                    else:
+                        await connection.commit()
+                    self.record_query(statement, time.perf_counter() - started)
+
+        except Exception as e:
+            self.metrics.query_errors.labels(statement.name).inc()
+            logger.error(f"Ошибка выполнения запроса {statement.name}: {e}")
+            raise
+
+        return result
+
+    async def stream_query(self, query: Query, params: Optional[Sequence[Any]] = None,
+                           batch_size: int = 1000) -> AsyncIterator[dict]:
+        """
+        Потоковое чтение результата SELECT через небуферизованный серверный курсор.
+
+        Строки читаются с сервера пачками по batch_size по мере потребления,
+        поэтому память не зависит от размера результата. Соединение занято
+        до конца итерации.
+
+        Args:
+            query (Query): Именованный запрос из реестра statements или текст SQL.
+            params (Optional[Sequence[Any]]): Параметры для запроса.
+            batch_size (int): Количество строк, читаемых за один раз.
 
-                    await connection.commit()
-                    logger.info(f"Выполнен запрос: {query} с параметрами: {params}")
+        Yields:
+            dict: Очередная строка результата.
+        """
+        statement = as_statement(query)
 
+        try:
+            async with self.acquire() as connection:
+                async with connection.cursor(aiomysql.SSDictCursor) as cursor:
+                    started = time.perf_counter()
+                    await cursor.execute(statement.sql, params)
+                    rows_read = 0
+                    while True:
+                        rows = await cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        rows_read += len(rows)
+                        for row in rows:
+                            yield row
+            logger.info(f"Выполнен потоковый запрос {statement.name}: {rows_read} строк за {time.perf_counter() - started:.2f} с")
         except Exception as e:
-            logger.error(f"Ошибка выполнения запроса: {query}, параметры: {params}, ошибка: {e}")
+            self.metrics.query_errors.labels(statement.name).inc()
+            logger.error(f"Ошибка потокового запроса {statement.name}: {e}")
             raise
 
-        return None
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiomysql.Cursor]:
+        """
+        Транзакция на одном соединении из пула.
+
+        Выдает курсор; при успешном выходе из блока изменения коммитятся,
+        при исключении откатываются.
+        """
+        async with self.acquire() as connection:
+            await connection.begin()
+            try:
+                async with connection.cursor() as cursor:
+                    yield cursor
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+
+    async def execute_many(self, query: Query, params_seq: Sequence[Sequence[Any]], chunk_size: Optional[int] = None) -> int:
+        """
+        Пакетное выполнение SQL-запроса в одной транзакции.
+
+        Для INSERT ... VALUES (%s, ...) драйвер собирает каждый чанк в один
+        многострочный INSERT, поэтому на чанк уходит один round trip.
+        При ошибке вся транзакция откатывается.
+
+        Args:
+            query (Query): Именованный запрос из реестра statements или текст SQL.
+            params_seq (Sequence[Sequence[Any]]): Наборы параметров, по одному на строку.
+            chunk_size (Optional[int]): Размер чанка, по умолчанию BULK_CHUNK_SIZE.
+
+        Returns:
+            int: Количество затронутых строк.
+        """
+        statement = as_statement(query)
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        affected = 0
+
+        try:
+            started = time.perf_counter()
+            async with self.transaction() as cursor:
+                for start in range(0, len(params_seq), chunk_size):
+                    await cursor.executemany(statement.sql, params_seq[start:start + chunk_size])
+                    affected += cursor.rowcount
+            self.record_query(statement, time.perf_counter() - started)
+            logger.info(f"Выполнен пакетный запрос {statement.name}: {len(params_seq)} строк, чанк {chunk_size}")
+        except Exception as e:
+            self.metrics.query_errors.labels(statement.name).inc()
+            logger.error(f"Ошибка пакетного выполнения запроса {statement.name}, строк: {len(params_seq)}, ошибка: {e}")
+            raise
+
+        return affected
+
+
+def _pool_connections() -> Dict[tuple, int]:
+    pool = DatabaseExecutor.db_pool
+    if pool is None:
+        return {('in_use',): 0, ('free',): 0}
+    return {('in_use',): pool.size - pool.freesize, ('free',): pool.freesize}
+
+
+registry.gauge('db_pool_connections', 'Соединения пула по состоянию', ('state',), callback=_pool_connections)
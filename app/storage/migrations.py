@@ -0,0 +1,281 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Sequence, Set, Tuple
+
+from decouple import config
+from loguru import logger
+
+from .database import DatabaseExecutor
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+SELECT_APPLIED = "SELECT version FROM schema_migrations"
+RECORD_MIGRATION = "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)"
+
+
+class MigrationConfig:
+    """
+    Класс конфигурации миграций схемы базы данных.
+    """
+    # Применять миграции при запуске приложения; иначе — python -m app.storage.migrations
+    MIGRATE_ON_STARTUP = config('MIGRATE_ON_STARTUP', default=False, cast=bool)
+    # Сколько ждать блокировку, пока миграции применяет другой процесс, сек
+    MIGRATION_LOCK_TIMEOUT = config('MIGRATION_LOCK_TIMEOUT', default=600, cast=int)
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Изменение схемы для баз, созданных по прежней версии models.sql.
+
+    models.sql всегда описывает актуальную схему и сразу отмечает включенные в нее
+    миграции в schema_migrations, поэтому на новой базе они не выполняются. База,
+    созданная по исходной схеме (без schema_migrations), проходит их все по порядку.
+    Каждое изменение CREATE TABLE в models.sql сопровождается новой миграцией.
+    """
+    version: int
+    name: str
+    statements: Tuple[str, ...]
+
+
+MIGRATIONS: Sequence[Migration] = (
+    Migration(1, 'listing_sources_unique', (
+        # Дубликаты имен сливаются в источник с наименьшим id: ссылки на остальные
+        # переносятся на него до удаления, иначе ON DELETE CASCADE удалит их строки
+        """UPDATE listing_prices p
+            JOIN listing_sources s ON s.id = p.source_id
+            JOIN (SELECT name, MIN(id) AS id FROM listing_sources GROUP BY name) keep ON keep.name = s.name
+            SET p.source_id = keep.id
+            WHERE p.source_id <> keep.id""",
+        """UPDATE listing_analytics a
+            JOIN listing_sources s ON s.id = a.source_id
+            JOIN (SELECT name, MIN(id) AS id FROM listing_sources GROUP BY name) keep ON keep.name = s.name
+            SET a.source_id = keep.id
+            WHERE a.source_id <> keep.id""",
+        """DELETE s FROM listing_sources s
+            JOIN listing_sources keep ON keep.name = s.name AND keep.id < s.id""",
+        "ALTER TABLE listing_sources ADD UNIQUE KEY uq_listing_sources_name (name)",
+        """INSERT IGNORE INTO listing_sources (name, base_url) VALUES
+            ('avito', 'https://www.avito.ru'),
+            ('cian', 'https://www.cian.ru')""",
+    )),
+    Migration(2, 'listings_source_keys', (
+        # Идентификация объявления в источнике для upsert и отпечаток содержимого
+        """ALTER TABLE listings
+            ADD COLUMN source_id INT AFTER id,
+            ADD COLUMN external_id VARCHAR(255) AFTER source_id,
+            ADD COLUMN url VARCHAR(512) AFTER external_id,
+            ADD COLUMN content_hash CHAR(40) AFTER location,
+            ADD UNIQUE KEY uq_listings_source_external (source_id, external_id),
+            ADD FOREIGN KEY (source_id) REFERENCES listing_sources(id) ON DELETE SET NULL""",
+    )),
+    Migration(3, 'listing_prices_unique', (
+        # Из повторов цены объявления по одному источнику остается последняя запись
+        """DELETE p FROM listing_prices p
+            JOIN listing_prices newer
+                ON newer.listing_id = p.listing_id AND newer.source_id = p.source_id AND newer.id > p.id""",
+        """ALTER TABLE listing_prices
+            MODIFY source_url VARCHAR(512) NOT NULL,
+            ADD UNIQUE KEY uq_listing_prices_listing_source (listing_id, source_id)""",
+    )),
+    Migration(4, 'listings_filter_indexes', (
+        """ALTER TABLE listings
+            ADD INDEX idx_listings_deal_rooms_price (deal_type, rooms, price, id),
+            ADD INDEX idx_listings_deal_price (deal_type, price, id),
+            ADD INDEX idx_listings_deal_area (deal_type, area, id),
+            ADD INDEX idx_listings_location (location, id),
+            ADD INDEX idx_listings_created (created_at, id)""",
+    )),
+    Migration(5, 'price_rollups', (
+        """CREATE TABLE listing_price_rollups (
+            metric VARCHAR(20) NOT NULL,
+            deal_type VARCHAR(50) NOT NULL,
+            rooms INT NOT NULL,
+            district VARCHAR(255) NOT NULL,
+            week_start DATE NOT NULL,
+            bucket SMALLINT NOT NULL,
+            observations INT NOT NULL,
+            sum_value DECIMAL(20, 2) NOT NULL,
+            PRIMARY KEY (metric, deal_type, rooms, district, week_start, bucket),
+            INDEX idx_price_rollups_week (metric, week_start)
+        )""",
+        """CREATE TABLE analytics_watermarks (
+            name VARCHAR(50) PRIMARY KEY,
+            last_id INT NOT NULL DEFAULT 0
+        )""",
+        "INSERT INTO analytics_watermarks (name, last_id) VALUES ('price_rollups', 0)",
+    )),
+    Migration(6, 'listings_geo', (
+        """ALTER TABLE listings
+            ADD COLUMN latitude DOUBLE AFTER location,
+            ADD COLUMN longitude DOUBLE AFTER latitude,
+            ADD COLUMN geocoded_at TIMESTAMP NULL AFTER longitude,
+            ADD INDEX idx_listings_geocoded (geocoded_at, id),
+            ADD INDEX idx_listings_coordinates (latitude, longitude)""",
+        """CREATE TABLE geocode_cache (
+            address_hash CHAR(40) PRIMARY KEY,
+            address VARCHAR(512) NOT NULL,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    )),
+    Migration(7, 'listings_dedup', (
+        """ALTER TABLE listings
+            ADD COLUMN canonical_id INT AFTER content_hash,
+            ADD COLUMN deduped_at TIMESTAMP NULL AFTER canonical_id,
+            ADD INDEX idx_listings_deduped (deduped_at, id),
+            ADD INDEX idx_listings_canonical (canonical_id),
+            ADD FOREIGN KEY (canonical_id) REFERENCES listings(id) ON DELETE SET NULL""",
+        """CREATE TABLE listing_signatures (
+            listing_id INT PRIMARY KEY,
+            signature VARBINARY(1024) NOT NULL,
+            FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+        )""",
+        """CREATE TABLE listing_lsh_buckets (
+            bucket BIGINT NOT NULL,
+            listing_id INT NOT NULL,
+            PRIMARY KEY (bucket, listing_id),
+            INDEX idx_lsh_buckets_listing (listing_id),
+            FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+        )""",
+    )),
+    Migration(8, 'saved_searches', (
+        """CREATE TABLE saved_searches (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            channel VARCHAR(20) NOT NULL,
+            deal_type VARCHAR(50),
+            rooms INT,
+            location VARCHAR(255),
+            price_min DECIMAL(10, 2),
+            price_max DECIMAL(10, 2),
+            area_min DECIMAL(10, 2),
+            area_max DECIMAL(10, 2),
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_saved_searches_recipient (recipient),
+            INDEX idx_saved_searches_active (active)
+        )""",
+    )),
+    Migration(9, 'notification_failures', (
+        """CREATE TABLE notification_failures (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            channel VARCHAR(20) NOT NULL,
+            recipient VARCHAR(255) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            error VARCHAR(512),
+            attempts INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            replayed_at TIMESTAMP NULL,
+            INDEX idx_notification_failures_replayed (replayed_at, id)
+        )""",
+    )),
+    Migration(10, 'parser_checkpoints', (
+        """CREATE TABLE parser_checkpoints (
+            parser VARCHAR(50) PRIMARY KEY,
+            newest_id VARCHAR(255),
+            newest_date DATETIME NULL,
+            http_validators TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )""",
+    )),
+    Migration(11, 'listings_updated_precision', (
+        # Микросекунды в updated_at различают версии для ETag
+        """ALTER TABLE listings
+            MODIFY updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            ADD INDEX idx_listings_updated (updated_at)""",
+    )),
+    Migration(12, 'listing_changes', (
+        """CREATE TABLE listing_changes (
+            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+            listing_id INT NOT NULL,
+            op ENUM('insert', 'update', 'price', 'delete') NOT NULL,
+            price DECIMAL(10, 2),
+            old_price DECIMAL(10, 2),
+            changed_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_listing_changes_changed (changed_at)
+        )""",
+        """CREATE TRIGGER trg_listings_changes_insert AFTER INSERT ON listings FOR EACH ROW
+            INSERT INTO listing_changes (listing_id, op, price) VALUES (NEW.id, 'insert', NEW.price)""",
+        """CREATE TRIGGER trg_listings_changes_update AFTER UPDATE ON listings FOR EACH ROW
+            INSERT INTO listing_changes (listing_id, op, price, old_price)
+            SELECT NEW.id, IF(OLD.price <=> NEW.price, 'update', 'price'), NEW.price, OLD.price
+            FROM DUAL
+            WHERE NOT (OLD.updated_at <=> NEW.updated_at)""",
+        """CREATE TRIGGER trg_listings_changes_delete AFTER DELETE ON listings FOR EACH ROW
+            INSERT INTO listing_changes (listing_id, op, old_price) VALUES (OLD.id, 'delete', OLD.price)""",
+    )),
+    Migration(13, 'listings_fulltext', (
+        # Полнотекстовый поиск по заголовку и описанию (см. app/storage/search.py);
+        # отдельный индекс по заголовку нужен для повышенного веса совпадений в нем
+        "ALTER TABLE listings ADD FULLTEXT INDEX ft_listings_text (title, description)",
+        "ALTER TABLE listings ADD FULLTEXT INDEX ft_listings_title (title)",
+    )),
+    Migration(14, 'listing_analytics_recorded', (
+        # Пересчет агрегатов цен по неделям наблюдений (app/analysis/analytics.py)
+        "ALTER TABLE listing_analytics ADD INDEX idx_listing_analytics_recorded (recorded_at)",
+    )),
+    Migration(15, 'listing_analytics_source_nullable', (
+        # История цен пишется и для объявлений без источника
+        "ALTER TABLE listing_analytics MODIFY source_id INT NULL",
+    )),
+)
+
+# Имя блокировки GET_LOCK, чтобы миграции не выполнялись несколькими процессами одновременно
+MIGRATION_LOCK = 'property_pulse.schema_migrations'
+
+
+class MigrationRunner(DatabaseExecutor, MigrationConfig):
+    """
+    Применение миграций по порядку версий. DDL в MySQL фиксируется неявно,
+    поэтому версия записывается после выполнения всех запросов миграции.
+    """
+
+    def __init__(self, migrations: Sequence[Migration] = MIGRATIONS):
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+
+    async def migrate(self) -> int:
+        """
+        :return: Количество примененных миграций
+        """
+        async with self.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, self.MIGRATION_LOCK_TIMEOUT))
+                (locked,) = await cursor.fetchone()
+                if not locked:
+                    raise RuntimeError(f"Не удалось получить блокировку миграций за {self.MIGRATION_LOCK_TIMEOUT} с.")
+                try:
+                    await cursor.execute(CREATE_MIGRATIONS_TABLE)
+                    await cursor.execute(SELECT_APPLIED)
+                    applied: Set[int] = {row[0] for row in await cursor.fetchall()}
+                    pending = [migration for migration in self.migrations if migration.version not in applied]
+                    for migration in pending:
+                        logger.info(f"Применение миграции {migration.version}: {migration.name}")
+                        for statement in migration.statements:
+                            await cursor.execute(statement)
+                        await cursor.execute(RECORD_MIGRATION, (migration.version, migration.name))
+                        await connection.commit()
+                finally:
+                    await cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        if pending:
+            logger.info(f"Применено миграций: {len(pending)}.")
+        return len(pending)
+
+
+async def main():
+    runner = MigrationRunner()
+    try:
+        await runner.migrate()
+    finally:
+        await runner.close_db_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -2,9 +2,14 @@
 CREATE TABLE listing_sources (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(255) NOT NULL,         
-    base_url VARCHAR(255) NOT NULL      
+    base_url VARCHAR(255) NOT NULL,
+    UNIQUE KEY uq_listing_sources_name (name)
 );
 
+INSERT INTO listing_sources (name, base_url) VALUES
+    ('avito', 'https://www.avito.ru'),
+    ('cian', 'https://www.cian.ru');
+
 -- Таблица для хранения категорий или типов недвижимости
 CREATE TABLE property_types (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -14,6 +19,9 @@ CREATE TABLE property_types (
 -- Таблица для хранения объявлений
 CREATE TABLE listings (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    source_id INT,                      -- Источник объявления (NULL для добавленных вручную)
+    external_id VARCHAR(255),           -- Идентификатор или URL объявления в источнике
+    url VARCHAR(512),
     title VARCHAR(255) NOT NULL,        
     description TEXT,                   
     price DECIMAL(10, 2) NOT NULL,
@@ -21,8 +29,82 @@ CREATE TABLE listings (
     rooms INT,                          
     area DECIMAL(10, 2),                
     location VARCHAR(255),              
+    latitude DOUBLE,                    -- Координаты по адресу location (см. app/analysis/geo_analysis.py)
+    longitude DOUBLE,
+    geocoded_at TIMESTAMP NULL,         -- NULL — адрес еще не геокодирован
+    content_hash CHAR(40),              -- Отпечаток содержимого для пропуска неизмененных объявлений
+    canonical_id INT,                   -- Самое раннее объявление той же квартиры (см. app/analysis/data_cleaning.py)
+    deduped_at TIMESTAMP NULL,          -- NULL — объявление еще не проверено на дубликаты
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    -- Микросекунды, чтобы две записи в одну секунду давали разные версии для ETag
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    UNIQUE KEY uq_listings_source_external (source_id, external_id),
+    -- Индексы под фильтры API; id в конце позволяет обходиться без сортировки при keyset-пагинации
+    INDEX idx_listings_deal_rooms_price (deal_type, rooms, price, id),
+    INDEX idx_listings_deal_price (deal_type, price, id),
+    INDEX idx_listings_deal_area (deal_type, area, id),
+    INDEX idx_listings_location (location, id),
+    INDEX idx_listings_created (created_at, id),
+    INDEX idx_listings_updated (updated_at),
+    INDEX idx_listings_geocoded (geocoded_at, id),
+    INDEX idx_listings_coordinates (latitude, longitude),
+    INDEX idx_listings_deduped (deduped_at, id),
+    INDEX idx_listings_canonical (canonical_id),
+    -- Полнотекстовый поиск (см. app/storage/search.py)
+    FULLTEXT INDEX ft_listings_text (title, description),
+    FULLTEXT INDEX ft_listings_title (title),
+    FOREIGN KEY (source_id) REFERENCES listing_sources(id) ON DELETE SET NULL,
+    FOREIGN KEY (canonical_id) REFERENCES listings(id) ON DELETE SET NULL
+);
+
+-- Лента изменений объявлений (см. app/storage/changes.py); заполняется триггерами ниже
+CREATE TABLE listing_changes (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,  -- Номер изменения, курсор since в GET /api/changes
+    listing_id INT NOT NULL,                -- Без внешнего ключа: записи об удалении переживают объявление
+    op ENUM('insert', 'update', 'price', 'delete') NOT NULL,
+    price DECIMAL(10, 2),
+    old_price DECIMAL(10, 2),               -- Цена до изменения для op = 'price'
+    changed_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_listing_changes_changed (changed_at)
+);
+
+CREATE TRIGGER trg_listings_changes_insert AFTER INSERT ON listings FOR EACH ROW
+    INSERT INTO listing_changes (listing_id, op, price) VALUES (NEW.id, 'insert', NEW.price);
+
+-- updated_at меняется, только если изменилась хотя бы одна колонка, поэтому UPDATE без изменений ленту не засоряет;
+-- служебные UPDATE (координаты, дубликаты) явно оставляют updated_at прежним
+CREATE TRIGGER trg_listings_changes_update AFTER UPDATE ON listings FOR EACH ROW
+    INSERT INTO listing_changes (listing_id, op, price, old_price)
+    SELECT NEW.id, IF(OLD.price <=> NEW.price, 'update', 'price'), NEW.price, OLD.price
+    FROM DUAL
+    WHERE NOT (OLD.updated_at <=> NEW.updated_at);
+
+CREATE TRIGGER trg_listings_changes_delete AFTER DELETE ON listings FOR EACH ROW
+    INSERT INTO listing_changes (listing_id, op, old_price) VALUES (OLD.id, 'delete', OLD.price);
+
+-- MinHash-подписи заголовка и описания (uint32 на каждую хеш-функцию)
+CREATE TABLE listing_signatures (
+    listing_id INT PRIMARY KEY,
+    signature VARBINARY(1024) NOT NULL,
+    FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+);
+
+-- LSH-корзины подписей: объявления из одной корзины — кандидаты в дубликаты
+CREATE TABLE listing_lsh_buckets (
+    bucket BIGINT NOT NULL,              -- Хеш полосы подписи вместе с номером полосы
+    listing_id INT NOT NULL,
+    PRIMARY KEY (bucket, listing_id),
+    INDEX idx_lsh_buckets_listing (listing_id),
+    FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+);
+
+-- Кэш геокодирования по нормализованному адресу; NULL в координатах — адрес не найден
+CREATE TABLE geocode_cache (
+    address_hash CHAR(40) PRIMARY KEY,
+    address VARCHAR(512) NOT NULL,
+    latitude DOUBLE,
+    longitude DOUBLE,
+    resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Таблица для хранения данных с разных источников по каждому объявлению
@@ -31,8 +113,9 @@ CREATE TABLE listing_prices (
     listing_id INT NOT NULL,             
     source_id INT NOT NULL,              
     price DECIMAL(10, 2),                
-    source_url VARCHAR(255) NOT NULL,    
+    source_url VARCHAR(512) NOT NULL,    
     last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_listing_prices_listing_source (listing_id, source_id),
     FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE,
     FOREIGN KEY (source_id) REFERENCES listing_sources(id) ON DELETE CASCADE
 );
@@ -41,9 +124,10 @@ CREATE TABLE listing_prices (
 CREATE TABLE listing_analytics (
     id INT AUTO_INCREMENT PRIMARY KEY,
     listing_id INT NOT NULL,             
-    source_id INT NOT NULL,              
+    source_id INT,                      -- NULL для объявлений без источника
     price DECIMAL(10, 2),                
     recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_listing_analytics_recorded (recorded_at),
     FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE,
     FOREIGN KEY (source_id) REFERENCES listing_sources(id) ON DELETE CASCADE
 );
@@ -56,3 +140,90 @@ CREATE TABLE listing_property_types (
     FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE,
     FOREIGN KEY (property_type_id) REFERENCES property_types(id) ON DELETE CASCADE
 );
+
+-- Предрасчитанные гистограммы цен по группам и неделям (см. app/analysis/analytics.py)
+CREATE TABLE listing_price_rollups (
+    metric VARCHAR(20) NOT NULL,         -- price или price_per_m2
+    deal_type VARCHAR(50) NOT NULL,
+    rooms INT NOT NULL,                  -- -1, если количество комнат неизвестно
+    district VARCHAR(255) NOT NULL,
+    week_start DATE NOT NULL,
+    bucket SMALLINT NOT NULL,            -- Номер логарифмической корзины
+    observations INT NOT NULL,
+    sum_value DECIMAL(20, 2) NOT NULL,
+    PRIMARY KEY (metric, deal_type, rooms, district, week_start, bucket),
+    INDEX idx_price_rollups_week (metric, week_start)
+);
+
+-- Водяные отметки инкрементальных расчетов: id последней обработанной строки
+CREATE TABLE analytics_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_id INT NOT NULL DEFAULT 0
+);
+
+INSERT INTO analytics_watermarks (name, last_id) VALUES ('price_rollups', 0);
+
+-- Сохраненные поиски для уведомлений о новых объявлениях (см. app/notifications/matcher.py)
+CREATE TABLE saved_searches (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    recipient VARCHAR(255) NOT NULL,     -- Email или chat id в Telegram
+    channel VARCHAR(20) NOT NULL,        -- email или telegram
+    deal_type VARCHAR(50),               -- NULL — любое значение
+    rooms INT,
+    location VARCHAR(255),               -- Префикс местоположения
+    price_min DECIMAL(10, 2),
+    price_max DECIMAL(10, 2),
+    area_min DECIMAL(10, 2),
+    area_max DECIMAL(10, 2),
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_saved_searches_recipient (recipient),
+    INDEX idx_saved_searches_active (active)
+);
+
+-- Уведомления, которые не удалось отправить; повторная отправка через POST /api/notifications/replay
+CREATE TABLE notification_failures (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    channel VARCHAR(20) NOT NULL,
+    recipient VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body TEXT NOT NULL,
+    error VARCHAR(512),
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    replayed_at TIMESTAMP NULL,         -- NULL — еще не отправлялось повторно
+    INDEX idx_notification_failures_replayed (replayed_at, id)
+);
+
+-- Состояние инкрементального обхода парсеров (см. app/notifications/scheduler.py)
+CREATE TABLE parser_checkpoints (
+    parser VARCHAR(50) PRIMARY KEY,
+    newest_id VARCHAR(255),              -- Самый новый виденный id объявления в источнике
+    newest_date DATETIME NULL,           -- Самая поздняя виденная дата публикации
+    http_validators TEXT,                -- JSON: ETag и Last-Modified страниц выдачи
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Примененные миграции (см. app/storage/migrations.py); эта схема уже включает перечисленные
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO schema_migrations (version, name) VALUES
+    (1, 'listing_sources_unique'),
+    (2, 'listings_source_keys'),
+    (3, 'listing_prices_unique'),
+    (4, 'listings_filter_indexes'),
+    (5, 'price_rollups'),
+    (6, 'listings_geo'),
+    (7, 'listings_dedup'),
+    (8, 'saved_searches'),
+    (9, 'notification_failures'),
+    (10, 'parser_checkpoints'),
+    (11, 'listings_updated_precision'),
+    (12, 'listing_changes'),
+    (13, 'listings_fulltext'),
+    (14, 'listing_analytics_recorded'),
+    (15, 'listing_analytics_source_nullable');
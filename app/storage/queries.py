@@ -1,52 +1,623 @@
-from typing import Dict, Any, List 
+import hashlib
+from decimal import Decimal
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
 from loguru import logger
 
-from .database import DatabaseExecutor
+from .cache import Cache, CacheConfig, cached
+from .database import DatabaseExecutor, Statement, statements
+from .search import SearchConfig, build_search_query
+
+# Поля, по которым считается отпечаток содержимого объявления
+CONTENT_HASH_FIELDS = ('title', 'description', 'price', 'rooms', 'area', 'location')
+
+# Колонки listings, доступные для выборки через API
+LISTING_COLUMNS = (
+    'id', 'source_id', 'external_id', 'url', 'title', 'description', 'price', 'deal_type',
+    'rooms', 'area', 'location', 'latitude', 'longitude', 'canonical_id', 'created_at', 'updated_at',
+)
+
+# Тег кэша для всех выборок списков объявлений
+LISTINGS_CACHE_TAG = 'listings'
+
+ListingKey = Tuple[int, str]
+ListingsListener = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+listing_cache = Cache()
+
+UPSERT_LISTING = statements.register('listings.upsert', """
+INSERT INTO listings (source_id, external_id, url, title, description, price, deal_type, rooms, area, location, content_hash)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    url = VALUES(url),
+    title = VALUES(title),
+    description = VALUES(description),
+    price = VALUES(price),
+    deal_type = VALUES(deal_type),
+    rooms = VALUES(rooms),
+    area = VALUES(area),
+    -- Смена адреса сбрасывает координаты до повторного геокодирования; должно идти до location
+    latitude = IF(location <=> VALUES(location), latitude, NULL),
+    longitude = IF(location <=> VALUES(location), longitude, NULL),
+    geocoded_at = IF(location <=> VALUES(location), geocoded_at, NULL),
+    location = VALUES(location),
+    -- Измененное содержимое заново проверяется на дубликаты; должно идти до content_hash
+    deduped_at = IF(content_hash <=> VALUES(content_hash), deduped_at, NULL),
+    content_hash = VALUES(content_hash)
+""")
+REGISTER_SOURCE = statements.register(
+    'listing_sources.register', "INSERT IGNORE INTO listing_sources (name, base_url) VALUES (%s, %s)"
+)
+SELECT_ALL_LISTINGS = statements.register('listings.all', "SELECT * FROM listings")
+# MAX по индексированным колонкам MySQL берет из индексов, без чтения таблицы.
+# listing_changes записывает и удаления, которые не меняют ни MAX(updated_at), ни MAX(id)
+SELECT_LISTINGS_VERSION = statements.register('listings.version', """
+SELECT UNIX_TIMESTAMP(MAX(updated_at)),
+       (SELECT UNIX_TIMESTAMP(MAX(changed_at)) FROM listing_changes),
+       (SELECT MAX(seq) FROM listing_changes)
+FROM listings
+""")
+SELECT_LISTING_VERSION = statements.register(
+    'listings.version_by_id', "SELECT UNIX_TIMESTAMP(updated_at) FROM listings WHERE id = %s"
+)
+
+
+class ListingsVersion(NamedTuple):
+    """
+    Версия данных объявлений: время последнего изменения (unix time) и номер последнего
+    изменения в ленте listing_changes. Меняется при любой вставке, изменении или удалении строки listings.
+    """
+    updated_at: Optional[Decimal]
+    change_seq: Optional[int]
+
+    @property
+    def tag(self) -> str:
+        return f"{self.updated_at}:{self.change_seq}"
+
+
+def listing_content_hash(listing: Dict[str, Any]) -> str:
+    """
+    Стабильный отпечаток содержимого объявления.
+
+    Пробелы схлопываются, а числа приводятся к точности колонок в БД,
+    поэтому повторный парсинг той же страницы дает тот же хеш.
+
+    Args:
+        listing (Dict[str, Any]): Объявление.
+
+    Returns:
+        str: SHA-1 в hex-представлении.
+    """
+    parts = []
+    for field in CONTENT_HASH_FIELDS:
+        value = listing.get(field)
+        if value is None:
+            parts.append('')
+        elif field in ('price', 'area'):
+            parts.append(str(Decimal(str(value)).quantize(Decimal('0.01'))))
+        elif field == 'rooms':
+            parts.append(str(int(value)))
+        else:
+            parts.append(' '.join(str(value).split()))
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _key_placeholders(count: int) -> str:
+    return ', '.join(['(%s, %s)'] * count)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_listing_filters(filters: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """
+    Условия WHERE для фильтров выборки объявлений.
+
+    Поддерживаются price_min/price_max, area_min/area_max, rooms, deal_type, location
+    (совпадение по префиксу, чтобы работал индекс), unique (без найденных дубликатов)
+    и пространственные условия:
+    ids (кандидаты из пространственного индекса), bbox (BoundingBox) и
+    radius (широта, долгота, км). Пустые значения игнорируются.
+
+    Returns:
+        Tuple[List[str], List[Any]]: Условия и параметры к ним.
+    """
+    filters = filters or {}
+    conditions, params = [], []
+
+    for name, condition in (
+        ('price_min', 'price >= %s'),
+        ('price_max', 'price <= %s'),
+        ('area_min', 'area >= %s'),
+        ('area_max', 'area <= %s'),
+        ('rooms', 'rooms = %s'),
+        ('deal_type', 'deal_type = %s'),
+    ):
+        if filters.get(name) is not None:
+            conditions.append(condition)
+            params.append(filters[name])
+
+    if filters.get('location'):
+        conditions.append('location LIKE %s')
+        params.append(_escape_like(filters['location']) + '%')
+
+    if filters.get('unique'):
+        conditions.append('canonical_id IS NULL')
+
+    if filters.get('ids') is not None:
+        ids = list(filters['ids'])
+        conditions.append(f"id IN ({', '.join(['%s'] * len(ids))})" if ids else 'FALSE')
+        params.extend(ids)
+
+    bbox = filters.get('bbox')
+    if bbox is not None:
+        conditions.append('latitude BETWEEN %s AND %s')
+        params.extend((bbox.min_lat, bbox.max_lat))
+        if bbox.min_lon <= bbox.max_lon:
+            conditions.append('longitude BETWEEN %s AND %s')
+        else:
+            # Переход через 180-й меридиан
+            conditions.append('(longitude >= %s OR longitude <= %s)')
+        params.extend((bbox.min_lon, bbox.max_lon))
+
+    if filters.get('radius') is not None:
+        lat, lon, radius_km = filters['radius']
+        conditions.append('ST_Distance_Sphere(POINT(longitude, latitude), POINT(%s, %s)) <= %s')
+        params.extend((lon, lat, radius_km * 1000))
+
+    return conditions, params
+
+
+def _select_columns(columns: Optional[Sequence[str]]) -> str:
+    """
+    Проекция колонок из белого списка; id включается всегда, он нужен для курсора.
+    """
+    if not columns:
+        return ', '.join(LISTING_COLUMNS)
+    unknown = set(columns) - set(LISTING_COLUMNS)
+    if unknown:
+        raise ValueError(f"Неизвестные колонки: {', '.join(sorted(unknown))}")
+    return ', '.join(['id'] + [column for column in LISTING_COLUMNS if column in columns and column != 'id'])
+
 
 class ListingService(DatabaseExecutor):
     """
     Класс для работы с объявлениями. Наследуется от DatabaseExecutor для получения доступа к методам работы с базой данных.
     """
 
+    # Кэш соответствия имени источника его id в listing_sources
+    _source_ids: Dict[str, int] = {}
+    # Обработчики новых объявлений, вызываются после фиксации транзакции
+    _listeners: List[ListingsListener] = []
+
+    @classmethod
+    def add_listener(cls, listener: ListingsListener) -> None:
+        """
+        Подписка на новые объявления: listener получает список вставленных объявлений
+        после каждой записи через upsert_listings. Ошибки обработчика логируются и не влияют на запись.
+        """
+        cls._listeners.append(listener)
+
     async def save_listing_to_db(self, listing: Dict[str, Any]) -> None:
         """
         Сохранение объявления в базе данных.
-        
+
         Args:
             listing (Dict[str, Any]): Объявление для сохранения.
         """
-        query = """
-        INSERT INTO listings (title, description, price, deal_type, rooms, area, location, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+        try:
+            await self.upsert_listings([listing])
+            logger.debug("Объявление успешно сохранено в базе данных.")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении объявления: {e}")
+            raise
+
+    async def save_listings_bulk(self, listings: List[Dict[str, Any]], chunk_size: Optional[int] = None) -> Dict[str, int]:
+        """
+        Пакетное сохранение объявлений в базе данных.
+
+        Все чанки пишутся в одной транзакции: либо сохраняется весь пакет, либо ничего.
+
+        Args:
+            listings (List[Dict[str, Any]]): Провалидированные объявления.
+            chunk_size (Optional[int]): Количество строк в одном INSERT.
+
+        Returns:
+            Dict[str, int]: Счетчики inserted, updated и unchanged.
+        """
+        try:
+            stats = await self.upsert_listings(listings, chunk_size=chunk_size)
+            logger.info(f"Пакет объявлений сохранен в базе данных: {stats}.")
+            return stats
+        except Exception as e:
+            logger.error(f"Ошибка при пакетном сохранении объявлений: {e}")
+            raise
+
+    async def upsert_listings(self, listings: List[Dict[str, Any]], chunk_size: Optional[int] = None) -> Dict[str, int]:
+        """
+        Идемпотентная запись объявлений по ключу (источник, внешний id).
+
+        Объявления с тем же отпечатком содержимого пропускаются без записи,
+        измененные обновляются через INSERT ... ON DUPLICATE KEY UPDATE.
+        Строка в истории цен (listing_analytics) и текущая цена источника
+        (listing_prices) пишутся для новых объявлений и при реальном
+        изменении цены. Для остальных объявлений пакета в историю раз
+        в неделю пишется наблюдение текущей цены, чтобы недельные агрегаты
+        цен учитывали и объявления без изменений. Объявления без источника
+        или внешнего id/URL ключа не имеют и всегда вставляются, по одному
+        INSERT, чтобы по их id записать историю цен.
+
+        Args:
+            listings (List[Dict[str, Any]]): Объявления для записи.
+            chunk_size (Optional[int]): Количество строк в одном INSERT.
+
+        Returns:
+            Dict[str, int]: Счетчики inserted, updated и unchanged.
+        """
+        stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not listings:
+            return stats
+
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        inserted = []
+
+        async with self.transaction() as cursor:
+            source_ids = await self._resolve_source_ids(cursor, listings)
+
+            for start in range(0, len(listings), chunk_size):
+                chunk = listings[start:start + chunk_size]
+                rows = [self._listing_row(listing, source_ids) for listing in chunk]
+                keys = [row[:2] for row in rows if row[0] is not None and row[1] is not None]
+                existing = await self._fetch_existing(cursor, keys)
+
+                to_write, keyless = [], []
+                price_changed: Dict[ListingKey, None] = {}
+                seen: Dict[ListingKey, None] = {}
+                for listing, row in zip(chunk, rows):
+                    key = row[:2] if row[0] is not None and row[1] is not None else None
+                    current = existing.get(key) if key else None
+                    content_hash, price = row[10], Decimal(str(row[5]))
+
+                    if current and current[0] == content_hash:
+                        stats['unchanged'] += 1
+                        seen[key] = None
+                        continue
+
+                    stats['updated' if current else 'inserted'] += 1
+                    if not current:
+                        inserted.append(listing)
+                    if key is None:
+                        keyless.append(row)
+                        continue
+                    to_write.append(row)
+                    if current is None or current[1] != price:
+                        price_changed[key] = None
+                    else:
+                        seen[key] = None
+                    existing[key] = (content_hash, price)
+
+                if to_write:
+                    await cursor.executemany(UPSERT_LISTING.sql, to_write)
+                if price_changed:
+                    await self._record_price_changes(cursor, list(price_changed))
+                seen_only = [key for key in seen if key not in price_changed]
+                if seen_only:
+                    await self._record_sightings(cursor, seen_only)
+                if keyless:
+                    await self._insert_keyless(cursor, keyless)
+
+        if stats['inserted'] or stats['updated']:
+            await listing_cache.invalidate(LISTINGS_CACHE_TAG)
+
+        for listener in self._listeners if inserted else ():
+            try:
+                await listener(inserted)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика новых объявлений: {e}")
+
+        return stats
+
+    def _listing_row(self, listing: Dict[str, Any], source_ids: Dict[str, int]) -> tuple:
         """
-        params = (
+        Параметры строки для UPSERT_LISTING.
+        """
+        external_id = listing.get('external_id') or listing.get('url')
+        return (
+            source_ids.get(listing.get('source')),
+            str(external_id) if external_id is not None else None,
+            listing.get('url'),
             listing['title'],
             listing.get('description'),
             listing['price'],
             listing['deal_type'],
             listing.get('rooms'),
             listing.get('area'),
-            listing.get('location')
+            listing.get('location'),
+            listing_content_hash(listing),
+        )
+
+    async def _resolve_source_ids(self, cursor, listings: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Поиск id источников по имени. Неизвестные источники регистрируются в listing_sources.
+        """
+        missing = {}
+        for listing in listings:
+            name = listing.get('source')
+            if name and name not in self._source_ids and name not in missing:
+                parsed = urlparse(listing.get('url') or '')
+                missing[name] = f"{parsed.scheme}://{parsed.netloc}" if parsed.netloc else ''
+
+        if missing:
+            await cursor.executemany(
+                REGISTER_SOURCE.sql,
+                list(missing.items())
+            )
+            await cursor.execute(
+                f"SELECT id, name FROM listing_sources WHERE name IN ({', '.join(['%s'] * len(missing))})",
+                list(missing)
+            )
+            for source_id, name in await cursor.fetchall():
+                self._source_ids[name] = source_id
+
+        return self._source_ids
+
+    async def _fetch_existing(self, cursor, keys: List[ListingKey]) -> Dict[ListingKey, Tuple[str, Decimal]]:
+        """
+        Текущие отпечатки и цены уже сохраненных объявлений по их ключам.
+        """
+        if not keys:
+            return {}
+
+        await cursor.execute(
+            f"""
+            SELECT source_id, external_id, content_hash, price FROM listings
+            WHERE (source_id, external_id) IN ({_key_placeholders(len(keys))})
+            """,
+            [value for key in keys for value in key]
+        )
+        return {
+            (source_id, external_id): (content_hash, Decimal(str(price)))
+            for source_id, external_id, content_hash, price in await cursor.fetchall()
+        }
+
+    async def _record_price_changes(self, cursor, keys: List[ListingKey]) -> None:
+        """
+        Запись изменившихся цен в историю и обновление текущей цены источника.
+        """
+        placeholders = _key_placeholders(len(keys))
+        params = [value for key in keys for value in key]
+
+        await cursor.execute(
+            f"""
+            INSERT INTO listing_analytics (listing_id, source_id, price)
+            SELECT id, source_id, price FROM listings
+            WHERE (source_id, external_id) IN ({placeholders})
+            """,
+            params
+        )
+        await cursor.execute(
+            f"""
+            INSERT INTO listing_prices (listing_id, source_id, price, source_url)
+            SELECT id, source_id, price, COALESCE(url, '') FROM listings
+            WHERE (source_id, external_id) IN ({placeholders})
+            ON DUPLICATE KEY UPDATE
+                price = VALUES(price),
+                source_url = VALUES(source_url),
+                last_checked = CURRENT_TIMESTAMP
+            """,
+            params
+        )
+
+    async def _record_sightings(self, cursor, keys: List[ListingKey]) -> None:
+        """
+        Наблюдение текущей цены для объявлений, у которых на этой неделе еще нет строки в истории.
+        """
+        await cursor.execute(
+            f"""
+            INSERT INTO listing_analytics (listing_id, source_id, price)
+            SELECT l.id, l.source_id, l.price FROM listings l
+            WHERE (l.source_id, l.external_id) IN ({_key_placeholders(len(keys))})
+              AND NOT EXISTS (
+                  SELECT 1 FROM listing_analytics a
+                  WHERE a.listing_id = l.id AND a.recorded_at >= CURDATE() - INTERVAL WEEKDAY(CURDATE()) DAY
+              )
+            """,
+            [value for key in keys for value in key]
+        )
+
+    async def _insert_keyless(self, cursor, rows: List[tuple]) -> None:
+        """
+        Вставка объявлений без ключа и запись их цен в историю по полученным id.
+
+        Текущая цена источника пишется только для объявлений с источником.
+        """
+        listing_ids = []
+        for row in rows:
+            await cursor.execute(UPSERT_LISTING.sql, row)
+            listing_ids.append(cursor.lastrowid)
+        placeholders = ', '.join(['%s'] * len(listing_ids))
+
+        await cursor.execute(
+            f"""
+            INSERT INTO listing_analytics (listing_id, source_id, price)
+            SELECT id, source_id, price FROM listings
+            WHERE id IN ({placeholders})
+            """,
+            listing_ids
         )
-        
+        if any(row[0] is not None for row in rows):
+            await cursor.execute(
+                f"""
+                INSERT INTO listing_prices (listing_id, source_id, price, source_url)
+                SELECT id, source_id, price, COALESCE(url, '') FROM listings
+                WHERE id IN ({placeholders}) AND source_id IS NOT NULL
+                """,
+                listing_ids
+            )
+
+    @cached(listing_cache, ttl=CacheConfig.CACHE_VERSION_TTL, tags=(LISTINGS_CACHE_TAG,))
+    async def get_listings_version(self) -> ListingsVersion:
+        """
+        Текущая версия данных объявлений для условных HTTP-запросов.
+
+        Кэшируется на CACHE_VERSION_TTL и сбрасывается вместе с кэшем выборок
+        при записи объявлений в этом процессе.
+        """
+        rows = await self.execute_query(SELECT_LISTINGS_VERSION, fetch=True)
+        updated_at, changed_at, change_seq = rows[0]
+        # Время удаления есть только в ленте изменений
+        moments = [value for value in (updated_at, changed_at) if value is not None]
+        return ListingsVersion(max(moments) if moments else None, change_seq)
+
+    async def get_listing_version(self, listing_id: int) -> Optional[Decimal]:
+        """
+        Время последнего изменения объявления (unix time) или None, если его нет.
+        """
+        rows = await self.execute_query(SELECT_LISTING_VERSION, (listing_id,), fetch=True)
+        return rows[0][0] if rows else None
+
+    async def get_listing(self, listing_id: int, columns: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Объявление по id или None, если его нет.
+        """
+        rows = await self.get_listings_by_ids([listing_id], columns=columns)
+        return rows.get(listing_id)
+
+    @cached(listing_cache, tags=(LISTINGS_CACHE_TAG,))
+    async def get_listings_page(self, filters: Optional[Dict[str, Any]] = None, columns: Optional[Sequence[str]] = None,
+                                cursor: Optional[int] = None, limit: int = 50,
+                                version: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Страница объявлений с keyset-пагинацией: от новых к старым по id.
+
+        Вместо OFFSET используется условие id < cursor, поэтому стоимость запроса
+        не растет с номером страницы. Результат кэшируется до изменения объявлений.
+
+        Args:
+            filters (Optional[Dict[str, Any]]): Фильтры, см. build_listing_filters.
+            columns (Optional[Sequence[str]]): Колонки для выборки, по умолчанию все.
+            cursor (Optional[int]): id последнего объявления предыдущей страницы.
+            limit (int): Размер страницы.
+            version (Optional[str]): Версия данных (ListingsVersion.tag). Входит только в ключ
+                кэша: страница, закэшированная до записи в другом процессе, не отдается
+                под ETag новой версии.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[int]]: Объявления и курсор следующей страницы.
+        """
+        conditions, params = build_listing_filters(filters)
+        if cursor is not None:
+            conditions.append('id < %s')
+            params.append(cursor)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = f"SELECT {_select_columns(columns)} FROM listings {where} ORDER BY id DESC LIMIT %s"
+        params.append(limit + 1)
+
         try:
-            await self.execute_query(query, params)
-            logger.info("Объявление успешно сохранено в базе данных.")
+            rows = await self.execute_query(Statement('listings.page', query), params, fetch=True, dict_rows=True)
         except Exception as e:
-            logger.error(f"Ошибка при сохранении объявления: {e}")
+            logger.error(f"Ошибка при получении страницы объявлений: {e}")
             raise
 
+        rows = list(rows)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]['id']
+        return rows, next_cursor
+
+    @cached(listing_cache, tags=(LISTINGS_CACHE_TAG,))
+    async def search_listings(self, text: str, filters: Optional[Dict[str, Any]] = None,
+                              columns: Optional[Sequence[str]] = None, limit: int = 20,
+                              version: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Полнотекстовый поиск по заголовку и описанию: limit лучших объявлений по убыванию
+        релевантности (score), совпадения в заголовке весят SEARCH_TITLE_WEIGHT.
+
+        Кандидатов отбирает индекс FULLTEXT (см. migrations.py), остальные фильтры
+        проверяются только для найденных строк, поэтому таблица целиком не читается.
+
+        Args:
+            text (str): Поисковый запрос, см. build_search_query.
+            filters (Optional[Dict[str, Any]]): Фильтры, см. build_listing_filters.
+            columns (Optional[Sequence[str]]): Колонки для выборки, по умолчанию все.
+            limit (int): Количество результатов.
+            version (Optional[str]): Версия данных для ключа кэша, см. get_listings_page.
+
+        Raises:
+            ValueError: В запросе нет слов для поиска.
+        """
+        against = build_search_query(text)
+        conditions, params = build_listing_filters(filters)
+        conditions.insert(0, 'MATCH(title, description) AGAINST (%s IN BOOLEAN MODE)')
+        score = (
+            "MATCH(title) AGAINST (%s IN BOOLEAN MODE) * %s"
+            " + MATCH(title, description) AGAINST (%s IN BOOLEAN MODE)"
+        )
+        query = (
+            f"SELECT {_select_columns(columns)}, {score} AS score FROM listings "
+            f"WHERE {' AND '.join(conditions)} ORDER BY score DESC, id DESC LIMIT %s"
+        )
+        params = [against, SearchConfig.SEARCH_TITLE_WEIGHT, against, against, *params, limit]
+
+        try:
+            rows = await self.execute_query(Statement('listings.search', query), params, fetch=True, dict_rows=True)
+        except Exception as e:
+            logger.error(f"Ошибка полнотекстового поиска объявлений: {e}")
+            raise
+        return list(rows)
+
+    async def get_listings_by_ids(self, ids: Sequence[int], filters: Optional[Dict[str, Any]] = None,
+                                  columns: Optional[Sequence[str]] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Объявления по списку id с дополнительными фильтрами.
+
+        Returns:
+            Dict[int, Dict[str, Any]]: Объявления по id; не прошедших фильтры в результате нет.
+        """
+        if not len(ids):
+            return {}
+        conditions, params = build_listing_filters({**(filters or {}), 'ids': list(ids)})
+        query = f"SELECT {_select_columns(columns)} FROM listings WHERE {' AND '.join(conditions)}"
+
+        try:
+            rows = await self.execute_query(Statement('listings.by_ids', query), params, fetch=True, dict_rows=True)
+        except Exception as e:
+            logger.error(f"Ошибка при получении объявлений по id: {e}")
+            raise
+        return {row['id']: row for row in rows}
+
+    async def stream_listings(self, filters: Optional[Dict[str, Any]] = None,
+                              columns: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая выгрузка объявлений через серверный курсор с постоянным расходом памяти.
+
+        Args:
+            filters (Optional[Dict[str, Any]]): Фильтры, см. build_listing_filters.
+            columns (Optional[Sequence[str]]): Колонки для выборки, по умолчанию все.
+
+        Yields:
+            Dict[str, Any]: Очередное объявление.
+        """
+        conditions, params = build_listing_filters(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = f"SELECT {_select_columns(columns)} FROM listings {where} ORDER BY id DESC"
+
+        async for row in self.stream_query(Statement('listings.export', query), params):
+            yield row
+
     async def get_all_listings(self) -> List[Dict[str, Any]]:
         """
         Получение всех объявлений из базы данных.
-        
+
         Returns:
             List[Dict[str, Any]]: Список объявлений.
         """
-        query = "SELECT * FROM listings"
-        
         try:
-            result = await self.execute_query(query, fetch=True)
+            result = await self.execute_query(SELECT_ALL_LISTINGS, fetch=True)
             logger.info("Объявления успешно получены из базы данных.")
             return result
         except Exception as e:
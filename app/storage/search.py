@@ -0,0 +1,74 @@
+import re
+from typing import List
+
+from decouple import config
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Окончания существительных и прилагательных, от длинных к коротким. Окончания на -ия/-ие
+# не отделяются целиком: «студия» сводится к «студи», а не к «студ»
+_ENDINGS = (
+    'ами', 'ями', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю',
+    'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+)
+
+
+class SearchConfig:
+    """
+    Класс конфигурации полнотекстового поиска объявлений.
+    """
+    # Слова короче не попадают в полнотекстовый индекс MySQL (innodb_ft_min_token_size)
+    SEARCH_MIN_TOKEN = config('SEARCH_MIN_TOKEN', default=3, cast=int)
+    # Основа слова после отбрасывания окончания не короче этого числа букв
+    SEARCH_MIN_STEM = config('SEARCH_MIN_STEM', default=4, cast=int)
+    SEARCH_MAX_TERMS = config('SEARCH_MAX_TERMS', default=8, cast=int)
+    # Во сколько раз совпадение в заголовке весомее совпадения в описании
+    SEARCH_TITLE_WEIGHT = config('SEARCH_TITLE_WEIGHT', default=2.0, cast=float)
+
+
+def stem_ru(word: str) -> str:
+    """
+    Облегченный стеммер: отбрасывает падежное окончание русского слова.
+    Нерусские слова и числа возвращаются как есть.
+    """
+    if not _CYRILLIC_RE.search(word):
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= SearchConfig.SEARCH_MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def search_terms(text: str) -> List[str]:
+    """
+    Уникальные слова поискового запроса в нижнем регистре, без коротких
+    и не больше SEARCH_MAX_TERMS.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower().replace('ё', 'е')):
+        if len(token) >= SearchConfig.SEARCH_MIN_TOKEN and token not in terms:
+            terms.append(token)
+    return terms[:SearchConfig.SEARCH_MAX_TERMS]
+
+
+def build_search_query(text: str) -> str:
+    """
+    Запрос MATCH ... AGAINST в BOOLEAN MODE: каждое слово обязательно и ищется
+    по основе с усечением (любая форма слова), точная форма ранжируется выше.
+
+    Например, «студия с балконом» — ``+(>студия студи*) +(>балконом балкон*)``.
+
+    Raises:
+        ValueError: В запросе нет слов, которые есть в полнотекстовом индексе.
+    """
+    terms = search_terms(text)
+    if not terms:
+        raise ValueError(f"В запросе нет слов длиной от {SearchConfig.SEARCH_MIN_TOKEN} символов")
+    parts = []
+    for term in terms:
+        stem = stem_ru(term)
+        parts.append(f"+(>{term} {stem}*)" if stem != term else f"+{term}*")
+    return ' '.join(parts)
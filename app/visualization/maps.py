@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from decouple import config
+from loguru import logger
+
+from app.analysis.geo_analysis import GeoService, SpatialIndex
+from app.storage.cache import LRUCache, MISSING
+
+# Размер тайла в пикселях (как у тайлов OpenStreetMap и Leaflet)
+TILE_SIZE = 256
+# Граница широты проекции Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+class MapConfig:
+    """
+    Класс конфигурации кластеризации меток и тайлов карты.
+    """
+    # Размер ячейки кластеризации в пикселях; степень двойки не больше размера тайла
+    MAP_CLUSTER_CELL_PX = config('MAP_CLUSTER_CELL_PX', default=64, cast=int)
+    # Наибольший масштаб, на котором метки объединяются в кластеры; дальше отдаются отдельные точки
+    MAP_CLUSTER_MAX_ZOOM = config('MAP_CLUSTER_MAX_ZOOM', default=16, cast=int)
+    MAP_MAX_ZOOM = config('MAP_MAX_ZOOM', default=20, cast=int)
+    MAP_TILE_CACHE_SIZE = config('MAP_TILE_CACHE_SIZE', default=20000, cast=int)
+    MAP_TILE_CACHE_TTL = config('MAP_TILE_CACHE_TTL', default=3600, cast=float)
+
+
+def mercator_x(lon: np.ndarray) -> np.ndarray:
+    return (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+
+
+def mercator_y(lat: np.ndarray) -> np.ndarray:
+    sin = np.sin(np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)))
+    return 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+
+
+def mercator_lon(x: np.ndarray) -> np.ndarray:
+    return x * 360.0 - 180.0
+
+
+def mercator_lat(y: np.ndarray) -> np.ndarray:
+    return np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y))))
+
+
+def tile_index(value: np.ndarray, zoom: int) -> np.ndarray:
+    """
+    Номер тайла по координате проекции в [0, 1].
+    """
+    side = 1 << zoom
+    return np.minimum((value * side).astype(np.int64), side - 1)
+
+
+@dataclass
+class ClusterLevel:
+    """
+    Кластеры одного масштаба, отсортированные по ключу тайла (y * 2^zoom + x).
+
+    x, y — центр масс кластера в координатах проекции, member — id объявления для
+    кластеров из одной точки и -1 для остальных.
+    """
+    tiles: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    counts: np.ndarray
+    member: np.ndarray
+
+    def tile(self, key: int) -> slice:
+        return slice(int(np.searchsorted(self.tiles, key, 'left')), int(np.searchsorted(self.tiles, key, 'right')))
+
+
+class ClusterIndex:
+    """
+    Иерархические кластеры меток по сетке в пикселях Web Mercator.
+
+    На наибольшем масштабе точки группируются по ячейкам cell_px x cell_px пикселей,
+    каждый следующий уровень объединяет по четыре соседние ячейки предыдущего, так что
+    весь набор уровней строится за один проход по точкам и по убывающему числу кластеров.
+    Ячейка целиком лежит в одном тайле, поэтому содержимое тайла зависит только от точек
+    внутри него: при изменении точки устаревают лишь тайлы с ее старыми и новыми координатами.
+    """
+
+    def __init__(self, cell_px: int = 64, max_zoom: int = 16):
+        if cell_px <= 0 or cell_px > TILE_SIZE or cell_px & (cell_px - 1):
+            raise ValueError(f"Размер ячейки должен быть степенью двойки не больше {TILE_SIZE}: {cell_px}")
+        self.max_zoom = max_zoom
+        # Ячеек на сторону тайла: 2 ** shift
+        self.shift = int(math.log2(TILE_SIZE // cell_px))
+        self.levels: Dict[int, ClusterLevel] = {}
+        self.points = ClusterLevel(*(np.empty(0, dtype=dtype) for dtype in
+                                     (np.int64, np.float64, np.float64, np.int64, np.int64)))
+
+    def __len__(self) -> int:
+        return len(self.points.tiles)
+
+    def build(self, ids: np.ndarray, lat: np.ndarray, lon: np.ndarray):
+        ids = np.asarray(ids, dtype=np.int64)
+        x, y = mercator_x(lon), mercator_y(lat)
+
+        # Отдельные точки для масштабов крупнее max_zoom, сгруппированные по тайлам max_zoom
+        tiles = tile_index(y, self.max_zoom) * (1 << self.max_zoom) + tile_index(x, self.max_zoom)
+        order = np.argsort(tiles, kind='stable')
+        self.points = ClusterLevel(tiles[order], x[order], y[order], np.ones(len(ids), dtype=np.int64), ids[order])
+
+        zoom = self.max_zoom
+        side = 1 << (zoom + self.shift)
+        codes = tile_index(y, zoom + self.shift) * side + tile_index(x, zoom + self.shift)
+        cells, inverse = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(cells)).astype(np.int64)
+        sum_x = np.bincount(inverse, weights=x, minlength=len(cells))
+        sum_y = np.bincount(inverse, weights=y, minlength=len(cells))
+        member = np.empty(len(cells), dtype=np.int64)
+        member[inverse] = ids
+
+        levels = {}
+        while True:
+            levels[zoom] = self._level(zoom, cells // side, cells % side, counts, sum_x, sum_y, member)
+            if zoom == 0:
+                break
+            parents = (cells // side >> 1) * (side >> 1) + (cells % side >> 1)
+            zoom, side = zoom - 1, side >> 1
+            cells, inverse = np.unique(parents, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts, minlength=len(cells)).astype(np.int64)
+            sum_x = np.bincount(inverse, weights=sum_x, minlength=len(cells))
+            sum_y = np.bincount(inverse, weights=sum_y, minlength=len(cells))
+            parent_member = np.empty(len(cells), dtype=np.int64)
+            parent_member[inverse] = member
+            member = parent_member
+        self.levels = levels
+
+    def _level(self, zoom: int, cell_y: np.ndarray, cell_x: np.ndarray, counts: np.ndarray,
+               sum_x: np.ndarray, sum_y: np.ndarray, member: np.ndarray) -> ClusterLevel:
+        tiles = (cell_y >> self.shift) * (1 << zoom) + (cell_x >> self.shift)
+        order = np.argsort(tiles, kind='stable')
+        return ClusterLevel(
+            tiles=tiles[order],
+            x=(sum_x / counts)[order],
+            y=(sum_y / counts)[order],
+            counts=counts[order],
+            member=np.where(counts == 1, member, -1)[order],
+        )
+
+    def tile(self, zoom: int, x: int, y: int) -> ClusterLevel:
+        """
+        Кластеры и точки тайла zoom/x/y.
+        """
+        if zoom <= self.max_zoom:
+            level = self.levels[zoom]
+            part = level.tile(y * (1 << zoom) + x)
+            return ClusterLevel(level.tiles[part], level.x[part], level.y[part], level.counts[part], level.member[part])
+
+        depth = zoom - self.max_zoom
+        part = self.points.tile((y >> depth) * (1 << self.max_zoom) + (x >> depth))
+        px, py = self.points.x[part], self.points.y[part]
+        inside = (tile_index(px, zoom) == x) & (tile_index(py, zoom) == y)
+        return ClusterLevel(self.points.tiles[part][inside], px[inside], py[inside],
+                            self.points.counts[part][inside], self.points.member[part][inside])
+
+
+def render_tile(zoom: int, x: int, y: int, level: ClusterLevel) -> bytes:
+    """
+    Компактный JSON тайла: кластеры [lat, lon, count] и отдельные объявления [lat, lon, id].
+    """
+    lat = np.round(mercator_lat(level.y), 6).tolist()
+    lon = np.round(mercator_lon(level.x), 6).tolist()
+    clusters, points = [], []
+    for item_lat, item_lon, count, member in zip(lat, lon, level.counts.tolist(), level.member.tolist()):
+        if count == 1:
+            points.append([item_lat, item_lon, member])
+        else:
+            clusters.append([item_lat, item_lon, count])
+    payload = {'z': zoom, 'x': x, 'y': y, 'clusters': clusters, 'points': points}
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+class MapTileService(MapConfig):
+    """
+    Тайлы карты с кластерами объявлений поверх пространственного индекса GeoService.
+
+    Готовые тайлы лежат в LRU-кэше. Индекс сообщает координаты изменившихся точек,
+    и из кэша удаляются только тайлы, в которые они попадают, на каждом масштабе;
+    кластеры перестраиваются при первом промахе кэша после изменения.
+    Полная перезагрузка индекса очищает кэш целиком.
+    """
+
+    def __init__(self, geo_service: Optional[GeoService] = None):
+        self.geo_service = geo_service or GeoService()
+        self.clusters = ClusterIndex(self.MAP_CLUSTER_CELL_PX, self.MAP_CLUSTER_MAX_ZOOM)
+        self.cache = LRUCache(self.MAP_TILE_CACHE_SIZE, self.MAP_TILE_CACHE_TTL)
+        self._index: Optional[SpatialIndex] = None
+        # Поколение данных растет при каждом изменении индекса; кластеры построены для _built
+        self._generation = 0
+        self._built = -1
+        self._build_lock = asyncio.Lock()
+
+    async def get_tile(self, zoom: int, x: int, y: int) -> Tuple[bytes, str]:
+        """
+        JSON тайла и его ETag.
+        """
+        await self._sync()
+        key = f"{zoom}/{x}/{y}"
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            return cached
+
+        generation = await self._ensure_clusters()
+        body = render_tile(zoom, x, y, self.clusters.tile(zoom, x, y))
+        tile = (body, f'W/"{hashlib.sha1(body).hexdigest()}"')
+        if generation == self._generation:
+            # Пока строился тайл, данные могли измениться; такой тайл не кэшируется
+            self.cache.set(key, tile)
+        return tile
+
+    async def _sync(self):
+        index = await self.geo_service.ensure_index()
+        if index is not self._index:
+            index.listeners.append(self.invalidate)
+            self._index = index
+            self.invalidate(None, None)
+        # Вливает отложенные изменения индекса и тем самым вызывает invalidate
+        index.snapshot()
+
+    async def _ensure_clusters(self) -> int:
+        async with self._build_lock:
+            generation = self._generation
+            if self._built != generation:
+                ids, lat, lon = self._index.snapshot()
+                await asyncio.to_thread(self.clusters.build, ids, lat, lon)
+                self._built = generation
+                logger.debug(f"Кластеры карты перестроены: {len(ids)} точек.")
+            return self._built
+
+    def invalidate(self, lat: Optional[np.ndarray], lon: Optional[np.ndarray]):
+        """
+        Удаление из кэша тайлов, содержащих точки с координатами lat, lon, на всех масштабах;
+        None — удаление всех тайлов.
+        """
+        self._generation += 1
+        if lat is None or lon is None:
+            self.cache.clear()
+            return
+        x, y = mercator_x(lon), mercator_y(lat)
+        for zoom in range(self.MAP_MAX_ZOOM + 1):
+            tiles = set(zip(tile_index(x, zoom).tolist(), tile_index(y, zoom).tolist()))
+            for tile_x, tile_y in tiles:
+                self.cache.delete(f"{zoom}/{tile_x}/{tile_y}")
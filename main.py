@@ -1,14 +1,48 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
 
-from app.api.routes import router
+from app.api.http_cache import HttpCacheConfig
+from app.api.routes import dispatcher, geo_service, router, scheduler
+from app.instrumentation import MetricsMiddleware
+from app.parsers.archive import close_page_archives
+from app.parsers.executor import shutdown_parse_executor
+from app.storage.database import DatabaseExecutor
+from app.storage.migrations import MigrationRunner
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    database = DatabaseExecutor()
+    await database.init_db_pool()
+    if MigrationRunner.MIGRATE_ON_STARTUP:
+        await MigrationRunner().migrate()
+    dispatcher.start()
+    if scheduler.SCHEDULER_ENABLED:
+        scheduler.start()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        shutdown_parse_executor()
+        await dispatcher.stop()
+        await geo_service.close()
+        close_page_archives()
+        await database.close_db_pool()
+
 
 def get_application() -> FastAPI:
-    application = FastAPI()
+    application = FastAPI(lifespan=lifespan)
     application.include_router(router)
+    application.add_middleware(
+        GZipMiddleware, minimum_size=HttpCacheConfig.GZIP_MIN_SIZE, compresslevel=HttpCacheConfig.GZIP_LEVEL
+    )
+    application.add_middleware(MetricsMiddleware)
     return application
 
 app = get_application()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host='localhost', port=8000, log_level='debug')
\ No newline at end of file
+    uvicorn.run(app, host='localhost', port=8000, log_level='debug')
@@ -0,0 +1,54 @@
+"""
+Бенчмарк пространственного индекса SpatialIndex на синтетических точках без базы данных.
+
+Сравнивает поиск в радиусе, прямоугольнике и k ближайших через индекс
+с полным перебором всех точек (то, что без индекса делала бы база данных).
+
+Запуск: python -m scripts.bench_geo_index
+"""
+import time
+
+import numpy as np
+
+from app.analysis.geo_analysis import BoundingBox, SpatialIndex, haversine_km
+
+POINTS = 2_000_000
+QUERIES = 200
+
+# Примерные границы Москвы
+MIN_LAT, MAX_LAT = 55.4, 56.0
+MIN_LON, MAX_LON = 37.2, 38.0
+
+
+def measure(name, call, centers):
+    started = time.perf_counter()
+    for lat, lon in centers:
+        call(lat, lon)
+    elapsed = (time.perf_counter() - started) / len(centers)
+    print(f"{name:<22} {elapsed * 1e3:8.2f} мс/запрос")
+    return elapsed
+
+
+def main():
+    rng = np.random.default_rng(42)
+    ids = np.arange(POINTS, dtype=np.int64)
+    lat = rng.uniform(MIN_LAT, MAX_LAT, POINTS)
+    lon = rng.uniform(MIN_LON, MAX_LON, POINTS)
+    centers = list(zip(rng.uniform(55.6, 55.9, QUERIES), rng.uniform(37.4, 37.8, QUERIES)))
+
+    index = SpatialIndex()
+    started = time.perf_counter()
+    index.build(ids, lat, lon)
+    print(f"Построение индекса на {POINTS} точках: {time.perf_counter() - started:.2f} с")
+
+    scan = measure('радиус 2 км, перебор', lambda a, b: np.flatnonzero(haversine_km(a, b, lat, lon) <= 2), centers[:10])
+    indexed = measure('радиус 2 км, индекс', lambda a, b: index.radius(a, b, 2), centers)
+    print(f"Ускорение: {scan / indexed:.0f}x")
+
+    measure('bbox 2x2 км, индекс', lambda a, b: index.bbox(BoundingBox(a - 0.009, b - 0.016, a + 0.009, b + 0.016)),
+            centers)
+    measure('10 ближайших, индекс', lambda a, b: index.nearest(a, b, 10), centers)
+
+
+if __name__ == '__main__':
+    main()
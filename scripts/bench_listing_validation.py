@@ -0,0 +1,142 @@
+"""
+Бенчмарк проверки пакета объявлений без базы данных.
+
+Сравнивает с пакетным валидатором BatchValidator два пути проверки по одной строке
+на 50 000 строк от парсеров, из которых около 10% некорректны, а у 10% цена
+пришла строкой:
+- исходный путь /api/listings/bulk: model_validate схемы без ограничений и ручные
+  проверки is_valid_listing с исключением на каждую ошибку;
+- ListingCreate.model_validate с ограничениями в Field и перехватом ValidationError.
+Совпадение результатов с ListingCreate проверяется в tests/test_validation.py.
+
+Запуск: python -m scripts.bench_listing_validation
+"""
+import random
+import time
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+
+from app.api.schemas import ListingCreate
+from app.api.validation import listing_validator
+
+ROWS = 50_000
+INVALID_SHARE = 0.1
+# Доля цен, пришедших строкой, а не числом (числа парсеры получают через to_number)
+STRING_PRICE_SHARE = 0.1
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск']
+BROKEN = [
+    ('price', 0), ('price', 'договорная'), ('price', None), ('deal_type', 'обмен'), ('rooms', 0),
+    ('rooms', 2.5), ('area', -1), ('title', ''), ('description', None), ('location', None),
+]
+
+
+def random_row(rng: random.Random, index: int) -> dict:
+    rooms = rng.randint(1, 4)
+    row = {
+        'title': f"{rooms}-к. квартира",
+        'description': "Светлая квартира с ремонтом рядом с метро.",
+        'price': float(rng.randint(3_000, 40_000) * 1000),
+        'deal_type': rng.choice(['sale', 'rent']),
+        'rooms': rooms,
+        'area': round(rng.uniform(20, 150), 1),
+        'location': f"{rng.choice(CITIES)}, ул. Ленина, {rng.randint(1, 200)}",
+        'url': f"https://example.com/{index}",
+        'source': 'avito',
+        'external_id': str(index),
+    }
+    if rng.random() < STRING_PRICE_SHARE:
+        row['price'] = f"{row['price']:.0f}"
+    if rng.random() < INVALID_SHARE:
+        field, value = rng.choice(BROKEN)
+        row[field] = value
+    return row
+
+
+class LegacyListing(BaseModel):
+    """
+    Схема объявления до переноса ограничений в Field: только типы.
+    """
+    title: str
+    description: str
+    price: float
+    deal_type: str
+    rooms: Optional[int] = None
+    area: Optional[float] = None
+    location: str
+    url: Optional[str] = None
+    source: Optional[str] = None
+    external_id: Optional[str] = None
+
+
+class InvalidListingData(Exception):
+    pass
+
+
+def is_valid_listing(listing: LegacyListing) -> None:
+    """
+    Прежние ручные проверки объявления.
+    """
+    if not listing.title:
+        raise InvalidListingData("Обязательное поле 'title' отсутствует.")
+    if not listing.description:
+        raise InvalidListingData("Обязательное поле 'description' отсутствует.")
+    if listing.price <= 0:
+        raise InvalidListingData("Цена должна быть положительным числом.")
+    if listing.deal_type not in ["sale", "rent"]:
+        raise InvalidListingData("Тип сделки должен быть 'sale' или 'rent'.")
+    if listing.rooms is not None and listing.rooms <= 0:
+        raise InvalidListingData("Количество комнат должно быть положительным целым числом.")
+    if listing.area is not None and listing.area <= 0:
+        raise InvalidListingData("Площадь должна быть положительным числом.")
+
+
+def validate_legacy(rows):
+    valid, rejected = [], 0
+    for row in rows:
+        try:
+            listing = LegacyListing.model_validate(row)
+            is_valid_listing(listing)
+        except (ValidationError, InvalidListingData):
+            rejected += 1
+            continue
+        valid.append(listing.model_dump())
+    return valid, rejected
+
+
+def validate_one_by_one(rows):
+    valid, rejected = [], 0
+    for row in rows:
+        try:
+            valid.append(ListingCreate.model_validate(row).model_dump())
+        except ValidationError:
+            rejected += 1
+    return valid, rejected
+
+
+def main():
+    rng = random.Random(42)
+    rows = [random_row(rng, index) for index in range(ROWS)]
+
+    started = time.perf_counter()
+    validate_legacy(rows)
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _, rejected = validate_one_by_one(rows)
+    one_by_one = time.perf_counter() - started
+
+    started = time.perf_counter()
+    listing_validator.validate(rows)
+    batch = time.perf_counter() - started
+
+    print(f"Строк: {ROWS}, отклонено: {rejected}")
+    print(f"is_valid_listing по строке:  {legacy * 1e3:8.1f} мс ({ROWS / legacy:9.0f} строк/с)")
+    print(f"ListingCreate по строке:     {one_by_one * 1e3:8.1f} мс ({ROWS / one_by_one:9.0f} строк/с)")
+    print(f"Пакетный валидатор:          {batch * 1e3:8.1f} мс ({ROWS / batch:9.0f} строк/с)")
+    print(f"Ускорение: {legacy / batch:.1f}x к is_valid_listing, {one_by_one / batch:.1f}x к ListingCreate")
+
+
+if __name__ == '__main__':
+    main()
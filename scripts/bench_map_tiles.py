@@ -0,0 +1,90 @@
+"""
+Бенчмарк кластеризации меток и тайлов карты на синтетических точках без базы данных.
+
+Сравнивает построение кластеров всех масштабов, выдачу тайла без кэша и из кэша,
+а также размер тайлов видимой области с выгрузкой всех попавших в нее меток.
+
+Запуск: python -m scripts.bench_map_tiles
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from app.analysis.geo_analysis import SpatialIndex
+from app.visualization.maps import ClusterIndex, MapTileService, mercator_x, mercator_y, render_tile, tile_index
+
+POINTS = 2_000_000
+ZOOM = 13
+# Окно браузера 1920x1080 — около 8x5 тайлов
+VIEWPORT = (8, 5)
+
+# Примерные границы Москвы
+MIN_LAT, MAX_LAT = 55.4, 56.0
+MIN_LON, MAX_LON = 37.2, 38.0
+
+
+class StaticGeoService:
+    def __init__(self, index: SpatialIndex):
+        self.index = index
+
+    async def ensure_index(self) -> SpatialIndex:
+        return self.index
+
+
+async def measure_service(index: SpatialIndex, tiles):
+    service = MapTileService(StaticGeoService(index))
+    await service.get_tile(0, 0, 0)
+
+    started = time.perf_counter()
+    for x, y in tiles:
+        service.cache.delete(f"{ZOOM}/{x}/{y}")
+        await service.get_tile(ZOOM, x, y)
+    cold = (time.perf_counter() - started) / len(tiles)
+
+    started = time.perf_counter()
+    for x, y in tiles:
+        await service.get_tile(ZOOM, x, y)
+    cached = (time.perf_counter() - started) / len(tiles)
+    print(f"Тайл без кэша: {cold * 1e3:.3f} мс, из кэша: {cached * 1e3:.3f} мс")
+
+    started = time.perf_counter()
+    index.upsert([0], [55.75], [37.62])
+    index.snapshot()
+    print(f"Инвалидация тайлов одной точки: {(time.perf_counter() - started) * 1e3:.2f} мс, "
+          f"осталось в кэше {len(service.cache)} тайлов")
+
+
+def main():
+    rng = np.random.default_rng(42)
+    ids = np.arange(POINTS, dtype=np.int64)
+    lat = rng.normal(55.75, 0.08, POINTS).clip(MIN_LAT, MAX_LAT)
+    lon = rng.normal(37.62, 0.12, POINTS).clip(MIN_LON, MAX_LON)
+
+    clusters = ClusterIndex()
+    started = time.perf_counter()
+    clusters.build(ids, lat, lon)
+    print(f"Кластеры масштабов 0-{clusters.max_zoom} на {POINTS} точках: {time.perf_counter() - started:.2f} с")
+
+    center_x = int(tile_index(mercator_x(np.array([37.62])), ZOOM)[0])
+    center_y = int(tile_index(mercator_y(np.array([55.75])), ZOOM)[0])
+    width, height = VIEWPORT
+    tiles = [(center_x + dx - width // 2, center_y + dy - height // 2) for dx in range(width) for dy in range(height)]
+
+    tiles_size = sum(len(render_tile(ZOOM, x, y, clusters.tile(ZOOM, x, y))) for x, y in tiles)
+    tile_x, tile_y = tile_index(mercator_x(lon), ZOOM), tile_index(mercator_y(lat), ZOOM)
+    visible = np.isin(tile_x * (1 << ZOOM) + tile_y, [x * (1 << ZOOM) + y for x, y in tiles])
+    markers = json.dumps([[round(a, 6), round(b, 6), int(c)] for a, b, c in
+                          zip(lat[visible].tolist(), lon[visible].tolist(), ids[visible].tolist())],
+                         separators=(',', ':'))
+    print(f"Видимая область z{ZOOM}, {len(tiles)} тайлов: {tiles_size / 1024:.1f} КБ "
+          f"против {len(markers) / 1024:.0f} КБ для {int(visible.sum())} отдельных меток")
+
+    index = SpatialIndex()
+    index.build(ids, lat, lon)
+    asyncio.run(measure_service(index, tiles))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Бенчмарк архива сырых страниц и офлайн-разбора без сети.
+
+Записывает в архив синтетическую выдачу (каждая пятая загрузка — повтор уже
+виденной страницы), затем разбирает архив через XPathExtractor в пуле процессов
+(Parser.replay) и сравнивает с разбором тех же страниц из памяти в одном процессе.
+Выигрыш воспроизведения растет с числом ядер (PARSE_WORKERS); на одном ядре пул
+процессов только добавляет передачу страниц между процессами.
+
+Запуск: python -m scripts.bench_page_archive [каталог архива]
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from app.parsers.archive import PageArchive
+from app.parsers.base_parser import Parser
+from app.parsers.executor import XPathExtractor, shutdown_parse_executor, to_int, to_number
+
+PAGES = 2000
+CARDS_PER_PAGE = 50
+REPEAT_SHARE = 0.2
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск']
+
+EXTRACTOR = XPathExtractor(
+    item_xpath='//div[@data-marker="item"]',
+    fields={
+        'external_id': 'string(@data-item-id)',
+        'title': 'string(.//h3)',
+        'price': 'string(.//span[@class="price"])',
+        'area': 'string(.//span[@class="area"])',
+        'rooms': 'string(.//span[@class="rooms"])',
+        'location': 'string(.//div[@class="geo"])',
+    },
+    follow_xpath='//a[@class="next"]/@href',
+    converters={'price': to_number, 'area': to_number, 'rooms': to_int},
+    constants={'source': 'bench', 'deal_type': 'sale'},
+)
+
+
+class BenchParser(Parser):
+    name = 'bench'
+    page_parser = EXTRACTOR
+
+    def __init__(self):
+        super().__init__('scripts.bench_page_archive', 'https://example.com/')
+
+
+def random_page(rng: random.Random, number: int) -> bytes:
+    cards = []
+    for index in range(CARDS_PER_PAGE):
+        rooms = rng.randint(1, 4)
+        area = rng.uniform(20, 150)
+        cards.append(
+            f'<div data-marker="item" data-item-id="{number * CARDS_PER_PAGE + index}">'
+            f'<h3>{rooms}-к. квартира, {area:.1f} м²</h3>'
+            f'<span class="price">{rng.randint(3000, 40000) * 1000:_} ₽</span>'
+            f'<span class="area">{area:.1f} м²</span><span class="rooms">{rooms}</span>'
+            f'<div class="geo">{rng.choice(CITIES)}, ул. Ленина, {rng.randint(1, 200)}</div>'
+            f'<p>{"Светлая квартира с ремонтом рядом с метро. " * rng.randint(3, 10)}</p></div>'
+        )
+    html = (
+        f'<html><head><title>Выдача {number}</title></head><body>{"".join(cards)}'
+        f'<a class="next" href="/list?p={number + 1}">Дальше</a></body></html>'
+    )
+    return html.replace('_', ' ').encode('utf-8')
+
+
+async def bench(path: str):
+    rng = random.Random(42)
+    pages = [random_page(rng, number) for number in range(PAGES)]
+    archive = PageArchive(path, segment_size=16 * 1024 * 1024)
+
+    started = time.perf_counter()
+    for number, body in enumerate(pages):
+        archive.store_sync(f"https://example.com/list?p={number}", 200, body, 'bench')
+        if rng.random() < REPEAT_SHARE:
+            archive.store_sync(f"https://example.com/list?p={number}", 200, body, 'bench')
+    elapsed = time.perf_counter() - started
+    stats = archive.stats
+    print(f"Запись: {stats['pages']} загрузок за {elapsed:.2f} с, повторов без записи: {stats['deduplicated']}, "
+          f"{archive.codec}: {stats['raw_bytes'] / 2 ** 20:.1f} МБ -> {stats['stored_bytes'] / 2 ** 20:.1f} МБ")
+
+    started = time.perf_counter()
+    records = archive.pages(parser='bench', unique=True)
+    read = sum(len(body) for _, body in archive.iter_bodies(records))
+    elapsed = time.perf_counter() - started
+    print(f"Чтение тел из сегментов: {read / 2 ** 20 / elapsed:.0f} МБ/с")
+
+    started = time.perf_counter()
+    reference = [EXTRACTOR(body) for body in pages]
+    inline = time.perf_counter() - started
+    expected = sum(len([item for item in result if isinstance(item, dict)]) for result in reference)
+
+    parser = BenchParser()
+    await parser.replay(archive, unique=True)  # прогрев пула процессов
+    started = time.perf_counter()
+    items, replay_stats = await parser.replay(archive, unique=True)
+    replayed = time.perf_counter() - started
+    assert len(items) == expected, "Разбор из архива дал другое число объявлений"
+
+    print(f"Разбор из памяти в одном процессе: {PAGES / inline:8.0f} страниц/с")
+    print(f"Воспроизведение архива (mmap + пул): {PAGES / replayed:8.0f} страниц/с, объявлений {len(items)}")
+    await parser.close()
+    archive.close()
+    shutdown_parse_executor()
+
+
+def main():
+    if len(sys.argv) > 1:
+        asyncio.run(bench(sys.argv[1]))
+        return
+    with tempfile.TemporaryDirectory() as path:
+        asyncio.run(bench(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Микро-бенчмарк накладных расходов DatabaseExecutor.execute_query без базы данных.
+
+Сравнивает прежний путь (полный текст запроса и параметры в лог на INFO на каждый вызов)
+с текущим (именованный запрос, лог только медленных и выборочных запросов).
+Соединение и курсор заменены заглушками, поэтому разница — это стоимость
+форматирования и вывода логов на один запрос.
+
+Запуск: python -m scripts.bench_query_overhead
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from app.storage.database import DatabaseExecutor
+from app.storage.queries import UPSERT_LISTING
+
+ITERATIONS = 20000
+
+PARAMS = (
+    1, 'https://www.avito.ru/moskva/kvartiry/123', 'https://www.avito.ru/moskva/kvartiry/123',
+    '2-к. квартира, 54 м², 7/12 эт.', 'Продается светлая квартира с балконом у метро. ' * 20,
+    12500000, 'sale', 2, 54.0, 'Москва, ул. Ленина, 1', 'a' * 40,
+)
+
+
+class FakeCursor:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, query, params=None):
+        pass
+
+    async def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    def cursor(self, *args):
+        return FakeCursor()
+
+    async def commit(self):
+        pass
+
+
+class BenchExecutor(DatabaseExecutor):
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection()
+
+    async def legacy_execute_query(self, query, params=None, fetch=False):
+        # Прежняя реализация execute_query: текст и параметры в лог на каждый запрос
+        try:
+            async with self.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await cursor.execute(query, params)
+
+                    if fetch:
+                        result = await cursor.fetchall()
+                        logger.info(f"Выполнен запрос: {query}")
+                        return result
+
+                    await connection.commit()
+                    logger.info(f"Выполнен запрос: {query} с параметрами: {params}")
+
+        except Exception as e:
+            logger.error(f"Ошибка выполнения запроса: {query}, параметры: {params}, ошибка: {e}")
+            raise
+
+        return None
+
+
+async def measure(name, call):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await call()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {elapsed / ITERATIONS * 1e6:8.1f} мкс/запрос")
+    return elapsed
+
+
+async def main():
+    # Синк, который форматирует сообщения, но никуда их не пишет: измеряется только стоимость логирования
+    logger.remove()
+    logger.add(lambda message: None, level='INFO')
+
+    executor = BenchExecutor()
+    before = await measure('до', lambda: executor.legacy_execute_query(UPSERT_LISTING.sql, PARAMS))
+    after = await measure('после', lambda: executor.execute_query(UPSERT_LISTING, PARAMS))
+    print(f"Ускорение: {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
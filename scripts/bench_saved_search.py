@@ -0,0 +1,78 @@
+"""
+Бенчмарк сопоставления новых объявлений с сохраненными поисками без базы данных.
+
+Сравнивает прямую проверку каждой подписки (O(подписки) на объявление)
+с индексом SavedSearchIndex на 100 000 случайных подписок и проверяет,
+что оба способа находят одинаковые совпадения.
+
+Запуск: python -m scripts.bench_saved_search
+"""
+import random
+import time
+
+from app.notifications.matcher import SavedSearch, SavedSearchIndex
+
+SUBSCRIPTIONS = 100_000
+LISTINGS = 2000
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Екатеринбург', 'Новосибирск', 'Сочи']
+DISTRICTS = ['Арбат', 'Хамовники', 'Басманный', 'Центральный', 'Приморский', 'Вахитовский', 'Ленинский']
+
+
+def random_search(rng: random.Random, id_: int) -> SavedSearch:
+    deal_type = rng.choice(['sale', 'rent', None])
+    base = 10_000_000 if deal_type != 'rent' else 60_000
+    location = None
+    if rng.random() < 0.8:
+        location = rng.choice(CITIES)
+        if rng.random() < 0.5:
+            location += f", р-н {rng.choice(DISTRICTS)}"
+    price_min = round(base * rng.uniform(0.2, 1.5)) if rng.random() < 0.7 else None
+    price_max = round((price_min or base * 0.2) * rng.uniform(1.1, 3)) if rng.random() < 0.8 else None
+    area_min = rng.choice([None, 25, 40, 60])
+    return SavedSearch(
+        id_, f"user{id_}@example.com", 'email', deal_type, rng.choice([None, 1, 2, 3, 4]), location,
+        price_min, price_max, area_min, area_min and rng.choice([None, area_min * 2]),
+    )
+
+
+def random_listing(rng: random.Random) -> dict:
+    deal_type = rng.choice(['sale', 'rent'])
+    base = 10_000_000 if deal_type == 'sale' else 60_000
+    return {
+        'deal_type': deal_type,
+        'rooms': rng.choice([None, 1, 2, 3, 4]),
+        'location': f"{rng.choice(CITIES)}, р-н {rng.choice(DISTRICTS)}, ул. Ленина, {rng.randint(1, 100)}",
+        'price': round(base * rng.uniform(0.2, 3)),
+        'area': rng.choice([None, rng.uniform(20, 150)]),
+    }
+
+
+def main():
+    rng = random.Random(42)
+    searches = [random_search(rng, id_) for id_ in range(1, SUBSCRIPTIONS + 1)]
+    listings = [random_listing(rng) for _ in range(LISTINGS)]
+
+    started = time.perf_counter()
+    index = SavedSearchIndex(searches)
+    index.match(listings[0])
+    print(f"Построение индекса на {SUBSCRIPTIONS} подписках: {time.perf_counter() - started:.2f} с")
+
+    naive_listings = listings[:50]
+    started = time.perf_counter()
+    expected = [{search.id for search in searches if search.matches(listing)} for listing in naive_listings]
+    naive = (time.perf_counter() - started) / len(naive_listings)
+
+    started = time.perf_counter()
+    found = [{search.id for search in index.match(listing)} for listing in listings]
+    indexed = (time.perf_counter() - started) / len(listings)
+
+    assert found[:len(naive_listings)] == expected, "Индекс и прямая проверка дали разные совпадения"
+    matches = sum(len(ids) for ids in found) / len(found)
+    print(f"Прямая проверка: {naive * 1e3:8.2f} мс на объявление")
+    print(f"Индекс:          {indexed * 1e3:8.3f} мс на объявление (в среднем {matches:.0f} совпадений)")
+    print(f"Ускорение: {naive / indexed:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from app.analysis.analytics import (
+    AFFECTED_WEEKS, LOCK_WATERMARK, NEXT_BATCH, SET_WATERMARK, UPSERT_ROLLUP, PriceAnalytics, PriceObservations,
+)
+
+
+def week_of(moment):
+    day = moment.date()
+    return day - timedelta(days=day.weekday())
+
+
+class FakeCursor:
+    """
+    Курсор, выполняющий запросы агрегатов цен над списками в памяти.
+    """
+
+    def __init__(self, analytics):
+        self.analytics = analytics
+        self.result = []
+
+    async def execute(self, sql, params=()):
+        analytics = self.analytics
+        observations = analytics.observations
+        if sql == LOCK_WATERMARK.sql:
+            self.result = [(analytics.watermark,)]
+        elif sql == NEXT_BATCH.sql:
+            ids = sorted(row[0] for row in observations if row[0] > params[0])[:params[1]]
+            self.result = [(len(ids), max(ids) if ids else None)]
+        elif sql == AFFECTED_WEEKS.sql:
+            last_id, upto = params
+            self.result = [(week,) for week in {week_of(row[3]) for row in observations if last_id < row[0] <= upto}]
+        elif sql.strip().startswith('DELETE FROM listing_price_rollups WHERE week_start IN'):
+            analytics.rollups = {key: value for key, value in analytics.rollups.items() if key[4] not in params}
+        elif 'NOT EXISTS' in sql:
+            upto, bounds = params[0], params[1:-1]
+            ranges = list(zip(bounds[::2], bounds[1::2]))
+            latest = {}
+            for row in observations:
+                key = (row[1], week_of(row[3]))
+                if row[0] <= upto and row[0] > latest.get(key, (0,))[0]:
+                    latest[key] = row
+            self.result = [
+                (id_, price, *analytics.listings[listing_id], recorded_at)
+                for id_, listing_id, price, recorded_at in latest.values()
+                if any(start <= recorded_at.date() < end for start, end in ranges)
+            ]
+        elif sql == SET_WATERMARK.sql:
+            analytics.watermark = params[1]
+        else:
+            raise AssertionError(sql)
+
+    async def executemany(self, sql, rows):
+        assert sql == UPSERT_ROLLUP.sql
+        for *key, observations, total in rows:
+            count, value = self.analytics.rollups.get(tuple(key), (0, 0.0))
+            self.analytics.rollups[tuple(key)] = (count + observations, value + total)
+
+    async def fetchone(self):
+        return self.result[0] if self.result else None
+
+    async def fetchall(self):
+        return self.result
+
+
+class FakePriceAnalytics(PriceAnalytics):
+    """
+    PriceAnalytics без базы: observations — строки (id, listing_id, price, recorded_at),
+    listings — атрибуты (area, rooms, deal_type, location) по id объявления.
+    """
+
+    def __init__(self, listings):
+        super().__init__()
+        self.listings = listings
+        self.observations = []
+        self.rollups = {}
+        self.watermark = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield FakeCursor(self)
+
+    def observe(self, listing_id, price, recorded_at):
+        self.observations.append((len(self.observations) + 1, listing_id, price, recorded_at))
+
+
+def expected_rollups(analytics):
+    # Последнее наблюдение каждого объявления в каждой неделе
+    latest = {}
+    for id_, listing_id, price, recorded_at in analytics.observations:
+        latest[listing_id, week_of(recorded_at)] = (id_, price, *analytics.listings[listing_id], recorded_at)
+    return {tuple(key): (count, total) for *key, count, total
+            in PriceObservations.from_rows(list(latest.values())).rollup_increments()}
+
+
+def price_counts_by_week(analytics):
+    counts = {}
+    for key, (count, _) in analytics.rollups.items():
+        if key[0] == 'price':
+            counts[key[4]] = counts.get(key[4], 0) + count
+    return counts
+
+
+def test_rollups_count_latest_price_of_each_listing_per_week():
+    monday = datetime(2026, 3, 2, 12)
+    analytics = FakePriceAnalytics({
+        1: (40.0, 1, 'sale', 'р-н Арбат, Москва'),
+        2: (60.0, 2, 'sale', 'р-н Арбат, Москва'),
+    })
+
+    async def scenario():
+        analytics.observe(1, 10_000_000, monday)
+        analytics.observe(2, 15_000_000, monday)
+        analytics.observe(1, 11_000_000, monday + timedelta(days=1))
+        await analytics.refresh()
+
+        # Изменение цены на следующей неделе не убирает объявление из прошлой
+        analytics.observe(1, 12_000_000, monday + timedelta(days=8))
+        analytics.observe(1, 12_500_000, monday + timedelta(days=9))
+        analytics.REFRESH_BATCH = 1
+        await analytics.refresh()
+
+    asyncio.run(scenario())
+
+    assert analytics.rollups == expected_rollups(analytics)
+    assert price_counts_by_week(analytics) == {week_of(monday): 2, week_of(monday) + timedelta(days=7): 1}
+    assert analytics.watermark == len(analytics.observations)
+
+
+def test_listing_with_stable_price_stays_in_weekly_snapshots():
+    monday = datetime(2026, 3, 2, 12)
+    analytics = FakePriceAnalytics({1: (40.0, 1, 'sale', 'Москва'), 2: (60.0, 2, 'sale', 'Москва')})
+
+    async def scenario():
+        analytics.observe(1, 10_000_000, monday)
+        analytics.observe(2, 15_000_000, monday)
+        await analytics.refresh()
+        # Парсер снова видит оба объявления: раз в неделю пишется наблюдение той же цены
+        for week in range(1, 6):
+            analytics.observe(1, 10_000_000, monday + timedelta(weeks=week))
+            analytics.observe(2, 15_000_000, monday + timedelta(weeks=week))
+            await analytics.refresh()
+
+    asyncio.run(scenario())
+
+    assert analytics.rollups == expected_rollups(analytics)
+    assert price_counts_by_week(analytics) == {week_of(monday) + timedelta(weeks=week): 2 for week in range(6)}
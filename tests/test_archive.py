@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.parsers.archive import CODEC_GZIP, PageArchive, content_hash
+from app.parsers.base_parser import Parser
+
+
+def page(number, size=2000):
+    # Случайные байты почти не сжимаются, поэтому размер блоба в сегменте предсказуем
+    return f"<html><body>Объявление {number}</body></html>".encode('utf-8') + os.urandom(size)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = PageArchive(str(tmp_path), codec=CODEC_GZIP, segment_size=5000)
+    yield archive
+    archive.close()
+
+
+def test_identical_bodies_are_stored_once(archive):
+    body = page(1)
+    first = archive.store_sync('https://example.com/1', 200, body, parser='avito', fetched_at=1.0)
+    second = archive.store_sync('https://example.com/1?utm=x', 200, body, parser='avito', fetched_at=2.0)
+    assert first == second == content_hash(body)
+    assert archive.store_sync('https://example.com/2', 503, parser='avito', fetched_at=3.0) is None
+
+    assert (archive.stats['pages'], archive.stats['blobs'], archive.stats['deduplicated']) == (3, 1, 1)
+    # Ответ без тела в выборку не попадает, повтор содержимого — только без unique
+    assert [record.fetched_at for record in archive.pages(parser='avito')] == [1.0, 2.0]
+    assert [record.url for record in archive.pages(unique=True)] == ['https://example.com/1']
+    assert archive.load(first) == body
+    assert archive.load('0' * 64) is None
+
+
+def test_segments_roll_over_and_read_back_after_reopen(tmp_path, archive):
+    bodies = [page(number) for number in range(6)]
+    for number, body in enumerate(bodies):
+        archive.store_sync(f'https://example.com/{number}', 200, body, parser='cian', fetched_at=float(number))
+        # Чтение текущего сегмента, пока он еще растет
+        assert archive.load(content_hash(body)) == body
+
+    segments = sorted(os.listdir(tmp_path / 'segments'))
+    assert len(segments) == 3
+    assert all(os.path.getsize(tmp_path / 'segments' / name) <= 5000 for name in segments)
+    archive.close()
+
+    reopened = PageArchive(str(tmp_path), codec=CODEC_GZIP, segment_size=5000)
+    try:
+        records = reopened.pages(parser='cian')
+        assert [body for _, body in reopened.iter_bodies(records)] == bodies
+        assert [record.url for record in reopened.pages(url_prefix='https://example.com/3')] == ['https://example.com/3']
+        assert len(reopened.pages(since=2.0, until=4.0)) == 2
+
+        # После открытия запись продолжает нумерацию: заполненный последний сегмент сменяется следующим
+        reopened.store_sync('https://example.com/6', 200, page(6), parser='cian')
+        assert len(os.listdir(tmp_path / 'segments')) == 4
+    finally:
+        reopened.close()
+
+
+def test_concurrent_loads(archive):
+    bodies = {content_hash(body): body for body in (page(number) for number in range(8))}
+    for key, body in bodies.items():
+        archive.store_sync(f'https://example.com/{key}', 200, body)
+
+    errors = []
+
+    def read():
+        for key, body in bodies.items():
+            if archive.load(key) != body:
+                errors.append(key)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+class ArchiveParser(Parser):
+    """
+    Парсер, разбирающий страницы архива: одно объявление на страницу, битая страница — ошибка.
+    """
+    PARSE_WORKERS = 1
+
+    async def parse_page(self, html):
+        assert threading.current_thread() is threading.main_thread()
+        if 'broken' in html:
+            raise ValueError('broken page')
+        title = html.split('<body>', 1)[1].split('</body>', 1)[0]
+        return [{'title': title}, None]
+
+
+def test_replay(archive):
+    for number in range(5):
+        archive.store_sync(f'https://example.com/{number}', 200, page(number, size=0), parser='fake')
+    archive.store_sync('https://example.com/broken', 200, b'<html><body>broken</body></html>', parser='fake')
+    archive.store_sync('https://example.com/other', 200, page(99, size=0), parser='other')
+
+    parser = ArchiveParser('fake', 'https://example.com')
+    items, stats = asyncio.run(parser.replay(archive, concurrency=2))
+
+    assert sorted(item['title'] for item in items) == [f'Объявление {number}' for number in range(5)]
+    assert (stats['pages'], stats['items'], stats['failed']) == (6, 5, 1)
+
+    collected = []
+
+    async def on_items(page_items):
+        collected.extend(page_items)
+
+    items, stats = asyncio.run(parser.replay(archive, on_items=on_items, parser='other'))
+    assert items == [] and collected == [{'title': 'Объявление 99'}]
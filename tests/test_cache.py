@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.storage.cache import MISSING, Cache
+
+
+def test_cancelled_leader_does_not_cancel_coalesced_waiters():
+    async def scenario():
+        cache = Cache(max_entries=10, ttl=60)
+        release = asyncio.Event()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return 'value'
+
+        leader = asyncio.create_task(cache.get_or_load('key', loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load('key', loader))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await waiter == 'value'
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert calls == 1
+        assert await cache.get('key') == 'value'
+
+    asyncio.run(scenario())
+
+
+def test_loader_error_reaches_every_waiter():
+    async def scenario():
+        cache = Cache(max_entries=10, ttl=60)
+
+        async def loader():
+            await asyncio.sleep(0)
+            raise ValueError('boom')
+
+        results = await asyncio.gather(*(cache.get_or_load('key', loader) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert cache.stats['misses'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_evicted_keys_are_removed_from_tags():
+    async def scenario():
+        cache = Cache(max_entries=2, ttl=60)
+        for number in range(5):
+            await cache.set(f"key{number}", number, tags=('listings',))
+
+        assert cache._tags['listings'] == {'key3', 'key4'}
+        await cache.invalidate('listings')
+        assert cache._tags == {} and cache._key_tags == {}
+        assert await cache.get('key4') is MISSING
+
+    asyncio.run(scenario())
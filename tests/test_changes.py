@@ -0,0 +1,243 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+from starlette.requests import Request
+
+from app.api import routes
+from app.api.exceptions import ChangeFeedExpiredException
+from app.storage.changes import ChangeFeed, ChangeFeedExpired
+
+
+class FakeListings:
+    async def get_listings_by_ids(self, ids, filters=None, columns=None):
+        return {id_: {'id': id_, 'title': f"Объявление {id_}"} for id_ in ids if id_ != 404}
+
+
+class FakeChangeFeed(ChangeFeed):
+    """
+    Лента без базы: номер занимается при записи, а виден только после commit, как в AUTO_INCREMENT.
+    """
+    CHANGE_FEED_POLL_INTERVAL = 0.01
+    CHANGE_FEED_GAP_TIMEOUT = 0.2
+    CHANGE_FEED_HEARTBEAT = 0.05
+
+    def __init__(self):
+        super().__init__(FakeListings())
+        self.rows = {}
+        self.pending = set()
+        self.next_seq = 1
+        self.queries = 0
+
+    def write(self, listing_id, op='update', commit=True, age=0.0):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.rows[seq] = {
+            'seq': seq, 'listing_id': listing_id, 'op': op, 'price': None, 'old_price': None,
+            'changed_at': datetime(2026, 1, 1), 'created': time.monotonic() - age,
+        }
+        if not commit:
+            self.pending.add(seq)
+        return seq
+
+    def visible(self):
+        return [row for seq, row in sorted(self.rows.items()) if seq not in self.pending]
+
+    def prune_until(self, seq):
+        self.rows = {key: row for key, row in self.rows.items() if key >= seq}
+
+    async def execute_query(self, query, params=None, fetch=False, dict_rows=False):
+        self.queries += 1
+        rows = self.visible()
+        if query.name == 'listing_changes.bounds':
+            seqs = [row['seq'] for row in rows]
+            return [(min(seqs), max(seqs)) if seqs else (None, None)]
+        if query.name == 'listing_changes.page':
+            since, limit = params
+            now = time.monotonic()
+            return [
+                {**{key: value for key, value in row.items() if key != 'created'}, 'age': now - row['created']}
+                for row in rows if row['seq'] > since
+            ][:limit]
+        raise AssertionError(query.name)
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    # Общее для процесса состояние ожидания привязано к циклу событий теста
+    for name, value in (('_head', 0), ('_loop', None), ('_condition', None), ('_poller', None), ('_waiters', 0)):
+        monkeypatch.setattr(ChangeFeed, name, value)
+    return FakeChangeFeed()
+
+
+def seqs(page):
+    return [change['seq'] for change in page.changes]
+
+
+def test_page_stops_before_uncommitted_change(feed):
+    feed.write(1)
+    feed.write(2)
+    uncommitted = feed.write(3, commit=False)
+    feed.write(4)
+
+    page = asyncio.run(feed.get_changes(0))
+    assert (seqs(page), page.next_since, page.head, page.has_more) == ([1, 2], 2, 4, True)
+    assert [change['listing'] for change in page.changes] == [
+        {'id': 1, 'title': "Объявление 1"}, {'id': 2, 'title': "Объявление 2"},
+    ]
+
+    # После фиксации пропуск закрывается, и клиент получает изменение, не пропустив его
+    feed.pending.discard(uncommitted)
+    page = asyncio.run(feed.get_changes(page.next_since))
+    assert (seqs(page), page.next_since, page.has_more) == ([3, 4], 4, False)
+
+
+def test_rolled_back_gap_is_skipped_after_timeout(feed):
+    feed.write(1)
+    rolled_back = feed.write(2, commit=False)
+    feed.write(3, age=FakeChangeFeed.CHANGE_FEED_GAP_TIMEOUT)
+    del feed.rows[rolled_back]
+
+    page = asyncio.run(feed.get_changes(1))
+    assert (seqs(page), page.has_more) == ([3], False)
+
+
+def test_limit_and_deleted_listing(feed):
+    for listing_id in (1, 404, 3):
+        feed.write(listing_id, op='delete' if listing_id == 404 else 'update')
+    page = asyncio.run(feed.get_changes(0, limit=2))
+    assert (seqs(page), page.has_more) == ([1, 2], True)
+    assert page.changes[1]['listing'] is None
+
+    page = asyncio.run(feed.get_changes(0, limit=5, include_listing=False))
+    assert 'listing' not in page.changes[0]
+
+
+def test_stalled_reader_behind_retention(feed):
+    for listing_id in range(1, 6):
+        feed.write(listing_id)
+    feed.prune_until(4)
+
+    with pytest.raises(ChangeFeedExpired) as error:
+        asyncio.run(feed.get_changes(2))
+    assert (error.value.since, error.value.oldest, error.value.head) == (2, 4, 5)
+
+    # Курсор сразу перед самым ранним хранимым изменением еще продолжает ленту
+    assert seqs(asyncio.run(feed.get_changes(3))) == [4, 5]
+    # Новый клиент начинает с хранимой части
+    assert seqs(asyncio.run(feed.get_changes(0))) == [4, 5]
+    # Все удалено, а клиент уже видел последнее изменение: ждать нечего, но и ошибки нет
+    feed.rows.clear()
+    assert asyncio.run(feed.get_changes(5)).changes == []
+
+
+def test_expired_cursor_is_410(feed, monkeypatch):
+    monkeypatch.setattr(routes, 'change_feed', feed)
+    for listing_id in range(1, 6):
+        feed.write(listing_id)
+    feed.prune_until(4)
+
+    with pytest.raises(ChangeFeedExpiredException) as error:
+        asyncio.run(routes.get_changes(since=1, limit=10, wait=0, include_listing=False, columns=None))
+    assert error.value.status_code == 410
+    assert (error.value.detail['oldest'], error.value.detail['head']) == (4, 5)
+
+
+def test_long_poll_times_out_without_changes(feed):
+    feed.write(1)
+
+    async def scenario():
+        started = time.monotonic()
+        pages = await asyncio.gather(*(feed.poll_changes(1, timeout=0.1) for _ in range(3)))
+        return pages, time.monotonic() - started
+
+    pages, elapsed = asyncio.run(scenario())
+    assert all((page.changes, page.next_since, page.has_more) == ([], 1, False) for page in pages)
+    assert 0.1 <= elapsed < 0.5
+    # Пока клиенты ждут, базу опрашивает один общий опрос MAX(seq) раз в CHANGE_FEED_POLL_INTERVAL;
+    # кроме него каждый клиент дважды читает страницу (границы и изменения)
+    assert feed.queries < 3 * 4 + 0.1 / FakeChangeFeed.CHANGE_FEED_POLL_INTERVAL + 5
+
+
+def test_long_poll_returns_new_change(feed):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, feed.write, 7)
+        started = time.monotonic()
+        pages = await asyncio.gather(*(feed.poll_changes(0, timeout=2) for _ in range(3)))
+        return pages, time.monotonic() - started
+
+    pages, elapsed = asyncio.run(scenario())
+    assert [seqs(page) for page in pages] == [[1], [1], [1]]
+    assert elapsed < 1
+    assert ChangeFeed._waiters == 0
+
+
+def test_long_poll_waits_for_gap_to_close(feed):
+    feed.write(1)
+    uncommitted = feed.write(2, commit=False)
+    feed.write(3)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, feed.pending.discard, uncommitted)
+        first = await feed.poll_changes(0, timeout=1)
+        second = await feed.poll_changes(first.next_since, timeout=1)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (seqs(first), first.has_more) == ([1], True)
+    assert seqs(second) == [2, 3]
+
+
+def test_follow_sends_heartbeat_pages(feed):
+    async def scenario():
+        pages = feed.follow(0, include_listing=False)
+        heartbeat = await anext(pages)
+        feed.write(1)
+        changes = await anext(pages)
+        await pages.aclose()
+        return heartbeat, changes
+
+    heartbeat, changes = asyncio.run(scenario())
+    assert (heartbeat.changes, heartbeat.next_since) == ([], 0)
+    assert seqs(changes) == [1]
+
+
+def make_request(headers=()):
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/api/changes/stream', 'query_string': b'',
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+    }
+    return Request(scope)
+
+
+def test_sse_stream(feed, monkeypatch):
+    monkeypatch.setattr(routes, 'change_feed', feed)
+    feed.write(1, op='insert')
+    feed.write(2, op='price')
+
+    async def read(request, since, count):
+        response = await routes.stream_changes(request, since=since, include_listing=False, columns=None)
+        assert response.media_type == 'text/event-stream'
+        chunks = []
+        body = response.body_iterator
+        while len(chunks) < count:
+            chunk = await anext(body)
+            chunks.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+            if len(chunks) == count - 1:
+                feed.write(3)
+        await body.aclose()
+        return chunks
+
+    chunks = asyncio.run(read(make_request(), 0, 4))
+    assert chunks[0].startswith(b'id: 1\nevent: insert\ndata: {"seq": 1,')
+    assert chunks[1].startswith(b'id: 2\nevent: price\n')
+    # Пока изменений нет, поток шлет комментарий, чтобы прокси не закрыли соединение
+    assert chunks[2] == b': keep-alive\n\n'
+    assert chunks[3].startswith(b'id: 3\nevent: update\n')
+
+    # Переподключение продолжает поток с Last-Event-ID
+    chunks = asyncio.run(read(make_request([('last-event-id', '2')]), 0, 1))
+    assert chunks[0].startswith(b'id: 3\n')
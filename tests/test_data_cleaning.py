@@ -0,0 +1,229 @@
+import asyncio
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.analysis.data_cleaning import (
+    STORE_BUCKET, STORE_DUPLICATE_PRICE, STORE_SIGNATURE, DedupListing, ListingDeduplicator, MinHasher,
+    shingle_hashes,
+)
+
+TEXT = ("Продается светлая однокомнатная квартира в кирпичном доме у метро, окна во двор, "
+        "сделан свежий ремонт, встроенная кухня, рядом школа и парк")
+
+
+def shingle_set(text, size=5):
+    text = ' '.join(text.lower().replace('ё', 'е').replace(',', ' ').split())
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def test_shingles_ignore_case_punctuation_and_yo():
+    assert set(shingle_hashes('Квартира, ЁЛКИ!', 'у метро').tolist()) == \
+        set(shingle_hashes('квартира елки', 'У  метро...').tolist())
+    assert len(shingle_hashes(None, '')) == 0
+
+
+def test_signature_similarity_estimates_jaccard():
+    hasher = MinHasher(num_perm=256, bands=32)
+    edited = TEXT.replace('свежий ремонт', 'косметический ремонт').replace('школа и парк', 'торговый центр')
+    first, second = shingle_set(TEXT), shingle_set(edited)
+    jaccard = len(first & second) / len(first | second)
+
+    estimate = hasher.similarity(hasher.signature(shingle_hashes(TEXT, None)),
+                                 hasher.signature(shingle_hashes(edited, None)))
+    assert abs(estimate - jaccard) < 0.1
+    assert hasher.signature(np.empty(0, dtype=np.uint64)) is None
+
+
+def test_signatures_and_buckets_are_stable_between_instances():
+    hashes = shingle_hashes(TEXT, None)
+    first, second = MinHasher(), MinHasher()
+    assert np.array_equal(first.signature(hashes), second.signature(hashes))
+    assert first.buckets(first.signature(hashes)) == second.buckets(second.signature(hashes))
+    assert not np.array_equal(MinHasher(seed=1).signature(hashes), first.signature(hashes))
+
+
+def test_banding():
+    hasher = MinHasher(num_perm=8, bands=4)
+    signature = np.array([1, 2, 3, 4, 5, 6, 7, 8], dtype=np.uint32)
+    buckets = hasher.buckets(signature)
+    assert len(set(buckets)) == 4
+
+    # Изменение одной компоненты меняет ключ только ее полосы
+    changed = signature.copy()
+    changed[5] = 60
+    assert [a == b for a, b in zip(buckets, hasher.buckets(changed))] == [True, True, False, True]
+
+    # Одинаковые значения в разных полосах дают разные ключи
+    repeated = hasher.buckets(np.array([1, 2] * 4, dtype=np.uint32))
+    assert len(set(repeated)) == 4
+
+    with pytest.raises(ValueError):
+        MinHasher(num_perm=10, bands=4)
+
+
+def make_listing(id_, text=TEXT, price='5000000', area='40', rooms=1, deal_type='sale', source_id=1, hasher=None):
+    hasher = hasher or MinHasher()
+    return DedupListing(id_, source_id, f'https://example.com/{id_}', Decimal(price), deal_type, rooms,
+                        Decimal(area) if area is not None else None, None,
+                        hasher.signature(shingle_hashes(text, None)))
+
+
+@pytest.mark.parametrize('changes, duplicate', [
+    ({}, True),
+    ({'price': '5200000'}, True),
+    ({'price': '5400000'}, False),
+    ({'area': '40.8'}, True),
+    ({'area': '42'}, False),
+    ({'area': None}, True),
+    ({'rooms': None}, True),
+    ({'rooms': 2}, False),
+    ({'deal_type': 'rent'}, False),
+    ({'text': 'Сдается гараж на длительный срок, охрана, свет, смотровая яма'}, False),
+])
+def test_is_duplicate(changes, duplicate):
+    deduplicator = ListingDeduplicator()
+    assert deduplicator.is_duplicate(make_listing(2, **changes), make_listing(1)) is duplicate
+
+
+class FakeDedupCursor:
+    """
+    Курсор, выполняющий запросы записи результатов поиска дубликатов над таблицами в памяти.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    async def execute(self, sql, params=()):
+        db = self.db
+        if sql.startswith('DELETE FROM listing_lsh_buckets WHERE listing_id IN'):
+            db.buckets = {(bucket, id_) for bucket, id_ in db.buckets if id_ not in params}
+        elif sql.startswith('SELECT id, canonical_id FROM listings'):
+            self.result = [(id_, db.listings[id_]['canonical_id']) for id_ in params if id_ in db.listings]
+        elif sql.startswith('SELECT id, source_id FROM listings'):
+            self.result = [(id_, db.listings[id_]['source_id']) for id_ in params if id_ in db.listings]
+        elif 'UPDATE listings l JOIN' in sql:
+            # Служебная запись оставляет updated_at прежним: иначе она попадет в ленту изменений
+            assert 'l.updated_at = l.updated_at' in sql
+            for id_, _, canonical_id in zip(params[::3], params[1::3], params[2::3]):
+                db.listings[id_]['canonical_id'] = canonical_id
+                db.listings[id_]['deduped'] = True
+        else:
+            raise AssertionError(sql)
+
+    async def executemany(self, sql, rows):
+        if sql == STORE_SIGNATURE.sql:
+            self.db.signatures.update(rows)
+        elif sql == STORE_BUCKET.sql:
+            self.db.buckets.update(rows)
+        elif sql == STORE_DUPLICATE_PRICE.sql:
+            self.db.prices.extend(rows)
+        else:
+            raise AssertionError(sql)
+
+    async def fetchall(self):
+        return self.result
+
+
+class FakeDeduplicator(ListingDeduplicator):
+    """
+    ListingDeduplicator без базы: listings — словарь id -> колонки объявления.
+    """
+
+    def __init__(self, **config):
+        super().__init__(MinHasher(num_perm=32, bands=16))
+        for name, value in config.items():
+            setattr(self, name, value)
+        self.listings = {}
+        self.signatures = {}
+        self.buckets = set()
+        self.prices = []
+
+    def add(self, id_, text=TEXT, price=5000000, source_id=1, canonical_id=None):
+        self.listings[id_] = {
+            'source_id': source_id, 'url': f'https://example.com/{id_}', 'text': text, 'price': price,
+            'deal_type': 'sale', 'rooms': 1, 'area': 40, 'canonical_id': canonical_id, 'deduped': False,
+        }
+
+    async def execute_query(self, query, params=None, fetch=False, dict_rows=False):
+        if query.name == 'dedup.pending':
+            last_id, limit = params
+            pending = sorted(id_ for id_, row in self.listings.items() if not row['deduped'] and id_ > last_id)
+            return [
+                (id_, row['source_id'], row['url'], row['text'], None, row['price'], row['deal_type'],
+                 row['rooms'], row['area'], 'hash')
+                for id_, row in ((id_, self.listings[id_]) for id_ in pending[:limit])
+            ]
+        if query.name == 'dedup.candidates':
+            *buckets, max_size = params
+            sizes = {}
+            for bucket, _ in self.buckets:
+                sizes[bucket] = sizes.get(bucket, 0) + 1
+            kept = {bucket for bucket in buckets if sizes.get(bucket, 0) <= max_size}
+            return [
+                (bucket, id_, row['source_id'], row['url'], row['price'], row['deal_type'], row['rooms'],
+                 row['area'], row['canonical_id'], self.signatures[id_])
+                for bucket, id_ in self.buckets if bucket in kept
+                for row in (self.listings[id_],)
+            ]
+        raise AssertionError(query.name)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield FakeDedupCursor(self)
+
+
+def canonical_ids(deduplicator):
+    return {id_: row['canonical_id'] for id_, row in deduplicator.listings.items()}
+
+
+def test_duplicates_point_to_earliest_listing_and_record_price():
+    deduplicator = FakeDeduplicator(DEDUP_BATCH=2)
+    deduplicator.add(1)
+    deduplicator.add(2, price=5100000, source_id=2)
+    deduplicator.add(3, text='Сдается гараж на длительный срок, охрана, свет, смотровая яма')
+    deduplicator.add(4, price=4950000, source_id=3)
+
+    assert asyncio.run(deduplicator.process_pending()) == 2
+    assert canonical_ids(deduplicator) == {1: None, 2: 1, 3: None, 4: 1}
+    assert sorted(price[:3] for price in deduplicator.prices) == [(1, 2, Decimal('5100000')), (1, 3, Decimal('4950000'))]
+
+
+def test_duplicate_of_a_duplicate_points_to_the_root():
+    deduplicator = FakeDeduplicator()
+    # Объявление 2 было каноническим для 3, а после изменения текста само стало дубликатом 1
+    deduplicator.add(1, text='Сдается гараж на длительный срок, охрана, свет, смотровая яма')
+    deduplicator.add(2, canonical_id=1)
+    deduplicator.add(3, canonical_id=2)
+    signature = deduplicator.hasher.signature(shingle_hashes(TEXT, None))
+    for id_ in (1, 2, 3):
+        deduplicator.listings[id_]['deduped'] = True
+    deduplicator.signatures[3] = signature.tobytes()
+    deduplicator.buckets = {(bucket, 3) for bucket in deduplicator.hasher.buckets(signature)}
+
+    deduplicator.add(4)
+    asyncio.run(deduplicator.process_pending())
+    assert deduplicator.listings[4]['canonical_id'] == 1
+
+    # Корень, удаленный после поиска кандидатов, не записывается
+    deduplicator.add(5)
+    del deduplicator.listings[1]
+    deduplicator.listings[2]['canonical_id'] = 1
+    asyncio.run(deduplicator.process_pending())
+    assert deduplicator.listings[5]['canonical_id'] is None
+
+
+def test_oversized_buckets_give_no_candidates():
+    deduplicator = FakeDeduplicator(DEDUP_MAX_BUCKET_SIZE=3)
+    for id_ in range(1, 5):
+        deduplicator.add(id_)
+    asyncio.run(deduplicator.process_pending())
+    # Первые объявления обработаны одной пачкой: корзины заполнены до размера 4
+    assert canonical_ids(deduplicator) == {1: None, 2: 1, 3: 1, 4: 1}
+
+    deduplicator.add(5)
+    asyncio.run(deduplicator.process_pending())
+    assert deduplicator.listings[5]['canonical_id'] is None
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+from app.analysis.geo_analysis import BoundingBox, GeoService, SpatialIndex, haversine_km
+
+
+class FakeGeoService(GeoService):
+    """
+    GeoService без базы: listings — словарь id -> (lat, lon, geocoded_at, updated_at),
+    deleted — id удаленных объявлений в порядке записей в ленте изменений.
+    """
+
+    def __init__(self, listings):
+        super().__init__()
+        self.listings = listings
+        self.deleted = []
+
+    def delete(self, listing_id):
+        del self.listings[listing_id]
+        self.deleted.append(listing_id)
+
+    async def execute_query(self, query, params=None, fetch=False, dict_rows=False):
+        if query.name == 'geo.updated_watermark':
+            return [(max(row[3] for row in self.listings.values()), len(self.deleted) or None)]
+        if query.name == 'geo.reset':
+            return [(id_,) for id_, row in self.listings.items() if row[3] >= params[0] and row[0] is None]
+        if query.name == 'geo.deleted':
+            return [(listing_id,) for listing_id in self.deleted[params[0]:params[1]]]
+        raise AssertionError(query.name)
+
+    async def stream_query(self, query, params=None, batch_size=None):
+        for id_, (lat, lon, geocoded_at, _) in self.listings.items():
+            if lat is not None and geocoded_at >= datetime.fromisoformat(str(params[0])):
+                yield {'id': id_, 'latitude': lat, 'longitude': lon, 'geocoded_at': geocoded_at}
+
+
+def test_incremental_sync_removes_points_with_reset_coordinates():
+    first, later = datetime(2026, 1, 1), datetime(2026, 1, 2)
+    service = FakeGeoService({
+        1: (55.75, 37.62, first, first),
+        2: (55.76, 37.63, first, first),
+    })
+
+    async def scenario():
+        await service._load(full=True)
+        assert sorted(service.index.snapshot()[0].tolist()) == [1, 2]
+
+        # Смена адреса: listings.upsert обнуляет координаты и geocoded_at
+        service.listings[2] = (None, None, None, later)
+        service.listings[3] = (55.70, 37.50, later, later)
+        await service._load(full=False)
+        assert sorted(service.index.snapshot()[0].tolist()) == [1, 3]
+
+    asyncio.run(scenario())
+
+
+def test_incremental_sync_removes_deleted_listings():
+    moment = datetime(2026, 1, 1)
+    service = FakeGeoService({id_: (55.75 + id_ / 100, 37.62, moment, moment) for id_ in (1, 2, 3, 4)})
+
+    async def scenario():
+        await service._load(full=True)
+        service.delete(2)
+        await service._load(full=False)
+        assert sorted(service.index.snapshot()[0].tolist()) == [1, 3, 4]
+
+        # Удаления, уже учтенные полной загрузкой, не мешают следующим
+        service.delete(4)
+        await service._load(full=True)
+        service.delete(1)
+        await service._load(full=False)
+        assert service.index.snapshot()[0].tolist() == [3]
+
+    asyncio.run(scenario())
+
+
+def test_geocoding_is_disabled_without_geocoder_url():
+    service = FakeGeoService({})
+    assert service.geocoder.backend is None
+    assert asyncio.run(service.geocode_pending()) == 0
+
+
+def random_points(rng, count):
+    ids = rng.permutation(count * 3)[:count].astype(np.int64)
+    # Половина точек в Москве, остальные по всему миру, включая окрестности 180-го меридиана
+    lat = np.concatenate((rng.uniform(55.5, 56.0, count // 2), rng.uniform(-89, 89, count - count // 2)))
+    lon = np.concatenate((rng.uniform(37.3, 37.9, count // 2), rng.uniform(-180, 180, count - count // 2)))
+    return ids, lat, lon
+
+
+def brute_radius(ids, lat, lon, center, radius_km):
+    distances = haversine_km(center[0], center[1], lat, lon)
+    return set(ids[distances <= radius_km].tolist())
+
+
+def brute_bbox(ids, lat, lon, bbox):
+    inside = (lat >= bbox.min_lat) & (lat <= bbox.max_lat)
+    if bbox.min_lon <= bbox.max_lon:
+        inside &= (lon >= bbox.min_lon) & (lon <= bbox.max_lon)
+    else:
+        inside &= (lon >= bbox.min_lon) | (lon <= bbox.max_lon)
+    return set(ids[inside].tolist())
+
+
+def assert_index_matches_brute_force(index, ids, lat, lon, rng):
+    centers = [(55.75, 37.62), (0.0, 179.9), (-60.0, -179.5), (89.5, 10.0)]
+    centers += list(zip(rng.uniform(-80, 80, 10), rng.uniform(-180, 180, 10)))
+    for center in centers:
+        for radius_km in (1.0, 15.0, 500.0, 5000.0):
+            found, distances = index.radius(*center, radius_km)
+            assert set(found.tolist()) == brute_radius(ids, lat, lon, center, radius_km)
+            assert np.all(np.diff(distances) >= 0)
+
+        found, distances = index.nearest(*center, 5)
+        expected = np.sort(haversine_km(center[0], center[1], lat, lon))[:5]
+        assert np.allclose(distances, expected)
+
+    for bbox in (BoundingBox(55.7, 37.5, 55.8, 37.7), BoundingBox(-30, 170, 30, -170), BoundingBox(-90, -180, 90, 180)):
+        assert set(index.bbox(bbox).tolist()) == brute_bbox(ids, lat, lon, bbox)
+
+
+def test_spatial_index_matches_brute_force():
+    rng = np.random.default_rng(3)
+    ids, lat, lon = random_points(rng, 2000)
+    index = SpatialIndex(cell_degrees=0.5)
+    index.build(ids, lat, lon)
+
+    assert len(index) == len(ids)
+    assert_index_matches_brute_force(index, ids, lat, lon, rng)
+
+
+def test_spatial_index_after_upsert_and_remove():
+    rng = np.random.default_rng(5)
+    ids, lat, lon = random_points(rng, 1000)
+    index = SpatialIndex(cell_degrees=0.5)
+    index.build(ids, lat, lon)
+    points = {id_: (lat_, lon_) for id_, lat_, lon_ in zip(ids.tolist(), lat.tolist(), lon.tolist())}
+
+    removed = rng.choice(ids, 200, replace=False).tolist()
+    index.remove(removed)
+    for id_ in removed:
+        points.pop(id_)
+    moved = rng.choice(list(points), 200, replace=False).tolist()
+    added = list(range(10_000, 10_100))
+    new_lat, new_lon = rng.uniform(-89, 89, 300), rng.uniform(-180, 180, 300)
+    index.upsert(moved + added, new_lat, new_lon)
+    points.update(zip(moved + added, zip(new_lat.tolist(), new_lon.tolist())))
+
+    ids = np.array(list(points), dtype=np.int64)
+    lat = np.array([point[0] for point in points.values()])
+    lon = np.array([point[1] for point in points.values()])
+    assert len(index) == len(ids)
+    assert_index_matches_brute_force(index, ids, lat, lon, rng)
@@ -0,0 +1,173 @@
+import os
+import time
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import router
+from app.instrumentation import (
+    UNMATCHED_ROUTE, InstrumentationConfig, MetricsMiddleware, MetricsRegistry, http_errors, http_requests,
+)
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Запросы', ('path',))
+    requests.labels('/a "b"\n').inc()
+    requests.labels('/a "b"\n').inc(2)
+    registry.gauge('test_pool_size', 'Размер пула', callback=lambda: 4)
+    registry.gauge('test_queue_size', 'Очереди', ('queue',), callback=lambda: {('email',): 2.5})
+    latency = registry.histogram('test_latency_seconds', 'Задержка', buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(seconds)
+
+    assert registry.render() == (
+        '# HELP test_requests_total Запросы\n'
+        '# TYPE test_requests_total counter\n'
+        'test_requests_total{path="/a \\"b\\"\\n"} 3\n'
+        '# HELP test_pool_size Размер пула\n'
+        '# TYPE test_pool_size gauge\n'
+        'test_pool_size 4\n'
+        '# HELP test_queue_size Очереди\n'
+        '# TYPE test_queue_size gauge\n'
+        'test_queue_size{queue="email"} 2.5\n'
+        '# HELP test_latency_seconds Задержка\n'
+        '# TYPE test_latency_seconds histogram\n'
+        'test_latency_seconds_bucket{le="0.1"} 2\n'
+        'test_latency_seconds_bucket{le="1.0"} 3\n'
+        'test_latency_seconds_bucket{le="+Inf"} 4\n'
+        'test_latency_seconds_sum 3.65\n'
+        'test_latency_seconds_count 4\n'
+    )
+    assert latency.snapshot() == {'buckets': {'0.1': 2, '1.0': 3, '+Inf': 4}, 'count': 4, 'sum': 3.65}
+
+
+def test_registry_returns_existing_family():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Счетчик', ('a',))
+    assert registry.counter('test_total', 'Счетчик', ('a',)) is counter
+    with pytest.raises(ValueError):
+        registry.counter('test_total', 'Счетчик', ('b',))
+    with pytest.raises(ValueError):
+        counter.labels('x', 'y')
+
+
+def test_failing_callback_does_not_break_render():
+    registry = MetricsRegistry()
+    registry.gauge('test_broken', 'Ошибка', callback=lambda: 1 / 0)
+    registry.counter('test_ok_total', 'Счетчик').inc()
+    assert registry.render().endswith('test_ok_total 1\n')
+
+
+def busy(seconds):
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        pass
+
+
+def make_client():
+    test_router = APIRouter()
+
+    @test_router.get('/instrumented/{item_id}')
+    async def item(item_id: int):
+        return {'id': item_id}
+
+    @test_router.get('/instrumented-error')
+    async def error():
+        raise RuntimeError('сбой')
+
+    @test_router.get('/instrumented-busy')
+    async def slow():
+        busy(0.05)
+        return {}
+
+    application = FastAPI()
+    application.include_router(test_router)
+    application.add_middleware(MetricsMiddleware)
+    return TestClient(application, raise_server_exceptions=False)
+
+
+def test_labels_use_route_templates():
+    client = make_client()
+    before = http_requests.labels('/instrumented/{item_id}', 'GET', 200).value
+    unmatched = http_requests.labels(UNMATCHED_ROUTE, 'GET', 404).value
+    errors = http_errors.labels('/instrumented-error', 'GET').value
+
+    for item_id in (1, 2, 3):
+        assert client.get(f'/instrumented/{item_id}').status_code == 200
+    assert client.get('/instrumented/4/missing').status_code == 404
+    assert client.get('/instrumented-error').status_code == 500
+
+    assert http_requests.labels('/instrumented/{item_id}', 'GET', 200).value == before + 3
+    assert http_requests.labels(UNMATCHED_ROUTE, 'GET', 404).value == unmatched + 1
+    assert http_errors.labels('/instrumented-error', 'GET').value == errors + 1
+    assert not any('/instrumented/1' in key for key, _ in http_requests.children())
+
+
+@pytest.fixture
+def profiling(monkeypatch, tmp_path):
+    monkeypatch.setattr(InstrumentationConfig, 'PROFILE_TOKEN', 'secret')
+    monkeypatch.setattr(InstrumentationConfig, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(InstrumentationConfig, 'PROFILE_INTERVAL', 0.001)
+    return tmp_path
+
+
+@pytest.mark.parametrize('headers', [{}, {'X-Profile': 'wrong'}, {'X-Profile': 'secre'}])
+def test_profile_requires_token(profiling, headers):
+    response = make_client().get('/instrumented-busy', headers=headers)
+    assert response.status_code == 200
+    assert 'x-profile-file' not in response.headers
+    assert os.listdir(profiling) == []
+
+
+def test_profile_is_disabled_without_token(profiling, monkeypatch):
+    monkeypatch.setattr(InstrumentationConfig, 'PROFILE_TOKEN', '')
+    response = make_client().get('/instrumented-busy', headers={'X-Profile': ''})
+    assert 'x-profile-file' not in response.headers
+
+
+def test_profile_dump(profiling):
+    response = make_client().get('/instrumented-busy', headers={'X-Profile': 'secret'})
+    path = response.headers['x-profile-file']
+    assert os.path.dirname(path) == str(profiling)
+    assert path.endswith('-instrumented-busy.collapsed')
+
+    with open(path, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+    # Обработчик запроса попадает в профиль вместе со своими вызовами
+    assert any('test_instrumentation:make_client.<locals>.slow;tests.test_instrumentation:busy' in line
+               for line in lines)
+
+
+@pytest.fixture
+def metrics_client():
+    application = FastAPI()
+    application.include_router(router)
+    return TestClient(application)
+
+
+def test_metrics_route(metrics_client, monkeypatch):
+    monkeypatch.setattr(InstrumentationConfig, 'METRICS_TOKEN', '')
+    response = metrics_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert '# TYPE http_requests_total counter' in response.text
+
+
+def test_metrics_token(metrics_client, monkeypatch):
+    monkeypatch.setattr(InstrumentationConfig, 'METRICS_TOKEN', 'scrape')
+    for headers in ({}, {'Authorization': 'Bearer wrong'}, {'Authorization': 'Basic scrape'}):
+        response = metrics_client.get('/metrics', headers=headers)
+        assert response.status_code == 401
+        assert response.headers['www-authenticate'] == 'Bearer'
+    assert metrics_client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
+
+
+def test_metrics_disabled(metrics_client, monkeypatch):
+    monkeypatch.setattr(InstrumentationConfig, 'METRICS_ENABLED', False)
+    assert metrics_client.get('/metrics').status_code == 404
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.visualization.maps import ClusterIndex, mercator_x, mercator_y, render_tile, tile_index
+
+MAX_ZOOM = 12
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(9)
+    count = 3000
+    ids = np.arange(1, count + 1, dtype=np.int64)
+    # Плотное облако в Москве, несколько совпадающих точек и редкие точки по всему миру
+    lat = np.concatenate((rng.normal(55.75, 0.1, count - 510), np.full(10, 55.7558), rng.uniform(-80, 80, 500)))
+    lon = np.concatenate((rng.normal(37.62, 0.15, count - 510), np.full(10, 37.6173), rng.uniform(-180, 180, 500)))
+    return ids, lat, lon
+
+
+@pytest.fixture(scope='module')
+def clusters(points):
+    index = ClusterIndex(cell_px=64, max_zoom=MAX_ZOOM)
+    index.build(*points)
+    return index
+
+
+def tiles_of(points, zoom):
+    _, lat, lon = points
+    return tile_index(mercator_x(lon), zoom), tile_index(mercator_y(lat), zoom)
+
+
+def test_every_level_keeps_all_points(clusters, points):
+    assert len(clusters) == len(points[0])
+    for zoom in range(MAX_ZOOM + 1):
+        level = clusters.levels[zoom]
+        assert level.counts.sum() == len(points[0])
+        singles = level.counts == 1
+        assert np.all(level.member[singles] > 0) and np.all(level.member[~singles] == -1)
+
+
+@pytest.mark.parametrize('zoom', [0, 3, 8, MAX_ZOOM, MAX_ZOOM + 2])
+def test_tile_matches_brute_force(clusters, points, zoom):
+    ids = points[0]
+    tile_x, tile_y = tiles_of(points, zoom)
+    for x, y in set(zip(tile_x.tolist(), tile_y.tolist())):
+        inside = (tile_x == x) & (tile_y == y)
+        level = clusters.tile(zoom, x, y)
+
+        assert level.counts.sum() == inside.sum()
+        # Центры кластеров лежат в своем тайле
+        assert np.all(tile_index(level.x, zoom) == x) and np.all(tile_index(level.y, zoom) == y)
+        if zoom > MAX_ZOOM:
+            assert sorted(level.member.tolist()) == sorted(ids[inside].tolist())
+        elif inside.sum() == 1:
+            assert level.member.tolist() == ids[inside].tolist()
+
+
+def test_empty_tile(clusters):
+    # Тайл в океане на крупном масштабе
+    for zoom in (MAX_ZOOM, MAX_ZOOM + 3):
+        level = clusters.tile(zoom, 0, 0)
+        assert len(level.counts) == 0
+
+
+def test_render_tile(clusters, points):
+    tile_x, tile_y = tiles_of(points, 10)
+    x, y = int(tile_x[0]), int(tile_y[0])
+    payload = json.loads(render_tile(10, x, y, clusters.tile(10, x, y)))
+
+    assert (payload['z'], payload['x'], payload['y']) == (10, x, y)
+    total = sum(count for _, _, count in payload['clusters']) + len(payload['points'])
+    assert total == ((tile_x == x) & (tile_y == y)).sum()
+
+
+def test_invalid_cell_size():
+    with pytest.raises(ValueError):
+        ClusterIndex(cell_px=48)
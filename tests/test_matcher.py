@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+
+from app.notifications.matcher import IntervalTree, SavedSearch, SavedSearchIndex
+
+LOCATIONS = [
+    'Москва, р-н Арбат, ул. Арбат, 10',
+    'Москва, р-н Хамовники, Комсомольский пр-т, 5',
+    'москва,  р-н Арбат, Староконюшенный пер., 3',
+    'Санкт-Петербург, Невский пр-т, 1',
+    'Королёв, ул. Ленина, 2',
+    None,
+]
+PREFIXES = ['', 'Москва', 'МОСКВА, р-н  арбат', 'Санкт', 'Королев', 'Казань']
+
+
+def random_bounds(rng, low, high):
+    lo = rng.choice([None, rng.uniform(low, high)])
+    hi = rng.choice([None, rng.uniform(low, high)])
+    if lo is not None and hi is not None and lo > hi:
+        lo, hi = hi, lo
+    return lo, hi
+
+
+def random_search(rng, id_):
+    price_min, price_max = random_bounds(rng, 1e6, 3e7)
+    area_min, area_max = random_bounds(rng, 20, 150)
+    return SavedSearch(
+        id_, f"user{id_}@example.com", 'email',
+        deal_type=rng.choice([None, 'sale', 'rent']),
+        rooms=rng.choice([None, 1, 2, 3]),
+        location=rng.choice(PREFIXES),
+        price_min=price_min, price_max=price_max, area_min=area_min, area_max=area_max,
+    )
+
+
+def random_listing(rng):
+    return {
+        'deal_type': rng.choice([None, 'sale', 'rent']),
+        'rooms': rng.choice([None, 1, 2, 3]),
+        'location': rng.choice(LOCATIONS),
+        'price': rng.uniform(1e6, 3e7),
+        'area': rng.choice([None, rng.uniform(20, 150)]),
+    }
+
+
+def assert_index_matches_direct_check(index, searches, listings):
+    for listing in listings:
+        expected = sorted(search.id for search in searches if search.matches(listing))
+        assert sorted(search.id for search in index.match(listing)) == expected, listing
+
+
+def test_interval_tree_stab_matches_brute_force():
+    rng = np.random.default_rng(1)
+    lo = rng.uniform(0, 100, 500)
+    hi = lo + rng.exponential(10, 500)
+    lo[rng.random(500) < 0.1] = -np.inf
+    hi[rng.random(500) < 0.1] = np.inf
+    tree = IntervalTree(lo, hi)
+
+    for x in np.concatenate((rng.uniform(-10, 150, 200), lo[np.isfinite(lo)][:50], hi[np.isfinite(hi)][:50])):
+        assert sorted(tree.stab(x).tolist()) == np.flatnonzero((lo <= x) & (hi >= x)).tolist()
+
+
+def test_index_matches_direct_check():
+    rng = random.Random(7)
+    searches = [random_search(rng, id_) for id_ in range(1, 1001)]
+    index = SavedSearchIndex(searches)
+
+    assert_index_matches_direct_check(index, searches, [random_listing(rng) for _ in range(500)])
+
+
+def test_index_after_add_and_remove():
+    rng = random.Random(11)
+    searches = {id_: random_search(rng, id_) for id_ in range(1, 301)}
+    index = SavedSearchIndex(searches.values())
+    listings = [random_listing(rng) for _ in range(200)]
+    assert_index_matches_direct_check(index, list(searches.values()), listings)
+
+    for id_ in rng.sample(sorted(searches), 100):
+        assert index.remove(id_) is searches.pop(id_)
+    for id_ in rng.sample(sorted(searches), 50):
+        # Повторное добавление с тем же id заменяет подписку
+        searches[id_] = random_search(rng, id_)
+        index.add(searches[id_])
+    for id_ in range(301, 351):
+        searches[id_] = random_search(rng, id_)
+        index.add(searches[id_])
+
+    assert len(index) == len(searches)
+    assert index.remove(10_000) is None
+    assert_index_matches_direct_check(index, list(searches.values()), listings)
@@ -0,0 +1,29 @@
+import re
+from pathlib import Path
+
+from app.storage.migrations import MIGRATIONS
+
+MODELS_SQL = (Path(__file__).resolve().parent.parent / 'app' / 'storage' / 'models.sql').read_text(encoding='utf-8')
+# Таблицы исходной схемы, которые есть в любой базе проекта
+BASELINE_TABLES = {
+    'listing_sources', 'property_types', 'listings', 'listing_prices', 'listing_analytics', 'listing_property_types',
+}
+
+
+def test_models_sql_records_every_migration():
+    recorded = MODELS_SQL.split('INSERT INTO schema_migrations (version, name) VALUES')[1]
+    versions = [(int(version), name) for version, name in re.findall(r"\((\d+), '(\w+)'\)", recorded)]
+
+    assert versions == [(migration.version, migration.name) for migration in MIGRATIONS]
+    assert [version for version, _ in versions] == list(range(1, len(MIGRATIONS) + 1))
+
+
+def test_every_new_table_and_trigger_has_a_migration():
+    statements = '\n'.join(statement for migration in MIGRATIONS for statement in migration.statements)
+    tables = set(re.findall(r'CREATE TABLE (\w+)', MODELS_SQL)) - BASELINE_TABLES - {'schema_migrations'}
+    triggers = set(re.findall(r'CREATE TRIGGER (\w+)', MODELS_SQL))
+
+    for name in tables:
+        assert f"CREATE TABLE {name} " in statements, name
+    for name in triggers:
+        assert f"CREATE TRIGGER {name} " in statements, name
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.notifications.dispatcher import NotificationError
+from app.notifications.telegram_notifications import TELEGRAM_MESSAGE_LIMIT, TelegramBackend, split_message
+
+
+class FakeResponse:
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self, content_type=None):
+        return self.data
+
+
+class FakeSession:
+    """
+    Сессия Bot API: statuses — ответы по порядку запросов, по умолчанию 200.
+    """
+    closed = False
+
+    def __init__(self, statuses=(), data=None):
+        self.statuses = list(statuses)
+        self.data = data
+        self.sent = []
+
+    def post(self, url, json):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            self.sent.append(json['text'])
+        return FakeResponse(status, self.data)
+
+
+def long_body(parts):
+    return '\n\n'.join(chr(ord('a') + number) * (TELEGRAM_MESSAGE_LIMIT - 10) for number in range(parts))
+
+
+def test_retry_continues_from_first_undelivered_part():
+    backend = TelegramBackend(token='token')
+    backend.session = FakeSession(statuses=[200, 500], data={'description': 'Internal Server Error'})
+    body = long_body(3)
+    parts = list(split_message(f"Дайджест\n\n{body}"))
+
+    with pytest.raises(NotificationError):
+        asyncio.run(backend.send('42', 'Дайджест', body))
+    assert len(backend.session.sent) == 1
+
+    asyncio.run(backend.send('42', 'Дайджест', body))
+    assert backend.session.sent == parts
+
+    # Доставленное целиком сообщение при повторной отправке уходит заново
+    asyncio.run(backend.send('42', 'Дайджест', body))
+    assert backend.session.sent == parts * 2
+
+
+def test_rate_limit_with_non_json_body_is_retryable_error():
+    backend = TelegramBackend(token='token')
+    backend.session = FakeSession(statuses=[429], data='Too Many Requests')
+
+    with pytest.raises(NotificationError) as error:
+        asyncio.run(backend.send('42', 'Тема', 'текст'))
+    assert error.value.retryable
+    assert error.value.retry_after is None
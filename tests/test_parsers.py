@@ -0,0 +1,205 @@
+import asyncio
+import pickle
+from datetime import datetime
+
+import pytest
+
+from app.parsers.checkpoint import Checkpoint
+from app.parsers.crawler import Crawler, FollowUrl
+from app.parsers.executor import ParseExecutor, XPathExtractor, to_int, to_number
+from app.parsers.utils import NOT_MODIFIED
+
+PAGE = '''
+<html><body>
+  <div class="item"><h3> Студия   у метро </h3><span class="price">5&nbsp;000&nbsp;000 ₽</span>
+    <span class="area">25,5 м²</span><a href="/item/1">ссылка</a></div>
+  <div class="item"><h3>2-к. квартира</h3><span class="price">12 500 000 ₽</span><a href="/item/2">ссылка</a></div>
+  <a class="next" href="/list?p=2">Дальше</a>
+</body></html>
+'''.encode('utf-8')
+
+EXPECTED = [
+    {'source': 'test', 'title': 'Студия у метро', 'price': 5000000.0, 'area': 25.5, 'url': '/item/1'},
+    {'source': 'test', 'title': '2-к. квартира', 'price': 12500000.0, 'area': None, 'url': '/item/2'},
+    FollowUrl('/list?p=2'),
+]
+
+
+class FakeParser:
+    """
+    Парсер без сети: страница выдачи с номером p ссылается на следующую через params.
+    """
+    CRAWL_WORKERS = 2
+    CRAWL_MAX_PAGES = 0
+    CRAWL_SEEN_STOP_RATIO = 1.0
+    checkpoint = None
+    raw_html = False
+    archive_name = 'fake'
+
+    def __init__(self, pages: int):
+        self.pages = pages
+        self.fetched = []
+
+    async def fetch_page(self, url, params=None, retries=None, raw=False):
+        self.fetched.append((url, dict(params or {})))
+        return (params or {}).get('p', 1)
+
+    async def parse_page(self, page):
+        results = [{'external_id': str(page)}]
+        if page < self.pages:
+            results.append(FollowUrl('/list', {'p': page + 1}))
+        return results
+
+
+def test_follow_urls_with_different_params_are_fetched():
+    parser = FakeParser(pages=3)
+    items = asyncio.run(Crawler(parser).run(['https://example.com/list']))
+
+    assert sorted(item['external_id'] for item in items) == ['1', '2', '3']
+    assert [params for _, params in parser.fetched] == [{}, {'p': 2}, {'p': 3}]
+
+
+def test_same_url_and_params_are_fetched_once():
+    crawler = Crawler(FakeParser(pages=1))
+
+    assert crawler.enqueue('https://example.com/list', {'p': 2, 'sort': 'date'})
+    assert not crawler.enqueue('https://example.com/list', {'sort': 'date', 'p': 2})
+    assert crawler.enqueue('https://example.com/list', {'p': 3, 'sort': 'date'})
+
+
+
+class FeedParser(FakeParser):
+    """
+    Выдача, отсортированная по новизне: на странице p объявления с убывающими id,
+    по per_page на страницу. Страницы из not_modified отвечают 304 на условный запрос.
+    """
+    CRAWL_SEEN_STOP_RATIO = 0.5
+
+    def __init__(self, pages, newest, per_page=4, checkpoint=None, not_modified=()):
+        super().__init__(pages)
+        self.newest = newest
+        self.per_page = per_page
+        self.checkpoint = checkpoint
+        self.not_modified = set(not_modified)
+
+    async def fetch_page(self, url, params=None, retries=None, raw=False):
+        page = (params or {}).get('p', 1)
+        self.fetched.append(page)
+        if page in self.not_modified and self.checkpoint.conditional_headers(url, params):
+            return NOT_MODIFIED
+        self.checkpoint.remember_validators(url, params, {'ETag': f'"page-{page}-v2"'})
+        return page
+
+    async def parse_page(self, page):
+        first = self.newest - (page - 1) * self.per_page
+        results = [{'external_id': str(first - index)} for index in range(self.per_page)]
+        if page < self.pages:
+            results.append(FollowUrl('/list', {'p': page + 1}))
+        return results
+
+
+def test_incremental_crawl_stops_at_seen_threshold():
+    # В прошлый раз самым новым было объявление 94: страница 2 (96..93) видена наполовину
+    parser = FeedParser(pages=5, newest=100, checkpoint=Checkpoint('fake', newest_id='94'))
+    crawler = Crawler(parser)
+    items = asyncio.run(crawler.run(['https://example.com/list']))
+
+    assert parser.fetched == [1, 2]
+    assert crawler.pages_stopped == 1
+    assert len(items) == 8
+    assert parser.checkpoint.advance().newest_id == '100'
+
+
+def test_pinned_old_listings_do_not_stop_crawl():
+    parser = FeedParser(pages=3, newest=100, checkpoint=Checkpoint('fake', newest_id='50'))
+
+    async def parse_page(page):
+        results = await FeedParser.parse_page(parser, page)
+        # Закрепленное старое объявление в начале каждой страницы
+        return [{'external_id': '7'}] + results
+
+    parser.parse_page = parse_page
+    asyncio.run(Crawler(parser).run(['https://example.com/list']))
+    assert parser.fetched == [1, 2, 3]
+
+
+def test_validators_carry_over_after_not_modified():
+    url = 'https://example.com/list'
+    checkpoint = Checkpoint('fake', newest_id='90', validators={
+        url: {'ETag': '"page-1-v1"'}, Checkpoint.page_key(url, {'p': 2}): {'ETag': '"page-2-v1"'},
+    })
+    parser = FeedParser(pages=2, newest=100, checkpoint=checkpoint, not_modified={1})
+    crawler = Crawler(parser)
+    asyncio.run(crawler.run([url]))
+
+    # Первая страница не изменилась, поэтому не разбиралась, и ссылки на вторую нет
+    assert parser.fetched == [1] and crawler.pages_unchanged == 1
+    following = checkpoint.advance()
+    assert following.validators[url] == {'ETag': '"page-1-v1"'}
+    assert following.conditional_headers(url) == {'If-None-Match': '"page-1-v1"'}
+    assert following.newest_id == '90'
+
+
+def test_checkpoint_advance_keeps_newest_values():
+    checkpoint = Checkpoint('fake', newest_id='100', newest_date=datetime(2026, 3, 1, 12))
+    assert not checkpoint.is_new({'external_id': '99'})
+    assert checkpoint.is_new({'external_id': '101'})
+    assert checkpoint.is_new({'external_id': 'abc'})
+    assert not checkpoint.is_new({'external_id': '500', 'published_at': '2026-03-01T11:00:00'})
+    assert checkpoint.is_new({'published_at': '2026-03-01T12:30:00+03:00'})
+
+    checkpoint.observe({'external_id': '98', 'published_at': '2026-03-02T08:00:00'})
+    checkpoint.observe({'external_id': 'abc'})
+    following = checkpoint.advance()
+    assert (following.newest_id, following.newest_date) == ('100', datetime(2026, 3, 2, 8))
+    # Исходное состояние не меняется: его можно сохранить, если обход не удался
+    assert (checkpoint.newest_id, checkpoint.newest_date) == ('100', datetime(2026, 3, 1, 12))
+
+def make_extractor():
+    return XPathExtractor(
+        item_xpath='//div[@class="item"]',
+        fields={'title': 'string(.//h3)', 'price': 'string(.//span[@class="price"])',
+                'area': './/span[@class="area"]', 'url': './/a/@href'},
+        follow_xpath='//a[@class="next"]/@href',
+        converters={'price': to_number, 'area': to_number},
+        constants={'source': 'test'},
+    )
+
+
+@pytest.mark.parametrize('text, number', [
+    ('12 500 000 ₽', 12500000.0), ('45,5 м²', 45.5), ('5\xa0000', 5000.0), ('без цены', None), (None, None),
+])
+def test_to_number(text, number):
+    assert to_number(text) == number
+
+
+def test_xpath_extractor():
+    extractor = make_extractor()
+    assert extractor(PAGE) == EXPECTED
+    assert extractor(b'') == []
+    assert to_int('3 комнаты') == 3
+
+
+def test_xpath_extractor_survives_pickling():
+    extractor = pickle.loads(pickle.dumps(make_extractor()))
+    assert extractor(PAGE) == EXPECTED
+
+
+def test_parse_executor_runs_extractor_in_worker_process():
+    async def scenario():
+        executor = ParseExecutor(max_workers=1)
+        try:
+            return await asyncio.gather(*(executor.run(make_extractor(), PAGE) for _ in range(3)))
+        finally:
+            executor.shutdown()
+
+    assert asyncio.run(scenario()) == [EXPECTED] * 3
+
+
+def test_parse_executor_inline_mode():
+    executor = ParseExecutor(max_workers=0)
+    assert executor.pool is None
+    # В текущем процессе подходит и функция, которую нельзя передать в воркер
+    result = asyncio.run(executor.run(lambda page, suffix: page.decode() + suffix, b'page', '!'))
+    assert result == 'page!'
+    executor.shutdown()
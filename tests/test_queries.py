@@ -0,0 +1,207 @@
+import asyncio
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+from app.storage.queries import UPSERT_LISTING, ListingService, listing_content_hash
+
+
+class FakeListingService(ListingService):
+    """
+    ListingService без базы: version — строка запроса listings.version.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+    async def execute_query(self, query, params=None, fetch=False, dict_rows=False):
+        assert query.name == 'listings.version'
+        return [self.version]
+
+
+def listings_version(service):
+    # Версия кэшируется, поэтому запрос выполняется в обход кэша
+    return asyncio.run(ListingService.get_listings_version.__wrapped__(service))
+
+
+def test_listings_version_changes_when_listing_is_deleted():
+    service = FakeListingService((Decimal('1767225600.000000'), Decimal('1767225600.000000'), 41))
+    before = listings_version(service)
+
+    # Удаление строки ниже наибольшего id: MAX(updated_at) и MAX(id) прежние, в ленте — новая запись
+    service.version = (Decimal('1767225600.000000'), Decimal('1767225660.500000'), 42)
+    after = listings_version(service)
+
+    assert after.tag != before.tag
+    assert after.updated_at == Decimal('1767225660.500000')
+
+
+def test_listings_version_without_change_feed():
+    service = FakeListingService((Decimal('1767225600.000000'), None, None))
+    assert listings_version(service).updated_at == Decimal('1767225600.000000')
+    service.version = (None, None, None)
+    assert listings_version(service).updated_at is None
+
+
+def test_content_hash_ignores_whitespace_and_number_format():
+    listing = {'title': 'Студия  у метро', 'description': 'Светлая\nквартира', 'price': 5000000, 'rooms': 1,
+               'area': 25.5, 'location': 'Москва'}
+    same = {**listing, 'title': ' Студия у метро ', 'description': 'Светлая квартира', 'price': '5000000.00',
+            'rooms': 1.0, 'area': Decimal('25.50'), 'url': 'https://example.com/1'}
+
+    assert listing_content_hash(listing) == listing_content_hash(same)
+    assert listing_content_hash(listing) != listing_content_hash({**listing, 'price': 5000000.01})
+    # Пустое значение отличается от отсутствия соседнего поля
+    assert listing_content_hash({**listing, 'area': None}) != listing_content_hash({**listing, 'rooms': None})
+
+
+class FakeUpsertCursor:
+    """
+    Курсор, выполняющий запросы upsert_listings над таблицами в памяти.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+        self.lastrowid = None
+
+    async def execute(self, sql, params=()):
+        db = self.db
+        if sql == UPSERT_LISTING.sql:
+            db.upsert(params)
+        elif sql.startswith('SELECT id, name FROM listing_sources'):
+            self.result = [(db.sources[name], name) for name in params]
+        elif 'SELECT source_id, external_id, content_hash, price FROM listings' in sql:
+            keys = set(zip(params[::2], params[1::2]))
+            self.result = [
+                (row[0], row[1], row[10], row[5]) for row in db.listings.values() if (row[0], row[1]) in keys
+            ]
+        else:
+            if 'WHERE id IN' in sql:
+                ids = [listing_id for listing_id in params if listing_id in db.listings]
+            else:
+                keys = set(zip(params[::2], params[1::2]))
+                ids = [listing_id for listing_id, row in db.listings.items() if (row[0], row[1]) in keys]
+            table = 'listing_analytics' if 'INSERT INTO listing_analytics' in sql else 'listing_prices'
+            if 'NOT EXISTS' in sql:
+                ids = [listing_id for listing_id in ids if listing_id not in db.recorded_this_week]
+            for listing_id in ids:
+                row = db.listings[listing_id]
+                if table == 'listing_prices' and row[0] is None:
+                    continue
+                db.history[table].append((listing_id, row[0], Decimal(str(row[5]))))
+                if table == 'listing_analytics':
+                    db.recorded_this_week.add(listing_id)
+        self.lastrowid = db.last_id
+
+    async def executemany(self, sql, rows):
+        if sql == UPSERT_LISTING.sql:
+            for row in rows:
+                self.db.upsert(row)
+        else:
+            for name, _ in rows:
+                self.db.sources.setdefault(name, len(self.db.sources) + 1)
+
+    async def fetchall(self):
+        return self.result
+
+
+class FakeUpsertService(ListingService):
+    """
+    ListingService с таблицами listings, listing_analytics и listing_prices в памяти;
+    recorded_this_week — объявления, у которых на текущей неделе есть строка в истории.
+    """
+    _listeners = []
+
+    def __init__(self):
+        self._source_ids = {}
+        self.sources = {}
+        self.listings = {}
+        self.history = {'listing_analytics': [], 'listing_prices': []}
+        self.recorded_this_week = set()
+        self.last_id = 0
+        self.BULK_CHUNK_SIZE = 2
+
+    def upsert(self, row):
+        for listing_id, current in self.listings.items():
+            if row[0] is not None and row[1] is not None and current[:2] == row[:2]:
+                self.listings[listing_id] = row
+                return
+        self.last_id += 1
+        self.listings[self.last_id] = row
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield FakeUpsertCursor(self)
+
+
+def make_listing(**fields):
+    return {'title': 'Студия', 'description': 'У метро', 'price': 5000000, 'deal_type': 'sale', 'rooms': 1,
+            'area': 25.0, 'location': 'Москва', **fields}
+
+
+def test_upsert_counts_and_price_history():
+    service = FakeUpsertService()
+    first = [
+        make_listing(source='avito', external_id='1'),
+        make_listing(source='avito', external_id='2', price=7000000),
+        make_listing(source='cian', url='https://cian.ru/3'),
+    ]
+    assert asyncio.run(service.upsert_listings(first)) == {'inserted': 3, 'updated': 0, 'unchanged': 0}
+    assert len(service.history['listing_analytics']) == 3
+
+    second = [
+        make_listing(source='avito', external_id='1'),
+        make_listing(source='avito', external_id='2', price=6500000),
+        make_listing(source='cian', url='https://cian.ru/3', description='У метро, с ремонтом'),
+        make_listing(source='avito', external_id='4'),
+    ]
+    assert asyncio.run(service.upsert_listings(second)) == {'inserted': 1, 'updated': 2, 'unchanged': 1}
+
+    # В историю попадают только новое объявление и изменение цены
+    analytics = service.history['listing_analytics']
+    assert [(listing_id, price) for listing_id, _, price in analytics[3:]] == [(2, Decimal('6500000')), (4, Decimal('5000000'))]
+    assert len(service.listings) == 4
+
+
+def test_upsert_records_history_for_keyless_listings():
+    service = FakeUpsertService()
+    listings = [
+        make_listing(),
+        make_listing(source='avito', price=6000000),
+        make_listing(source='avito', external_id='1'),
+    ]
+    assert asyncio.run(service.upsert_listings(listings)) == {'inserted': 3, 'updated': 0, 'unchanged': 0}
+    # Объявления без ключа вставляются при каждой записи
+    assert asyncio.run(service.upsert_listings(listings[:1])) == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+
+    source_id = service.sources['avito']
+    assert sorted(service.history['listing_analytics']) == [
+        (1, None, Decimal('5000000')),
+        (2, source_id, Decimal('6000000')),
+        (3, source_id, Decimal('5000000')),
+        (4, None, Decimal('5000000')),
+    ]
+    # Текущая цена источника — только у объявлений с источником
+    assert sorted(service.history['listing_prices']) == [
+        (2, source_id, Decimal('6000000')), (3, source_id, Decimal('5000000')),
+    ]
+
+
+def test_upsert_records_weekly_sighting_of_unchanged_listings():
+    service = FakeUpsertService()
+    listings = [make_listing(source='avito', external_id='1'), make_listing(source='avito', external_id='2')]
+    asyncio.run(service.upsert_listings(listings))
+    asyncio.run(service.upsert_listings(listings))
+    assert len(service.history['listing_analytics']) == 2
+
+    # На следующей неделе те же объявления снова видны парсеру, одно — с новым описанием
+    service.recorded_this_week.clear()
+    changed = [listings[0], {**listings[1], 'description': 'У метро, с ремонтом'}]
+    assert asyncio.run(service.upsert_listings(changed)) == {'inserted': 0, 'updated': 1, 'unchanged': 1}
+    asyncio.run(service.upsert_listings(changed))
+
+    assert [(listing_id, price) for listing_id, _, price in service.history['listing_analytics'][2:]] == [
+        (1, Decimal('5000000')), (2, Decimal('5000000')),
+    ]
+    # Наблюдение без изменения цены не трогает текущую цену источника
+    assert len(service.history['listing_prices']) == 2
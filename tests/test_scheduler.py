@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.notifications import scheduler
+from app.notifications.scheduler import CronSchedule, ParserJob, ParserScheduler
+from app.parsers.checkpoint import Checkpoint
+
+EXPRESSIONS = [
+    '*/15 * * * *',
+    '30 3 * * *',
+    '0 9-18/3 * * 1-5',
+    '5,35 */6 1,15 * *',
+    # Заданы и дни месяца, и дни недели: подходит любое из условий
+    '0 12 13 * 5',
+    '0 0 * 2 0',
+    '59 23 31 * *',
+]
+
+
+def brute_next_after(expression, moment):
+    minute, hour, day, month, weekday = expression.split()
+    schedule = CronSchedule(expression)
+    candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    while True:
+        # В cron 0 — воскресенье
+        cron_weekday = (candidate.weekday() + 1) % 7
+        by_day = candidate.day in schedule.days
+        by_weekday = cron_weekday in {(value + 1) % 7 for value in schedule.weekdays}
+        day_ok = by_day and by_weekday if day == '*' or weekday == '*' else by_day or by_weekday
+        if (candidate.minute in schedule.minutes and candidate.hour in schedule.hours
+                and candidate.month in schedule.months and day_ok):
+            return candidate
+        candidate += timedelta(minutes=1)
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_next_after_matches_minute_scan(expression):
+    schedule = CronSchedule(expression)
+    moment = datetime(2026, 1, 30, 22, 47, 31)
+    for _ in range(10):
+        expected = brute_next_after(expression, moment)
+        assert schedule.next_after(moment) == expected
+        moment = expected
+
+
+def test_cron_weekdays_start_on_sunday():
+    schedule = CronSchedule('0 10 * * 0')
+    # 2026-10-18 — воскресенье
+    assert schedule.next_after(datetime(2026, 10, 14, 12, 0)) == datetime(2026, 10, 18, 10, 0)
+    assert CronSchedule('0 10 * * 1').next_after(datetime(2026, 10, 18, 10, 0)) == datetime(2026, 10, 19, 10, 0)
+
+
+def test_next_after_is_strictly_later():
+    schedule = CronSchedule('0 * * * *')
+    assert schedule.next_after(datetime(2026, 3, 1, 5, 0)) == datetime(2026, 3, 1, 6, 0)
+    assert schedule.next_after(datetime(2026, 3, 1, 5, 0, 30)) == datetime(2026, 3, 1, 6, 0)
+
+
+def test_leap_day_and_impossible_schedule():
+    assert CronSchedule('0 0 29 2 *').next_after(datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+    with pytest.raises(ValueError):
+        CronSchedule('0 0 31 2 *').next_after(datetime(2026, 1, 1))
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '* * 0 * *', '* * * 13 *', 'x * * * *'])
+def test_invalid_expression(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+class FakeController:
+    """
+    Controller без сети: обход видит объявления 101 и 102, pages_failed страниц не загрузились.
+    """
+    pages_failed = 0
+
+    def __init__(self, module, script_name, api_url):
+        pass
+
+    async def run(self, checkpoint, workers=None, max_pages=None, on_items=None):
+        for external_id in ('101', '102'):
+            checkpoint.observe({'external_id': external_id})
+        checkpoint.remember_validators('https://example.com/list', None, {'ETag': '"v2"'})
+        crawl = SimpleNamespace(pages_fetched=2, pages_unchanged=0, pages_stopped=0, pages_failed=self.pages_failed)
+        return SimpleNamespace(last_crawl=crawl)
+
+
+class FakeScheduler(ParserScheduler):
+    """
+    ParserScheduler с checkpoint в памяти.
+    """
+
+    def __init__(self, checkpoint):
+        super().__init__(jobs=[ParserJob('fake', 'fake_parser', CronSchedule('* * * * *'), workers=1)])
+        self.saved = checkpoint
+
+    async def load_checkpoint(self, parser):
+        return Checkpoint(parser, self.saved.newest_id, self.saved.newest_date, dict(self.saved.validators))
+
+    async def save_checkpoint(self, checkpoint):
+        self.saved = checkpoint
+
+
+@pytest.mark.parametrize('pages_failed, status, newest_id', [(0, 'ok', '102'), (1, 'partial', '100')])
+def test_checkpoint_is_saved_only_after_complete_run(monkeypatch, pages_failed, status, newest_id):
+    monkeypatch.setattr(scheduler, 'Controller', FakeController)
+    monkeypatch.setattr(FakeController, 'pages_failed', pages_failed)
+    jobs = FakeScheduler(Checkpoint('fake', newest_id='100', validators={'https://example.com/list': {'ETag': '"v1"'}}))
+    job = jobs.jobs['fake']
+
+    asyncio.run(jobs._crawl(job, full=False))
+
+    assert job.last_status == status
+    assert jobs.saved.newest_id == newest_id
+    assert jobs.saved.validators['https://example.com/list'] == {'ETag': '"v2"' if not pages_failed else '"v1"'}
@@ -0,0 +1,37 @@
+import pytest
+
+from app.storage.search import SearchConfig, build_search_query, search_terms, stem_ru
+
+
+@pytest.mark.parametrize('word, stem', [
+    ('студия', 'студи'),
+    ('балконом', 'балкон'),
+    ('квартиры', 'квартир'),
+    ('новостройке', 'новостройк'),
+    ('метро', 'метр'),
+    ('дом', 'дом'),
+    ('loft', 'loft'),
+    ('2024', '2024'),
+])
+def test_stem_ru(word, stem):
+    assert stem_ru(word) == stem
+
+
+def test_build_search_query():
+    assert build_search_query("Студия с балконом у метро") == "+(>студия студи*) +(>балконом балкон*) +(>метро метр*)"
+
+
+def test_search_terms_are_normalized_and_unique():
+    assert search_terms("Ёлка, ЕЛКА и лофт_2к!") == ['елка', 'лофт']
+    assert build_search_query("дом") == "+дом*"
+
+
+def test_search_terms_limit():
+    words = [f"слово{index}" for index in range(SearchConfig.SEARCH_MAX_TERMS + 3)]
+    assert search_terms(' '.join(words)) == words[:SearchConfig.SEARCH_MAX_TERMS]
+
+
+@pytest.mark.parametrize('text', ['', 'в на у', '!!! ---'])
+def test_query_without_indexed_words(text):
+    with pytest.raises(ValueError):
+        build_search_query(text)
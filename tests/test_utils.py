@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.api.exceptions import InvalidBulkPayloadHTTPException
+from app.api.utils import iter_bulk_payload
+
+
+def make_request(chunks, content_type):
+    """
+    Запрос, тело которого приходит указанными кусками.
+    """
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': True} for chunk in chunks]
+    messages.append({'type': 'http.request', 'body': b'', 'more_body': False})
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': '/api/listings/bulk', 'query_string': b'',
+        'headers': [(b'content-type', content_type.encode())],
+    }
+    return Request(scope, receive)
+
+
+def collect(request):
+    async def scenario():
+        return [item async for item in iter_bulk_payload(request)]
+    return asyncio.run(scenario())
+
+
+def test_ndjson_mixed_rows_and_blank_lines():
+    body = b'{"id": 1}\n\n   \n{"id": 2\n{"id": 3}\r\n\n[1, 2]\n{"id": 4}'
+    # Куски режут строки посередине
+    chunks = [body[start:start + 5] for start in range(0, len(body), 5)]
+    items = collect(make_request(chunks, 'application/x-ndjson; charset=utf-8'))
+
+    assert [raw for raw, _ in items] == [{'id': 1}, None, {'id': 3}, [1, 2], {'id': 4}]
+    errors = [error for _, error in items]
+    assert errors[0] is None and errors[2:] == [None, None, None]
+    assert errors[1].startswith('Некорректная строка JSON')
+
+
+def test_ndjson_empty_body():
+    assert collect(make_request([b'\n \n'], 'application/jsonl')) == []
+
+
+def test_json_array():
+    items = collect(make_request([b'[{"id": 1}, ', b'"x", null]'], 'application/json'))
+    assert items == [({'id': 1}, None), ('x', None), (None, None)]
+
+
+@pytest.mark.parametrize('body', [b'[{"id": 1}, {"id": 2}', b'[{"id": 1}, {"id": ', b''])
+def test_truncated_json_array(body):
+    with pytest.raises(InvalidBulkPayloadHTTPException) as error:
+        collect(make_request([body], 'application/json'))
+    assert error.value.status_code == 400
+    assert 'Некорректный JSON' in error.value.detail
+
+
+def test_json_payload_must_be_array():
+    with pytest.raises(InvalidBulkPayloadHTTPException) as error:
+        collect(make_request([b'{"id": 1}'], 'application/json'))
+    assert error.value.detail == 'Ожидается JSON-массив объявлений.'
@@ -0,0 +1,132 @@
+import random
+from decimal import Decimal
+from typing import List, Optional, Union
+
+import pytest
+from pydantic import BaseModel, Field, ValidationError
+
+from app.api.schemas import ListingCreate
+from app.api.validation import KIND_OTHER, BatchValidator, listing_validator
+
+BROKEN = [
+    ('price', 0), ('price', 'договорная'), ('price', '12500000'), ('price', None), ('price', float('nan')),
+    ('deal_type', 'обмен'), ('rooms', 0), ('rooms', 2.5), ('rooms', '3'), ('area', -1), ('area', True),
+    ('title', ''), ('title', 5), ('description', None), ('location', None), ('url', None),
+]
+
+# Значения, которые float()/int() и pydantic разбирают по-разному
+ODD = [
+    ('price', '١٢٣'), ('rooms', '٣'), ('price', '１２'), ('price', '\xa012'), ('price', '1_000'), ('price', '1_0.5'),
+    ('price', ' 12 '), ('price', 'inf'), ('price', '1e400'), ('price', b'12'), ('area', b'12'), ('area', b' 7 '),
+    ('area', bytearray(b'12')), ('rooms', b'3'), ('rooms', '3.0'), ('rooms', '1e3'), ('rooms', Decimal('2')),
+    ('price', Decimal('1e400')), ('price', 10 ** 400), ('price', -10 ** 400), ('area', 10 ** 400),
+    ('rooms', 10 ** 400), ('rooms', -10 ** 400), ('price', 2 ** 63), ('title', b'Studio'), ('title', b'\xff'),
+    ('title', bytearray(b'x')), ('deal_type', b'sale'), ('deal_type', 'Sale'),
+]
+
+
+def listing_row(rng: random.Random, index: int) -> dict:
+    rooms = rng.randint(1, 4)
+    return {
+        'title': f"{rooms}-к. квартира",
+        'description': "Светлая квартира с ремонтом рядом с метро.",
+        'price': float(rng.randint(3_000, 40_000) * 1000),
+        'deal_type': rng.choice(['sale', 'rent']),
+        'rooms': rooms,
+        'area': round(rng.uniform(20, 150), 1),
+        'location': f"Москва, ул. Ленина, {rng.randint(1, 200)}",
+        'url': f"https://example.com/{index}",
+        'source': 'avito',
+        'external_id': str(index),
+    }
+
+
+def validate_one_by_one(rows):
+    valid, errors = [], set()
+    for index, row in enumerate(rows):
+        try:
+            valid.append(ListingCreate.model_validate(row).model_dump())
+        except ValidationError as e:
+            errors.update((index, '.'.join(map(str, error['loc'])), error['type']) for error in e.errors())
+    return valid, errors
+
+
+def assert_same_as_pydantic(rows):
+    expected, expected_errors = validate_one_by_one(rows)
+    valid, _, issues = listing_validator.validate(rows)
+
+    assert valid == expected
+    assert {(issue.index, issue.field, issue.type) for issue in issues} == expected_errors
+
+
+@pytest.mark.parametrize('field, value', BROKEN)
+def test_broken_field_matches_pydantic(field, value):
+    row = listing_row(random.Random(0), 0)
+    row[field] = value
+    assert_same_as_pydantic([listing_row(random.Random(1), 1), row])
+
+
+@pytest.mark.parametrize('field, value', ODD, ids=[f"{field}={value!r:.20}" for field, value in ODD])
+def test_odd_value_matches_pydantic(field, value):
+    row = listing_row(random.Random(0), 0)
+    row[field] = value
+    assert_same_as_pydantic([listing_row(random.Random(1), 1), row])
+
+
+def test_number_overflow_is_a_row_error():
+    rows = [listing_row(random.Random(index), index) for index in range(3)]
+    rows[1]['price'] = 10 ** 400
+    valid, indexes, issues = listing_validator.validate(rows)
+    assert indexes == [0, 2]
+    assert issues == [(1, 'price', 'float_type', "Input should be a valid number")]
+    assert_same_as_pydantic(rows)
+
+
+class Offer(BaseModel):
+    code: str = Field(..., pattern=r'^[A-Z]{2}\d+$')
+    tags: List[str] = Field(default_factory=list)
+    amount: Union[int, str]
+    note: Optional[str] = Field(None, max_length=5)
+    floor: int = Field(1, ge=1)
+
+
+def test_other_field_types_are_validated_by_pydantic():
+    validator = BatchValidator(Offer)
+    assert [rule.kind for rule in validator.rules] == [KIND_OTHER, KIND_OTHER, KIND_OTHER, 'str', 'int']
+    rows = [
+        {'code': 'AB12', 'amount': 5},
+        {'code': 'ab12', 'tags': 'x', 'amount': 'много', 'note': 'слишком длинно', 'floor': 0},
+        {'code': 'CD3', 'tags': ['a', b'b'], 'amount': [1]},
+    ]
+    expected, expected_errors = [], set()
+    for index, row in enumerate(rows):
+        try:
+            expected.append(Offer.model_validate(row).model_dump())
+        except ValidationError as e:
+            expected_errors.update((index, '.'.join(map(str, error['loc'][:1])), error['type']) for error in e.errors())
+
+    valid, _, issues = validator.validate(rows)
+    assert valid == expected
+    assert {(issue.index, issue.field, issue.type) for issue in issues} == expected_errors
+
+
+def test_missing_and_extra_keys_match_pydantic():
+    rng = random.Random(2)
+    missing = listing_row(rng, 0)
+    del missing['price']
+    extra = {**listing_row(rng, 1), 'floor': 5}
+    assert_same_as_pydantic([missing, extra, listing_row(rng, 2), 'не объект'])
+
+
+def test_random_batch_matches_pydantic():
+    rng = random.Random(42)
+    rows = []
+    for index in range(2000):
+        row = listing_row(rng, index)
+        if rng.random() < 0.1:
+            row['price'] = f"{row['price']:.0f}"
+        if rng.random() < 0.2:
+            field, value = rng.choice(BROKEN)
+            row[field] = value
+        rows.append(row)
+    assert_same_as_pydantic(rows)